@@ -1,14 +1,20 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from typing import Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator, List, Optional, Set
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
+import anyio.from_thread
+import asyncio
+import functools
+import hashlib
+import json
 import os
 import tempfile
 from pathlib import Path
-import shutil
 import time
+import uuid
 import warnings
 
 # Фильтрация предупреждений Whisper о FP16 на CPU (это нормальное поведение)
@@ -26,8 +32,28 @@ try:
 except ImportError:
     pass
 
-from app.services.video_processor import VideoProcessor
+from app.services.video_processor import VideoProcessor, MediaInfo, MediaProbeError
 from app.services.speech_recognition import SpeechRecognitionService
+from app.services.upload_sessions import (
+    UploadSessionManager,
+    UploadError,
+    UploadNotFoundError,
+    UploadOffsetError,
+)
+from app.services.result_cache import ResultCache
+from app.services.single_flight import SingleFlight
+from app.services.job_store import JobStore, JobNotFoundError, CANCELLED
+from app.services.transcript import Transcript
+from app.services.transcript_export import EXPORT_FORMATS, export_transcript, iter_encoded
+from app.services.response_encoding import encode_response, round_segments
+from app.services.audio_cache import AudioCache
+from app.services.long_form import SAMPLE_RATE
+from app.services.audio_handoff import TranscriptionWorkerPool, transcribe_shared
+from app.services.job_queue import JobQueue, JobQueueError, FAILED, DONE, RUNNING, create_job_queue
+from app.services.admission import AdmissionController, AdmissionRejected, RTFHistory, preset
+from app.services.cancellation import CancelToken, InflightJobs, JobCancelled
+from app.services.metrics import metrics, flatten, render_prometheus
+from app.services.temp_storage import TempStorage, TempStorageFullError
 
 # Попытка импорта оптимизированного сервиса
 try:
@@ -45,73 +71,98 @@ try:
 except ImportError:
     WHISPER_CACHE_DIR = None
 
-app = FastAPI(title="Video to Text Converter", version="1.0.0")
+try:
+    from config import UPLOAD_DIR, UPLOAD_SESSION_TTL, UPLOAD_STORED_TTL, RESULT_CACHE_SIZE, JOBS_DIR
+except ImportError:
+    UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "videoconverter_uploads")
+    UPLOAD_SESSION_TTL = 24 * 3600
+    UPLOAD_STORED_TTL = 7 * 24 * 3600
+    RESULT_CACHE_SIZE = 64
+    JOBS_DIR = os.path.join(tempfile.gettempdir(), "videoconverter_jobs")
 
-# Добавляем маршрут для статики (frontend) если развернуто на Spaces
-# Проверяем несколько возможных путей
-static_dirs = [
-    os.path.join(os.path.dirname(__file__), "..", "static"),  # Локальная разработка
-    "/app/static",  # Hugging Face Spaces
-    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static"),  # Альтернативный путь
-]
+try:
+    from config import LONG_FORM_MIN_DURATION, LONG_FORM_WINDOW_SECONDS
+except ImportError:
+    LONG_FORM_MIN_DURATION = 30 * 60
+    LONG_FORM_WINDOW_SECONDS = 300
 
-static_dir = None
-for dir_path in static_dirs:
-    if os.path.exists(dir_path):
-        static_dir = dir_path
-        break
+try:
+    from config import AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES
+except ImportError:
+    AUDIO_CACHE_DIR = os.path.join(tempfile.gettempdir(), "videoconverter_audio_cache")
+    AUDIO_CACHE_MAX_BYTES = 4 * 1024 ** 3
 
-if static_dir:
-    from fastapi.staticfiles import StaticFiles
-    from fastapi.responses import FileResponse, Response
-    from starlette.responses import HTMLResponse
-    
-    # Монтируем статику на /static
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
-    
-    # Также монтируем /assets для прямого доступа к assets из HTML
-    assets_dir = os.path.join(static_dir, "assets")
-    if os.path.exists(assets_dir):
-        app.mount("/assets", StaticFiles(directory=assets_dir), name="assets")
-    
-    @app.get("/")
-    async def read_root():
-        index_path = os.path.join(static_dir, "index.html")
-        print(f"Проверка index.html: путь={index_path}, существует={os.path.exists(index_path)}")
-        if os.path.exists(index_path):
-            print(f"✓ Отправка index.html из {index_path}")
-            with open(index_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            return HTMLResponse(content=content)
-        print(f"⚠️ index.html не найден в {index_path}")
-        print(f"   Содержимое static_dir ({static_dir}):")
-        if os.path.exists(static_dir):
-            try:
-                for item in os.listdir(static_dir):
-                    print(f"     - {item}")
-            except Exception as e:
-                print(f"     Ошибка при чтении директории: {e}")
-        return {"message": "Video to Text Converter API", "status": "running", "static_dir": static_dir, "index_exists": os.path.exists(index_path)}
-    
-    # Fallback для SPA routing - все остальные GET запросы возвращают index.html
-    @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
-        # Пропускаем API маршруты
-        if full_path.startswith("api/"):
-            raise HTTPException(status_code=404, detail="Not found")
-        
-        # Пропускаем статические файлы (они должны обрабатываться через mount)
-        if full_path.startswith(("static/", "assets/")):
-            raise HTTPException(status_code=404, detail="Not found")
-        
-        # Для всех остальных маршрутов возвращаем index.html (SPA routing)
-        index_path = os.path.join(static_dir, "index.html")
-        if os.path.exists(index_path):
-            with open(index_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            return HTMLResponse(content=content)
-        
-        raise HTTPException(status_code=404, detail="Not found")
+try:
+    from config import TRANSCRIBE_WORKERS
+except ImportError:
+    TRANSCRIBE_WORKERS = 0
+
+try:
+    from config import ROLE, JOB_QUEUE_URL, JOB_QUEUE_LEASE_SECONDS
+except ImportError:
+    ROLE = "all"
+    JOB_QUEUE_URL = "sqlite:///" + os.path.join(tempfile.gettempdir(), "videoconverter_queue.db")
+    JOB_QUEUE_LEASE_SECONDS = 120
+
+try:
+    from config import (
+        SCRATCH_DIR, TEMP_MEMORY_MAX_FILE_BYTES, TEMP_MEMORY_BUDGET_BYTES, TEMP_MIN_FREE_BYTES, TEMP_FILE_MAX_AGE
+    )
+except ImportError:
+    SCRATCH_DIR = (
+        os.getenv("SCRATCH_DIR") or os.getenv("INPUT_DIR")
+        or os.path.join(tempfile.gettempdir(), "videoconverter_scratch")
+    )
+    TEMP_MEMORY_MAX_FILE_BYTES = 64 * 1024 ** 2
+    TEMP_MEMORY_BUDGET_BYTES = 512 * 1024 ** 2
+    TEMP_MIN_FREE_BYTES = 1024 ** 3
+    TEMP_FILE_MAX_AGE = 24 * 3600
+
+try:
+    from config import (
+        SCHEDULER_FAST_LANE_SECONDS, SCHEDULER_STARVATION_SECONDS, SCHEDULER_FAST_LANE_RESERVED, CLIENT_WEIGHTS
+    )
+except ImportError:
+    SCHEDULER_FAST_LANE_SECONDS = 120
+    SCHEDULER_STARVATION_SECONDS = 1800
+    SCHEDULER_FAST_LANE_RESERVED = 1
+    CLIENT_WEIGHTS = ""
+
+try:
+    from config import ADMISSION_MAX_WAIT_SECONDS, ADMISSION_DISK_WATERMARK, ADMISSION_CAPACITY
+except ImportError:
+    ADMISSION_MAX_WAIT_SECONDS = 1800
+    ADMISSION_DISK_WATERMARK = 0.9
+    ADMISSION_CAPACITY = 0
+
+try:
+    from config import DIARIZATION_ENGINE
+except ImportError:
+    DIARIZATION_ENGINE = "auto"
+
+try:
+    from config import PARALLEL_DIARIZATION, TRANSCRIBE_CPU_THREADS, DIARIZATION_CPU_THREADS
+except ImportError:
+    PARALLEL_DIARIZATION = True
+    # Параллельные этапы делят ядра пополам
+    _cpu_count = os.cpu_count() or 1
+    TRANSCRIBE_CPU_THREADS = _cpu_count - _cpu_count // 2
+    DIARIZATION_CPU_THREADS = max(_cpu_count // 2, 1)
+
+try:
+    from config import DIARIZATION_CACHE_DIR, DIARIZATION_CACHE_MAX_BYTES
+except ImportError:
+    DIARIZATION_CACHE_DIR = os.path.join(tempfile.gettempdir(), "videoconverter_diarization_cache")
+    DIARIZATION_CACHE_MAX_BYTES = 1024 ** 3
+
+try:
+    from config import JOB_RETENTION_SECONDS, JOB_MAX_ATTEMPTS, JOB_LEASE_SECONDS
+except ImportError:
+    JOB_RETENTION_SECONDS = 30 * 24 * 3600
+    JOB_MAX_ATTEMPTS = 2
+    JOB_LEASE_SECONDS = 60.0
+
+app = FastAPI(title="Video to Text Converter", version="1.0.0")
 
 # CORS middleware для работы с frontend
 app.add_middleware(
@@ -120,6 +171,7 @@ app.add_middleware(
     allow_credentials=False,  # Отключаем credentials для разрешения всех источников
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],  # Клиент читает его в ответе 429
 )
 
 # Middleware для логирования всех запросов
@@ -181,6 +233,55 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 # Инициализация сервисов
 video_processor = VideoProcessor()
+upload_manager = UploadSessionManager(
+    UPLOAD_DIR,
+    session_ttl=UPLOAD_SESSION_TTL,
+    stored_ttl=UPLOAD_STORED_TTL
+)
+result_cache = ResultCache(max_entries=RESULT_CACHE_SIZE)
+single_flight = SingleFlight()
+job_store = JobStore(JOBS_DIR, lease_seconds=JOB_LEASE_SECONDS)
+# Декодированное аудио по хэшу файла: повторные запуски (другая модель, diarization) без ffmpeg
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+def _parse_client_weights(value: str) -> Dict[str, float]:
+    """CLIENT_WEIGHTS: "клиент=вес,клиент=вес" (клиент - как в _client_id)"""
+    weights = {}
+    for item in value.split(","):
+        client, _, weight = item.strip().rpartition("=")
+        if client:
+            weights[client] = float(weight)
+    return weights
+
+# Очередь задач рабочим процессам (нужна процессу API при ROLE=api и рабочим процессам)
+job_queue: Optional[JobQueue] = (
+    create_job_queue(
+        JOB_QUEUE_URL,
+        JOB_QUEUE_LEASE_SECONDS,
+        fast_lane_seconds=SCHEDULER_FAST_LANE_SECONDS,
+        starvation_seconds=SCHEDULER_STARVATION_SECONDS,
+        fast_lane_reserved=SCHEDULER_FAST_LANE_RESERVED,
+        client_weights=_parse_client_weights(CLIENT_WEIGHTS)
+    ) if ROLE in ("api", "worker") else None
+)
+# Временные файлы задач: небольшие - в памяти (/dev/shm), остальные - в SCRATCH_DIR
+temp_storage = TempStorage(
+    SCRATCH_DIR,
+    memory_max_file_bytes=TEMP_MEMORY_MAX_FILE_BYTES,
+    memory_budget_bytes=TEMP_MEMORY_BUDGET_BYTES,
+    min_free_bytes=TEMP_MIN_FREE_BYTES,
+    max_age_seconds=TEMP_FILE_MAX_AGE
+)
+
+# Контроль приема: 429, если прогноз ожидания больше лимита или временный диск заполнен
+rtf_history = RTFHistory()
+admission = AdmissionController(
+    ADMISSION_MAX_WAIT_SECONDS,
+    ADMISSION_DISK_WATERMARK,
+    [SCRATCH_DIR, UPLOAD_DIR],
+    ADMISSION_CAPACITY or max(TRANSCRIBE_WORKERS, 1)
+)
+# Выполняющиеся задачи: отмена при отключении клиентов или DELETE /api/jobs/{id}
+inflight_jobs = InflightJobs()
 
 # Получение пути к кэшу моделей
 # Приоритет: переменная окружения > config.py > системный кэш
@@ -219,13 +320,164 @@ if OPTIMIZED_AVAILABLE:
     speech_service = OptimizedSpeechRecognitionService(
         cache_dir=whisper_cache_dir,
         use_gpu=use_gpu,
-        device="auto"
+        device="auto",
+        diarization_engine=DIARIZATION_ENGINE,
+        parallel_diarization=PARALLEL_DIARIZATION,
+        transcribe_threads=TRANSCRIBE_CPU_THREADS,
+        diarization_threads=DIARIZATION_CPU_THREADS,
+        diarization_cache_dir=DIARIZATION_CACHE_DIR,
+        diarization_cache_max_bytes=DIARIZATION_CACHE_MAX_BYTES,
+        # Рабочий процесс задает свою емкость сам (app.worker)
+        concurrent_jobs=admission.capacity if ROLE == "all" else 1
     )
     print("✓ Используется оптимизированный сервис распознавания")
 else:
     speech_service = SpeechRecognitionService(cache_dir=whisper_cache_dir)
     print("⚠ Используется стандартный сервис. Для ускорения установите: pip install faster-whisper")
 
+# Пул процессов распознавания (запускается при старте приложения, если TRANSCRIBE_WORKERS > 0)
+transcription_pool: Optional[TranscriptionWorkerPool] = None
+
+async def _upload_cleanup_loop():
+    """Периодически удаляет истекшие сессии загрузки, чтобы освободить диск"""
+    interval = max(60, min(UPLOAD_SESSION_TTL, 3600))
+    while True:
+        try:
+            await run_in_threadpool(upload_manager.cleanup_expired)
+        except Exception as e:
+            print(f"⚠️  Ошибка при очистке загрузок: {e}")
+        await asyncio.sleep(interval)
+
+async def _job_retention_loop():
+    """Периодически удаляет задачи старше JOB_RETENTION_SECONDS"""
+    while True:
+        try:
+            removed = await run_in_threadpool(job_store.cleanup_expired, JOB_RETENTION_SECONDS)
+            if removed:
+                print(f"[JOB_STORE] Удалено задач с истекшим сроком хранения: {removed}")
+        except Exception as e:
+            print(f"⚠️  Ошибка при очистке хранилища задач: {e}")
+        await asyncio.sleep(3600)
+
+# Интервал очистки временных файлов упавших процессов (секунды)
+TEMP_JANITOR_INTERVAL = 300
+
+def _reclaim_temp_files() -> int:
+    """Удаляет временные файлы завершившихся процессов; входные файлы задач для перезапуска сохраняются"""
+    return temp_storage.janitor(protected=job_store.input_paths())
+
+async def _temp_janitor_loop():
+    """Периодически освобождает временное хранилище от файлов упавших процессов"""
+    while True:
+        try:
+            removed = await run_in_threadpool(_reclaim_temp_files)
+            if removed:
+                print(f"[TEMP_STORAGE] Удалено забытых временных файлов: {removed}")
+        except Exception as e:
+            print(f"⚠️  Ошибка при очистке временных файлов: {e}")
+        await asyncio.sleep(TEMP_JANITOR_INTERVAL)
+
+# Перезапускаемые задачи этого процесса: аренда продлевается и до начала выполнения
+# (задача ждет приема или присоединилась к такой же задаче другого запроса)
+_resuming_jobs: Set[str] = set()
+
+async def _resume_job(job: Dict) -> None:
+    """Запускает заново задачу, прерванную остановкой процесса (результат - в хранилище задач)"""
+    _resuming_jobs.add(job["job_id"])
+    try:
+        data = await _convert_single_flight(
+            job["input_path"], job["params"], job["content_hash"], time.time(),
+            cleanup_input=job["cleanup_input"], client=job["client"], job_id=job["job_id"],
+            queue_id=job["queue_id"]
+        )
+        if data.get("job_id") and data["job_id"] != job["job_id"]:
+            # Результат взят у другой задачи (кэш, такой же запрос) - копируем его в перезапущенную
+            done = await run_in_threadpool(job_store.get, data["job_id"])
+            await run_in_threadpool(
+                job_store.save, done["result"], done["params"], done["content_hash"],
+                job_id=job["job_id"], created_at=job["created_at"]
+            )
+        print(f"[JOB_STORE] Задача {job['job_id']} выполнена после перезапуска")
+    except HTTPException as e:
+        print(f"[JOB_STORE] ⚠️  Задача {job['job_id']} после перезапуска завершилась ошибкой: {e.detail}")
+    except Exception as e:
+        print(f"[JOB_STORE] ⚠️  Задача {job['job_id']} после перезапуска завершилась ошибкой: {e}")
+    finally:
+        _resuming_jobs.discard(job["job_id"])
+
+async def _recover_jobs():
+    """
+    Перезапускает задачи процессов, остановившихся во время их выполнения
+
+    Задачу с истекшей арендой забирает один процесс (claim_expired) - при
+    нескольких workers uvicorn или репликах API задача не запускается дважды.
+    При ROLE=api задача, уже поставленная в очередь, не ставится повторно -
+    API продолжает ждать ее результат. Клиент, потерявший соединение,
+    получает результат по job_id (GET /api/jobs/{id}). Задача без входного
+    файла или прерванная JOB_MAX_ATTEMPTS раз завершается с ошибкой.
+    """
+    jobs = await run_in_threadpool(job_store.claim_expired)
+    for job in jobs:
+        if job["attempts"] >= JOB_MAX_ATTEMPTS:
+            detail = f"Обработка прервана остановкой процесса {job['attempts']} раз подряд"
+        elif not job["input_path"] or not os.path.exists(job["input_path"]):
+            detail = "Обработка прервана остановкой процесса, входной файл не сохранился"
+        else:
+            print(f"[JOB_STORE] Задача {job['job_id']} прервана остановкой процесса - запускаем заново "
+                  f"(попытка {job['attempts'] + 1})")
+            asyncio.create_task(_resume_job(job))
+            continue
+        print(f"[JOB_STORE] ⚠️  Задача {job['job_id']}: {detail}")
+        await run_in_threadpool(job_store.fail, job["job_id"], {"status_code": 500, "detail": detail})
+        if job["queue_id"] and job_queue is not None:
+            # Рабочий процесс замечает удаление задачи из очереди и останавливается
+            await run_in_threadpool(job_queue.delete, job["queue_id"])
+        if job["cleanup_input"] and job["input_path"] and os.path.exists(job["input_path"]):
+            os.unlink(job["input_path"])
+
+async def _job_lease_loop():
+    """Продлевает аренду задач этого процесса и забирает задачи остановившихся процессов"""
+    while True:
+        try:
+            await run_in_threadpool(job_store.renew, [*inflight_jobs.job_ids(), *_resuming_jobs])
+            await _recover_jobs()
+        except Exception as e:
+            print(f"[JOB_STORE] ⚠️  Ошибка продления аренды задач: {e}")
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global transcription_pool
+    asyncio.create_task(_upload_cleanup_loop())
+    asyncio.create_task(_temp_janitor_loop())
+    if JOB_RETENTION_SECONDS > 0:
+        asyncio.create_task(_job_retention_loop())
+    if ROLE == "api":
+        print(f"✓ Роль api: распознавание выполняют рабочие процессы (очередь {JOB_QUEUE_URL})")
+    elif TRANSCRIBE_WORKERS > 0 and OPTIMIZED_AVAILABLE:
+        transcription_pool = await run_in_threadpool(
+            TranscriptionWorkerPool,
+            TRANSCRIBE_WORKERS,
+            {
+                "cache_dir": whisper_cache_dir, "use_gpu": use_gpu, "device": "auto",
+                "diarization_engine": DIARIZATION_ENGINE,
+                "parallel_diarization": PARALLEL_DIARIZATION,
+                "transcribe_threads": TRANSCRIBE_CPU_THREADS,
+                "diarization_threads": DIARIZATION_CPU_THREADS,
+                "diarization_cache_dir": DIARIZATION_CACHE_DIR,
+                "diarization_cache_max_bytes": DIARIZATION_CACHE_MAX_BYTES,
+                # Процесс пула распознает одну задачу за раз
+                "concurrent_jobs": 1,
+            }
+        )
+    # После пула процессов: перезапущенные задачи распознаются там же, где новые
+    asyncio.create_task(_job_lease_loop())
+
+@app.on_event("shutdown")
+async def stop_transcription_pool():
+    if transcription_pool is not None:
+        await run_in_threadpool(transcription_pool.shutdown)
+
 # Корневой маршрут уже определен выше для статики
 # Если статика не найдена, этот маршрут будет работать
 @app.get("/api")
@@ -236,13 +488,983 @@ async def api_root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/api/workers")
+async def list_workers():
+    """Зарегистрированные рабочие процессы и очередь задач (ROLE=api)"""
+    if job_queue is None:
+        return {"role": ROLE, "workers": [], "queue": {}}
+    workers, stats = await run_in_threadpool(lambda: (job_queue.workers(), job_queue.stats()))
+    return {"role": ROLE, "workers": workers, "queue": stats}
+
+@app.get("/api/metrics")
+async def get_metrics(format: str = "json"):
+    """
+    Метрики: счетчики процесса API, очередь задач (в т.ч. доля холодных загрузок моделей),
+    кэши декодированного аудио и эмбеддингов diarization, задачи хранилища по состояниям,
+    занятость временного хранилища; format=prometheus - текстовый формат Prometheus
+    """
+    data = {
+        "process": metrics.snapshot(),
+        "audio_cache": audio_cache.info(),
+        "diarization_cache": speech_service.diarization_cache.info() if OPTIMIZED_AVAILABLE else {},
+        "admission": {**admission.info(), "rtf": rtf_history.snapshot()},
+        "jobs": await run_in_threadpool(job_store.stats),
+        "temp_storage": await run_in_threadpool(temp_storage.info),
+    }
+    if job_queue is not None:
+        data["queue"] = await run_in_threadpool(job_queue.stats)
+    if format != "prometheus":
+        return data
+    values = flatten(data["process"])
+    values.update({f"queue_{name}": value for name, value in data.get("queue", {}).items()})
+    values.update({
+        f"{cache}_{name}": value
+        for cache in ("audio_cache", "diarization_cache")
+        for name, value in data[cache].items()
+        if isinstance(value, (int, float))
+    })
+    values.update({
+        f"{section}_{name}": value
+        for section in ("admission", "jobs", "temp_storage")
+        for name, value in data[section].items()
+        if isinstance(value, (int, float))
+    })
+    return PlainTextResponse(render_prometheus(values))
+
+@app.get("/api/admission")
+async def get_admission(
+    request: Request,
+    model: str = "base",
+    duration: float = 0.0,
+    enable_diarization: bool = False,
+    translate_to_english: bool = False,
+    idempotency_key: Optional[str] = None
+):
+    """
+    Прогноз для задачи до загрузки: примет ли сервер задачу и когда она будет готова
+
+    - duration: длительность аудио (секунды), модель и режим - как у /api/convert
+    - idempotency_key: ETA уже принятой задачи этого клиента с этим Idempotency-Key
+      (eta_seconds - оставшееся время) и ее job_id (для отмены через DELETE /api/jobs/{job_id})
+    """
+    mode = preset({"enable_diarization": enable_diarization, "translate_to_english": translate_to_english})
+    expected = rtf_history.estimate(duration, model, mode)
+    response = {"accepting": True, "retry_after": None, "rtf": round(rtf_history.rtf(model, mode), 4)}
+    idempotency_key = _scoped_idempotency_key(request, idempotency_key)
+    if idempotency_key:
+        eta = admission.eta(idempotency_key)
+        if eta is not None:
+            found = inflight_jobs.find(idempotency_key)
+            return {
+                **response, "admitted": True, "job_id": found[0] if found else None,
+                "wait_seconds": 0.0, "eta_seconds": eta
+            }
+    backlog, capacity = await _admission_load()
+    prediction = admission.predict(expected, backlog, capacity)
+    try:
+        # Только прогноз - в статистике отказов не учитывается
+        admission.check_limits(prediction)
+    except AdmissionRejected as e:
+        response.update(accepting=False, retry_after=e.retry_after, detail=str(e))
+    return {**response, "admitted": False, **prediction}
+
 @app.get("/api/test")
 async def test():
     print(">>> ТЕСТОВЫЙ ЗАПРОС ПОЛУЧЕН!")
     return {"message": "Backend работает!", "timestamp": time.time()}
 
+def _parse_speaker_names(speaker_names: Optional[str]) -> List[str]:
+    """Парсит имена спикеров из JSON-строки формы"""
+    speaker_names_list = []
+    if speaker_names:
+        try:
+            speaker_names_list = json.loads(speaker_names)
+            print(f"Имена спикеров: {speaker_names_list}")
+        except json.JSONDecodeError as e:
+            print(f"⚠️  Ошибка при парсинге имен спикеров (невалидный JSON): {e}")
+            print(f"   Полученная строка: {speaker_names}")
+        except Exception as e:
+            print(f"⚠️  Ошибка при парсинге имен спикеров: {e}")
+            import traceback
+            traceback.print_exc()
+    return speaker_names_list
+
+def _parse_time(value: Optional[str], name: str) -> Optional[float]:
+    """
+    Время из параметра запроса: секунды ("2400", "2400.5") или ЧЧ:ММ:СС / ММ:СС ("40:00")
+    """
+    if value is None or not str(value).strip():
+        return None
+    try:
+        seconds = 0.0
+        for part in str(value).strip().split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Некорректное значение {name}: {value}")
+    if seconds < 0:
+        raise HTTPException(status_code=400, detail=f"{name} не может быть отрицательным")
+    return seconds
+
+def _conversion_params(
+    language: str,
+    model: str,
+    beam_size: int,
+    enable_diarization: bool,
+    num_speakers: Optional[int],
+    speaker_names: Optional[str],
+    translate_to_english: Optional[bool],
+    word_timestamps: bool = False,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    deadline_seconds: Optional[float] = None
+) -> Dict:
+    """Нормализует параметры конвертации (они же - часть ключа кэша результатов)"""
+    if deadline_seconds is not None and deadline_seconds <= 0:
+        raise HTTPException(status_code=400, detail="deadline_seconds должен быть больше 0")
+    range_start = _parse_time(start, "start")
+    range_end = _parse_time(end, "end")
+    if range_start is not None and range_end is not None and range_end <= range_start:
+        raise HTTPException(status_code=400, detail="end должен быть больше start")
+    if range_start is not None or range_end is not None:
+        print(f"Диапазон: {range_start or 0:.1f} - {range_end if range_end is not None else 'конец'} сек")
+    print(f"Настройки: язык={language}, модель={model}, beam_size={beam_size}, тайминги слов={word_timestamps}")
+    print(f"Diarization: {enable_diarization}, спикеров={num_speakers}")
+    # Обрабатываем translate_to_english как опциональный параметр (для совместимости)
+    translate_to_english_value = translate_to_english if translate_to_english is not None else False
+    print(f"Перевод на английский: {translate_to_english_value}")
+    if translate_to_english_value and enable_diarization:
+        print("⚠️  Внимание: Diarization отключен при переводе на английский (несовместимо)")
+    if deadline_seconds:
+        print(f"Срок распознавания: {deadline_seconds:.0f} сек (при отставании качество снижается)")
+    
+    return {
+        "language": language,
+        "model": model,
+        "beam_size": beam_size,
+        "enable_diarization": enable_diarization,
+        "num_speakers": num_speakers,
+        "speaker_names": _parse_speaker_names(speaker_names),
+        "translate_to_english": translate_to_english_value,
+        "word_timestamps": bool(word_timestamps),
+        "start": range_start,
+        "end": range_end,
+        "deadline_seconds": deadline_seconds,
+    }
+
+def _transcript_key(content_hash: Optional[str], params: Dict) -> Optional[str]:
+    """
+    Ключ готовой транскрипции: хэш файла + параметры, влияющие на сегменты
+    
+    Имена спикеров и формат субтитров применяются при отображении, поэтому
+    в ключ не входят. При переводе diarization не выполняется.
+    """
+    if not content_hash:
+        return None
+    transcript_params = {
+        "language": params["language"],
+        "model": params["model"],
+        "beam_size": params["beam_size"],
+        "enable_diarization": params["enable_diarization"] and not params["translate_to_english"],
+        "num_speakers": params["num_speakers"],
+    }
+    # Ключ без тайминга слов совпадает с ключом задач, сохраненных до появления этого режима
+    if params.get("word_timestamps"):
+        transcript_params["word_timestamps"] = True
+    if params.get("start") is not None or params.get("end") is not None:
+        transcript_params["start"] = params.get("start")
+        transcript_params["end"] = params.get("end")
+    # Результат со сроком может быть распознан с пониженным качеством - не подменяет полный
+    if params.get("deadline_seconds"):
+        transcript_params["deadline_seconds"] = params["deadline_seconds"]
+    return ResultCache.make_key(content_hash, transcript_params)
+
+def _diarization_reuse_key(content_hash: Optional[str], params: Dict) -> Optional[str]:
+    """
+    Ключ транскрипции с diarization без учета количества спикеров
+    
+    По нему запуск с другим num_speakers находит готовую транскрипцию той же
+    записи: распознавание не повторяется, спикеры назначаются заново.
+    """
+    if not params["enable_diarization"] or params["translate_to_english"]:
+        return None
+    return _transcript_key(content_hash, {**params, "num_speakers": "any"})
+
+def _audio_key(content_hash: Optional[str], params: Dict) -> Optional[str]:
+    """Ключ распознаваемого аудио (файл и диапазон) - для кэша эмбеддингов diarization"""
+    if not content_hash:
+        return None
+    if params.get("start") is None and params.get("end") is None:
+        return content_hash
+    end = params.get("end")
+    return f"{content_hash}_{params.get('start') or 0:.3f}_{'end' if end is None else f'{end:.3f}'}"
+
+def _result_transcript(result: Dict, with_words: bool = False) -> Transcript:
+    """Транскрипция из результата сервиса (стандартный сервис возвращает список сегментов)"""
+    if "transcript" not in result:
+        result["transcript"] = Transcript.from_segments(result.get("segments", []), with_words=with_words)
+    return result["transcript"]
+
+def _job_result(result: Dict, transcript: Transcript) -> Dict:
+    """
+    Результат для хранилища задач: сегменты в компактном колоночном виде
+    
+    Полный текст и текст по спикерам не сохраняются - они восстанавливаются
+    из транскрипции при чтении задачи.
+    """
+    job_result = {
+        key: value for key, value in result.items()
+        if key not in ("transcript", "segments", "text", "formatted_text", "speakers")
+    }
+    job_result["transcript"] = transcript.to_compact()
+    return job_result
+
+# Время сегментов в ответах округляется до миллисекунд (точнее субтитры не используют)
+TIMESTAMP_PRECISION = 3
+
+async def _encoded_response(request: Request, data: Dict, fields: Optional[str] = None):
+    """
+    Ответ с выбором полей (fields), сериализацией по Accept (JSON/msgpack)
+    и сжатием по Accept-Encoding (br/gzip)
+
+    Сериализация и сжатие больших транскрипций выполняются в пуле потоков.
+    """
+    return await run_in_threadpool(
+        encode_response,
+        data,
+        request.headers.get("accept"),
+        request.headers.get("accept-encoding"),
+        fields
+    )
+
+def _job_transcript(job: Dict) -> Transcript:
+    """Транскрипция сохраненной задачи (поддерживается и старый формат со списком сегментов)"""
+    result = job["result"]
+    if "transcript" in result:
+        return Transcript.from_compact(result["transcript"])
+    return Transcript.from_segments(result.get("segments", []))
+
+# Служебные поля хранилища задач, не возвращаемые клиентам
+JOB_PRIVATE_FIELDS = ("input_path", "cleanup_input", "client", "owner", "lease_until", "queue_id")
+
+def _job_view(job: Dict) -> Dict:
+    """Сохраненная задача в формате ответа API (незавершенная - состояние без результата)"""
+    job = {key: value for key, value in job.items() if key not in JOB_PRIVATE_FIELDS}
+    if job["result"] is None:
+        # У выполняющейся задачи - сегменты, готовые до завершения
+        if "partial_segments" in job:
+            job["segments"] = job.pop("partial_segments")
+        return job
+    transcript = _job_transcript(job)
+    result = {
+        key: value for key, value in job["result"].items()
+        if key not in ("transcript", "segments")
+    }
+    result["text"] = transcript.full_text()
+    result["segments"] = transcript.to_segments(TIMESTAMP_PRECISION)
+    if transcript.words is not None:
+        result["words"] = transcript.words_compact(TIMESTAMP_PRECISION)
+    if transcript.has_speakers:
+        result["speakers"] = transcript.texts_by_speaker()
+        result["num_speakers"] = len(result["speakers"])
+        if OPTIMIZED_AVAILABLE and isinstance(speech_service, OptimizedSpeechRecognitionService):
+            result["formatted_text"] = speech_service._format_speaker_text(
+                transcript, job["params"].get("speaker_names")
+            )
+    return {**job, "result": result}
+
+def _finished_job(job: Dict) -> Dict:
+    """Задача с результатом: 409, если она еще выполняется или завершилась ошибкой"""
+    if job["status"] == RUNNING:
+        raise HTTPException(status_code=409, detail=f"Задача {job['job_id']} еще выполняется")
+    if job["result"] is None:
+        error = job["error"] or {}
+        raise HTTPException(
+            status_code=409,
+            detail=f"Задача {job['job_id']} завершилась без результата: {error.get('detail', job['status'])}"
+        )
+    return job
+
+def _use_long_form(duration: float, params: Dict) -> bool:
+    """
+    Нужен ли режим длинных записей (окна из pipe ffmpeg вместо извлечения WAV целиком)
+    
+    Только для оптимизированного сервиса и без перевода (перевод требует второго прохода).
+    """
+    if not LONG_FORM_MIN_DURATION or params["translate_to_english"]:
+        return False
+    if not (OPTIMIZED_AVAILABLE and isinstance(speech_service, OptimizedSpeechRecognitionService)):
+        return False
+    if duration >= LONG_FORM_MIN_DURATION:
+        print(f"Длительность {duration / 60:.1f} мин - режим длинных записей (окна по {LONG_FORM_WINDOW_SECONDS:.0f} сек)")
+        return True
+    return False
+
+def _preflight(input_path: str) -> MediaInfo:
+    """
+    Предварительный анализ входного файла (ffprobe) до извлечения аудио
+    
+    Файлы без аудиодорожки и нераспознаваемые файлы отклоняются с 400.
+    """
+    print(f"[2/4] Анализ файла (ffprobe)...")
+    try:
+        media = video_processor.probe(input_path)
+    except MediaProbeError as e:
+        print(f"[2/4] ❌ {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"[2/4] Длительность: {media.duration / 60:.1f} мин, аудиодорожка #{media.audio_stream_index} "
+          f"({media.audio_codec}, {media.sample_rate} Гц, каналов: {media.channels}, "
+          f"всего аудиодорожек: {media.audio_stream_count})")
+    return media
+
+def _slice_audio(audio, start: float, end: Optional[float]):
+    """Диапазон времени из декодированного аудио (срез memmap - без копирования)"""
+    first = int(start * SAMPLE_RATE)
+    last = int(end * SAMPLE_RATE) if end is not None else None
+    return audio[first:last]
+
+def _publish_partial(job_id: str, range_start: float, segments: List[Dict]) -> None:
+    """Готовые сегменты длинной записи - в задачу до завершения (на шкале исходного файла)"""
+    for seg in segments:
+        seg["start"] = round(seg["start"] + range_start, TIMESTAMP_PRECISION)
+        seg["end"] = round(seg["end"] + range_start, TIMESTAMP_PRECISION)
+    try:
+        job_store.append_partial(job_id, segments)
+    except Exception as e:
+        # Частичный результат необязателен - распознавание продолжается
+        print(f"[JOB_STORE] Не удалось сохранить частичные сегменты задачи {job_id}: {e}")
+
+def _run_conversion(
+    input_path: str,
+    params: Dict,
+    start_time: float,
+    content_hash: Optional[str] = None,
+    media: Optional[MediaInfo] = None,
+    cancel: Optional[CancelToken] = None,
+    job_id: Optional[str] = None
+) -> Dict:
+    """
+    Извлекает аудио и распознает речь, возвращает данные ответа API
+    
+    Общая часть /api/convert и финализации загрузки по частям.
+    Исходный файл не удаляется - им управляет вызывающий код.
+    Результат сохраняется в хранилище задач (job_id в ответе).
+    media - результат ffprobe, если файл уже проанализирован (контроль приема).
+    cancel - токен отмены: ffmpeg завершается, распознавание останавливается (JobCancelled).
+    job_id - идентификатор, выданный задаче при приеме (по нему ее можно отменить).
+    """
+    language = params["language"]
+    model = params["model"]
+    beam_size = params["beam_size"]
+    enable_diarization = params["enable_diarization"]
+    num_speakers = params["num_speakers"]
+    speaker_names_list = params["speaker_names"]
+    translate_to_english_value = params["translate_to_english"]
+    word_timestamps = params.get("word_timestamps", False)
+    deadline_seconds = params.get("deadline_seconds")
+    
+    if media is None:
+        media = _preflight(input_path)
+    
+    # Диапазон времени: ffmpeg декодирует только его (seek на входе),
+    # стоимость зависит от длины диапазона, а не файла
+    range_start = params.get("start") or 0.0
+    range_end = params.get("end")
+    if media.duration and range_start >= media.duration:
+        raise HTTPException(
+            status_code=400,
+            detail=f"start ({range_start:.1f} сек) за пределами записи ({media.duration:.1f} сек)"
+        )
+    if range_end is not None and media.duration:
+        range_end = min(range_end, media.duration)
+    has_range = bool(range_start) or range_end is not None
+    clip_end = range_end if range_end is not None else media.duration
+    duration = max(clip_end - range_start, 0.0)
+    
+    # Длинные записи не извлекаются в WAV - аудио читается окнами из pipe ffmpeg
+    long_form = _use_long_form(duration, params)
+    audio_path = None
+    # Вход движка: путь к WAV или массив float32 (memmap из кэша декодированного аудио)
+    audio_input = None
+    
+    cached_audio = audio_cache.get(content_hash) if not long_form else None
+    if cached_audio is not None:
+        # Этот файл уже декодировался (другая модель, diarization, диапазон) - ffmpeg не нужен
+        audio_input = _slice_audio(cached_audio, range_start, range_end)
+        print(f"[2/4] Аудио из кэша: {len(audio_input) / SAMPLE_RATE / 60:.1f} мин - извлечение пропущено")
+    elif media.is_target_pcm and not long_form and not has_range:
+        # Файл уже в формате Whisper (WAV 16 кГц моно) - перекодирование не нужно
+        print(f"[2/4] Файл уже в формате WAV PCM 16 кГц моно - извлечение аудио пропущено")
+        audio_path = input_path
+    elif not long_form and not has_range and content_hash and audio_cache.enabled:
+        # Декодирование из pipe ffmpeg сразу в кэш, без промежуточного WAV
+        print(f"[2/4] Декодирование аудио в кэш...")
+        extract_start = time.time()
+        audio_input = audio_cache.put(
+            content_hash,
+            video_processor.stream_audio(input_path, audio_stream=media.audio_stream_index, cancel=cancel)
+        )
+        print(f"[2/4] Аудио декодировано за {time.time() - extract_start:.2f} сек")
+    
+    if audio_input is None and audio_path is None and not long_form:
+        # Извлечение аудио из видео
+        print(f"[2/4] Извлечение аудио из видео...")
+        extract_start = time.time()
+        # WAV PCM s16le 16 кГц моно: размер известен по длительности - короткие записи в памяти
+        try:
+            output_path = temp_storage.create(".wav", int(duration * SAMPLE_RATE * 2) + 44)
+        except TempStorageFullError as e:
+            raise HTTPException(status_code=507, detail=str(e))
+        audio_path = video_processor.extract_audio(
+            input_path, audio_stream=media.audio_stream_index, start=range_start, end=range_end, cancel=cancel,
+            output_path=output_path
+        )
+        extract_time = time.time() - extract_start
+        audio_size = os.path.getsize(audio_path) if os.path.exists(audio_path) else 0
+        print(f"[2/4] Аудио извлечено: {audio_size / 1024 / 1024:.2f} MB за {extract_time:.2f} сек")
+    if audio_path is not None:
+        audio_input = audio_path
+    
+    # Запись уже распознавалась с другим количеством спикеров: транскрипция берется
+    # из хранилища задач, заново выполняется только diarization (эмбеддинги - из кэша)
+    stored_transcript = None
+    stored_language = None
+    reuse_key = _diarization_reuse_key(content_hash, params) if not long_form else None
+    stored_job = job_store.find_by_transcript_key(reuse_key) if reuse_key else None
+    if stored_job is not None:
+        stored_transcript = _job_transcript(stored_job)
+        # Сохраненное время - на шкале исходного файла, движку нужна шкала фрагмента
+        stored_transcript.shift(-range_start)
+        stored_language = stored_job["result"].get("language")
+        print(f"[3/4] Транскрипция из задачи {stored_job['job_id']} - распознавание пропущено, "
+              f"только diarization (спикеров: {num_speakers or 'авто'})")
+    
+    try:
+        # Распознавание речи
+        print(f"[3/4] Начало распознавания речи (модель: {model})...")
+        transcribe_start = time.time()
+        # Срок отсчитывается от приема запроса - распознаванию остается срок без извлечения аудио
+        transcribe_deadline = max(deadline_seconds - (transcribe_start - start_time), 1.0) if deadline_seconds else None
+        
+        if long_form:
+            if enable_diarization:
+                print(f"[MAIN] Режим длинных записей: онлайн-diarization по мере распознавания (WhisperX требует всю запись в памяти)")
+            try:
+                result = speech_service.transcribe_long_form(
+                    video_processor.stream_audio(
+                        input_path, LONG_FORM_WINDOW_SECONDS, audio_stream=media.audio_stream_index,
+                        start=range_start, end=range_end, cancel=cancel
+                    ),
+                    duration=duration,
+                    cancel=cancel,
+                    deadline_seconds=transcribe_deadline,
+                    language=language if language != "auto" else None,
+                    model=model,
+                    beam_size=beam_size,
+                    enable_diarization=enable_diarization,
+                    num_speakers=num_speakers,
+                    speaker_names=speaker_names_list,
+                    word_timestamps=word_timestamps,
+                    on_partial=functools.partial(_publish_partial, job_id, range_start) if job_id else None
+                )
+            except Exception as e:
+                print(f"[MAIN] ❌ Ошибка при транскрипции длинной записи: {e}")
+                import traceback
+                traceback.print_exc()
+                raise HTTPException(status_code=500, detail=f"Ошибка транскрипции: {str(e)}")
+        elif hasattr(speech_service, 'transcribe'):
+            # Оптимизированный сервис
+            print(f"[MAIN] Используется оптимизированный сервис")
+            print(f"[MAIN] Параметры транскрипции:")
+            print(f"  - audio: {audio_path or 'декодированное аудио из кэша'}")
+            print(f"  - language: {language if language != 'auto' else None}")
+            print(f"  - model: {model}")
+            print(f"  - beam_size: {beam_size}")
+            print(f"  - enable_diarization: {enable_diarization}")
+            print(f"  - num_speakers: {num_speakers}")
+            print(f"  - translate_to_english: {translate_to_english_value}")
+            print(f"  - word_timestamps: {word_timestamps}")
+            try:
+                if transcription_pool is not None:
+                    # Аудио передается процессу распознавания через разделяемую память
+                    print(f"[MAIN] Передача задачи в пул процессов распознавания...")
+                    transcribe = functools.partial(transcribe_shared, transcription_pool, audio_input, cancel=cancel)
+                else:
+                    print(f"[MAIN] Вызов speech_service.transcribe()...")
+                    transcribe = functools.partial(speech_service.transcribe, audio_path=audio_input, cancel=cancel)
+                result = transcribe(
+                    language=stored_language or (language if language != "auto" else None),
+                    model=model,
+                    beam_size=beam_size,
+                    enable_diarization=enable_diarization,
+                    num_speakers=num_speakers,
+                    speaker_names=speaker_names_list,
+                    translate_to_english=translate_to_english_value,
+                    word_timestamps=word_timestamps,
+                    deadline_seconds=transcribe_deadline,
+                    audio_key=_audio_key(content_hash, params),
+                    transcript=stored_transcript
+                )
+                print(f"[MAIN] ✓ Транскрипция завершена успешно")
+                print(f"[MAIN] Результат содержит: {len(_result_transcript(result, word_timestamps))} сегментов")
+            except Exception as e:
+                print(f"[MAIN] ❌ Ошибка при транскрипции: {e}")
+                import traceback
+                traceback.print_exc()
+                raise HTTPException(status_code=500, detail=f"Ошибка транскрипции: {str(e)}")
+        else:
+            # Стандартный сервис
+            print(f"Используется стандартный сервис")
+            try:
+                result = speech_service.transcribe(
+                    audio_path=audio_input,
+                    language=language if language != "auto" else None,
+                    model=model,
+                    word_timestamps=word_timestamps
+                )
+            except Exception as e:
+                print(f"❌ Ошибка при транскрипции: {e}")
+                import traceback
+                traceback.print_exc()
+                raise HTTPException(status_code=500, detail=f"Ошибка транскрипции: {str(e)}")
+        
+        transcribe_time = time.time() - transcribe_start
+        if cancel is not None:
+            # Результат отмененной задачи не сохраняется
+            cancel.check()
+        transcript = _result_transcript(result, word_timestamps)
+        result["duration"] = media.duration
+        if has_range:
+            # Время сегментов - на шкале исходного файла, а не фрагмента
+            transcript.shift(range_start)
+            if result.get("translated_segments"):
+                for seg in result["translated_segments"]:
+                    seg["start"] += range_start
+                    seg["end"] += range_start
+            for region in result.get("deadline", {}).get("regions", []):
+                region["start"] = round(region["start"] + range_start, 3)
+                region["end"] = round(region["end"] + range_start, 3)
+            result["range"] = {"start": range_start, "end": clip_end or None}
+        metrics.inc("conversions_total")
+        metrics.observe("transcribe_seconds", transcribe_time)
+        speed = f" ({duration / transcribe_time:.1f}x реального времени)" if duration and transcribe_time else ""
+        print(f"[3/4] Распознавание завершено за {transcribe_time:.2f} сек{speed}")
+        print(f"Результат: {len(result.get('text', ''))} символов, {len(transcript)} сегментов")
+        
+        # Отладочная информация о diarization
+        if enable_diarization:
+            print(f"✓ Diarization был запрошен пользователем")
+            if "speakers" in result:
+                num_speakers = result.get("num_speakers", 0)
+                print(f"✓ Разделение по спикерам: найдено {num_speakers} спикеров")
+                speakers_list = list(result.get("speakers", {}).keys())
+                print(f"  Спикеры: {speakers_list}")
+                if "formatted_text" in result:
+                    formatted_len = len(result["formatted_text"])
+                    print(f"✓ Форматированный текст создан ({formatted_len} символов)")
+                else:
+                    print(f"⚠️  Форматированный текст НЕ создан!")
+            else:
+                print(f"⚠️  Diarization был запрошен, но результат не содержит информации о спикерах!")
+        else:
+            print(f"ℹ️  Diarization НЕ был запрошен пользователем")
+        
+        # Используем форматированный текст, если есть (для diarization)
+        # Иначе используем обычный текст
+        display_text = result.get("formatted_text")
+        if not display_text:
+            display_text = result.get("text", "")
+            if enable_diarization:
+                print(f"⚠️  Используется обычный текст вместо форматированного!")
+        
+        # Сохраняем транскрипцию, чтобы субтитры можно было перегенерировать без распознавания
+        reuse_key = _diarization_reuse_key(content_hash, params) if "speakers" in result else None
+        job_id = job_store.save(
+            _job_result(result, transcript), params, content_hash, _transcript_key(content_hash, params), job_id,
+            alias_keys=[reuse_key] if reuse_key else []
+        )
+        
+        # Сегменты-словари создаются только здесь, при формировании ответа
+        response_data = {
+            "success": True,
+            "job_id": job_id,
+            "text": display_text,
+            "segments": transcript.to_segments(TIMESTAMP_PRECISION),
+            "language": result.get("language", "unknown"),
+            "duration": media.duration
+        }
+        if has_range:
+            response_data["range"] = result["range"]
+        
+        # Тайминги слов - колонками, а не словарем на каждое слово
+        if transcript.words is not None:
+            response_data["words"] = transcript.words_compact(TIMESTAMP_PRECISION)
+        
+        # Добавляем информацию о спикерах, если есть
+        if "speakers" in result:
+            response_data["speakers"] = result["speakers"]
+            response_data["num_speakers"] = result.get("num_speakers", 0)
+        
+        # Добавляем перевод, если есть
+        if result.get("has_translation") and result.get("translated_text"):
+            response_data["translated_text"] = result["translated_text"]
+            response_data["translated_language"] = result.get("translated_language", "en")
+            response_data["translated_segments"] = round_segments(
+                result.get("translated_segments", []), TIMESTAMP_PRECISION
+            )
+            response_data["has_translation"] = True
+            print(f"✓ Перевод добавлен в ответ: {len(result['translated_text'])} символов")
+        
+        total_time = time.time() - start_time
+        if result.get("deadline"):
+            # Участки с пониженным качеством; срок и время - от приема запроса
+            response_data["deadline"] = {
+                **result["deadline"],
+                "deadline_seconds": deadline_seconds,
+                "elapsed_seconds": round(total_time, 2),
+                "met": total_time <= deadline_seconds,
+            }
+        print(f"[4/4] Формирование ответа...")
+        print(f"{'='*60}")
+        print(f"=== КОНВЕРТАЦИЯ ЗАВЕРШЕНА УСПЕШНО ===")
+        print(f"Общее время: {total_time:.2f} сек ({total_time/60:.2f} мин)")
+        print(f"Текст: {len(response_data['text'])} символов")
+        print(f"Сегментов: {len(response_data['segments'])}")
+        print(f"{'='*60}\n")
+        
+        return response_data
+    
+    finally:
+        # Очистка извлеченного аудио (исходный файл, использованный без перекодирования, не удаляется)
+        if audio_path and audio_path != input_path and os.path.exists(audio_path):
+            os.unlink(audio_path)
+
+# Интервал опроса очереди процессом API в ожидании результата рабочего процесса
+QUEUE_POLL_INTERVAL = 0.5
+
+def _client_id(request: Request) -> str:
+    """
+    Клиент для справедливого разделения рабочих процессов: API-ключ (хэш) или IP
+    
+    Ключ не сохраняется в очереди в открытом виде.
+    """
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return request.client.host if request.client else "unknown"
+
+def _scoped_idempotency_key(request: Request, idempotency_key: Optional[str]) -> Optional[str]:
+    """
+    Idempotency-Key в пространстве клиента запроса
+
+    По ключу выдаются результат, прогноз и отмена задачи - другой клиент с тем
+    же значением ключа не получает доступа к чужой задаче.
+    """
+    return f"{_client_id(request)}/{idempotency_key}" if idempotency_key else None
+
+def _clip_duration(media: MediaInfo, params: Dict) -> float:
+    """Длительность распознаваемого аудио (ffprobe, с учетом диапазона)"""
+    start = params.get("start") or 0.0
+    end = params.get("end") if params.get("end") is not None else media.duration
+    if media.duration:
+        end = min(end, media.duration)
+    return max(end - start, 0.0)
+
+def _job_cost(media: MediaInfo, params: Dict) -> float:
+    """Оценка времени обработки по длительности и измеренному RTF модели и режима"""
+    return rtf_history.estimate(_clip_duration(media, params), params["model"], preset(params))
+
+async def _admission_load():
+    """
+    (оставшаяся работа, емкость) для прогноза ожидания: из очереди при ROLE=api,
+    иначе (None, None) - по задачам, принятым этим процессом
+    """
+    if job_queue is None:
+        return None, None
+    stats = await run_in_threadpool(job_queue.stats)
+    # Нет живых рабочих процессов - прогноз по настроенной емкости
+    return stats.get("backlog_seconds", 0.0), stats.get("capacity") or None
+
+async def _admit(expected_seconds: float = 0.0) -> Dict:
+    """
+    Контроль приема: прогноз {"wait_seconds", "eta_seconds"} или 429 с Retry-After
+
+    expected_seconds=0 - предварительная проверка до записи файла на диск.
+    """
+    backlog, capacity = await _admission_load()
+    try:
+        return admission.check(expected_seconds, backlog, capacity)
+    except AdmissionRejected as e:
+        raise _rejected(e)
+
+def _create_input_file(file: UploadFile) -> str:
+    """
+    Временный файл для загруженного файла запроса в SCRATCH_DIR
+
+    Файл - вход задачи в хранилище задач: после перезапуска контейнера задача
+    запускается заново с него, поэтому не в памяти (tmpfs не переживает
+    перезапуск). При ROLE=api его также читают рабочие процессы.
+    Если места недостаточно - 507.
+    """
+    suffix = Path(file.filename).suffix if file.filename else ".mp4"
+    try:
+        return temp_storage.create(
+            suffix, getattr(file, "size", None) or 0, shared=ROLE == "api", durable=True
+        )
+    except TempStorageFullError as e:
+        print(f"[TEMP_STORAGE] ❌ {e}")
+        raise HTTPException(status_code=507, detail=str(e))
+
+def _rejected(e: AdmissionRejected) -> HTTPException:
+    metrics.inc("admission_rejected_total")
+    print(f"[ADMISSION] ❌ {e} (Retry-After: {e.retry_after} сек)")
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def _run_remote_conversion(
+    input_path: str,
+    params: Dict,
+    start_time: float,
+    content_hash: Optional[str] = None,
+    client: Optional[str] = None,
+    media: Optional[MediaInfo] = None,
+    cancel: Optional[CancelToken] = None,
+    job_id: Optional[str] = None,
+    queue_id: Optional[str] = None
+) -> Dict:
+    """
+    Ставит конвертацию в очередь рабочим процессам (ROLE=api) и ждет результат
+    
+    Рабочий процесс выполняет _run_conversion с теми же аргументами, поэтому
+    input_path должен быть на общем хранилище (SCRATCH_DIR, UPLOAD_DIR).
+    Длительность для оценки стоимости задачи (полоса, доля клиента) берется
+    из ffprobe до постановки в очередь - файлы без аудио отклоняются сразу.
+    При отмене задача удаляется из очереди - рабочий процесс, который ее
+    выполняет, замечает это и останавливается.
+    Задача в очереди (queue_id) запоминается в хранилище задач: API,
+    перезапущенный во время ее выполнения, ждет ее же, а не ставит новую.
+    """
+    if media is None:
+        media = await run_in_threadpool(_preflight, input_path)
+    cost = _job_cost(media, params)
+    if queue_id is not None:
+        try:
+            await run_in_threadpool(job_queue.status, queue_id)
+            print(f"[QUEUE] Задача {queue_id} уже в очереди - ожидаем ее результат после перезапуска")
+        except JobQueueError:
+            queue_id = None
+    if queue_id is None:
+        queue_id = await run_in_threadpool(
+            job_queue.enqueue,
+            {
+                "input_path": os.path.abspath(input_path),
+                "params": params,
+                "start_time": start_time,
+                "content_hash": content_hash,
+                "job_id": job_id,
+            },
+            params["model"],
+            params["enable_diarization"] and not params["translate_to_english"],
+            cost,
+            client
+        )
+        print(f"[QUEUE] Задача {queue_id} поставлена в очередь (модель {params['model']}, "
+              f"оценка {cost:.0f} сек, клиент {client})")
+        if job_id:
+            await run_in_threadpool(job_store.set_queue_id, job_id, queue_id)
+    try:
+        while True:
+            state = await run_in_threadpool(job_queue.status, queue_id)
+            if state["status"] == DONE:
+                break
+            if state["status"] == FAILED:
+                error = state["error"] or {}
+                raise HTTPException(status_code=error.get("status_code", 500), detail=error.get("detail"))
+            if cancel is not None:
+                cancel.check()
+            await asyncio.sleep(QUEUE_POLL_INTERVAL)
+    finally:
+        await run_in_threadpool(job_queue.delete, queue_id)
+    response_data = state["result"]
+    print(f"[QUEUE] Задача {queue_id} выполнена рабочим процессом {state['worker_id']} "
+          f"за {time.time() - start_time:.2f} сек")
+    if state["claimed_at"] and state["finished_at"]:
+        rtf_history.record(
+            params["model"], preset(params), _clip_duration(media, params),
+            state["finished_at"] - state["claimed_at"]
+        )
+    # Транскрипцию сохранил рабочий процесс - запоминаем ее для повторного использования
+    if response_data.get("job_id"):
+        job_store.remember(_transcript_key(content_hash, params), response_data["job_id"])
+        if response_data.get("speakers"):
+            job_store.remember(_diarization_reuse_key(content_hash, params), response_data["job_id"])
+    return response_data
+
+# Интервал проверки отключения клиента, ожидающего результат конвертации
+DISCONNECT_POLL_INTERVAL = 1.0
+
+def _cancel_job(job_id_or_key: str, reason: str, keys: bool = True) -> bool:
+    """Отменяет выполняющуюся задачу (job_id, ключ single-flight или Idempotency-Key; keys=False - только job_id)"""
+    found = inflight_jobs.find(job_id_or_key, keys)
+    if found is None:
+        return False
+    job_id, job = found
+    if job["token"].cancel(reason):
+        print(f"[CANCEL] Задача {job_id}: {reason} - останавливаем обработку")
+    return True
+
+async def _watch_disconnect(request: Request, key: str) -> None:
+    """Отменяет задачу, когда отключились все клиенты, ожидающие ее результат"""
+    inflight_jobs.attach(key)
+    disconnected = False
+    try:
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+        disconnected = True
+    finally:
+        remaining = inflight_jobs.detach(key)
+    if disconnected and remaining == 0:
+        _cancel_job(key, "клиент отключился")
+
+async def _await_conversion(request: Optional[Request], key: str, conversion: Awaitable) -> Any:
+    """
+    Ожидает конвертацию, следя за отключением клиента
+
+    Отмененная задача (отключение, DELETE /api/jobs/{id}) завершает запрос с 499.
+    """
+    watcher = asyncio.ensure_future(_watch_disconnect(request, key)) if request is not None else None
+    try:
+        return await conversion
+    except JobCancelled as e:
+        raise HTTPException(status_code=499, detail=f"Задача отменена: {e.reason}")
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+async def _convert_single_flight(
+    input_path: str,
+    params: Dict,
+    content_hash: str,
+    start_time: float,
+    idempotency_key: Optional[str] = None,
+    cleanup_input: bool = False,
+    client: Optional[str] = None,
+    request: Optional[Request] = None,
+    job_id: Optional[str] = None,
+    queue_id: Optional[str] = None
+) -> Dict:
+    """
+    Конвертирует файл, объединяя одинаковые одновременные запросы
+    
+    Запросы с тем же хэшем файла и параметрами (или тем же Idempotency-Key)
+    ждут одну задачу конвертации. Готовые результаты берутся из кэша.
+    Задача отменяется, когда отключаются все ожидающие ее клиенты.
+    Состояние задачи записывается в хранилище задач: после остановки процесса
+    задача запускается заново (_recover_jobs).
+    
+    Args:
+        cleanup_input: удалить input_path после обработки (временный файл запроса)
+        client: клиент запроса (справедливая доля в очереди при ROLE=api)
+        request: запрос, отключение которого отслеживается
+        job_id: идентификатор перезапускаемой задачи (None - новая задача)
+        queue_id: идентификатор перезапускаемой задачи в очереди рабочих процессов (ROLE=api)
+    """
+    cache_key = result_cache.make_key(content_hash, params)
+    response_data = result_cache.get(cache_key)
+    if response_data is not None:
+        print(f"✓ Найден готовый результат для sha256={content_hash[:12]} - обработка пропущена")
+        if cleanup_input and os.path.exists(input_path):
+            os.unlink(input_path)
+        return response_data
+    
+    leader = False
+    # Идентификатор выдается при приеме: по нему задачу можно отменить до завершения
+    job_id = job_id or uuid.uuid4().hex
+    
+    async def compute(cancel: CancelToken) -> Dict:
+        ticket = None
+        expected = 0.0
+        run_start = None
+        # Остановка процесса (отмена asyncio-задачи) - входной файл нужен для перезапуска
+        keep_input = False
+        try:
+            # Длительность (ffprobe) нужна для прогноза до постановки задачи
+            media = await run_in_threadpool(_preflight, input_path)
+            expected = _job_cost(media, params)
+            prediction = await _admit(expected)
+            ticket = admission.admit(expected, prediction["eta_seconds"], idempotency_key)
+            print(f"[ADMISSION] Задача {job_id} принята: ожидание ~{prediction['wait_seconds']:.0f} сек, "
+                  f"готовность ~{prediction['eta_seconds']:.0f} сек")
+            cancel.check()
+            await run_in_threadpool(
+                job_store.start, job_id, params, content_hash, os.path.abspath(input_path), cleanup_input, client
+            )
+            run_start = time.time()
+            # Конвертация выполняется в пуле потоков, чтобы не блокировать event loop
+            # (иначе другие запросы не смогли бы присоединиться к задаче)
+            if ROLE == "api":
+                data = await _run_remote_conversion(
+                    input_path, params, start_time, content_hash, client, media, cancel, job_id, queue_id
+                )
+            else:
+                data = await run_in_threadpool(
+                    _run_conversion, input_path, params, start_time, content_hash, media, cancel, job_id
+                )
+                # Одновременные задачи делят процессор - время приводится к одной задаче на слот
+                rtf_history.record(
+                    params["model"], preset(params), _clip_duration(media, params),
+                    (time.time() - run_start) * admission.share()
+                )
+            data["content_hash"] = content_hash
+            result_cache.put(cache_key, data)
+            return data
+        except JobCancelled as e:
+            # Сэкономлено - оставшаяся по прогнозу (RTF) часть работы
+            elapsed = time.time() - run_start if run_start else 0.0
+            saved = max(expected - elapsed, 0.0)
+            metrics.inc("jobs_cancelled_total")
+            metrics.inc("cancelled_cpu_seconds_saved", saved)
+            print(f"[CANCEL] Задача {job_id} остановлена через {elapsed:.1f} сек ({e.reason}), "
+                  f"сэкономлено ~{saved:.0f} сек вычислений")
+            await run_in_threadpool(
+                job_store.fail, job_id, {"status_code": 499, "detail": f"Задача отменена: {e.reason}"}, CANCELLED
+            )
+            raise
+        except HTTPException as e:
+            await run_in_threadpool(job_store.fail, job_id, {"status_code": e.status_code, "detail": e.detail})
+            raise
+        except asyncio.CancelledError:
+            keep_input = True
+            raise
+        except Exception as e:
+            await run_in_threadpool(job_store.fail, job_id, {"status_code": 500, "detail": str(e)})
+            raise
+        finally:
+            inflight_jobs.unregister(job_id)
+            if ticket is not None:
+                admission.release(ticket)
+            if cleanup_input and not keep_input and os.path.exists(input_path):
+                os.unlink(input_path)
+    
+    def start():
+        # Вызывается синхронно только для первого запроса с этим ключом
+        nonlocal leader
+        leader = True
+        return compute(inflight_jobs.register(job_id, cache_key, idempotency_key))
+    
+    try:
+        response_data, shared = await _await_conversion(
+            request, cache_key, single_flight.do(cache_key, start, idempotency_key)
+        )
+    finally:
+        # Файл присоединившегося запроса не нужен - работает файл первого запроса
+        if cleanup_input and not leader and os.path.exists(input_path):
+            os.unlink(input_path)
+    if shared:
+        print(f"✓ Результат получен от задачи, запущенной другим запросом (sha256={content_hash[:12]})")
+    return response_data
+
 @app.post("/api/convert")
 async def convert_video_to_text(
+    request: Request,
     file: UploadFile = File(...),
     language: str = Form("auto"),
     model: str = Form("base"),
@@ -250,7 +1472,13 @@ async def convert_video_to_text(
     enable_diarization: bool = Form(False),
     num_speakers: Optional[int] = Form(None),
     speaker_names: Optional[str] = Form(None),
-    translate_to_english: Optional[bool] = Form(False)
+    translate_to_english: Optional[bool] = Form(False),
+    word_timestamps: bool = Form(False),
+    start: Optional[str] = Form(None),
+    end: Optional[str] = Form(None),
+    deadline_seconds: Optional[float] = Form(None),
+    fields: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
     Конвертирует видео в текст
@@ -259,8 +1487,14 @@ async def convert_video_to_text(
     - file: видео файл
     - language: язык распознавания (код ISO, например 'ru', 'en', 'auto')
     - model: модель Whisper (tiny, base, small, medium, large)
+    - word_timestamps: тайминги слов (поле words: segment_index, start, end, probability, text)
+    - start, end: распознать только диапазон (секунды или ЧЧ:ММ:СС); время в ответе -
+      по шкале исходного файла
+    - deadline_seconds: срок (от приема запроса) - при отставании оставшееся аудио распознается
+      быстрее (жадное декодирование, модель меньше), участки - в поле deadline.regions
+    - fields: поля ответа через запятую (например "text,segments"); по умолчанию - все
+    - Idempotency-Key (заголовок): повторы с тем же ключом получают результат первого запроса
     """
-    import time
     start_time = time.time()
     
     print(f"\n{'='*60}")
@@ -270,49 +1504,44 @@ async def convert_video_to_text(
         print(f"Размер: {file.size if hasattr(file, 'size') else 'неизвестно'} байт")
     except Exception as e:
         print(f"⚠️  Ошибка при чтении информации о файле: {e}")
-    print(f"Настройки: язык={language}, модель={model}, beam_size={beam_size}")
-    print(f"Diarization: {enable_diarization}, спикеров={num_speakers}")
-    # Обрабатываем translate_to_english как опциональный параметр (для совместимости)
-    translate_to_english_value = translate_to_english if translate_to_english is not None else False
-    print(f"Перевод на английский: {translate_to_english_value}")
-    if translate_to_english_value and enable_diarization:
-        print("⚠️  Внимание: Diarization отключен при переводе на английский (несовместимо)")
+    params = _conversion_params(
+        language, model, beam_size, enable_diarization,
+        num_speakers, speaker_names, translate_to_english, word_timestamps, start, end, deadline_seconds
+    )
+    print(f"{'='*60}\n")
     
-    # Парсим имена спикеров из JSON
-    speaker_names_list = []
-    if speaker_names:
-        try:
-            import json
-            speaker_names_list = json.loads(speaker_names)
-            print(f"Имена спикеров: {speaker_names_list}")
-        except json.JSONDecodeError as e:
-            print(f"⚠️  Ошибка при парсинге имен спикеров (невалидный JSON): {e}")
-            print(f"   Полученная строка: {speaker_names}")
-        except Exception as e:
-            print(f"⚠️  Ошибка при парсинге имен спикеров: {e}")
-            import traceback
-            traceback.print_exc()
+    # Повтор запроса (например, после таймаута на клиенте) с тем же Idempotency-Key
+    # получает результат уже запущенной задачи - файл даже не сохраняется
+    idempotency_key = _scoped_idempotency_key(request, idempotency_key)
+    existing_task = single_flight.lookup(idempotency_key)
+    if existing_task is not None:
+        print(f"✓ Idempotency-Key {idempotency_key} уже обрабатывается - ожидаем результат")
+        response_data = await _await_conversion(request, idempotency_key, single_flight.wait(existing_task))
+        return await _encoded_response(request, response_data, fields)
     
-    print(f"{'='*60}\n")
+    # При перегрузке запрос отклоняется до записи файла на диск
+    await _admit()
     
     try:
         # Сохранение временного файла (используем более надежный способ для больших файлов)
-        suffix = Path(file.filename).suffix if file.filename else ".mp4"
-        tmp_path = tempfile.NamedTemporaryFile(delete=False, suffix=suffix).name
+        tmp_path = _create_input_file(file)
         
         print(f"[1/4] Сохранение файла: {tmp_path}")
         print(f"Начало чтения файла из запроса...")
         save_start = time.time()
         
         # Сохраняем файл по частям для больших файлов (асинхронно)
+        # Хэш содержимого считается по ходу записи - по нему ищется готовый результат
         bytes_written = 0
         chunk_size = 1024 * 1024  # 1 MB chunks
+        hasher = hashlib.sha256()
         with open(tmp_path, "wb") as tmp_file:
             while True:
                 chunk = await file.read(chunk_size)
                 if not chunk:
                     break
                 tmp_file.write(chunk)
+                hasher.update(chunk)
                 bytes_written += len(chunk)
                 if bytes_written % (10 * 1024 * 1024) == 0:  # Каждые 10 MB
                     print(f"  Записано: {bytes_written / 1024 / 1024:.1f} MB...")
@@ -321,216 +1550,538 @@ async def convert_video_to_text(
         
         file_size = os.path.getsize(tmp_path)
         save_time = time.time() - save_start
-        print(f"[1/4] Файл сохранен: {file_size / 1024 / 1024:.2f} MB за {save_time:.2f} сек")
+        content_hash = hasher.hexdigest()
+        print(f"[1/4] Файл сохранен: {file_size / 1024 / 1024:.2f} MB за {save_time:.2f} сек (sha256={content_hash[:12]})")
         
+        # Временный файл удаляется задачей конвертации (или сразу, если
+        # запрос присоединился к уже выполняющейся задаче)
+        response_data = await _convert_single_flight(
+            tmp_path, params, content_hash, start_time,
+            idempotency_key=idempotency_key, cleanup_input=True, client=_client_id(request), request=request
+        )
+        return await _encoded_response(request, response_data, fields)
+    
+    except HTTPException:
+        # Ошибки с кодом (400 - файл без аудио и т.п.) передаются клиенту как есть
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- Возобновляемая загрузка по частям ---
+# 1. POST /api/uploads                  - создать сессию (filename, size, опционально sha256)
+# 2. PUT  /api/uploads/{id}             - отправить диапазон байт (заголовок Content-Range)
+# 3. GET  /api/uploads/{id}             - узнать текущее смещение (для возобновления)
+# 4. POST /api/uploads/{id}/finalize    - завершить загрузку и запустить конвертацию
+
+def _iter_body(stream: AsyncIterator[bytes]) -> Iterator[bytes]:
+    """
+    Тело запроса как синхронный итератор для кода в пуле потоков
+
+    Части читаются в event loop по мере записи - тело не собирается в памяти целиком.
+    """
+    async def next_chunk() -> bytes:
+        return await stream.__anext__()
+
+    while True:
         try:
-            # Извлечение аудио из видео
-            print(f"[2/4] Извлечение аудио из видео...")
-            extract_start = time.time()
-            audio_path = video_processor.extract_audio(tmp_path)
-            extract_time = time.time() - extract_start
-            audio_size = os.path.getsize(audio_path) if os.path.exists(audio_path) else 0
-            print(f"[2/4] Аудио извлечено: {audio_size / 1024 / 1024:.2f} MB за {extract_time:.2f} сек")
-            
-            # Распознавание речи
-            print(f"[3/4] Начало распознавания речи (модель: {model})...")
-            transcribe_start = time.time()
-            
-            if hasattr(speech_service, 'transcribe'):
-                # Оптимизированный сервис
-                print(f"[MAIN] Используется оптимизированный сервис")
-                print(f"[MAIN] Параметры транскрипции:")
-                print(f"  - audio_path: {audio_path}")
-                print(f"  - language: {language if language != 'auto' else None}")
-                print(f"  - model: {model}")
-                print(f"  - beam_size: {beam_size}")
-                print(f"  - enable_diarization: {enable_diarization}")
-                print(f"  - num_speakers: {num_speakers}")
-                print(f"  - translate_to_english: {translate_to_english}")
-                try:
-                    print(f"[MAIN] Вызов speech_service.transcribe()...")
-                    result = speech_service.transcribe(
-                        audio_path=audio_path,
-                        language=language if language != "auto" else None,
-                        model=model,
-                        beam_size=beam_size,
-                        enable_diarization=enable_diarization,
-                        num_speakers=num_speakers,
-                        speaker_names=speaker_names_list,
-                        translate_to_english=translate_to_english_value
-                    )
-                    print(f"[MAIN] ✓ Транскрипция завершена успешно")
-                    print(f"[MAIN] Результат содержит: {len(result.get('segments', []))} сегментов")
-                except Exception as e:
-                    print(f"[MAIN] ❌ Ошибка при транскрипции: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    raise HTTPException(status_code=500, detail=f"Ошибка транскрипции: {str(e)}")
-            else:
-                # Стандартный сервис
-                print(f"Используется стандартный сервис")
-                try:
-                    result = speech_service.transcribe(
-                        audio_path=audio_path,
-                        language=language if language != "auto" else None,
-                        model=model
-                    )
-                except Exception as e:
-                    print(f"❌ Ошибка при транскрипции: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    raise HTTPException(status_code=500, detail=f"Ошибка транскрипции: {str(e)}")
-            
-            transcribe_time = time.time() - transcribe_start
-            print(f"[3/4] Распознавание завершено за {transcribe_time:.2f} сек")
-            print(f"Результат: {len(result.get('text', ''))} символов, {len(result.get('segments', []))} сегментов")
-            
-            # Отладочная информация о diarization
-            if enable_diarization:
-                print(f"✓ Diarization был запрошен пользователем")
-                if "speakers" in result:
-                    num_speakers = result.get("num_speakers", 0)
-                    print(f"✓ Разделение по спикерам: найдено {num_speakers} спикеров")
-                    speakers_list = list(result.get("speakers", {}).keys())
-                    print(f"  Спикеры: {speakers_list}")
-                    if "formatted_text" in result:
-                        formatted_len = len(result["formatted_text"])
-                        print(f"✓ Форматированный текст создан ({formatted_len} символов)")
-                    else:
-                        print(f"⚠️  Форматированный текст НЕ создан!")
-                else:
-                    print(f"⚠️  Diarization был запрошен, но результат не содержит информации о спикерах!")
-            else:
-                print(f"ℹ️  Diarization НЕ был запрошен пользователем")
-            
-            # Используем форматированный текст, если есть (для diarization)
-            # Иначе используем обычный текст
-            display_text = result.get("formatted_text")
-            if not display_text:
-                display_text = result.get("text", "")
-                if enable_diarization:
-                    print(f"⚠️  Используется обычный текст вместо форматированного!")
-            
-            response_data = {
-                "success": True,
-                "text": display_text,
-                "segments": result.get("segments", []),
-                "language": result.get("language", "unknown")
-            }
-            
-            # Добавляем информацию о спикерах, если есть
-            if "speakers" in result:
-                response_data["speakers"] = result["speakers"]
-                response_data["num_speakers"] = result.get("num_speakers", 0)
-            
-            # Добавляем перевод, если есть
-            if result.get("has_translation") and result.get("translated_text"):
-                response_data["translated_text"] = result["translated_text"]
-                response_data["translated_language"] = result.get("translated_language", "en")
-                response_data["translated_segments"] = result.get("translated_segments", [])
-                response_data["has_translation"] = True
-                print(f"✓ Перевод добавлен в ответ: {len(result['translated_text'])} символов")
-            
-            total_time = time.time() - start_time
-            print(f"[4/4] Формирование ответа...")
-            print(f"{'='*60}")
-            print(f"=== КОНВЕРТАЦИЯ ЗАВЕРШЕНА УСПЕШНО ===")
-            print(f"Общее время: {total_time:.2f} сек ({total_time/60:.2f} мин)")
-            print(f"Текст: {len(response_data['text'])} символов")
-            print(f"Сегментов: {len(response_data['segments'])}")
-            print(f"{'='*60}\n")
-            
-            return JSONResponse(content=response_data)
-        
-        finally:
-            # Очистка временных файлов
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-            if os.path.exists(audio_path):
-                os.unlink(audio_path)
+            yield anyio.from_thread.run(next_chunk)
+        except StopAsyncIteration:
+            return
+
+def _parse_content_range(content_range: Optional[str], upload_offset: Optional[str]) -> int:
+    """Возвращает начальное смещение диапазона из Content-Range или Upload-Offset"""
+    if content_range:
+        # Формат: "bytes 0-1048575/5242880"
+        try:
+            unit, range_spec = content_range.strip().split(" ", 1)
+            if unit != "bytes":
+                raise ValueError(unit)
+            return int(range_spec.split("-", 1)[0])
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Некорректный Content-Range: {content_range}")
+    if upload_offset is not None:
+        try:
+            return int(upload_offset)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Некорректный Upload-Offset: {upload_offset}")
+    return 0
+
+@app.post("/api/uploads")
+async def create_upload(
+    filename: str = Form(...),
+    size: int = Form(...),
+    sha256: Optional[str] = Form(None)
+):
+    """
+    Создает сессию загрузки
+    
+    Если передан sha256 уже загруженного файла, сессия сразу завершена (complete=true)
+    и передавать данные не нужно - можно сразу вызывать finalize.
+    При перегрузке - 429 с Retry-After до начала загрузки.
+    """
+    await _admit()
+    try:
+        session = await run_in_threadpool(upload_manager.create, filename, size, sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session.to_dict()
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Состояние сессии загрузки (offset - с какого байта продолжать)"""
+    try:
+        session = await run_in_threadpool(upload_manager.get, upload_id)
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return session.to_dict()
+
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    content_range: Optional[str] = Header(None),
+    upload_offset: Optional[str] = Header(None)
+):
+    """Принимает очередной диапазон байт файла (429, если временный диск заполнен)"""
+    offset = _parse_content_range(content_range, upload_offset)
+    try:
+        # Начатые загрузки не прерываются из-за очереди - только из-за диска
+        admission.check_disk()
+    except AdmissionRejected as e:
+        raise _rejected(e)
+    try:
+        session = await run_in_threadpool(upload_manager.write, upload_id, offset, _iter_body(request.stream()))
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadOffsetError as e:
+        # Клиент должен продолжить с ожидаемого смещения
+        return JSONResponse(
+            status_code=409,
+            content={"detail": str(e), "offset": e.expected_offset}
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session.to_dict()
+
+@app.delete("/api/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    """Отменяет загрузку и удаляет частичный файл"""
+    await run_in_threadpool(upload_manager.delete, upload_id)
+    return {"success": True}
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload(
+    request: Request,
+    upload_id: str,
+    language: str = Form("auto"),
+    model: str = Form("base"),
+    beam_size: int = Form(5),
+    enable_diarization: bool = Form(False),
+    num_speakers: Optional[int] = Form(None),
+    speaker_names: Optional[str] = Form(None),
+    translate_to_english: Optional[bool] = Form(False),
+    word_timestamps: bool = Form(False),
+    start: Optional[str] = Form(None),
+    end: Optional[str] = Form(None),
+    deadline_seconds: Optional[float] = Form(None),
+    fields: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    Завершает загрузку и конвертирует файл (параметры - как у /api/convert)
+    
+    Если для файла с таким хэшем и параметрами уже есть результат,
+    он возвращается без повторной обработки.
+    """
+    start_time = time.time()
+    print(f"\n{'='*60}")
+    print(f"=== ФИНАЛИЗАЦИЯ ЗАГРУЗКИ {upload_id} ===")
+    params = _conversion_params(
+        language, model, beam_size, enable_diarization,
+        num_speakers, speaker_names, translate_to_english, word_timestamps, start, end, deadline_seconds
+    )
+    print(f"{'='*60}\n")
+    
+    idempotency_key = _scoped_idempotency_key(request, idempotency_key)
+    try:
+        session = await run_in_threadpool(upload_manager.finalize, upload_id)
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
+    try:
+        response_data = await _convert_single_flight(
+            session.stored_path, params, session.sha256, start_time,
+            idempotency_key=idempotency_key, cleanup_input=False, client=_client_id(request), request=request
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return await _encoded_response(request, response_data, fields)
+
+# Форматы субтитров в JSON-ответе (файлы всех EXPORT_FORMATS - через /api/jobs/{id}/export)
+SUBTITLE_FORMATS = ("srt", "vtt")
+
+def _check_subtitle_format(format: str) -> None:
+    """400 для неподдерживаемого формата - до загрузки и распознавания"""
+    if format.lower() not in SUBTITLE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неподдерживаемый формат субтитров: {format}. Доступны: {', '.join(SUBTITLE_FORMATS)}"
+        )
+
+def _render_subtitles(
+    result: Dict,
+    format: str,
+    include_speakers: bool = False,
+    speaker_names: Optional[List[str]] = None,
+    word_timing: bool = False
+) -> str:
+    """Генерирует субтитры из результата распознавания (без повторного распознавания)"""
+    if OPTIMIZED_AVAILABLE and isinstance(speech_service, OptimizedSpeechRecognitionService):
+        return speech_service.generate_subtitles(
+            result,
+            format=format,
+            include_speakers=include_speakers,
+            speaker_names=speaker_names,
+            word_timing=word_timing
+        )
+    return speech_service.generate_subtitles(result, format=format)
+
+def _subtitles_response(
+    job: Dict,
+    format: str,
+    include_speakers: bool = False,
+    speaker_names: Optional[List[str]] = None,
+    word_timing: bool = False
+) -> Dict:
+    """Формирует ответ с субтитрами из сохраненной задачи"""
+    result = job["result"]
+    transcript = _job_transcript(job)
+    subtitles = _render_subtitles(
+        {"segments": transcript.iter_segments(include_words=word_timing)},
+        format, include_speakers, speaker_names, word_timing
+    )
+    
+    response_data = {
+        "success": True,
+        "job_id": job["job_id"],
+        "text": transcript.full_text(),
+        "subtitles": subtitles,
+        "format": format,
+        "language": result.get("language", "unknown")
+    }
+    
+    # Добавляем информацию о спикерах, если есть
+    if transcript.has_speakers:
+        response_data["speakers"] = transcript.texts_by_speaker()
+        response_data["num_speakers"] = len(response_data["speakers"])
+    
+    return response_data
 
 @app.post("/api/convert-with-subtitles")
 async def convert_with_subtitles(
+    request: Request,
     file: UploadFile = File(...),
     language: str = Form("auto"),
     model: str = Form("base"),
-    format: str = Form("srt"),  # srt или vtt
+    format: str = Form("srt"),
     beam_size: int = Form(5),
     enable_diarization: bool = Form(False),
     num_speakers: Optional[int] = Form(None),
-    include_speakers: bool = Form(False)
+    include_speakers: bool = Form(False),
+    word_timestamps: bool = Form(False),
+    start: Optional[str] = Form(None),
+    end: Optional[str] = Form(None),
+    deadline_seconds: Optional[float] = Form(None),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
     Конвертирует видео в текст с субтитрами
+    
+    Если этот файл уже распознавался с теми же параметрами (например, через
+    /api/convert), субтитры строятся из сохраненной транскрипции.
+    word_timestamps - VTT с тегами времени слов (караоке).
+    start, end - субтитры только для диапазона (секунды или ЧЧ:ММ:СС).
+    deadline_seconds - срок распознавания (качество снижается при отставании).
+    format - SUBTITLE_FORMATS (srt, vtt); другой формат - 400 до загрузки файла.
+    Idempotency-Key (заголовок) - как у /api/convert: повтор ждет уже запущенную задачу,
+    прогноз и отмена - через /api/admission и DELETE /api/jobs/{id}.
     """
+    start_time = time.time()
+    params = _conversion_params(
+        language, model, beam_size, enable_diarization,
+        num_speakers, None, False, word_timestamps, start, end, deadline_seconds
+    )
+    _check_subtitle_format(format)
+    subtitles_options = dict(include_speakers=include_speakers and enable_diarization, word_timing=word_timestamps)
+    
+    idempotency_key = _scoped_idempotency_key(request, idempotency_key)
+    existing_task = single_flight.lookup(idempotency_key)
+    if existing_task is not None:
+        print(f"✓ Idempotency-Key {idempotency_key} уже обрабатывается - ожидаем результат")
+        response_data = await _await_conversion(request, idempotency_key, single_flight.wait(existing_task))
+        job = await run_in_threadpool(job_store.get, response_data["job_id"])
+        return JSONResponse(content=_subtitles_response(job, format, **subtitles_options))
+    
+    await _admit()
+    
     try:
         # Сохранение временного файла (используем более надежный способ для больших файлов)
-        suffix = Path(file.filename).suffix if file.filename else ".mp4"
-        tmp_path = tempfile.NamedTemporaryFile(delete=False, suffix=suffix).name
+        tmp_path = _create_input_file(file)
         
-        # Сохраняем файл по частям для больших файлов
+        # Сохраняем файл по частям для больших файлов, считая хэш содержимого
+        hasher = hashlib.sha256()
         with open(tmp_path, "wb") as tmp_file:
-            shutil.copyfileobj(file.file, tmp_file)
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                tmp_file.write(chunk)
+                hasher.update(chunk)
+        content_hash = hasher.hexdigest()
         
-        try:
-            audio_path = video_processor.extract_audio(tmp_path)
-            
-            # Распознавание речи
-            if hasattr(speech_service, 'transcribe'):
-                # Оптимизированный сервис
-                result = speech_service.transcribe(
-                    audio_path=audio_path,
-                    language=language if language != "auto" else None,
-                    model=model,
-                    beam_size=beam_size,
-                    enable_diarization=enable_diarization,
-                    num_speakers=num_speakers
-                )
-            else:
-                # Стандартный сервис
-                result = speech_service.transcribe(
-                    audio_path=audio_path,
-                    language=language if language != "auto" else None,
-                    model=model
-                )
-            
-            # Генерация субтитров
-            if hasattr(speech_service, 'generate_subtitles'):
-                subtitles = speech_service.generate_subtitles(
-                    result, 
-                    format=format,
-                    include_speakers=include_speakers and enable_diarization
-                )
-            else:
-                subtitles = speech_service.generate_subtitles(result, format=format)
-            
-            response_data = {
-                "success": True,
-                "text": result["text"],
-                "subtitles": subtitles,
-                "format": format,
-                "language": result.get("language", "unknown")
-            }
-            
-            # Добавляем информацию о спикерах, если есть
-            if "speakers" in result:
-                response_data["speakers"] = result["speakers"]
-                response_data["num_speakers"] = result.get("num_speakers", 0)
-            
-            return JSONResponse(content=response_data)
+        job = await run_in_threadpool(job_store.find_by_transcript_key, _transcript_key(content_hash, params))
+        if job is not None:
+            print(f"✓ Найдена сохраненная транскрипция (задача {job['job_id']}) - распознавание пропущено")
+            os.unlink(tmp_path)
+        else:
+            response_data = await _convert_single_flight(
+                tmp_path, params, content_hash, start_time, idempotency_key=idempotency_key,
+                cleanup_input=True, client=_client_id(request), request=request
+            )
+            job = await run_in_threadpool(job_store.get, response_data["job_id"])
         
-        finally:
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-            if os.path.exists(audio_path):
-                os.unlink(audio_path)
+        return JSONResponse(content=_subtitles_response(job, format, **subtitles_options))
     
+    except HTTPException:
+        # Ошибки с кодом (400 - файл без аудио и т.п.) передаются клиенту как есть
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _parse_speaker_names_query(speaker_names: Optional[str]) -> List[str]:
+    """Имена спикеров из query-параметра: JSON-массив или список через запятую"""
+    if not speaker_names:
+        return []
+    if speaker_names.lstrip().startswith("["):
+        return _parse_speaker_names(speaker_names)
+    return [name.strip() for name in speaker_names.split(",")]
+
+@app.get("/api/jobs")
+async def list_jobs(content_hash: str, limit: int = 100):
+    """
+    Задачи файла по SHA-256 содержимого (новые первыми, без результатов)
+
+    По списку клиент находит уже распознанные варианты файла (модель, diarization,
+    диапазон) и забирает нужный через GET /api/jobs/{job_id} без повторной загрузки.
+    """
+    jobs = await run_in_threadpool(job_store.find_by_content_hash, content_hash.lower(), min(max(limit, 1), 1000))
+    return {"jobs": [_job_view(job) for job in jobs]}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(request: Request, job_id: str, fields: Optional[str] = None):
+    """
+    Возвращает сохраненный результат задачи
+
+    Задача записывается при приеме: status - running, done, failed или cancelled;
+    результат (result) есть только у выполненной. У выполняющейся длинной записи
+    segments - сегменты, распознанные на данный момент (со speaker при онлайн-
+    diarization), по мере готовности. Задачи, прерванные остановкой
+    сервера, выполняются заново после запуска - их результат забирается здесь.
+    fields - поля верхнего уровня через запятую (например "job_id,params,result")
+    """
+    try:
+        job = await run_in_threadpool(job_store.get, job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return await _encoded_response(request, _job_view(job), fields)
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str, request: Request):
+    """
+    Отменяет выполняющуюся задачу: job_id (из /api/admission) или Idempotency-Key запроса
+
+    Idempotency-Key действует только для задач того же клиента. Обработка
+    останавливается (ffmpeg, распознавание, diarization), временные
+    файлы удаляются, ожидающие запросы завершаются с 499.
+    """
+    reason = "удалена через DELETE /api/jobs"
+    if _cancel_job(job_id, reason, keys=False) or _cancel_job(_scoped_idempotency_key(request, job_id), reason):
+        return {"success": True, "job_id": job_id, "cancelled": True}
+    try:
+        await run_in_threadpool(job_store.get, job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    raise HTTPException(status_code=409, detail=f"Задача {job_id} уже завершена")
+
+@app.get("/api/jobs/{job_id}/subtitles")
+async def get_job_subtitles(
+    job_id: str,
+    format: str = "srt",
+    include_speakers: bool = False,
+    speaker_names: Optional[str] = None,
+    word_timing: bool = False
+):
+    """
+    Перегенерирует субтитры из сохраненной транскрипции задачи
+    
+    Parameters:
+    - format: srt или vtt
+    - include_speakers: добавлять метки спикеров
+    - speaker_names: имена спикеров (JSON-массив или через запятую) вместо SPEAKER_XX
+    - word_timing: теги времени слов в VTT (если задача распознавалась с word_timestamps)
+    """
+    _check_subtitle_format(format)
+    try:
+        job = _finished_job(await run_in_threadpool(job_store.get, job_id))
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        response_data = _subtitles_response(
+            job, format, include_speakers, _parse_speaker_names_query(speaker_names), word_timing
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(content=response_data)
+
+@app.get("/api/jobs/{job_id}/export")
+async def export_job(
+    job_id: str,
+    format: str = "srt",
+    include_speakers: bool = False,
+    speaker_names: Optional[str] = None,
+    word_timing: bool = False
+):
+    """
+    Скачивание транскрипции задачи файлом (без JSON-обертки)
+    
+    Файл формируется потоково из сохраненных сегментов.
+    
+    Parameters:
+    - format: srt, vtt, tsv, jsonl или ass
+    - include_speakers: добавлять метки спикеров
+    - speaker_names: имена спикеров (JSON-массив или через запятую) вместо SPEAKER_XX
+    - word_timing: использовать тайминги слов (караоке в VTT/ASS, строка на слово в TSV,
+      массив words в JSON Lines); задача должна быть распознана с word_timestamps
+    """
+    exporter = EXPORT_FORMATS.get(format.lower())
+    if exporter is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неподдерживаемый формат: {format}. Доступны: {', '.join(EXPORT_FORMATS)}"
+        )
+    _, media_type, extension = exporter
+    
+    try:
+        job = _finished_job(await run_in_threadpool(job_store.get, job_id))
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    names = _parse_speaker_names_query(speaker_names)
+    speaker_label = None
+    if names and OPTIMIZED_AVAILABLE and isinstance(speech_service, OptimizedSpeechRecognitionService):
+        speaker_label = lambda speaker: speech_service._format_speaker_name(speaker, names)
+    
+    parts = export_transcript(
+        _job_transcript(job).iter_segments(include_words=word_timing),
+        format=format,
+        include_speakers=include_speakers,
+        speaker_label=speaker_label,
+        word_timing=word_timing
+    )
+    return StreamingResponse(
+        iter_encoded(parts),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{job_id}.{extension}"'}
+    )
+
+# Добавляем маршрут для статики (frontend) если развернуто на Spaces
+# ВАЖНО: регистрируется последним, чтобы SPA fallback (GET /{full_path:path})
+# не перехватывал GET-маршруты API, объявленные выше
+# Проверяем несколько возможных путей
+static_dirs = [
+    os.path.join(os.path.dirname(__file__), "..", "static"),  # Локальная разработка
+    "/app/static",  # Hugging Face Spaces
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "static"),  # Альтернативный путь
+]
+
+static_dir = None
+for dir_path in static_dirs:
+    if os.path.exists(dir_path):
+        static_dir = dir_path
+        break
+
+if static_dir:
+    from fastapi.responses import Response
+    from app.services.static_files import PrecompressedStaticFiles, SpaShell, precompress_directory
+    
+    # Монтируем статику на /static
+    app.mount("/static", PrecompressedStaticFiles(directory=static_dir), name="static")
+    
+    # Также монтируем /assets для прямого доступа к assets из HTML
+    # (имена файлов содержат хэш содержимого - кэшируются браузером без проверки)
+    assets_dir = os.path.join(static_dir, "assets")
+    if os.path.exists(assets_dir):
+        app.mount("/assets", PrecompressedStaticFiles(directory=assets_dir, immutable=True), name="assets")
+    
+    # Оболочка SPA читается один раз - запросы отдаются из памяти (с ETag и сжатием)
+    index_path = os.path.join(static_dir, "index.html")
+    spa_shell: Optional[SpaShell] = None
+    if os.path.exists(index_path):
+        spa_shell = SpaShell(index_path)
+        print(f"✓ index.html загружен в память из {index_path} ({len(spa_shell.body)} байт, "
+              f"сжатые варианты: {', '.join(spa_shell.variants) or 'нет'})")
+    else:
+        print(f"⚠️ index.html не найден в {index_path}")
+        print(f"   Содержимое static_dir ({static_dir}):")
+        try:
+            for item in os.listdir(static_dir):
+                print(f"     - {item}")
+        except Exception as e:
+            print(f"     Ошибка при чтении директории: {e}")
+    
+    @app.on_event("startup")
+    async def precompress_static():
+        """Сжатые копии (.br, .gz) ассетов рядом с файлами - отдаются по Accept-Encoding без сжатия на лету"""
+        try:
+            compressed, skipped = await run_in_threadpool(precompress_directory, static_dir)
+            print(f"✓ Статика: сжато файлов {compressed}, актуальных или несжимаемых {skipped}")
+        except OSError as e:
+            # Директория только для чтения - ассеты отдаются без сжатых копий
+            print(f"⚠️  Не удалось создать сжатые копии статики: {e}")
+    
+    def _spa_response(request: Request) -> Response:
+        return spa_shell.response(request.headers.get("if-none-match"), request.headers.get("accept-encoding"))
+    
+    @app.get("/")
+    async def read_root(request: Request):
+        if spa_shell is not None:
+            return _spa_response(request)
+        return {
+            "message": "Video to Text Converter API", "status": "running",
+            "static_dir": static_dir, "index_exists": False
+        }
+    
+    # Fallback для SPA routing - все остальные GET запросы возвращают index.html
+    @app.get("/{full_path:path}")
+    async def serve_spa(request: Request, full_path: str):
+        # Пропускаем API маршруты
+        if full_path.startswith("api/"):
+            raise HTTPException(status_code=404, detail="Not found")
+        
+        # Пропускаем статические файлы (они должны обрабатываться через mount)
+        if full_path.startswith(("static/", "assets/")):
+            raise HTTPException(status_code=404, detail="Not found")
+        
+        # Для всех остальных маршрутов возвращаем index.html (SPA routing)
+        if spa_shell is not None:
+            return _spa_response(request)
+        
+        raise HTTPException(status_code=404, detail="Not found")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
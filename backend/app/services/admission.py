@@ -0,0 +1,253 @@
+"""
+Контроль приема задач (admission control)
+
+При всплеске запросов каждая загрузка раньше принималась, записывалась
+во временную директорию и ставилась в очередь, пока контейнеру не переставало
+хватать диска или памяти. Теперь новая задача принимается, только если
+прогноз ожидания укладывается в лимит и временный диск не заполнен выше
+порога; иначе - 429 с Retry-After.
+
+Прогноз строится по содержимому очереди (оставшаяся работа принятых задач)
+и измеренному коэффициенту реального времени (RTF = время обработки /
+длительность аудио) для каждой модели и режима обработки.
+"""
+import math
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Optional
+
+from .scheduler import DEFAULT_COST_FACTOR, DIARIZATION_COST_FACTOR, MODEL_COST_FACTOR
+
+# Вес нового измерения в скользящем среднем RTF
+RTF_SMOOTHING = 0.3
+# Retry-After при заполненном диске (секунды)
+DISK_RETRY_AFTER = 60
+MAX_RETRY_AFTER = 3600
+
+
+class AdmissionRejected(Exception):
+    """Задача не принята: очередь перегружена или временный диск заполнен"""
+
+    def __init__(self, detail: str, retry_after: int, reason: str):
+        super().__init__(detail)
+        self.retry_after = retry_after
+        # "queue" или "disk"
+        self.reason = reason
+
+
+def preset(params: Dict) -> str:
+    """Режим обработки, влияющий на RTF"""
+    if params.get("translate_to_english"):
+        return "translate"
+    if params.get("enable_diarization"):
+        return "diarization"
+    return "plain"
+
+
+class RTFHistory:
+    """Скользящее среднее RTF по (модель, режим); до первых измерений - оценка по таблице"""
+
+    def __init__(self, smoothing: float = RTF_SMOOTHING):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        # "модель/режим" -> [rtf, количество измерений]
+        self._rtf: Dict[str, list] = {}
+
+    @staticmethod
+    def _default(model: str, mode: str) -> float:
+        factor = MODEL_COST_FACTOR.get(model, DEFAULT_COST_FACTOR)
+        if mode == "diarization":
+            factor += DIARIZATION_COST_FACTOR
+        elif mode == "translate":
+            # Второй проход распознавания для перевода
+            factor *= 2
+        return factor
+
+    def record(self, model: str, mode: str, audio_seconds: float, processing_seconds: float) -> None:
+        # Очень короткие клипы - в основном накладные расходы, RTF по ним завышен
+        if audio_seconds < 10 or processing_seconds <= 0:
+            return
+        rtf = processing_seconds / audio_seconds
+        key = f"{model}/{mode}"
+        with self._lock:
+            entry = self._rtf.get(key)
+            if entry is None:
+                self._rtf[key] = [rtf, 1]
+            else:
+                entry[0] += self.smoothing * (rtf - entry[0])
+                entry[1] += 1
+
+    def rtf(self, model: str, mode: str) -> float:
+        with self._lock:
+            entry = self._rtf.get(f"{model}/{mode}")
+        return entry[0] if entry else self._default(model, mode)
+
+    def estimate(self, audio_seconds: float, model: str, mode: str) -> float:
+        """Прогноз времени обработки (секунды)"""
+        return max(audio_seconds, 0.0) * self.rtf(model, mode)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {key: {"rtf": round(rtf, 4), "samples": count} for key, (rtf, count) in self._rtf.items()}
+
+
+class AdmissionController:
+    """
+    Решение о приеме задачи и прогноз времени ее завершения (ETA)
+
+    В роли all оставшаяся работа считается по принятым задачам этого процесса;
+    в роли api - передается из очереди (backlog_seconds, capacity).
+    """
+
+    def __init__(
+        self,
+        max_wait_seconds: float,
+        disk_watermark: float,
+        disk_paths: Iterable[str],
+        capacity: int = 1
+    ):
+        """
+        Args:
+            max_wait_seconds: задачи не принимаются, если прогноз ожидания больше (0 - без лимита)
+            disk_watermark: доля заполнения временного диска, выше которой задачи не принимаются
+            disk_paths: директории временных файлов (входные файлы, загрузки)
+            capacity: сколько задач обрабатывается параллельно
+        """
+        self.max_wait_seconds = max_wait_seconds
+        self.disk_watermark = disk_watermark
+        self.disk_paths = [path for path in disk_paths if path]
+        self.capacity = max(capacity, 1)
+        self._lock = threading.Lock()
+        # ticket -> {"expected", "admitted_at", "eta_at", "key"}
+        self._tickets: Dict[str, Dict] = {}
+        self.stats = {"admitted": 0, "rejected_queue": 0, "rejected_disk": 0}
+
+    def disk_usage(self) -> float:
+        """Максимальная доля заполнения среди временных директорий"""
+        usage = 0.0
+        for path in self.disk_paths:
+            try:
+                total, used, _ = shutil.disk_usage(path)
+            except OSError:
+                continue
+            if total:
+                usage = max(usage, used / total)
+        return usage
+
+    def share(self) -> float:
+        """Доля слота на одну принятую задачу: задачи сверх capacity делят слоты поровну"""
+        with self._lock:
+            count = len(self._tickets)
+        return min(1.0, self.capacity / count) if count else 1.0
+
+    def backlog_seconds(self, now: Optional[float] = None) -> float:
+        """Оставшаяся работа принятых задач (прогресс - по текущей доле слота)"""
+        now = now or time.time()
+        share = self.share()
+        with self._lock:
+            tickets = list(self._tickets.values())
+        return sum(max(ticket["expected"] - (now - ticket["admitted_at"]) * share, 0.0) for ticket in tickets)
+
+    def predict(
+        self,
+        expected_seconds: float = 0.0,
+        backlog_seconds: Optional[float] = None,
+        capacity: Optional[int] = None
+    ) -> Dict:
+        """Прогноз ожидания и завершения для новой задачи (без проверки лимитов)"""
+        backlog = self.backlog_seconds() if backlog_seconds is None else backlog_seconds
+        wait = backlog / max(capacity or self.capacity, 1)
+        return {"wait_seconds": round(wait, 1), "eta_seconds": round(wait + expected_seconds, 1)}
+
+    def check_disk(self) -> None:
+        """
+        Raises:
+            AdmissionRejected: временный диск заполнен выше порога
+        """
+        usage = self.disk_usage()
+        if usage > self.disk_watermark:
+            raise AdmissionRejected(
+                f"Временный диск заполнен на {usage:.0%} (порог {self.disk_watermark:.0%})",
+                DISK_RETRY_AFTER,
+                "disk"
+            )
+
+    def check_limits(self, prediction: Dict) -> None:
+        """
+        Raises:
+            AdmissionRejected: диск выше порога или прогноз ожидания больше лимита
+        """
+        self.check_disk()
+        wait = prediction["wait_seconds"]
+        if self.max_wait_seconds and wait > self.max_wait_seconds:
+            # Через столько секунд ожидание опустится до лимита при текущей загрузке
+            retry_after = math.ceil(wait - self.max_wait_seconds)
+            raise AdmissionRejected(
+                f"Очередь перегружена: ожидание ~{wait / 60:.0f} мин (лимит {self.max_wait_seconds / 60:.0f} мин)",
+                min(max(retry_after, 1), MAX_RETRY_AFTER),
+                "queue"
+            )
+
+    def check(
+        self,
+        expected_seconds: float = 0.0,
+        backlog_seconds: Optional[float] = None,
+        capacity: Optional[int] = None
+    ) -> Dict:
+        """
+        Проверяет, можно ли принять задачу
+
+        Returns:
+            прогноз {"wait_seconds", "eta_seconds"}
+
+        Raises:
+            AdmissionRejected: диск выше порога или прогноз ожидания больше лимита
+        """
+        prediction = self.predict(expected_seconds, backlog_seconds, capacity)
+        try:
+            self.check_limits(prediction)
+        except AdmissionRejected as e:
+            self.stats[f"rejected_{e.reason}"] += 1
+            raise
+        return prediction
+
+    def admit(self, expected_seconds: float, eta_seconds: float, key: Optional[str] = None) -> str:
+        """Регистрирует принятую задачу; key (Idempotency-Key) - для запроса ETA клиентом"""
+        ticket = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._tickets[ticket] = {
+                "expected": expected_seconds,
+                "admitted_at": now,
+                "eta_at": now + eta_seconds,
+                "key": key,
+            }
+        self.stats["admitted"] += 1
+        return ticket
+
+    def release(self, ticket: str) -> None:
+        with self._lock:
+            self._tickets.pop(ticket, None)
+
+    def eta(self, key: str) -> Optional[float]:
+        """Оставшееся время до прогнозного завершения принятой задачи (по Idempotency-Key)"""
+        now = time.time()
+        with self._lock:
+            for ticket in self._tickets.values():
+                if ticket["key"] == key:
+                    return round(max(ticket["eta_at"] - now, 0.0), 1)
+        return None
+
+    def info(self) -> Dict:
+        with self._lock:
+            in_flight = len(self._tickets)
+        return {
+            "in_flight": in_flight,
+            "capacity": self.capacity,
+            "max_wait_seconds": self.max_wait_seconds,
+            "disk_watermark": self.disk_watermark,
+            "disk_usage": round(self.disk_usage(), 4),
+            **self.stats,
+        }
@@ -0,0 +1,144 @@
+"""
+Кэш декодированного аудио (float32, 16 кГц, моно) по хэшу исходного файла
+
+Повторный запуск того же файла (другая модель, diarization, другой диапазон)
+не запускает ffmpeg: аудио открывается через np.memmap из файла .npy
+и передается движку без копирования - страницы читаются из page cache.
+Размер кэша ограничен бюджетом в байтах, вытесняются давно не использованные файлы.
+"""
+import os
+import struct
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from .long_form import SAMPLE_RATE, pcm_to_float32
+
+# NumPy нужен для memmap (есть везде, где установлен Whisper)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Заголовок .npy фиксированной длины: его можно переписать на месте,
+# когда после потоковой записи станет известно число отсчетов
+NPY_HEADER_SIZE = 128
+
+
+def _npy_header(num_samples: int) -> bytes:
+    """Заголовок .npy версии 1.0 для одномерного массива float32 (little-endian)"""
+    header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d,), }" % num_samples
+    # 6 байт magic + 2 байта версии + 2 байта длины заголовка; заголовок заканчивается \n
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class AudioCache:
+    """Файлы <sha256>.npy с LRU-вытеснением по суммарному размеру"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Args:
+            cache_dir: директория кэша
+            max_bytes: бюджет на диске (0 - кэш отключен)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Недописанные файлы после перезапуска
+            for path in self.cache_dir.glob("*.tmp"):
+                path.unlink(missing_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return NUMPY_AVAILABLE and self.max_bytes > 0
+
+    def _path(self, content_hash: str) -> Path:
+        return self.cache_dir / f"{content_hash}.npy"
+
+    def get(self, content_hash: Optional[str]):
+        """Декодированное аудио из кэша (np.memmap только для чтения) или None"""
+        if not self.enabled or not content_hash:
+            return None
+        path = self._path(content_hash)
+        try:
+            audio = np.load(path, mmap_mode="r")
+            # Время изменения - время последнего использования (для LRU)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return audio
+
+    def put(self, content_hash: str, windows: Iterable[bytes]):
+        """
+        Записывает аудио из окон PCM s16le (VideoProcessor.stream_audio) в кэш
+
+        Returns:
+            np.memmap записанного аудио или None (пустое аудио / кэш отключен)
+        """
+        if not self.enabled:
+            return None
+        path = self._path(content_hash)
+        tmp_path = path.with_name(f"{content_hash}.{uuid.uuid4().hex}.tmp")
+        num_samples = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(_npy_header(0))
+                for pcm in windows:
+                    audio = pcm_to_float32(pcm)
+                    audio.tofile(f)
+                    num_samples += len(audio)
+                f.seek(0)
+                f.write(_npy_header(num_samples))
+            if num_samples == 0:
+                tmp_path.unlink()
+                return None
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        size = path.stat().st_size
+        print(f"[AUDIO_CACHE] Сохранено {num_samples / SAMPLE_RATE / 60:.1f} мин аудио "
+              f"({size / 1024 / 1024:.1f} MB) для sha256={content_hash[:12]}")
+        self._evict(keep=path)
+        return np.load(path, mmap_mode="r")
+
+    def _evict(self, keep: Optional[Path] = None) -> None:
+        """Удаляет давно не использованные файлы, пока кэш не уложится в бюджет"""
+        with self._lock:
+            entries = []
+            for path in self.cache_dir.glob("*.npy"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                # Открытые memmap других задач продолжают работать - файл удаляется из каталога
+                path.unlink(missing_ok=True)
+                total -= size
+                self.stats["evictions"] += 1
+                print(f"[AUDIO_CACHE] Вытеснен {path.name} ({size / 1024 / 1024:.1f} MB)")
+
+    def info(self) -> Dict:
+        files = list(self.cache_dir.glob("*.npy")) if self.enabled else []
+        return {
+            "enabled": self.enabled,
+            "files": len(files),
+            "bytes": sum(path.stat().st_size for path in files if path.exists()),
+            "max_bytes": self.max_bytes,
+            **self.stats,
+        }
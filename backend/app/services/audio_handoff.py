@@ -0,0 +1,320 @@
+"""
+Передача декодированного аудио рабочим процессам через разделяемую память
+
+Процесс API записывает аудио (float32, 16 кГц) в multiprocessing.shared_memory
+один раз; рабочий процесс подключается к блоку по имени и получает NumPy-массив
+поверх той же памяти, без pickle и временных файлов. Обратно по pipe идет
+только компактная колоночная транскрипция (Transcript.to_compact).
+
+Блоком памяти владеет процесс API: он удаляет его после завершения задачи
+(в том числе при падении рабочего процесса). Блоки, оставшиеся после падения
+самого процесса API, удаляет sweep_orphans() при следующем запуске -
+в имени блока записан PID создателя.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+import uuid
+import wave
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, Optional
+
+from .cancellation import CancelToken
+from .long_form import SAMPLE_RATE, pcm_to_float32
+from .transcript import Transcript
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Префикс имен блоков: vcaudio_<pid>_<id>
+SHM_PREFIX = "vcaudio_"
+SHM_DIR = "/dev/shm"
+
+BYTES_PER_FLOAT = 4
+# Размер блока при копировании WAV в разделяемую память (сэмплов)
+WAV_CHUNK_SAMPLES = SAMPLE_RATE * 60
+
+
+class WorkerCrashedError(Exception):
+    """Рабочий процесс завершился во время обработки задачи"""
+
+
+class SharedAudio:
+    """Блок разделяемой памяти с аудио float32 (создается и удаляется процессом API)"""
+
+    def __init__(self, num_samples: int):
+        name = f"{SHM_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        # Блок нулевого размера создать нельзя
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=max(num_samples * BYTES_PER_FLOAT, 1))
+        self.num_samples = num_samples
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def array(self):
+        return np.ndarray((self.num_samples,), dtype=np.float32, buffer=self.shm.buf)
+
+    @classmethod
+    def from_array(cls, audio) -> "SharedAudio":
+        """Копирует массив (например, memmap из кэша аудио) в разделяемую память"""
+        shared = cls(len(audio))
+        view = shared.array()
+        view[:] = audio
+        del view
+        return shared
+
+    @classmethod
+    def from_wav(cls, path: str) -> "SharedAudio":
+        """Декодирует WAV (PCM s16le, 16 кГц, моно) прямо в разделяемую память, по блокам"""
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1 or wav.getframerate() != SAMPLE_RATE:
+                raise ValueError("Ожидается WAV PCM s16le 16 кГц моно")
+            shared = cls(wav.getnframes())
+            view = shared.array()
+            position = 0
+            while True:
+                pcm = wav.readframes(WAV_CHUNK_SAMPLES)
+                if not pcm:
+                    break
+                chunk = pcm_to_float32(pcm)
+                view[position:position + len(chunk)] = chunk
+                position += len(chunk)
+            del view
+        return shared
+
+    def descriptor(self) -> Dict:
+        """Данные для подключения в рабочем процессе (передаются через pipe)"""
+        return {"name": self.name, "samples": self.num_samples}
+
+    def close(self) -> None:
+        """Освобождает блок (вызывается владельцем после завершения задачи)"""
+        try:
+            self.shm.close()
+        except BufferError:
+            # Остались ссылки на массив - память освободится вместе с ними
+            pass
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SharedAudio":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+@contextmanager
+def attach_audio(descriptor: Dict) -> Iterator[Any]:
+    """Подключается к блоку аудио в рабочем процессе и выдает массив без копирования"""
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    # До Python 3.13 подключение регистрирует блок в resource_tracker рабочего процесса,
+    # и тот удалил бы чужой блок при выходе процесса. Блоком владеет процесс API.
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    try:
+        yield np.ndarray((descriptor["samples"],), dtype=np.float32, buffer=shm.buf)
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+def sweep_orphans() -> int:
+    """Удаляет блоки аудио, созданные процессами, которых больше нет (после падения API)"""
+    if not os.path.isdir(SHM_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(SHM_DIR):
+        if not name.startswith(SHM_PREFIX):
+            continue
+        try:
+            pid = int(name[len(SHM_PREFIX):].split("_", 1)[0])
+        except ValueError:
+            continue
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        try:
+            os.unlink(os.path.join(SHM_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        print(f"[AUDIO_HANDOFF] Удалено осиротевших блоков разделяемой памяти: {removed}")
+    return removed
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _encode_result(result: Dict) -> Dict:
+    """Результат сервиса для передачи по pipe: транскрипция в колоночном виде"""
+    encoded = dict(result)
+    if "transcript" in encoded:
+        encoded["transcript"] = encoded["transcript"].to_compact()
+    return encoded
+
+
+def _decode_result(payload: Dict) -> Dict:
+    if "transcript" in payload:
+        payload["transcript"] = Transcript.from_compact(payload["transcript"])
+    return payload
+
+
+def _worker_main(conn, service_kwargs: Dict) -> None:
+    """Цикл рабочего процесса: модели загружаются один раз и переиспользуются между задачами"""
+    from .speech_recognition_optimized import OptimizedSpeechRecognitionService
+    service = OptimizedSpeechRecognitionService(**service_kwargs)
+    print(f"[WORKER {os.getpid()}] Готов к работе")
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        descriptor, kwargs = message
+        try:
+            with attach_audio(descriptor) as audio:
+                result = service.transcribe(audio_path=audio, **kwargs)
+                del audio
+            conn.send(("ok", _encode_result(result)))
+        except Exception as e:
+            traceback.print_exc()
+            conn.send(("error", str(e)))
+
+
+class _Worker:
+    def __init__(self, context, service_kwargs: Dict):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, service_kwargs), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class TranscriptionWorkerPool:
+    """Пул долгоживущих процессов распознавания (аудио передается через SharedAudio)"""
+
+    def __init__(self, num_workers: int, service_kwargs: Dict):
+        """
+        Args:
+            num_workers: количество рабочих процессов
+            service_kwargs: параметры OptimizedSpeechRecognitionService в рабочем процессе
+        """
+        # spawn: CUDA и потоки ONNX/CTranslate2 не переживают fork
+        self._context = multiprocessing.get_context("spawn")
+        self._service_kwargs = service_kwargs
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        sweep_orphans()
+        for _ in range(num_workers):
+            worker = _Worker(self._context, service_kwargs)
+            self._workers.append(worker)
+            self._idle.put(worker)
+        print(f"✓ Запущено рабочих процессов распознавания: {num_workers}")
+
+    def transcribe(
+        self,
+        audio: SharedAudio,
+        poll_interval: float = 1.0,
+        cancel: Optional[CancelToken] = None,
+        **kwargs
+    ) -> Dict:
+        """
+        Распознает аудио в свободном рабочем процессе (блокирует до результата)
+
+        Raises:
+            WorkerCrashedError: процесс упал; он перезапускается, блок аудио остается у вызывающего
+            JobCancelled: задача отменена - процесс завершается и перезапускается
+                          (распознавание в другом процессе иначе не остановить)
+        """
+        worker = self._idle.get()
+        try:
+            worker.conn.send((audio.descriptor(), kwargs))
+            while not worker.conn.poll(poll_interval):
+                if cancel is not None and cancel.cancelled:
+                    print(f"[AUDIO_HANDOFF] Задача отменена - перезапуск рабочего процесса {worker.process.pid}")
+                    worker = self._replace(worker)
+                    cancel.check()
+                if not worker.process.is_alive():
+                    raise WorkerCrashedError(
+                        f"Рабочий процесс {worker.process.pid} завершился (код {worker.process.exitcode})"
+                    )
+            status, payload = worker.conn.recv()
+        except (WorkerCrashedError, EOFError, OSError) as e:
+            print(f"[AUDIO_HANDOFF] ❌ {e} - перезапуск рабочего процесса")
+            worker = self._replace(worker)
+            raise WorkerCrashedError(str(e))
+        finally:
+            self._idle.put(worker)
+        if status == "error":
+            raise Exception(payload)
+        return _decode_result(payload)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=5)
+        worker.conn.close()
+        replacement = _Worker(self._context, self._service_kwargs)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = replacement
+        return replacement
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+
+
+def transcribe_shared(
+    pool: TranscriptionWorkerPool,
+    audio_input,
+    cancel: Optional[CancelToken] = None,
+    **kwargs
+) -> Dict:
+    """
+    Передает аудио в пул через разделяемую память и освобождает блок после задачи
+
+    Args:
+        audio_input: путь к WAV (PCM s16le 16 кГц моно) или массив float32 (memmap из кэша)
+        cancel: токен отмены (в рабочий процесс не передается - проверяется при ожидании)
+    """
+    shared = SharedAudio.from_wav(audio_input) if isinstance(audio_input, str) else SharedAudio.from_array(audio_input)
+    with shared:
+        print(f"[AUDIO_HANDOFF] Аудио в разделяемой памяти: {shared.name} "
+              f"({shared.num_samples * BYTES_PER_FLOAT / 1024 / 1024:.1f} MB)")
+        return pool.transcribe(shared, cancel=cancel, **kwargs)
@@ -0,0 +1,170 @@
+"""
+Кооперативная отмена задач конвертации
+
+Задача получает CancelToken; при отключении клиента или DELETE /api/jobs/{id}
+токен отменяется, и каждый этап конвейера останавливается в ближайшей точке
+проверки: процесс ffmpeg завершается (on_cancel), итерация по генератору
+сегментов faster-whisper прекращается (guard), diarization прерывается через
+hook pyannote, временные файлы удаляются блоками finally.
+"""
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class JobCancelled(BaseException):
+    """
+    Задача отменена
+
+    Наследуется от BaseException (как asyncio.CancelledError): отмена не должна
+    перехватываться блоками except Exception, которые в сервисах распознавания
+    переключают на запасной вариант (простая diarization, ответ без перевода).
+    """
+
+    def __init__(self, reason: str = "отменена"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """Флаг отмены задачи, общий для потоков конвейера"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str) -> bool:
+        """Отменяет задачу; возвращает False, если она уже была отменена"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[CANCEL] ⚠️  Ошибка обработчика отмены: {e}")
+        return True
+
+    def check(self) -> None:
+        """Raises: JobCancelled, если задача отменена"""
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Вызывает callback при отмене (сразу, если задача уже отменена)
+
+        Returns:
+            функция, снимающая обработчик (например, после завершения ffmpeg)
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def guard(items: Iterable, cancel: Optional[CancelToken]) -> Iterator:
+    """
+    Проверяет отмену перед каждым элементом
+
+    Генератор сегментов faster-whisper декодирует аудио лениво - прекращение
+    итерации останавливает распознавание.
+    """
+    if cancel is None:
+        yield from items
+        return
+    for item in items:
+        cancel.check()
+        yield item
+    cancel.check()
+
+
+def pyannote_hook(cancel: Optional[CancelToken]) -> Optional[Callable]:
+    """hook для pyannote Pipeline: вызывается на каждом шаге и пакете эмбеддингов"""
+    if cancel is None:
+        return None
+
+    def hook(*args, **kwargs) -> None:
+        cancel.check()
+
+    return hook
+
+
+class InflightJobs:
+    """
+    Выполняющиеся задачи: токен отмены и клиенты, ожидающие результат
+
+    Задача находится по job_id или по Idempotency-Key запроса. Одну задачу
+    могут ждать несколько запросов (single-flight) - при отключении клиента
+    она отменяется, только когда отключились все.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # job_id -> {"token", "idempotency_key", "waiters", ...}
+        self._jobs: Dict[str, Dict] = {}
+
+    def register(self, job_id: str, key: str, idempotency_key: Optional[str] = None, **info) -> CancelToken:
+        """key - ключ single-flight, по которому к задаче присоединяются запросы"""
+        token = CancelToken()
+        with self._lock:
+            self._jobs[job_id] = {
+                "token": token, "key": key, "idempotency_key": idempotency_key, "waiters": 0, **info
+            }
+        return token
+
+    def unregister(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def find(self, job_id_or_key: str, keys: bool = True) -> Optional[Tuple[str, Dict]]:
+        """(job_id, запись) по job_id, ключу single-flight или Idempotency-Key (keys=False - только job_id)"""
+        with self._lock:
+            if job_id_or_key in self._jobs:
+                return job_id_or_key, self._jobs[job_id_or_key]
+            if not keys:
+                return None
+            for job_id, job in self._jobs.items():
+                if job_id_or_key in (job["key"], job["idempotency_key"]):
+                    return job_id, job
+        return None
+
+    def attach(self, key: str) -> None:
+        """Еще один запрос ждет задачу с ключом key"""
+        found = self.find(key)
+        if found is not None:
+            with self._lock:
+                found[1]["waiters"] += 1
+
+    def detach(self, key: str) -> int:
+        """Запрос больше не ждет задачу; возвращает число оставшихся ожидающих"""
+        found = self.find(key)
+        if found is None:
+            return 0
+        with self._lock:
+            found[1]["waiters"] = max(found[1]["waiters"] - 1, 0)
+            return found[1]["waiters"]
+
+    def job_ids(self) -> List[str]:
+        """Задачи, выполняющиеся в этом процессе"""
+        with self._lock:
+            return list(self._jobs)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
@@ -0,0 +1,172 @@
+"""
+Распознавание к сроку (deadline_seconds) с постепенным снижением качества
+
+Клиенту иногда нужна транскрипция к фиксированному сроку. Монитор следит
+за скоростью распознавания (секунды обработки на секунду аудио) на текущих
+настройках и, если прогноз завершения выходит за срок, переключает
+оставшееся аудио на более дешевые настройки:
+
+    заданные -> жадное декодирование (beam_size=1, best_of=1) -> модель меньше -> ... -> tiny
+
+Уже распознанные сегменты не пересчитываются. Участки записи с настройками,
+на которых они распознаны, возвращаются в ответе (regions), чтобы клиент
+видел, какие фрагменты распознаны с пониженным качеством.
+"""
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .long_form import _segment_fields, _shift_words
+from .scheduler import DIARIZATION_COST_FACTOR, DIARIZATION_LOAD_SECONDS
+from .transcript import Transcript
+
+# Следующая модель на лестнице снижения качества
+SMALLER_MODEL = {
+    "large-v3": "medium",
+    "large-v2": "medium",
+    "large": "medium",
+    "medium": "small",
+    "small": "base",
+    "base": "tiny",
+}
+# Скорость уровня оценивается после стольких секунд аудио (раньше - шум загрузки и VAD)
+MIN_PROGRESS_SECONDS = 30.0
+# Распознавание должно уложиться в эту долю срока - остаток на diarization и ответ
+SAFETY_MARGIN = 0.85
+
+# Движок для участка: (начало участка в секундах, настройки, язык) -> (сегменты от начала участка, язык)
+RegionTranscriber = Callable[[float, Dict, Optional[str]], Tuple[Iterable, Optional[str]]]
+
+
+def degrade_levels(model: str, beam_size: int, best_of: int) -> List[Dict]:
+    """Настройки от заданных до самых дешевых"""
+    levels = [{"model": model, "beam_size": beam_size, "best_of": best_of}]
+    if beam_size > 1 or best_of > 1:
+        levels.append({"model": model, "beam_size": 1, "best_of": 1})
+    while model in SMALLER_MODEL:
+        model = SMALLER_MODEL[model]
+        levels.append({"model": model, "beam_size": 1, "best_of": 1})
+    return levels
+
+
+def diarization_seconds(duration: float, loaded: bool) -> float:
+    """Прогноз времени полной diarization (pyannote/WhisperX) для записи длительностью duration"""
+    return duration * DIARIZATION_COST_FACTOR + (0.0 if loaded else DIARIZATION_LOAD_SECONDS)
+
+
+class DeadlineMonitor:
+    """Текущий уровень качества и участки записи, распознанные на каждом уровне"""
+
+    def __init__(
+        self,
+        levels: List[Dict],
+        duration: float,
+        deadline_seconds: float,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            levels: настройки от заданных до самых дешевых (degrade_levels)
+            duration: длительность аудио (секунды)
+            deadline_seconds: срок от начала распознавания
+        """
+        self.levels = levels
+        self.duration = duration
+        self.deadline_seconds = deadline_seconds
+        self.clock = clock
+        self.started_at = clock()
+        self.level = 0
+        self._region_start = 0.0
+        self._level_started_at = self.started_at
+        self.regions: List[Dict] = []
+
+    @property
+    def settings(self) -> Dict:
+        return self.levels[self.level]
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started_at
+
+    def remaining(self) -> float:
+        return self.deadline_seconds - self.elapsed()
+
+    def update(self, position: float) -> bool:
+        """
+        Учитывает прогресс (распознано аудио до position секунд)
+
+        Returns:
+            True - прогноз не укладывается в срок, и оставшееся аудио нужно
+            распознавать на следующем уровне (settings уже переключены)
+        """
+        if self.level + 1 >= len(self.levels):
+            return False
+        processed = position - self._region_start
+        if processed < MIN_PROGRESS_SECONDS:
+            return False
+        now = self.clock()
+        rtf = (now - self._level_started_at) / processed
+        projected = (now - self.started_at) + max(self.duration - position, 0.0) * rtf
+        if projected <= self.deadline_seconds * SAFETY_MARGIN:
+            return False
+        self._close_region(position)
+        self.level += 1
+        self._level_started_at = now
+        print(f"[DEADLINE] Прогноз {projected:.0f} сек при сроке {self.deadline_seconds:.0f} сек - "
+              f"с {position:.0f} сек: {self.settings['model']}, beam_size={self.settings['beam_size']}")
+        return True
+
+    def _close_region(self, end: float) -> None:
+        if end > self._region_start:
+            self.regions.append({
+                "start": round(self._region_start, 3),
+                "end": round(end, 3),
+                **self.settings,
+                "degraded": self.level > 0,
+            })
+        self._region_start = end
+
+    def finish(self) -> Dict:
+        """Отчет для ответа API: срок, фактическое время и участки по уровням качества"""
+        self._close_region(max(self.duration, self._region_start))
+        elapsed = self.elapsed()
+        return {
+            "deadline_seconds": self.deadline_seconds,
+            "elapsed_seconds": round(elapsed, 2),
+            "met": elapsed <= self.deadline_seconds,
+            "degraded": any(region["degraded"] for region in self.regions),
+            "regions": self.regions,
+        }
+
+
+def transcribe_with_deadline(
+    transcribe_region: RegionTranscriber,
+    monitor: DeadlineMonitor,
+    transcript: Transcript,
+    language: Optional[str] = None
+) -> Optional[str]:
+    """
+    Распознает аудио участками, переключаясь на более дешевые настройки при отставании
+
+    При переключении генератор сегментов прерывается, и распознавание
+    продолжается с конца последнего сегмента на новых настройках. Язык
+    определяется на первом участке и фиксируется для остальных.
+
+    Returns:
+        язык записи
+    """
+    offset = 0.0
+    while True:
+        segments, detected_language = transcribe_region(offset, monitor.settings, language)
+        language = language or detected_language
+        switched = False
+        for seg in segments:
+            start, end, text, words = _segment_fields(seg)
+            transcript.append(offset + start, offset + end, text.strip(), words=_shift_words(words, offset))
+            if monitor.update(offset + end):
+                offset += end
+                switched = True
+                break
+        if hasattr(segments, "close"):
+            # Генератор faster-whisper: дальнейшее декодирование не нужно
+            segments.close()
+        if not switched:
+            return language
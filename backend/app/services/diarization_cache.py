@@ -0,0 +1,192 @@
+"""
+Кэш сегментации и эмбеддингов спикеров pyannote по хэшу аудио
+
+Пайплайн pyannote/speaker-diarization-3.1 состоит из дорогих шагов
+(сегментация окнами и эмбеддинг каждого спикера в каждом окне - минуты
+на час аудио) и дешевой кластеризации эмбеддингов. Пользователи часто
+перезапускают задачу с другим num_speakers, увидев первый результат, -
+при этом аудио то же самое, и меняется только кластеризация.
+
+Результаты get_segmentations и get_embeddings пайплайна сохраняются в
+<ключ>.npz; при повторной diarization того же аудио они берутся из кэша,
+и пайплайн выполняет только подсчет спикеров, кластеризацию с новыми
+num_speakers/min_speakers/max_speakers и сборку разметки - секунды.
+
+Пайплайн общий для задач и вызывается из нескольких потоков, поэтому методы
+перехватываются один раз, а кэш текущей задачи передается через
+thread-local контекст (вызовы пайплайна выполняются в потоке задачи).
+"""
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Кэш текущей задачи потока: {"segmentations", "embeddings"} (+ "dirty" - есть что сохранить)
+_context = threading.local()
+
+
+def install(pipeline) -> bool:
+    """
+    Перехватывает get_segmentations и get_embeddings пайплайна (один раз)
+
+    Returns:
+        False - пайплайн без этих шагов (не SpeakerDiarization pyannote 3.x)
+    """
+    if pipeline is None:
+        return False
+    if getattr(pipeline, "_diarization_cache_installed", False):
+        return True
+    if not (hasattr(pipeline, "get_segmentations") and hasattr(pipeline, "get_embeddings")):
+        return False
+    get_segmentations = pipeline.get_segmentations
+    get_embeddings = pipeline.get_embeddings
+
+    def cached_segmentations(file, *args, **kwargs):
+        entry = getattr(_context, "entry", None)
+        if entry is None:
+            return get_segmentations(file, *args, **kwargs)
+        if "segmentations" not in entry:
+            entry["segmentations"] = get_segmentations(file, *args, **kwargs)
+            entry["dirty"] = True
+        return entry["segmentations"]
+
+    def cached_embeddings(file, *args, **kwargs):
+        entry = getattr(_context, "entry", None)
+        if entry is None:
+            return get_embeddings(file, *args, **kwargs)
+        if "embeddings" not in entry:
+            entry["embeddings"] = get_embeddings(file, *args, **kwargs)
+            entry["dirty"] = True
+        return entry["embeddings"]
+
+    pipeline.get_segmentations = cached_segmentations
+    pipeline.get_embeddings = cached_embeddings
+    pipeline._diarization_cache_installed = True
+    return True
+
+
+class DiarizationCache:
+    """Файлы <ключ>.npz с LRU-вытеснением по суммарному размеру (как AudioCache)"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Args:
+            cache_dir: директория кэша
+            max_bytes: бюджет на диске (0 - кэш отключен); час аудио ~ 10-20 MB
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            for path in self.cache_dir.glob("*.tmp"):
+                path.unlink(missing_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return NUMPY_AVAILABLE and self.max_bytes > 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    @contextmanager
+    def reuse(self, pipeline, key: Optional[str]) -> Iterator[None]:
+        """
+        Вызовы pipeline внутри блока берут сегментацию и эмбеддинги из кэша по key;
+        посчитанные заново сохраняются, если блок завершился без ошибки
+        """
+        if not self.enabled or not key or not install(pipeline):
+            yield
+            return
+        entry = self.get(key) or {}
+        if entry:
+            print(f"[DIARIZATION_CACHE] Сегментация и эмбеддинги из кэша ({key[:12]}) - "
+                  f"пересчитывается только кластеризация")
+        _context.entry = entry
+        try:
+            yield
+        finally:
+            _context.entry = None
+        if entry.pop("dirty", False) and "segmentations" in entry and "embeddings" in entry:
+            self.put(key, entry)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """{"segmentations": SlidingWindowFeature, "embeddings": массив} или None"""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                window = data["window"]
+                segmentations, embeddings = data["segmentations"], data["embeddings"]
+            os.utime(path)
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            self.stats["misses"] += 1
+            return None
+        from pyannote.core import SlidingWindow, SlidingWindowFeature
+        self.stats["hits"] += 1
+        return {
+            "segmentations": SlidingWindowFeature(
+                segmentations, SlidingWindow(start=window[0], duration=window[1], step=window[2])
+            ),
+            "embeddings": embeddings,
+        }
+
+    def put(self, key: str, entry: Dict) -> None:
+        segmentations = entry["segmentations"]
+        window = segmentations.sliding_window
+        path = self._path(key)
+        tmp_path = path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                # Сегментация - вероятности/метки активности, хорошо сжимается
+                np.savez_compressed(
+                    f,
+                    segmentations=segmentations.data,
+                    window=np.array([window.start, window.duration, window.step]),
+                    embeddings=np.asarray(entry["embeddings"]),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        size = path.stat().st_size
+        print(f"[DIARIZATION_CACHE] Сохранены сегментация и эмбеддинги ({size / 1024 / 1024:.1f} MB) для {key[:12]}")
+        self._evict(keep=path)
+
+    def _evict(self, keep: Optional[Path] = None) -> None:
+        """Удаляет давно не использованные файлы, пока кэш не уложится в бюджет"""
+        with self._lock:
+            entries = []
+            for path in self.cache_dir.glob("*.npz"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                path.unlink(missing_ok=True)
+                total -= size
+                self.stats["evictions"] += 1
+
+    def info(self) -> Dict:
+        files = list(self.cache_dir.glob("*.npz")) if self.enabled else []
+        return {
+            "enabled": self.enabled,
+            "files": len(files),
+            "bytes": sum(path.stat().st_size for path in files if path.exists()),
+            "max_bytes": self.max_bytes,
+            **self.stats,
+        }
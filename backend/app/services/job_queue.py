@@ -0,0 +1,482 @@
+"""
+Очередь задач распознавания между процессами API и рабочими процессами
+
+Процесс API (ROLE=api) не загружает модели: он сохраняет входной файл
+в общее хранилище, ставит задачу в очередь и ждет результат. Рабочие
+процессы (python -m app.worker) регистрируются с емкостью и списком моделей,
+забирают подходящие задачи и записывают результат обратно в очередь
+(транскрипция задачи - в общее хранилище задач JOBS_DIR).
+
+JobQueue - интерфейс, который может реализовать любой брокер
+(Redis, RabbitMQ, SQS). В комплекте - SQLiteJobQueue для одного хоста
+и тестов: файл базы на общем диске видят все процессы.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from . import scheduler
+
+# Состояния задачи в очереди
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueError(Exception):
+    """Ошибка очереди задач"""
+
+
+class QueuedJob:
+    """Задача, выданная рабочему процессу"""
+
+    __slots__ = ("job_id", "payload", "attempts")
+
+    def __init__(self, job_id: str, payload: Dict, attempts: int):
+        self.job_id = job_id
+        self.payload = payload
+        self.attempts = attempts
+
+
+class JobQueue(ABC):
+    """
+    Интерфейс очереди задач
+
+    Задача проходит состояния queued -> running -> done/failed. Рабочий процесс
+    периодически подтверждает, что жив (heartbeat); задачи процесса, переставшего
+    отвечать дольше lease_seconds, возвращаются в очередь.
+    """
+
+    lease_seconds: float = 120.0
+
+    @abstractmethod
+    def enqueue(
+        self,
+        payload: Dict,
+        model: Optional[str] = None,
+        diarization: bool = False,
+        cost: float = 0.0,
+        client: Optional[str] = None
+    ) -> str:
+        """
+        Ставит задачу в очередь, возвращает ее идентификатор
+
+        Args:
+            model, diarization: что должно быть загружено в рабочем процессе (для model affinity)
+            cost: оценка времени обработки (scheduler.estimate_cost) - полоса и доля клиента
+            client: клиент (API-ключ) для справедливого разделения рабочих процессов
+        """
+
+    @abstractmethod
+    def claim(self, worker_id: str, models: Optional[List[str]] = None) -> Optional[QueuedJob]:
+        """
+        Забирает задачу для рабочего процесса (None - подходящих задач нет)
+
+        Порядок - scheduler.order (быстрая полоса, справедливая доля клиентов,
+        защита от голодания); среди них предпочитаются задачи для моделей,
+        уже загруженных в этом процессе (scheduler.pick); состояние моделей
+        процесс сообщает через heartbeat.
+
+        Args:
+            models: модели, которые обслуживает процесс (None - любые)
+        """
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        """
+        Сохраняет результат задачи, выполненной рабочим процессом worker_id
+
+        Returns:
+            False - задача уже не принадлежит процессу (возвращена в очередь после
+            потери heartbeat, удалена или завершена), результат отброшен
+        """
+
+    @abstractmethod
+    def fail(self, job_id: str, worker_id: str, error: Dict) -> bool:
+        """Завершает задачу с ошибкой ({"status_code", "detail"}); False - как у complete"""
+
+    @abstractmethod
+    def status(self, job_id: str) -> Dict:
+        """
+        Состояние задачи: {"status", "result", "error", "worker_id", "claimed_at", "finished_at"}
+
+        Raises:
+            JobQueueError: задача не найдена
+        """
+
+    @abstractmethod
+    def delete(self, job_id: str) -> None:
+        """Удаляет задачу после получения результата"""
+
+    @abstractmethod
+    def register_worker(self, worker_id: str, info: Dict) -> None:
+        """Регистрирует рабочий процесс (емкость, модели, устройство)"""
+
+    @abstractmethod
+    def heartbeat(self, worker_id: str, warm: Optional[Dict] = None) -> None:
+        """Подтверждает, что рабочий процесс жив, и обновляет список загруженных моделей"""
+
+    @abstractmethod
+    def unregister_worker(self, worker_id: str) -> None:
+        """Удаляет рабочий процесс (его незавершенные задачи возвращаются в очередь)"""
+
+    @abstractmethod
+    def workers(self) -> List[Dict]:
+        """Зарегистрированные рабочие процессы"""
+
+    def stats(self) -> Dict:
+        """
+        Количество задач по состояниям, доля холодных загрузок, оставшаяся работа
+        (backlog_seconds) и емкость живых процессов (capacity); брокер может не поддерживать
+        """
+        return {}
+
+
+class SQLiteJobQueue(JobQueue):
+    """Очередь в файле SQLite (WAL): подходит для одного хоста и общего диска"""
+
+    _COLUMNS = {
+        "diarization": "INTEGER NOT NULL DEFAULT 0",
+        "cost": "REAL NOT NULL DEFAULT 0",
+        "client": "TEXT",
+    }
+    # Сколько задач из начала очереди рассматривает планировщик
+    SCHEDULING_WINDOW = 200
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = 120.0,
+        max_attempts: int = 3,
+        fast_lane_seconds: float = scheduler.FAST_LANE_SECONDS,
+        starvation_seconds: float = scheduler.STARVATION_SECONDS,
+        client_weights: Optional[Dict[str, float]] = None,
+        fast_lane_reserved: int = scheduler.FAST_LANE_RESERVED
+    ):
+        """
+        Args:
+            path: путь к файлу базы
+            lease_seconds: задачи процесса без heartbeat дольше этого возвращаются в очередь
+            max_attempts: после стольких потерянных выполнений задача завершается с ошибкой
+            fast_lane_seconds: задачи с оценкой стоимости не больше этой - в быстрой полосе
+            starvation_seconds: задача, ждущая дольше, обслуживается первой
+            client_weights: веса клиентов в справедливой очереди (по умолчанию 1)
+            fast_lane_reserved: слоты рабочих процессов, которые не получают длинные задачи
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.fast_lane_seconds = fast_lane_seconds
+        self.starvation_seconds = starvation_seconds
+        self.client_weights = client_weights or {}
+        self.fast_lane_reserved = fast_lane_reserved
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, status TEXT NOT NULL, model TEXT,"
+                " payload TEXT NOT NULL, result TEXT, error TEXT, worker_id TEXT,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL, claimed_at REAL, finished_at REAL)"
+            )
+            # Колонки, добавленные после первой версии схемы
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, definition in self._COLUMNS.items():
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                " worker_id TEXT PRIMARY KEY, info TEXT NOT NULL,"
+                " registered_at REAL NOT NULL, last_seen REAL NOT NULL)"
+            )
+            # Накопительные счетчики планировщика (выполненные задачи API удаляет из очереди)
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # Состояние справедливой очереди по полосам: виртуальное время ("virtual_time/<полоса>")
+            # и конец последней задачи клиентов ("<полоса>/<клиент>")
+            db.execute("CREATE TABLE IF NOT EXISTS fair_share (client TEXT PRIMARY KEY, last_finish REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS scheduler_state (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение на поток: запросы API выполняются в пуле потоков
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        # IMMEDIATE: запись блокируется сразу, две выдачи одной задачи невозможны
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def enqueue(
+        self,
+        payload: Dict,
+        model: Optional[str] = None,
+        diarization: bool = False,
+        cost: float = 0.0,
+        client: Optional[str] = None
+    ) -> str:
+        job_id = uuid.uuid4().hex
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (job_id, status, model, diarization, cost, client, payload, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, model, int(diarization), cost, client,
+                 json.dumps(payload, ensure_ascii=False), time.time())
+            )
+        return job_id
+
+    def _requeue_lost(self, db: sqlite3.Connection) -> None:
+        """Возвращает в очередь задачи процессов без heartbeat (упали или потеряли сеть)"""
+        deadline = time.time() - self.lease_seconds
+        lost = db.execute(
+            "SELECT job_id, attempts FROM jobs WHERE status = ? AND (worker_id IS NULL OR worker_id NOT IN"
+            " (SELECT worker_id FROM workers WHERE last_seen >= ?))",
+            (RUNNING, deadline)
+        ).fetchall()
+        for job_id, attempts in lost:
+            if attempts >= self.max_attempts:
+                error = {"status_code": 500, "detail": f"Рабочий процесс потерян {attempts} раз подряд"}
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                    (FAILED, json.dumps(error, ensure_ascii=False), time.time(), job_id)
+                )
+            else:
+                db.execute("UPDATE jobs SET status = ?, worker_id = NULL WHERE job_id = ?", (QUEUED, job_id))
+            print(f"[JOB_QUEUE] Задача {job_id} потеряла рабочий процесс (попыток: {attempts})")
+        db.execute("DELETE FROM workers WHERE last_seen < ?", (deadline,))
+
+    def _alive_workers(self, db: sqlite3.Connection) -> Dict[str, Dict]:
+        rows = db.execute(
+            "SELECT worker_id, info FROM workers WHERE last_seen >= ?", (time.time() - self.lease_seconds,)
+        ).fetchall()
+        return {worker_id: json.loads(info) for worker_id, info in rows}
+
+    def _fair_shares(self, db: sqlite3.Connection) -> Dict[str, scheduler.FairShare]:
+        fair = scheduler.new_fair_shares(self.client_weights)
+        for name, value in db.execute("SELECT name, value FROM scheduler_state"):
+            lane = name.partition("/")[2]
+            if name.startswith("virtual_time/") and lane in fair:
+                fair[lane].virtual_time = value
+        for key, last_finish in db.execute("SELECT client, last_finish FROM fair_share"):
+            lane, _, client = key.partition("/")
+            if lane in fair:
+                fair[lane].last_finish[client] = last_finish
+        return fair
+
+    def _charge(self, db: sqlite3.Connection, fair: Dict[str, scheduler.FairShare], job: Dict) -> None:
+        lane = scheduler.lane(job, self.fast_lane_seconds)
+        share = fair[lane]
+        share.charge(job)
+        client = job.get("client") or ""
+        db.execute(
+            "INSERT OR REPLACE INTO scheduler_state (name, value) VALUES (?, ?)",
+            (f"virtual_time/{lane}", share.virtual_time)
+        )
+        db.execute(
+            "INSERT OR REPLACE INTO fair_share (client, last_finish) VALUES (?, ?)",
+            (f"{lane}/{client}", share.last_finish[client])
+        )
+        # Клиенты, у которых все задачи позади виртуального времени, не влияют на теги
+        db.execute(
+            "DELETE FROM fair_share WHERE client LIKE ? AND last_finish <= ?", (f"{lane}/%", share.virtual_time)
+        )
+
+    def claim(self, worker_id: str, models: Optional[List[str]] = None) -> Optional[QueuedJob]:
+        with self._transaction() as db:
+            self._requeue_lost(db)
+            query = ("SELECT job_id, payload, attempts, model, diarization, cost, client, created_at"
+                     " FROM jobs WHERE status = ?")
+            args: list = [QUEUED]
+            if models:
+                query += f" AND (model IS NULL OR model IN ({', '.join('?' * len(models))}))"
+                args.extend(models)
+            rows = db.execute(query + " ORDER BY created_at LIMIT ?", args + [self.SCHEDULING_WINDOW]).fetchall()
+            candidates = [
+                {"job_id": job_id, "payload": payload, "attempts": attempts, "model": model,
+                 "diarization": bool(diarization), "cost": cost, "client": client, "created_at": created_at}
+                for job_id, payload, attempts, model, diarization, cost, client, created_at in rows
+            ]
+            now = time.time()
+            fair = self._fair_shares(db)
+            candidates = scheduler.order(candidates, fair, now, self.fast_lane_seconds, self.starvation_seconds)
+            workers = self._alive_workers(db)
+            workers.setdefault(worker_id, {"models": models})
+            running_bulk = db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND cost > ?", (RUNNING, self.fast_lane_seconds)
+            ).fetchone()[0]
+            capacity = sum(worker.get("capacity", 1) for worker in workers.values())
+            allow_bulk = scheduler.bulk_allowed(running_bulk, capacity, self.fast_lane_reserved)
+            job, cold = scheduler.pick(candidates, worker_id, workers, now, allow_bulk)
+            if job is None:
+                return None
+            self._charge(db, fair, job)
+            db.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, attempts = ?, claimed_at = ? WHERE job_id = ?",
+                (RUNNING, worker_id, job["attempts"] + 1, time.time(), job["job_id"])
+            )
+            for counter in ("claims", "cold_loads") if cold else ("claims",):
+                db.execute(
+                    "INSERT INTO counters (name, value) VALUES (?, 1)"
+                    " ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                    (counter,)
+                )
+        print(f"[JOB_QUEUE] Задача {job['job_id']} -> {worker_id} "
+              f"(полоса {job['lane']}, оценка {job['cost']:.0f} сек, "
+              f"ожидание {now - job['created_at']:.1f} сек)")
+        if cold:
+            print(f"[JOB_QUEUE] Задача {job['job_id']}: холодная загрузка {job['model']}"
+                  f"{' + diarization' if job['diarization'] else ''} в {worker_id}")
+        return QueuedJob(job["job_id"], json.loads(job["payload"]), job["attempts"] + 1)
+
+    def _finish(self, job_id: str, worker_id: str, status: str, column: str, value: Dict) -> bool:
+        with self._transaction() as db:
+            finished = db.execute(
+                f"UPDATE jobs SET status = ?, {column} = ?, finished_at = ?"
+                " WHERE job_id = ? AND worker_id = ? AND status = ?",
+                (status, json.dumps(value, ensure_ascii=False), time.time(), job_id, worker_id, RUNNING)
+            ).rowcount == 1
+        if not finished:
+            # Задачу после потери heartbeat выполняет другой процесс - его результат не перезаписывается
+            print(f"[JOB_QUEUE] ⚠️  Задача {job_id}: результат {worker_id} отброшен - задача уже не его")
+        return finished
+
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        return self._finish(job_id, worker_id, DONE, "result", result)
+
+    def fail(self, job_id: str, worker_id: str, error: Dict) -> bool:
+        return self._finish(job_id, worker_id, FAILED, "error", error)
+
+    def status(self, job_id: str) -> Dict:
+        row = self._connection().execute(
+            "SELECT status, result, error, worker_id, claimed_at, finished_at FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            raise JobQueueError(f"Задача {job_id} не найдена в очереди")
+        status, result, error, worker_id, claimed_at, finished_at = row
+        return {
+            "status": status,
+            "result": json.loads(result) if result else None,
+            "error": json.loads(error) if error else None,
+            "worker_id": worker_id,
+            "claimed_at": claimed_at,
+            "finished_at": finished_at,
+        }
+
+    def delete(self, job_id: str) -> None:
+        with self._transaction() as db:
+            db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def register_worker(self, worker_id: str, info: Dict) -> None:
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, info, registered_at, last_seen) VALUES (?, ?, ?, ?)",
+                (worker_id, json.dumps(info, ensure_ascii=False), now, now)
+            )
+
+    def heartbeat(self, worker_id: str, warm: Optional[Dict] = None) -> None:
+        with self._transaction() as db:
+            row = db.execute("SELECT info FROM workers WHERE worker_id = ?", (worker_id,)).fetchone()
+            updated = 0
+            if row is not None:
+                info = json.loads(row[0])
+                if warm is not None:
+                    info["warm"] = warm
+                updated = db.execute(
+                    "UPDATE workers SET info = ?, last_seen = ? WHERE worker_id = ?",
+                    (json.dumps(info, ensure_ascii=False), time.time(), worker_id)
+                ).rowcount
+        if not updated:
+            raise JobQueueError(f"Рабочий процесс {worker_id} не зарегистрирован")
+
+    def unregister_worker(self, worker_id: str) -> None:
+        with self._transaction() as db:
+            db.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+            db.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL WHERE status = ? AND worker_id = ?",
+                (QUEUED, RUNNING, worker_id)
+            )
+
+    def workers(self) -> List[Dict]:
+        now = time.time()
+        rows = self._connection().execute(
+            "SELECT worker_id, info, registered_at, last_seen FROM workers ORDER BY registered_at"
+        ).fetchall()
+        running = dict(self._connection().execute(
+            "SELECT worker_id, COUNT(*) FROM jobs WHERE status = ? GROUP BY worker_id", (RUNNING,)
+        ).fetchall())
+        return [
+            {
+                "worker_id": worker_id,
+                **json.loads(info),
+                "running": running.get(worker_id, 0),
+                "registered_at": registered_at,
+                "last_seen_seconds_ago": round(now - last_seen, 1),
+                "alive": now - last_seen <= self.lease_seconds,
+            }
+            for worker_id, info, registered_at, last_seen in rows
+        ]
+
+    def stats(self) -> Dict:
+        db = self._connection()
+        counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        stats = {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}
+        lanes = db.execute(
+            "SELECT cost <= ?, COUNT(*), COALESCE(MIN(created_at), 0) FROM jobs WHERE status = ? GROUP BY cost <= ?",
+            (self.fast_lane_seconds, QUEUED, self.fast_lane_seconds)
+        ).fetchall()
+        now = time.time()
+        for fast, count, oldest in lanes:
+            name = scheduler.FAST_LANE if fast else scheduler.BULK_LANE
+            stats[f"queued_{name}"] = count
+            stats[f"oldest_wait_{name}"] = round(now - oldest, 1)
+        # Доля выданных задач, потребовавших холодной загрузки модели
+        counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        claims, cold = counters.get("claims", 0), counters.get("cold_loads", 0)
+        stats["claims"] = claims
+        stats["cold_loads"] = cold
+        stats["cold_load_rate"] = round(cold / claims, 4) if claims else 0.0
+        # Оставшаяся работа (оценка, секунды) и емкость живых процессов - для прогноза ожидания
+        queued_cost, running = db.execute(
+            "SELECT COALESCE(SUM(CASE WHEN status = ? THEN cost END), 0),"
+            " COALESCE(SUM(CASE WHEN status = ? THEN MAX(cost - (? - claimed_at), 0) END), 0) FROM jobs",
+            (QUEUED, RUNNING, now)
+        ).fetchone()
+        stats["backlog_seconds"] = round(queued_cost + running, 1)
+        stats["capacity"] = sum(worker.get("capacity", 1) for worker in self._alive_workers(db).values())
+        return stats
+
+
+def create_job_queue(url: str, lease_seconds: float = 120.0, **scheduling) -> JobQueue:
+    """
+    Очередь по URL: sqlite:///путь/к/queue.db
+
+    Другие брокеры подключаются реализацией JobQueue и веткой здесь.
+
+    Args:
+        scheduling: fast_lane_seconds, starvation_seconds, client_weights, fast_lane_reserved
+    """
+    if url.startswith("sqlite:///"):
+        return SQLiteJobQueue(url[len("sqlite:///"):], lease_seconds=lease_seconds, **scheduling)
+    raise JobQueueError(f"Неподдерживаемая очередь задач: {url} (реализуйте JobQueue для этого брокера)")
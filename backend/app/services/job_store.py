@@ -0,0 +1,435 @@
+"""
+Хранилище задач (job): состояние, параметры, тайминги и результаты
+
+Задача записывается при приеме (running) и обновляется при завершении
+(done, failed, cancelled). Процесс, выполняющий задачу, - ее владелец
+(owner) - продлевает аренду (lease_until, renew); задачи с истекшей арендой
+принадлежат остановившемуся процессу (OOM, деплой) - их входные файлы
+сохранены, и любой процесс с тем же хранилищем (несколько workers uvicorn,
+реплики API) атомарно забирает их себе и запускает заново (claim_expired).
+
+Выполняющаяся задача может публиковать готовые сегменты (со спикерами
+онлайн-diarization) до завершения (append_partial): get возвращает их
+в partial_segments, пока задача running.
+
+Сегменты транскрипции готовых задач хранятся, чтобы субтитры и экспорт
+можно было перегенерировать (другой формат, метки и имена спикеров)
+без повторной загрузки файла и распознавания речи. Результат хранится
+JSON, сжатым zstd (если установлен zstandard) или zlib.
+
+База - файл SQLite (WAL) в директории хранилища: рабочие процессы очереди
+(ROLE=api) пишут в нее результаты своих задач. JSON-файлы задач прежних
+версий переносятся в базу при открытии.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .job_queue import DONE, FAILED, RUNNING
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Задача отменена (клиент отключился, DELETE /api/jobs/{id})
+CANCELLED = "cancelled"
+
+# Уровни сжатия результатов: транскрипция сжимается в 5-10 раз уже на быстрых уровнях
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+
+_COLUMNS = (
+    "job_id, status, created_at, started_at, finished_at, attempts, content_hash,"
+    " transcript_key, params, input_path, cleanup_input, client, error, codec, result,"
+    " owner, lease_until, queue_id"
+)
+
+
+class JobNotFoundError(Exception):
+    """Задача не найдена"""
+
+
+def _compress(data: bytes) -> Tuple[str, bytes]:
+    if ZSTD_AVAILABLE:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Результат сжат zstd - установите zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class JobStore:
+    """Хранилище задач в файле SQLite"""
+
+    DB_NAME = "jobs.db"
+    # Колонки, добавленные после первой версии схемы
+    _ADDED_COLUMNS = {
+        "owner": "TEXT",
+        "lease_until": "REAL",
+        "queue_id": "TEXT",
+    }
+
+    def __init__(self, storage_dir: str, lease_seconds: float = 60.0):
+        """
+        Args:
+            storage_dir: директория хранилища (файл базы jobs.db)
+            lease_seconds: аренда задачи владельцем - без продления дольше этого
+                задачу забирает другой процесс
+        """
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.path = str(self.storage_dir / self.DB_NAME)
+        self.lease_seconds = lease_seconds
+        # Владелец - этот процесс; случайная часть отличает перезапуск с тем же PID (контейнер)
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, status TEXT NOT NULL,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0, content_hash TEXT, transcript_key TEXT,"
+                " params TEXT NOT NULL, input_path TEXT, cleanup_input INTEGER NOT NULL DEFAULT 0,"
+                " client TEXT, error TEXT, codec TEXT, result BLOB)"
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, definition in self._ADDED_COLUMNS.items():
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_content_hash ON jobs (content_hash, finished_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, finished_at)")
+            # Ключи поиска готовой транскрипции (transcript_key и дополнительные) -> задача
+            db.execute("CREATE TABLE IF NOT EXISTS job_keys (key TEXT PRIMARY KEY, job_id TEXT NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS job_keys_job ON job_keys (job_id)")
+            # Сегменты, готовые до завершения задачи, - порциями по мере публикации
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS job_partials ("
+                " job_id TEXT NOT NULL, seq INTEGER NOT NULL, segments TEXT NOT NULL,"
+                " PRIMARY KEY (job_id, seq))"
+            )
+        self._import_json()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение на поток: запросы API выполняются в пуле потоков
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _import_json(self) -> None:
+        """Переносит в базу задачи, сохраненные прежними версиями в <job_id>.json"""
+        imported = 0
+        for path in self.storage_dir.glob("*.json"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+                self.save(
+                    job["result"], job.get("params", {}), job.get("content_hash"), job.get("transcript_key"),
+                    job["job_id"], job.get("alias_keys", []), created_at=job.get("created_at")
+                )
+            except (OSError, ValueError, KeyError):
+                continue
+            path.unlink(missing_ok=True)
+            imported += 1
+        if imported:
+            print(f"[JOB_STORE] Перенесено в базу задач из JSON-файлов: {imported}")
+
+    def start(
+        self,
+        job_id: str,
+        params: Dict,
+        content_hash: Optional[str] = None,
+        input_path: Optional[str] = None,
+        cleanup_input: bool = False,
+        client: Optional[str] = None
+    ) -> None:
+        """
+        Записывает принятую задачу (running; повторный запуск увеличивает attempts)
+
+        Владелец задачи - этот процесс; аренда действует lease_seconds (продлевается renew).
+
+        Args:
+            input_path: входной файл - по нему задача перезапускается после сбоя процесса
+            cleanup_input: входной файл временный (удаляется после обработки)
+            client: клиент запроса (справедливая доля в очереди при перезапуске)
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (job_id, status, created_at, started_at, attempts, content_hash,"
+                " params, input_path, cleanup_input, client, owner, lease_until)"
+                " VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (job_id) DO UPDATE SET status = excluded.status,"
+                " started_at = excluded.started_at, attempts = attempts + 1, finished_at = NULL, error = NULL,"
+                " owner = excluded.owner, lease_until = excluded.lease_until",
+                (job_id, RUNNING, now, now, content_hash, json.dumps(params, ensure_ascii=False),
+                 input_path, int(cleanup_input), client, self.owner, now + self.lease_seconds)
+            )
+            # Перезапуск распознает запись заново
+            db.execute("DELETE FROM job_partials WHERE job_id = ?", (job_id,))
+
+    def save(
+        self,
+        result: Dict,
+        params: Dict,
+        content_hash: Optional[str] = None,
+        transcript_key: Optional[str] = None,
+        job_id: Optional[str] = None,
+        alias_keys: Iterable[str] = (),
+        created_at: Optional[float] = None
+    ) -> str:
+        """
+        Сохраняет результат распознавания (задача завершена)
+
+        Args:
+            result: результат speech_service.transcribe()
+            params: параметры конвертации
+            content_hash: SHA-256 исходного файла
+            transcript_key: ключ для поиска готовой транскрипции (хэш + параметры распознавания)
+            job_id: идентификатор, выданный задаче при приеме (None - новый)
+            alias_keys: дополнительные ключи поиска (транскрипция для повторной
+                diarization с другим количеством спикеров)
+            created_at: время приема (по умолчанию - время записи задачи при start или сейчас)
+
+        Returns:
+            идентификатор задачи
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        codec, data = _compress(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (job_id, status, created_at, finished_at, content_hash, transcript_key,"
+                " params, codec, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (job_id) DO UPDATE SET status = excluded.status,"
+                " finished_at = excluded.finished_at, content_hash = excluded.content_hash,"
+                " transcript_key = excluded.transcript_key, params = excluded.params,"
+                " codec = excluded.codec, result = excluded.result, error = NULL",
+                (job_id, DONE, created_at or now, now, content_hash, transcript_key,
+                 json.dumps(params, ensure_ascii=False), codec, sqlite3.Binary(data))
+            )
+            for key in [transcript_key, *alias_keys]:
+                if key:
+                    db.execute("INSERT OR REPLACE INTO job_keys (key, job_id) VALUES (?, ?)", (key, job_id))
+            # Сегменты есть в результате
+            db.execute("DELETE FROM job_partials WHERE job_id = ?", (job_id,))
+        return job_id
+
+    def fail(self, job_id: str, error: Dict, status: str = FAILED) -> None:
+        """Завершает задачу с ошибкой (status - failed или cancelled)"""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+                (status, json.dumps(error, ensure_ascii=False), time.time(), job_id, RUNNING)
+            )
+            db.execute("DELETE FROM job_partials WHERE job_id = ?", (job_id,))
+
+    def append_partial(self, job_id: str, segments: List[Dict]) -> None:
+        """
+        Публикует сегменты выполняющейся задачи, готовые до ее завершения
+
+        Сегменты - словари формата ответа API (id, start, end, text, speaker);
+        порции добавляются по порядку. Завершенной задаче не добавляются.
+        """
+        if not segments:
+            return
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO job_partials (job_id, seq, segments)"
+                " SELECT ?, COALESCE((SELECT MAX(seq) FROM job_partials WHERE job_id = ?), -1) + 1, ?"
+                " WHERE EXISTS (SELECT 1 FROM jobs WHERE job_id = ? AND status = ?)",
+                (job_id, job_id, json.dumps(segments, ensure_ascii=False), job_id, RUNNING)
+            )
+
+    def partial_segments(self, job_id: str) -> List[Dict]:
+        """Сегменты, опубликованные выполняющейся задачей (append_partial), по порядку"""
+        segments = []
+        for (chunk,) in self._connection().execute(
+            "SELECT segments FROM job_partials WHERE job_id = ? ORDER BY seq", (job_id,)
+        ):
+            segments.extend(json.loads(chunk))
+        return segments
+
+    def set_queue_id(self, job_id: str, queue_id: str) -> None:
+        """Запоминает задачу в очереди рабочих процессов (ROLE=api): после перезапуска API ждет ее же"""
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET queue_id = ? WHERE job_id = ?", (queue_id, job_id))
+
+    def renew(self, job_ids: Iterable[str]) -> int:
+        """
+        Продлевает аренду задач этого процесса
+
+        Задачи, которые за время простоя забрал другой процесс, не продлеваются.
+
+        Returns:
+            количество продленных задач
+        """
+        lease_until = time.time() + self.lease_seconds
+        renewed = 0
+        with self._transaction() as db:
+            for job_id in job_ids:
+                renewed += db.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND owner = ? AND status = ?",
+                    (lease_until, job_id, self.owner, RUNNING)
+                ).rowcount
+        return renewed
+
+    def claim_expired(self) -> List[Dict]:
+        """
+        Забирает задачи с истекшей арендой (владелец остановился) в порядке приема
+
+        Задачу забирает ровно один процесс: аренда проверяется в том же UPDATE,
+        что назначает владельца.
+        """
+        now = time.time()
+        claimed = []
+        with self._transaction() as db:
+            candidates = db.execute(
+                "SELECT job_id FROM jobs WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)"
+                " ORDER BY created_at",
+                (RUNNING, now)
+            ).fetchall()
+            for (job_id,) in candidates:
+                cursor = db.execute(
+                    "UPDATE jobs SET owner = ?, lease_until = ?"
+                    " WHERE job_id = ? AND status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                    (self.owner, now + self.lease_seconds, job_id, RUNNING, now)
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(job_id)
+        return [self.get(job_id) for job_id in claimed]
+
+    def remember(self, transcript_key: Optional[str], job_id: str) -> None:
+        """Добавляет ключ поиска задачи, сохраненной другим процессом (рабочим процессом очереди)"""
+        if transcript_key:
+            with self._transaction() as db:
+                db.execute("INSERT OR REPLACE INTO job_keys (key, job_id) VALUES (?, ?)", (transcript_key, job_id))
+
+    def _job(self, row: tuple, with_result: bool = True) -> Dict:
+        (job_id, status, created_at, started_at, finished_at, attempts, content_hash, transcript_key,
+         params, input_path, cleanup_input, client, error, codec, result, owner, lease_until, queue_id) = row
+        alias_keys = [
+            key for (key,) in self._connection().execute("SELECT key FROM job_keys WHERE job_id = ?", (job_id,))
+            if key != transcript_key
+        ]
+        return {
+            "job_id": job_id,
+            "status": status,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "attempts": attempts,
+            "content_hash": content_hash,
+            "transcript_key": transcript_key,
+            "alias_keys": alias_keys,
+            "params": json.loads(params),
+            "input_path": input_path,
+            "cleanup_input": bool(cleanup_input),
+            "client": client,
+            "owner": owner,
+            "lease_until": lease_until,
+            "queue_id": queue_id,
+            "error": json.loads(error) if error else None,
+            "result": json.loads(_decompress(codec, result)) if with_result and result is not None else None,
+        }
+
+    def get(self, job_id: str) -> Dict:
+        """
+        Загружает задачу по идентификатору
+
+        result - None, пока задача не завершена; у выполняющейся задачи
+        partial_segments - сегменты, опубликованные до завершения.
+        """
+        row = self._connection().execute(f"SELECT {_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise JobNotFoundError(f"Задача {job_id} не найдена")
+        job = self._job(row)
+        if job["status"] == RUNNING:
+            job["partial_segments"] = self.partial_segments(job_id)
+        return job
+
+    def find_by_transcript_key(self, transcript_key: str) -> Optional[Dict]:
+        """Ищет задачу с уже готовой транскрипцией того же файла с теми же параметрами"""
+        row = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM jobs"
+            " WHERE job_id = (SELECT job_id FROM job_keys WHERE key = ?) AND status = ?",
+            (transcript_key, DONE)
+        ).fetchone()
+        return self._job(row) if row is not None else None
+
+    def find_by_content_hash(self, content_hash: str, limit: int = 100) -> List[Dict]:
+        """Задачи файла с этим хэшем, новые первыми (без результатов - их загружает get)"""
+        rows = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM jobs WHERE content_hash = ? ORDER BY created_at DESC LIMIT ?",
+            (content_hash, limit)
+        ).fetchall()
+        return [self._job(row, with_result=False) for row in rows]
+
+    def cleanup_expired(self, retention_seconds: float) -> int:
+        """
+        Удаляет задачи, завершенные раньше retention_seconds назад, и их ключи
+
+        Временные входные файлы завершенных задач (оставшиеся после сбоя) удаляются.
+
+        Returns:
+            количество удаленных задач
+        """
+        deadline = time.time() - retention_seconds
+        with self._transaction() as db:
+            expired = db.execute(
+                "SELECT job_id, input_path, cleanup_input FROM jobs WHERE status != ? AND finished_at < ?",
+                (RUNNING, deadline)
+            ).fetchall()
+            for job_id, _, _ in expired:
+                db.execute("DELETE FROM job_keys WHERE job_id = ?", (job_id,))
+                db.execute("DELETE FROM job_partials WHERE job_id = ?", (job_id,))
+                db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        for _, input_path, cleanup_input in expired:
+            if cleanup_input and input_path and os.path.exists(input_path):
+                os.unlink(input_path)
+        return len(expired)
+
+    def input_paths(self) -> List[str]:
+        """Входные файлы незавершенных задач (нужны для перезапуска - не удаляются очисткой)"""
+        return [
+            path for (path,) in self._connection().execute(
+                "SELECT input_path FROM jobs WHERE status = ? AND input_path IS NOT NULL", (RUNNING,)
+            )
+        ]
+
+    def stats(self) -> Dict:
+        counts = dict(self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {
+            "jobs": sum(counts.values()),
+            **{status: counts.get(status, 0) for status in (RUNNING, DONE, FAILED, CANCELLED)},
+            "codec": "zstd" if ZSTD_AVAILABLE else "zlib",
+        }
@@ -0,0 +1,196 @@
+"""
+Обработка длинных записей с ограниченным потреблением памяти
+
+Аудио читается окнами из pipe ffmpeg (PCM s16le, 16 кГц, моно) и подается
+движку распознавания по частям. Готовые сегменты сразу дописываются
+в файл на диске (SegmentSpool), поэтому пиковая память определяется размером
+окна, а не длительностью записи: WAV целиком не извлекается, а волна
+и mel-спектрограмма всей записи не строятся.
+
+Границы окон не совпадают с паузами, поэтому сегменты в конце окна,
+которые могли быть обрезаны, не фиксируются: их аудио переносится
+в начало следующего окна и распознается заново.
+"""
+import json
+import os
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2  # PCM s16le
+BYTES_PER_SECOND = SAMPLE_RATE * BYTES_PER_SAMPLE
+
+# Движок для одного окна: (PCM s16le, язык или None) -> (сегменты относительно начала окна, язык)
+WindowTranscriber = Callable[[bytes, Optional[str]], Tuple[Iterable, Optional[str]]]
+
+
+def iter_pcm_windows(stream, window_seconds: float) -> Iterator[bytes]:
+    """Читает PCM из потока (stdout ffmpeg) окнами по window_seconds"""
+    window_bytes = int(window_seconds * SAMPLE_RATE) * BYTES_PER_SAMPLE
+    while True:
+        # read(n) у буферизованного pipe возвращает меньше n байт только в конце потока
+        window = stream.read(window_bytes)
+        if not window:
+            return
+        yield window
+
+
+def pcm_to_float32(pcm: bytes):
+    """PCM s16le -> numpy float32 в диапазоне [-1, 1] (формат входа Whisper)"""
+    import numpy as np
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def _segment_fields(seg) -> Tuple[float, float, str, Optional[List]]:
+    """Поля сегмента openai-whisper (словарь) или faster-whisper (объект)"""
+    if isinstance(seg, dict):
+        return seg.get("start", 0), seg.get("end", 0), seg.get("text", ""), seg.get("words")
+    return seg.start, seg.end, seg.text, getattr(seg, "words", None)
+
+
+def _shift_words(words: Optional[List], offset: float) -> Optional[List[Dict]]:
+    if words is None:
+        return None
+    shifted = []
+    for word in words:
+        if isinstance(word, dict):
+            start, end = word.get("start", 0), word.get("end", 0)
+            text, probability = word.get("word", ""), word.get("probability", 0.0)
+        else:
+            start, end, text, probability = word.start, word.end, word.word, word.probability
+        shifted.append({
+            "word": text,
+            "start": start + offset,
+            "end": end + offset,
+            "probability": probability,
+        })
+    return shifted
+
+
+class SegmentSpool:
+    """
+    Дописываемый файл готовых сегментов (JSON Lines)
+
+    Сегменты не держатся в памяти во время распознавания; после завершения
+    они читаются потоком (iter_segments) прямо в колоночный Transcript.
+    """
+
+    def __init__(self, directory: Optional[str] = None, on_append: Optional[Callable[[float, float, str], None]] = None):
+        """
+        Args:
+            on_append: вызывается с (start, end, text) каждого записанного сегмента
+                       (онлайн-diarization и частичные результаты по мере распознавания)
+        """
+        fd, self.path = tempfile.mkstemp(suffix=".segments.jsonl", dir=directory)
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        self.on_append = on_append
+        self.count = 0
+        self.end = 0.0
+
+    def append(self, start: float, end: float, text: str, words: Optional[List[Dict]] = None) -> None:
+        record = {"start": start, "end": end, "text": text.strip()}
+        if words is not None:
+            record["words"] = words
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
+        self.end = end
+        if self.on_append is not None:
+            self.on_append(start, end, record["text"])
+
+    def iter_segments(self) -> Iterator[Dict]:
+        """Читает сегменты с диска по одному"""
+        self._file.flush()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "SegmentSpool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class LongFormTranscriber:
+    """Распознавание потока окон с переносом незавершенного хвоста в следующее окно"""
+
+    def __init__(
+        self,
+        transcribe_window: WindowTranscriber,
+        commit_margin: float = 5.0,
+        max_carry: float = 30.0
+    ):
+        """
+        Args:
+            transcribe_window: движок распознавания одного окна
+            commit_margin: сегменты, заканчивающиеся ближе этого (сек) к концу окна,
+                           не фиксируются - их аудио переносится в следующее окно
+            max_carry: максимальная длительность переносимого хвоста (сек) -
+                       ограничивает рост буфера, если в конце окна долго нет границ сегментов
+        """
+        self.transcribe_window = transcribe_window
+        self.commit_margin = commit_margin
+        self.max_carry = max_carry
+
+    def run(
+        self,
+        windows: Iterable[bytes],
+        spool: SegmentSpool,
+        language: Optional[str] = None,
+        on_progress: Optional[Callable[[float], None]] = None
+    ) -> Optional[str]:
+        """
+        Распознает все окна и дописывает сегменты в spool (время - от начала записи)
+
+        Язык определяется по первому окну и фиксируется для остальных,
+        чтобы части записи не распознавались на разных языках.
+
+        Returns:
+            язык записи
+        """
+        pending = bytearray()
+        offset = 0.0  # время начала pending от начала записи
+        iterator = iter(windows)
+        window = next(iterator, None)
+
+        while window is not None:
+            pending += window
+            window = next(iterator, None)
+            final = window is None
+
+            duration = len(pending) / BYTES_PER_SECOND
+            segments, detected_language = self.transcribe_window(bytes(pending), language)
+            language = language or detected_language
+
+            commit_limit = duration if final else duration - self.commit_margin
+            cut = 0.0 if final else max(0.0, duration - self.max_carry)
+            committed_end = 0.0
+            for seg in segments:
+                start, end, text, words = _segment_fields(seg)
+                # Сегмент, начавшийся до принудительного среза, фиксируется целиком -
+                # иначе его начало было бы потеряно
+                if end > commit_limit and start >= cut:
+                    break
+                spool.append(offset + start, offset + end, text, _shift_words(words, offset))
+                committed_end = end
+
+            if on_progress:
+                on_progress(offset + (duration if final else max(committed_end, cut)))
+            if final:
+                break
+
+            # В следующее окно переходит только незафиксированный хвост
+            cut_bytes = int(max(committed_end, cut) * SAMPLE_RATE) * BYTES_PER_SAMPLE
+            del pending[:cut_bytes]
+            offset += cut_bytes / BYTES_PER_SECOND
+
+        return language
@@ -0,0 +1,68 @@
+"""
+Метрики процесса: счетчики, значения и распределения
+
+Сервисы обновляют метрики через общий экземпляр metrics; GET /api/metrics
+отдает их в JSON или в текстовом формате Prometheus (?format=prometheus).
+Метрики, общие для нескольких процессов (очередь задач), берутся из брокера.
+"""
+import threading
+from typing import Dict
+
+
+class Metrics:
+    """Потокобезопасный набор метрик процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        # name -> [count, sum, max]
+        self._summaries: Dict[str, list] = {}
+
+    def inc(self, name: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0.0) + value
+
+    def set(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            summary = self._summaries.setdefault(name, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {
+                    name: {"count": count, "sum": round(total, 6), "max": round(peak, 6)}
+                    for name, (count, total, peak) in self._summaries.items()
+                },
+            }
+
+
+def render_prometheus(values: Dict[str, float]) -> str:
+    """Плоский словарь метрик в текстовом формате Prometheus"""
+    return "".join(
+        f"videoconverter_{name} {int(value) if isinstance(value, bool) else value}\n"
+        for name, value in sorted(values.items())
+    )
+
+
+def flatten(snapshot: Dict) -> Dict[str, float]:
+    """Снимок Metrics.snapshot() в плоский словарь для render_prometheus"""
+    values = dict(snapshot["counters"])
+    values.update(snapshot["gauges"])
+    for name, summary in snapshot["summaries"].items():
+        values[f"{name}_count"] = summary["count"]
+        values[f"{name}_sum"] = summary["sum"]
+        values[f"{name}_max"] = summary["max"]
+    return values
+
+
+metrics = Metrics()
@@ -0,0 +1,235 @@
+"""
+Онлайн-diarization для потокового и живого распознавания
+
+simple_diarization и pyannote назначают спикеров только по полному списку
+сегментов. OnlineDiarizer принимает окна аудио и сегменты по мере их
+появления и выдает метку спикера каждого сегмента с ограниченной
+задержкой: решение по сегменту принимается, когда после его конца
+распознано еще lookahead_seconds аудио (следующие сегменты помогают
+отличить смену спикера от шума).
+
+Признаки те же, что у spectral_diarization (MFCC и основной тон); сегмент
+присоединяется к ближайшему спикеру или открывает нового, если расхождение
+гауссиан на кадр со всеми спикерами выше порога. Состояние задачи
+компактно: статистика каждого спикера (число кадров, суммы признаков и их
+квадратов), сегменты в окне ожидания и кадры аудио, которые им еще нужны.
+Выданные метки не пересматриваются.
+"""
+from array import array
+from typing import Callable, List, Optional, Tuple
+
+from .long_form import SAMPLE_RATE
+from .spectral_diarization import (
+    HOP_LENGTH,
+    MAX_SPEAKERS,
+    MIN_REGION_SECONDS,
+    N_MFCC,
+    NUMPY_AVAILABLE,
+    frame_features,
+    gaussians,
+    log_det,
+    log_likelihood,
+    range_statistics,
+    seconds_to_frames,
+)
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+# Задержка решения по сегменту (секунды аудио после его конца)
+LOOKAHEAD_SECONDS = 10.0
+# Сегмент относится к новому спикеру, если расхождение (рост отрицательного
+# log-правдоподобия на кадр при слиянии) со всеми известными спикерами выше порога
+# (подобран на записях benchmarks.bench_diarization)
+NEW_SPEAKER_DIVERGENCE = 4.0
+# Новый спикер открывается по группе сегментов не короче (озвученные секунды)
+NEW_SPEAKER_SECONDS = 2.0
+
+# Метка готова: (номер сегмента, спикер)
+LabelCallback = Callable[[int, str], None]
+
+
+def divergence(count, sums, squares, counts, cluster_sums, cluster_squares) -> "np.ndarray":
+    """Расхождение сегмента с каждым кластером: прирост dBIC без штрафа на кадр"""
+    merged = log_det(counts + count, cluster_sums + sums, cluster_squares + squares)
+    own = log_det(np.array([count]), sums[None], squares[None])[0]
+    data = (counts + count) * merged - counts * log_det(counts, cluster_sums, cluster_squares) - count * own
+    # Нормировка на эффективный объем n*N/(n+N): против кластера того же размера
+    # расхождение вдвое меньше, чем против большого, - порог один для обоих случаев
+    return 0.5 * data * (counts + count) / np.maximum(counts * count, 1.0)
+
+
+class OnlineDiarizer:
+    """
+    Потоковое назначение спикеров одной задачи
+
+    Порядок вызовов: add_audio - окна аудио подряд с начала записи;
+    add_segment - сегменты в порядке времени (их аудио уже должно быть
+    передано, либо передается вместе с сегментом); flush - в конце записи.
+    """
+
+    def __init__(
+        self,
+        lookahead_seconds: float = LOOKAHEAD_SECONDS,
+        num_speakers: Optional[int] = None,
+        max_speakers: int = MAX_SPEAKERS,
+        on_label: Optional[LabelCallback] = None
+    ):
+        """
+        Args:
+            lookahead_seconds: задержка решения по сегменту
+            num_speakers: известное количество спикеров (верхняя граница)
+            on_label: вызывается для каждой готовой метки (доставка клиенту)
+        """
+        self.lookahead_seconds = lookahead_seconds
+        self.max_speakers = num_speakers or max_speakers
+        self.on_label = on_label
+        # Статистика спикеров: число озвученных кадров, суммы признаков и их квадратов
+        self._counts = np.zeros(0)
+        self._sums = np.zeros((0, N_MFCC))
+        self._squares = np.zeros((0, N_MFCC))
+        # Номер спикера каждого сегмента, по которому принято решение
+        self.labels = array("H")
+        # Сегменты в окне ожидания: (начало, конец, статистика)
+        self._pending: List[Tuple[float, float, Tuple]] = []
+        # Кадры аудио с номера _frames_start; хвост окна - для кадров на стыке окон
+        self._features = np.zeros((0, N_MFCC), dtype=np.float32)
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._frames_start = 0
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._samples = 0
+        self._previous: Optional[int] = None
+        self._decided_until = 0.0
+
+    @property
+    def num_speakers(self) -> int:
+        return len(self._counts)
+
+    @property
+    def audio_seconds(self) -> float:
+        return self._samples / SAMPLE_RATE
+
+    def speaker_labels(self) -> List[str]:
+        """Метки всех сегментов, по которым принято решение"""
+        return [f"SPEAKER_{speaker:02d}" for speaker in self.labels]
+
+    def add_audio(self, samples) -> None:
+        """Следующее окно аудио (float32 16 кГц, продолжение предыдущего)"""
+        samples = np.asarray(samples, dtype=np.float32)
+        buffer = np.concatenate([self._tail, samples])
+        # Начало буфера - на сетке кадров (кратно HOP_LENGTH от начала записи)
+        buffer_start = self._samples - len(self._tail)
+        self._samples += len(samples)
+        features, weights = frame_features(buffer)
+        if not len(self._weights):
+            self._frames_start = buffer_start // HOP_LENGTH
+        self._features = np.concatenate([self._features, features])
+        self._weights = np.concatenate([self._weights, weights])
+        # Кадры, не поместившиеся в буфер целиком, считаются со следующим окном
+        next_frame = len(features)
+        self._tail = buffer[next_frame * HOP_LENGTH:]
+
+    def add_segment(self, start: float, end: float, samples=None) -> List[Tuple[int, str]]:
+        """
+        Очередной сегмент; samples - его аудио, если окна не передаются через add_audio
+
+        Returns:
+            метки, готовые после этого сегмента: [(номер сегмента, спикер)]
+        """
+        if samples is not None:
+            features, weights = frame_features(samples)
+            stats = range_statistics(features, weights, np.array([0]), np.array([len(weights)]))
+        else:
+            stats = self._statistics(start, end)
+        self._pending.append((start, end, tuple(part[0] for part in stats)))
+        return self._decide(end - self.lookahead_seconds)
+
+    def flush(self) -> List[Tuple[int, str]]:
+        """Конец записи: решение по всем оставшимся сегментам"""
+        return self._decide(float("inf"))
+
+    def _statistics(self, start: float, end: float):
+        first = seconds_to_frames([start]) - self._frames_start
+        last = seconds_to_frames([end]) - self._frames_start
+        return range_statistics(self._features, self._weights, first, last)
+
+    def _decide(self, until: float) -> List[Tuple[int, str]]:
+        """Решение по сегментам, закончившимся не позже until; остальные - контекст"""
+        ready = sum(1 for _, end, _ in self._pending if end <= until)
+        if not ready:
+            return []
+        assignments = self._cluster_pending(ready)
+        emitted = []
+        for speaker in assignments:
+            self.labels.append(speaker)
+            index = len(self.labels) - 1
+            label = f"SPEAKER_{speaker:02d}"
+            emitted.append((index, label))
+            if self.on_label is not None:
+                self.on_label(index, label)
+        self._decided_until = self._pending[ready - 1][1]
+        del self._pending[:ready]
+        self._trim_frames()
+        return emitted
+
+    def _cluster_pending(self, ready: int) -> List[int]:
+        """Номера спикеров первых ready сегментов ожидания (новые спикеры получают следующие номера)"""
+        counts = np.array([stats[0] for _, _, stats in self._pending])
+        sums = np.array([stats[1] for _, _, stats in self._pending]).reshape(-1, N_MFCC)
+        squares = np.array([stats[2] for _, _, stats in self._pending]).reshape(-1, N_MFCC)
+        reliable = counts * HOP_LENGTH / SAMPLE_RATE >= MIN_REGION_SECONDS
+        assignments = []
+        for i in range(ready):
+            if not reliable[i]:
+                speaker = self._nearest(counts[i], sums[i], squares[i])
+            else:
+                # Сегмент оценивается вместе с близкими к нему следующими сегментами окна
+                # ожидания (обычно - продолжение той же реплики): больше кадров - надежнее решение
+                group = [i] + [
+                    j for j in range(i + 1, len(self._pending))
+                    if reliable[j] and divergence(counts[i], sums[i], squares[i], counts[j:j + 1],
+                                                  sums[j:j + 1], squares[j:j + 1])[0] < NEW_SPEAKER_DIVERGENCE
+                ]
+                speaker = self._match(counts[group].sum(), sums[group].sum(axis=0), squares[group].sum(axis=0))
+            self._add_to_speaker(speaker, (counts[i], sums[i], squares[i]))
+            self._previous = speaker
+            assignments.append(speaker)
+        return assignments
+
+    def _match(self, count, sums, squares) -> int:
+        """Ближайший спикер по расхождению на кадр; новый спикер, если все дальше порога"""
+        if self.num_speakers:
+            distances = divergence(count, sums, squares, self._counts, self._sums, self._squares)
+            nearest = int(np.argmin(distances))
+            if (distances[nearest] < NEW_SPEAKER_DIVERGENCE or self.num_speakers >= self.max_speakers
+                    or count * HOP_LENGTH / SAMPLE_RATE < NEW_SPEAKER_SECONDS):
+                return nearest
+        return self.num_speakers
+
+    def _nearest(self, count, sums, squares) -> int:
+        """Короткий сегмент - к наиболее правдоподобному спикеру; без озвученных кадров - к предыдущему"""
+        if count <= 0 or not self.num_speakers:
+            return self._previous if self._previous is not None else 0
+        means, variances = gaussians(self._counts, self._sums, self._squares)
+        return int(np.argmax(log_likelihood(
+            np.array([count]), sums[None], squares[None], means, variances
+        )[0]))
+
+    def _add_to_speaker(self, speaker: int, stats: Tuple) -> None:
+        count, sums, squares = stats
+        if speaker >= self.num_speakers:
+            self._counts = np.append(self._counts, 0.0)
+            self._sums = np.vstack([self._sums, np.zeros(N_MFCC)])
+            self._squares = np.vstack([self._squares, np.zeros(N_MFCC)])
+        self._counts[speaker] += count
+        self._sums[speaker] += sums
+        self._squares[speaker] += squares
+
+    def _trim_frames(self) -> None:
+        """Удаляет кадры до начала самого раннего сегмента ожидания (следующие сегменты начнутся позже)"""
+        keep_from = int(seconds_to_frames([self._pending[0][0] if self._pending else self._decided_until])[0])
+        drop = min(max(keep_from - self._frames_start, 0), len(self._weights))
+        if drop:
+            self._features = self._features[drop:]
+            self._weights = self._weights[drop:]
+            self._frames_start += drop
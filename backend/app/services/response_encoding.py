@@ -0,0 +1,137 @@
+"""
+Компактные ответы API: выбор полей, быстрая сериализация и сжатие
+
+- fields: клиент перечисляет нужные поля верхнего уровня (text, segments, speakers, ...)
+- сериализация: orjson (если установлен) или стандартный json; msgpack по заголовку Accept
+- сжатие: brotli (если установлен) или gzip по заголовку Accept-Encoding
+"""
+import gzip
+import json
+from typing import Dict, Iterable, Optional, Tuple
+
+from starlette.responses import Response
+
+# Быстрая сериализация JSON (опционально)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# MessagePack (опционально)
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Brotli (опционально)
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Поля, которые возвращаются всегда, независимо от fields
+ALWAYS_INCLUDED_FIELDS = ("success", "job_id")
+
+# Ответы меньше этого размера не сжимаются
+MIN_COMPRESS_SIZE = 1024
+
+
+def select_fields(data: Dict, fields: Optional[str]) -> Dict:
+    """
+    Оставляет в ответе только запрошенные поля верхнего уровня
+
+    Args:
+        fields: список полей через запятую (например "text,segments"); None - все поля
+    """
+    if not fields:
+        return data
+    wanted = {name.strip() for name in fields.split(",") if name.strip()}
+    wanted.update(ALWAYS_INCLUDED_FIELDS)
+    return {key: value for key, value in data.items() if key in wanted}
+
+
+def round_segments(segments: Iterable[Dict], precision: int = 3) -> list:
+    """Округляет start/end сегментов (по умолчанию до миллисекунд)"""
+    rounded = []
+    for seg in segments:
+        seg = dict(seg)
+        if "start" in seg:
+            seg["start"] = round(seg["start"], precision)
+        if "end" in seg:
+            seg["end"] = round(seg["end"], precision)
+        rounded.append(seg)
+    return rounded
+
+
+def _accepts(header: Optional[str], token: str) -> bool:
+    """Проверяет, что token есть в заголовке Accept/Accept-Encoding и не запрещен через q=0"""
+    if not header:
+        return False
+    for part in header.split(","):
+        name, *params = [item.strip() for item in part.split(";")]
+        if name.lower() != token:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def serialize(data: Dict, accept: Optional[str] = None) -> Tuple[bytes, str]:
+    """
+    Сериализует ответ с учетом заголовка Accept
+
+    Returns:
+        (тело ответа, media type)
+    """
+    if MSGPACK_AVAILABLE and any(_accepts(accept, media_type) for media_type in MSGPACK_MEDIA_TYPES):
+        return msgpack.packb(data, use_bin_type=True), "application/msgpack"
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data), "application/json"
+    return (
+        json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        "application/json"
+    )
+
+
+def compress(body: bytes, accept_encoding: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+    """
+    Сжимает тело ответа, если клиент это поддерживает
+
+    Returns:
+        (тело, значение Content-Encoding или None)
+    """
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    if BROTLI_AVAILABLE and _accepts(accept_encoding, "br"):
+        # quality 5 - разумный компромисс между степенью сжатия и временем для больших ответов
+        return brotli.compress(body, quality=5), "br"
+    if _accepts(accept_encoding, "gzip"):
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+def encode_response(
+    data: Dict,
+    accept: Optional[str] = None,
+    accept_encoding: Optional[str] = None,
+    fields: Optional[str] = None,
+    status_code: int = 200
+) -> Response:
+    """Формирует HTTP-ответ: выбор полей -> сериализация -> сжатие"""
+    body, media_type = serialize(select_fields(data, fields), accept)
+    body, content_encoding = compress(body, accept_encoding)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
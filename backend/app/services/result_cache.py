@@ -0,0 +1,47 @@
+"""
+Кэш результатов конвертации по хэшу содержимого файла и параметрам распознавания
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class ResultCache:
+    """LRU-кэш готовых ответов API (в памяти процесса)"""
+
+    def __init__(self, max_entries: int = 64, ttl: float = 24 * 3600):
+        """
+        Args:
+            max_entries: максимальное количество результатов в кэше
+            ttl: время жизни результата в секундах
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(content_hash: str, params: Dict) -> str:
+        """Ключ кэша: хэш файла + канонический JSON параметров"""
+        return f"{content_hash}:{json.dumps(params, sort_keys=True, ensure_ascii=False)}"
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if time.time() - created_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
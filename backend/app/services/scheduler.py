@@ -0,0 +1,233 @@
+"""
+Выбор задачи из очереди для рабочего процесса
+
+Model affinity: загрузка medium/large занимает секунды и гигабайты памяти,
+поэтому рабочий процесс в первую очередь берет задачи для уже загруженных
+моделей (и пайплайна diarization). Задачу, требующую холодной загрузки,
+он берет, только если ни у одного живого процесса эта модель не загружена
+или задача ждет дольше, чем стоит загрузка, - тогда ожидание теплого
+процесса обходится дороже.
+
+Порядок задач (order): стоимость задачи оценивается по длительности аудио
+(ffprobe) и размеру модели. Короткие задачи идут в быструю полосу и не ждут
+за многочасовыми записями; внутри полосы клиенты (API-ключи) делят
+рабочие процессы по весам - взвешенная справедливая очередь (WFQ) по
+виртуальному времени начала/завершения. Задача, ждущая дольше порога
+голодания, обслуживается первой независимо от полосы.
+
+Функции не зависят от брокера: задачи и процессы передаются словарями.
+    задача:  {"job_id", "model", "diarization", "created_at", "cost", "client", ...}
+    процесс: {"models": [обслуживаемые] или None, "warm": SpeechService.warm_state()}
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Оценка времени загрузки моделей (секунды, CPU), пока процессы не сообщили измеренное
+MODEL_LOAD_SECONDS = {
+    "tiny": 1.0,
+    "base": 2.0,
+    "small": 5.0,
+    "medium": 15.0,
+    "large": 30.0,
+    "large-v2": 30.0,
+    "large-v3": 30.0,
+}
+DEFAULT_LOAD_SECONDS = 10.0
+DIARIZATION_LOAD_SECONDS = 20.0
+
+# Секунды вычислений на секунду аудио (CPU, int8) - оценка стоимости задачи
+MODEL_COST_FACTOR = {
+    "tiny": 0.05,
+    "base": 0.1,
+    "small": 0.25,
+    "medium": 0.6,
+    "large": 1.2,
+    "large-v2": 1.2,
+    "large-v3": 1.2,
+}
+DEFAULT_COST_FACTOR = 0.3
+DIARIZATION_COST_FACTOR = 0.15
+
+FAST_LANE = "fast"
+BULK_LANE = "bulk"
+# Задачи дешевле этого (секунды вычислений) идут в быструю полосу
+FAST_LANE_SECONDS = 120.0
+# Задача, ждущая дольше этого (секунды), обслуживается первой
+STARVATION_SECONDS = 1800.0
+# Слоты рабочих процессов, которые не занимаются длинными задачами: без резерва
+# многочасовые записи занимают все процессы на часы, и быстрая полоса стоит
+FAST_LANE_RESERVED = 1
+
+
+def estimate_cost(duration: float, model: Optional[str], diarization: bool = False) -> float:
+    """Оценка времени обработки задачи (секунды) по длительности аудио и модели"""
+    factor = MODEL_COST_FACTOR.get(model, DEFAULT_COST_FACTOR)
+    if diarization:
+        factor += DIARIZATION_COST_FACTOR
+    return max(duration, 0.0) * factor
+
+
+def lane(job: Dict, fast_lane_seconds: float = FAST_LANE_SECONDS) -> str:
+    return FAST_LANE if job.get("cost", 0.0) <= fast_lane_seconds else BULK_LANE
+
+
+def bulk_allowed(running_bulk: int, capacity: int, reserved: int = FAST_LANE_RESERVED) -> bool:
+    """Можно ли выдать еще одну длинную задачу (хотя бы один слот длинным задачам доступен всегда)"""
+    return running_bulk < max(capacity - reserved, 1)
+
+
+class FairShare:
+    """
+    Состояние взвешенной справедливой очереди (start-time fair queuing)
+
+    Задача клиента получает тег начала max(V, конец предыдущей задачи клиента)
+    и тег завершения = начало + стоимость / вес клиента. Обслуживается задача
+    с наименьшим тегом завершения; V - тег начала последней выданной задачи.
+    Клиент, отправивший много задач, не отодвигает задачи остальных.
+    """
+
+    def __init__(
+        self,
+        virtual_time: float = 0.0,
+        last_finish: Optional[Dict[str, float]] = None,
+        weights: Optional[Dict[str, float]] = None
+    ):
+        self.virtual_time = virtual_time
+        self.last_finish = dict(last_finish or {})
+        self.weights = weights or {}
+
+    def weight(self, client: Optional[str]) -> float:
+        return max(self.weights.get(client or "", 1.0), 1e-6)
+
+    def tag(self, candidates: Iterable[Dict]) -> None:
+        """Проставляет start_tag/finish_tag задачам (в порядке поступления внутри клиента)"""
+        finish: Dict[str, float] = {}
+        for job in sorted(candidates, key=lambda job: job["created_at"]):
+            client = job.get("client") or ""
+            start = max(self.virtual_time, finish.get(client, self.last_finish.get(client, 0.0)))
+            job["start_tag"] = start
+            job["finish_tag"] = start + job.get("cost", 0.0) / self.weight(client)
+            finish[client] = job["finish_tag"]
+
+    def charge(self, job: Dict) -> None:
+        """Учитывает выданную задачу"""
+        self.virtual_time = max(self.virtual_time, job["start_tag"])
+        self.last_finish[job.get("client") or ""] = job["finish_tag"]
+
+
+def new_fair_shares(weights: Optional[Dict[str, float]] = None) -> Dict[str, FairShare]:
+    """Состояние справедливой очереди для каждой полосы"""
+    return {FAST_LANE: FairShare(weights=weights), BULK_LANE: FairShare(weights=weights)}
+
+
+def order(
+    candidates: Iterable[Dict],
+    fair: Dict[str, FairShare],
+    now: float,
+    fast_lane_seconds: float = FAST_LANE_SECONDS,
+    starvation_seconds: float = STARVATION_SECONDS
+) -> List[Dict]:
+    """
+    Задачи в порядке обслуживания: голодающие, затем быстрая полоса, затем остальные (внутри - WFQ)
+
+    После выдачи задачи вызывается fair[lane(job)].charge(job).
+    """
+    candidates = list(candidates)
+    # Доли клиентов считаются в каждой полосе отдельно: многочасовая запись
+    # клиента не отодвигает его же короткие задачи
+    for name, share in fair.items():
+        share.tag(job for job in candidates if lane(job, fast_lane_seconds) == name)
+    for job in candidates:
+        job["lane"] = lane(job, fast_lane_seconds)
+        if now - job["created_at"] >= starvation_seconds:
+            job["tier"] = 0
+        else:
+            job["tier"] = 1 if job["lane"] == FAST_LANE else 2
+
+    def priority(job: Dict):
+        if job["tier"] == 0:
+            return (0, job["created_at"])
+        return (job["tier"], job["finish_tag"], job["created_at"])
+
+    return sorted(candidates, key=priority)
+
+
+def _warm(worker: Dict) -> Dict:
+    return worker.get("warm") or {}
+
+
+def estimated_load_seconds(name: str, workers: Dict[str, Dict]) -> float:
+    """Время загрузки модели (или "diarization"): измеренное процессами, иначе по таблице"""
+    measured = [
+        _warm(worker).get("load_seconds", {}).get(name)
+        for worker in workers.values()
+    ]
+    measured = [seconds for seconds in measured if seconds]
+    if measured:
+        return max(measured)
+    if name == "diarization":
+        return DIARIZATION_LOAD_SECONDS
+    return MODEL_LOAD_SECONDS.get(name, DEFAULT_LOAD_SECONDS)
+
+
+def load_cost(job: Dict, worker: Dict, workers: Dict[str, Dict]) -> float:
+    """Стоимость холодной загрузки для задачи на этом процессе (0 - все уже загружено)"""
+    warm = _warm(worker)
+    cost = 0.0
+    if job.get("model") and job["model"] not in warm.get("models", ()):
+        cost += estimated_load_seconds(job["model"], workers)
+    if job.get("diarization") and not warm.get("diarization"):
+        cost += estimated_load_seconds("diarization", workers)
+    return cost
+
+
+def serves(worker: Dict, model: Optional[str]) -> bool:
+    return not model or not worker.get("models") or model in worker["models"]
+
+
+def warm_elsewhere(job: Dict, worker_id: str, workers: Dict[str, Dict]) -> bool:
+    """Есть ли другой живой процесс, у которого все для задачи уже загружено"""
+    return any(
+        other_id != worker_id and serves(other, job.get("model")) and load_cost(job, other, workers) == 0
+        for other_id, other in workers.items()
+    )
+
+
+def pick(
+    candidates: Iterable[Dict],
+    worker_id: str,
+    workers: Dict[str, Dict],
+    now: float,
+    allow_bulk: bool = True
+) -> Tuple[Optional[Dict], bool]:
+    """
+    Выбирает задачу для процесса worker_id
+
+    Задача без холодной загрузки предпочитается, но не в ущерб более
+    приоритетной группе (tier из order): короткая задача не ждет ради
+    теплой модели для многочасовой записи. Кандидаты должны пройти order().
+
+    Args:
+        candidates: задачи в очереди в порядке приоритета
+        workers: живые процессы (включая worker_id)
+        allow_bulk: False - длинные задачи уже занимают все слоты, кроме резерва быстрой полосы
+
+    Returns:
+        (задача или None, нужна ли холодная загрузка)
+    """
+    worker = workers.get(worker_id, {})
+    fallback = None
+    for job in candidates:
+        if not serves(worker, job.get("model")):
+            continue
+        if not allow_bulk and job.get("lane") == BULK_LANE:
+            continue
+        cost = load_cost(job, worker, workers)
+        if cost == 0:
+            if fallback is not None and fallback.get("tier", 0) < job.get("tier", 0):
+                break
+            return job, False
+        if fallback is None:
+            waited = now - job["created_at"]
+            if waited >= cost or not warm_elsewhere(job, worker_id, workers):
+                fallback = job
+    return fallback, fallback is not None
@@ -2,7 +2,9 @@
 Простая реализация diarization на основе пауз между сегментами
 Не требует дополнительных моделей - работает сразу
 """
-from typing import Dict, List
+from typing import Dict, Iterator, List, Sequence
+
+from .transcript import Transcript
 
 
 def simple_diarization(segments: List[Dict], pause_threshold: float = 0.3) -> List[Dict]:
@@ -25,7 +27,48 @@ def simple_diarization(segments: List[Dict], pause_threshold: float = 0.3) -> Li
     if not segments:
         return []
     
+    labels = iter_speaker_labels(
+        [seg.get("start", 0) for seg in segments],
+        [seg.get("end", 0) for seg in segments],
+        [seg.get("text", "") for seg in segments],
+        pause_threshold
+    )
+    
     result = []
+    for segment, speaker in zip(segments, labels):
+        # Добавляем поле speaker к сегменту
+        new_segment = dict(segment)
+        new_segment["speaker"] = speaker
+        result.append(new_segment)
+    
+    return result
+
+
+def diarize_transcript(transcript: Transcript, pause_threshold: float = 0.3) -> Transcript:
+    """
+    То же, что simple_diarization, но для колоночной транскрипции
+    
+    Спикеры присваиваются на месте - сегменты не копируются.
+    """
+    transcript.set_speakers(
+        iter_speaker_labels(transcript.starts, transcript.ends, transcript.texts, pause_threshold)
+    )
+    return transcript
+
+
+def iter_speaker_labels(
+    starts: Sequence[float],
+    ends: Sequence[float],
+    texts: Sequence[str],
+    pause_threshold: float = 0.3
+) -> Iterator[str]:
+    """
+    Выдает метку спикера для каждого сегмента (эвристики simple_diarization)
+    
+    Args:
+        starts, ends, texts: колонки сегментов одинаковой длины
+        pause_threshold: минимальная пауза (секунды) для определения нового спикера
+    """
     current_speaker = "SPEAKER_00"
     speaker_id = 0
     
@@ -34,26 +77,24 @@ def simple_diarization(segments: List[Dict], pause_threshold: float = 0.3) -> Li
                       'расскажи', 'скажи', 'поделись', 'поделишься', 'можешь', 'может', 'есть']
     
     # Анализируем сегменты для определения паттернов диалога
-    for i, segment in enumerate(segments):
+    for i in range(len(starts)):
         # Если это первый сегмент - всегда SPEAKER_00
         if i == 0:
-            new_segment = dict(segment)
-            new_segment["speaker"] = current_speaker
-            result.append(new_segment)
+            yield current_speaker
             continue
         
         # Вычисляем паузу между предыдущим и текущим сегментами
-        prev_end = segments[i-1].get("end", 0)
-        curr_start = segment.get("start", 0)
+        prev_end = ends[i-1]
+        curr_start = starts[i]
         pause = curr_start - prev_end
         
         # Дополнительная проверка: длительность текущего и предыдущего сегментов
-        seg_duration = segment.get("end", curr_start) - curr_start
-        prev_duration = segments[i-1].get("end", 0) - segments[i-1].get("start", 0)
+        seg_duration = ends[i] - curr_start
+        prev_duration = ends[i-1] - starts[i-1]
         
         # Анализ текста для определения вопросов и ответов
-        text = segment.get("text", "").strip().lower()
-        prev_text = segments[i-1].get("text", "").strip()
+        text = texts[i].strip().lower()
+        prev_text = texts[i-1].strip()
         prev_text_lower = prev_text.lower()
         
         # Определяем, является ли предыдущий сегмент вопросом
@@ -119,12 +160,9 @@ def simple_diarization(segments: List[Dict], pause_threshold: float = 0.3) -> Li
             speaker_id += 1
             current_speaker = f"SPEAKER_{speaker_id:02d}"
         
-        # Добавляем поле speaker к сегменту
-        new_segment = dict(segment)
-        new_segment["speaker"] = current_speaker
-        result.append(new_segment)
-    
-    return result
+        yield current_speaker
+
+
 
 
 def group_by_speakers(segments: List[Dict]) -> Dict[str, str]:
@@ -0,0 +1,94 @@
+"""
+Объединение одинаковых одновременных вычислений (single-flight)
+
+Если несколько запросов приходят с одним и тем же ключом (хэш файла + параметры)
+или с одним и тем же заголовком Idempotency-Key, вычисление запускается один раз,
+а все запросы получают его результат.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    """Реестр выполняющихся вычислений (работает в event loop приложения)"""
+
+    def __init__(self, idempotency_ttl: float = 600):
+        """
+        Args:
+            idempotency_ttl: сколько секунд после завершения хранить результат
+                             для повторов с тем же Idempotency-Key
+        """
+        self.idempotency_ttl = idempotency_ttl
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Idempotency-Key -> (время истечения, задача)
+        self._idempotency: Dict[str, Tuple[float, asyncio.Task]] = {}
+        self.stats = {"started": 0, "coalesced": 0}
+
+    def lookup(self, idempotency_key: Optional[str]) -> Optional[asyncio.Task]:
+        """
+        Возвращает задачу, уже связанную с Idempotency-Key (выполняющуюся или
+        недавно завершенную успешно), чтобы повтор запроса не делал работу заново
+        """
+        if not idempotency_key:
+            return None
+        self._purge_expired()
+        entry = self._idempotency.get(idempotency_key)
+        return entry[1] if entry else None
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        idempotency_key: Optional[str] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Выполняет fn() один раз на ключ
+
+        Returns:
+            (результат, shared) - shared=True, если запрос присоединился
+            к уже выполняющемуся вычислению и fn() не вызывалась
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+            self.stats["started"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            print(f"[SINGLE_FLIGHT] Запрос присоединен к выполняющейся задаче "
+                  f"(запущено: {self.stats['started']}, объединено: {self.stats['coalesced']})")
+
+        if idempotency_key:
+            self._idempotency[idempotency_key] = (time.time() + self.idempotency_ttl, task)
+
+        # shield: отключение одного клиента не отменяет общую задачу
+        return await asyncio.shield(task), shared
+
+    async def wait(self, task: asyncio.Task) -> Any:
+        """Ожидает задачу, найденную через lookup()"""
+        self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        failed = task.cancelled() or task.exception() is not None
+        for idem_key, (_, idem_task) in list(self._idempotency.items()):
+            if idem_task is not task:
+                continue
+            if failed:
+                # Ошибку не запоминаем - повтор с тем же ключом должен выполниться заново
+                del self._idempotency[idem_key]
+            else:
+                # Срок хранения результата отсчитывается от завершения задачи
+                self._idempotency[idem_key] = (time.time() + self.idempotency_ttl, task)
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        for idem_key, (expires_at, task) in list(self._idempotency.items()):
+            if task.done() and expires_at <= now:
+                del self._idempotency[idem_key]
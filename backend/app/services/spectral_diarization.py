@@ -0,0 +1,337 @@
+"""
+Diarization по спектральным признакам (CPU, без моделей и токена HuggingFace)
+
+Промежуточный вариант между эвристикой по паузам (simple_diarization) и
+pyannote. Для каждого сегмента транскрипции по озвученным кадрам аудио
+считается компактный эмбеддинг - среднее и дисперсия MFCC и логарифма
+основного тона (автокорреляция через БПФ). Сегменты объединяются
+агломеративной кластеризацией: на каждом шаге сливаются два кластера,
+для которых одна гауссиана описывает кадры лучше двух по критерию BIC;
+слияния прекращаются, когда любое следующее ухудшает BIC, - так
+оценивается число спикеров (в том числе один спикер).
+
+Признаки кадров считаются векторными операциями NumPy по блокам, статистика
+сегментов берется из накопленных сумм; работает в сотни раз быстрее
+реального времени.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from .long_form import SAMPLE_RATE
+from .transcript import Transcript
+
+# Кадр анализа 25 мс с шагом 10 мс
+FRAME_LENGTH = 400
+HOP_LENGTH = 160
+N_FFT = 512
+# Основной тон - по более длинному кадру (64 мс, не меньше 4 периодов низкого голоса)
+PITCH_FRAME_LENGTH = 1024
+PITCH_N_FFT = 2048
+N_MELS = 32
+N_MFCC = 20
+# Диапазон основного тона (Гц)
+MIN_F0 = 70.0
+MAX_F0 = 400.0
+# Кадров в блоке векторной обработки (~30 сек аудио)
+BLOCK_FRAMES = 3000
+# Кадры тише этой доли от 95-го перцентиля энергии не учитываются (паузы, шум)
+SILENCE_RATIO = 0.05
+# Сегменты с меньшей озвученной частью не кластеризуются, а присоединяются к ближайшему кластеру
+MIN_REGION_SECONDS = 1.0
+# Максимум сегментов в кластеризации (остальные присоединяются к ближайшему кластеру)
+MAX_CLUSTER_REGIONS = 500
+MAX_SPEAKERS = 8
+# Вес штрафа за число параметров в BIC: соседние кадры коррелированы, поэтому
+# штраф намного выше 1 (подобран на записях 1-10 мин из benchmarks.bench_diarization)
+BIC_PENALTY = 12.0
+# Нижняя граница дисперсии признака
+MIN_VARIANCE = 1e-4
+
+
+def _mel_filterbank() -> "np.ndarray":
+    """Треугольные mel-фильтры (N_MELS x N_FFT/2+1)"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    mels = np.linspace(hz_to_mel(60.0), hz_to_mel(SAMPLE_RATE / 2 * 0.95), N_MELS + 2)
+    bins = np.fft.rfftfreq(N_FFT, 1.0 / SAMPLE_RATE)
+    edges = mel_to_hz(mels)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+def _dct_matrix() -> "np.ndarray":
+    """DCT-II (N_MELS -> N_MFCC) без нулевого коэффициента (громкость)"""
+    n = np.arange(N_MELS)
+    k = np.arange(1, N_MFCC)[:, None]
+    return np.cos(np.pi / N_MELS * (n + 0.5) * k).astype(np.float32)
+
+
+def frame_features(audio: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Признаки кадров аудио 16 кГц
+
+    Returns:
+        (features, weights): features - MFCC 1..19 и log F0 (кадры x 20),
+        weights - 1 для озвученных кадров, 0 для пауз
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    num_frames = max((len(audio) - FRAME_LENGTH) // HOP_LENGTH + 1, 0)
+    features = np.zeros((num_frames, N_MFCC), dtype=np.float32)
+    energy = np.zeros(num_frames, dtype=np.float32)
+    voicing = np.zeros(num_frames, dtype=np.float32)
+    if not num_frames:
+        return features, energy
+
+    window = np.hanning(FRAME_LENGTH).astype(np.float32)
+    pitch_window = np.hanning(PITCH_FRAME_LENGTH).astype(np.float32)
+    mel = _mel_filterbank()
+    dct = _dct_matrix()
+    min_lag = int(SAMPLE_RATE / MAX_F0)
+    max_lag = int(SAMPLE_RATE / MIN_F0)
+    lags = np.arange(min_lag, max_lag)
+    # Автокорреляция окна: деление на нее убирает спад автокорреляции кадра с ростом лага
+    window_autocorr = np.fft.irfft(np.abs(np.fft.rfft(pitch_window, PITCH_N_FFT)) ** 2)[:max_lag]
+    window_autocorr /= window_autocorr[0]
+    # Кадр основного тона центрирован на кадре MFCC
+    offset = (PITCH_FRAME_LENGTH - FRAME_LENGTH) // 2
+    padded = np.pad(audio, (offset, PITCH_FRAME_LENGTH))
+    for first in range(0, num_frames, BLOCK_FRAMES):
+        count = min(BLOCK_FRAMES, num_frames - first)
+        start = first * HOP_LENGTH
+        chunk = audio[start:start + (count - 1) * HOP_LENGTH + FRAME_LENGTH]
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, FRAME_LENGTH)[::HOP_LENGTH][:count]
+        frames = frames - frames.mean(axis=1, keepdims=True)
+        power = np.abs(np.fft.rfft(frames * window, N_FFT)) ** 2
+        energy[first:first + count] = power.sum(axis=1)
+        features[first:first + count, :-1] = np.log(power @ mel.T + 1e-8) @ dct.T
+
+        # Основной тон: пик нормированной автокорреляции (обратное БПФ спектра мощности)
+        chunk = padded[start:start + (count - 1) * HOP_LENGTH + PITCH_FRAME_LENGTH]
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, PITCH_FRAME_LENGTH)[::HOP_LENGTH][:count]
+        frames = frames - frames.mean(axis=1, keepdims=True)
+        pitch_power = np.abs(np.fft.rfft(frames * pitch_window, PITCH_N_FFT)) ** 2
+        autocorr = np.fft.irfft(pitch_power, PITCH_N_FFT)[:, :max_lag]
+        autocorr = autocorr / (autocorr[:, :1] + 1e-8) / window_autocorr
+        peak = np.argmax(autocorr[:, lags], axis=1)
+        voicing[first:first + count] = autocorr[np.arange(count), lags[peak]]
+        features[first:first + count, -1] = np.log(SAMPLE_RATE / lags[peak])
+
+    loud = energy > np.percentile(energy, 95) * SILENCE_RATIO
+    weights = (loud & (voicing > 0.3)).astype(np.float32)
+    return features, weights
+
+
+def segment_statistics(
+    audio: "np.ndarray",
+    starts: Sequence[float],
+    ends: Sequence[float]
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    Статистика озвученных кадров сегментов
+
+    Returns:
+        (counts, sums, squares): число кадров, суммы признаков и их квадратов
+        (сегменты x признаки) - из них получаются среднее и дисперсия
+    """
+    features, weights = frame_features(audio)
+    return range_statistics(features, weights, seconds_to_frames(starts), seconds_to_frames(ends))
+
+
+def seconds_to_frames(seconds: Sequence[float]) -> "np.ndarray":
+    return (np.asarray(seconds, dtype=np.float64) * SAMPLE_RATE / HOP_LENGTH).astype(int)
+
+
+def range_statistics(
+    features: "np.ndarray",
+    weights: "np.ndarray",
+    first: "np.ndarray",
+    last: "np.ndarray"
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Статистика озвученных кадров в диапазонах [first, last) (номера кадров в features)"""
+    features = features.astype(np.float64)
+    # Накопленные суммы: статистика любого диапазона - разность двух строк
+    cum_counts = np.concatenate([[0.0], np.cumsum(weights, dtype=np.float64)])
+    zeros = np.zeros((1, features.shape[1]))
+    cum_sums = np.vstack([zeros, np.cumsum(features * weights[:, None], axis=0)])
+    cum_squares = np.vstack([zeros, np.cumsum(features ** 2 * weights[:, None], axis=0)])
+    first = np.clip(first, 0, len(weights))
+    last = np.maximum(np.clip(last, 0, len(weights)), first)
+    return (
+        cum_counts[last] - cum_counts[first],
+        cum_sums[last] - cum_sums[first],
+        cum_squares[last] - cum_squares[first],
+    )
+
+
+def log_det(counts: "np.ndarray", sums: "np.ndarray", squares: "np.ndarray") -> "np.ndarray":
+    """Логарифм определителя диагональной ковариации (по строкам статистики)"""
+    counts = np.maximum(counts, 1.0)[..., None]
+    variance = squares / counts - (sums / counts) ** 2
+    return np.log(np.maximum(variance, MIN_VARIANCE)).sum(axis=-1)
+
+
+def _merge_cost(
+    counts: "np.ndarray",
+    sums: "np.ndarray",
+    squares: "np.ndarray",
+    log_dets: "np.ndarray",
+    i: int
+) -> "np.ndarray":
+    """
+    dBIC слияния кластера i с каждым кластером
+
+    Отрицательное значение - одна гауссиана на объединенных кадрах лучше двух
+    """
+    merged = counts[i] + counts
+    merged_log_det = log_det(merged, sums[i] + sums, squares[i] + squares)
+    dimensions = sums.shape[1]
+    penalty = BIC_PENALTY * 0.5 * (2 * dimensions) * np.log(np.maximum(merged, 2.0))
+    return 0.5 * (merged * merged_log_det - counts[i] * log_dets[i] - counts * log_dets) - penalty
+
+
+def bic_cluster(
+    counts: "np.ndarray",
+    sums: "np.ndarray",
+    squares: "np.ndarray",
+    num_speakers: Optional[int] = None,
+    max_speakers: int = MAX_SPEAKERS
+) -> "np.ndarray":
+    """
+    Агломеративная кластеризация сегментов по dBIC
+
+    Без num_speakers слияния идут, пока dBIC лучшей пары отрицателен (и
+    кластеров больше max_speakers); с num_speakers - до этого числа кластеров.
+
+    Returns:
+        номер кластера для каждого сегмента (0..k-1)
+    """
+    n = len(counts)
+    if n < 2:
+        return np.zeros(n, dtype=int)
+    counts, sums, squares = counts.copy(), sums.copy(), squares.copy()
+    log_dets = log_det(counts, sums, squares)
+    cost = np.vstack([_merge_cost(counts, sums, squares, log_dets, i) for i in range(n)])
+    np.fill_diagonal(cost, np.inf)
+    labels = np.arange(n)
+    clusters = n
+    target = num_speakers or 1
+    while clusters > target:
+        i, j = np.unravel_index(np.argmin(cost), cost.shape)
+        if num_speakers is None and clusters <= max_speakers and cost[i, j] >= 0:
+            break
+        i, j = min(i, j), max(i, j)
+        # j сливается в i
+        counts[i] += counts[j]
+        sums[i] += sums[j]
+        squares[i] += squares[j]
+        log_dets[i] = log_det(counts[i], sums[i], squares[i])
+        labels[labels == j] = i
+        cost[j, :] = np.inf
+        cost[:, j] = np.inf
+        row = _merge_cost(counts, sums, squares, log_dets, i)
+        row[cost[i] == np.inf] = np.inf
+        cost[i, :] = row
+        cost[:, i] = row
+        clusters -= 1
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def gaussians(
+    counts: "np.ndarray",
+    sums: "np.ndarray",
+    squares: "np.ndarray"
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Средние и дисперсии диагональных гауссиан по статистике кластеров"""
+    counts = np.maximum(counts, 1.0)[:, None]
+    means = sums / counts
+    return means, np.maximum(squares / counts - means ** 2, MIN_VARIANCE)
+
+
+def log_likelihood(
+    counts: "np.ndarray",
+    sums: "np.ndarray",
+    squares: "np.ndarray",
+    means: "np.ndarray",
+    variances: "np.ndarray"
+) -> "np.ndarray":
+    """Средний log-правдоподобие кадров сегментов под гауссианами кластеров (сегменты x кластеры)"""
+    counts = np.maximum(counts, 1.0)[:, None, None]
+    first, second = sums[:, None] / counts, squares[:, None] / counts
+    squared_error = second - 2 * first * means[None] + means[None] ** 2
+    return -0.5 * (np.log(variances)[None] + squared_error / variances[None]).sum(axis=2)
+
+
+def speaker_labels(
+    audio: "np.ndarray",
+    starts: Sequence[float],
+    ends: Sequence[float],
+    num_speakers: Optional[int] = None,
+    max_speakers: int = MAX_SPEAKERS
+) -> List[str]:
+    """
+    Метка спикера для каждого сегмента (SPEAKER_00 - первый заговоривший)
+
+    Args:
+        audio: аудио float32 16 кГц моно
+        starts, ends: границы сегментов (секунды)
+        num_speakers: известное количество спикеров (None - оценка по BIC)
+    """
+    n = len(starts)
+    if not n:
+        return []
+    counts, sums, squares = segment_statistics(audio, starts, ends)
+    voiced = counts * HOP_LENGTH / SAMPLE_RATE
+    # В кластеризации участвуют сегменты с достаточной озвученной частью
+    reliable = np.flatnonzero(voiced >= MIN_REGION_SECONDS)
+    if len(reliable) < 2:
+        reliable = np.flatnonzero(counts > 0)
+    if not len(reliable):
+        return ["SPEAKER_00"] * n
+    sample = reliable
+    if len(sample) > MAX_CLUSTER_REGIONS:
+        sample = reliable[np.linspace(0, len(reliable) - 1, MAX_CLUSTER_REGIONS).astype(int)]
+    sample_labels = bic_cluster(counts[sample], sums[sample], squares[sample], num_speakers, max_speakers)
+
+    # Остальные сегменты - к наиболее правдоподобному кластеру; без озвученных кадров - спикер предыдущего
+    k = sample_labels.max() + 1
+    means, variances = gaussians(
+        np.bincount(sample_labels, weights=counts[sample], minlength=k),
+        np.vstack([sums[sample][sample_labels == j].sum(axis=0) for j in range(k)]),
+        np.vstack([squares[sample][sample_labels == j].sum(axis=0) for j in range(k)])
+    )
+    labels = np.argmax(log_likelihood(counts, sums, squares, means, variances), axis=1)
+    labels[sample] = sample_labels
+    previous = labels[reliable[0]]
+    names = {}
+    result = []
+    for label, count in zip(labels, counts):
+        if count <= 0:
+            label = previous
+        previous = label
+        if label not in names:
+            names[label] = f"SPEAKER_{len(names):02d}"
+        result.append(names[label])
+    return result
+
+
+def diarize_transcript(
+    transcript: Transcript,
+    audio: "np.ndarray",
+    num_speakers: Optional[int] = None
+) -> Transcript:
+    """Присваивает спикеров сегментам транскрипции на месте (как simple_diarization.diarize_transcript)"""
+    labels = speaker_labels(audio, transcript.starts, transcript.ends, num_speakers)
+    for i, speaker in enumerate(labels):
+        transcript.set_speaker(i, speaker)
+    return transcript
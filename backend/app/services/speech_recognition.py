@@ -1,6 +1,6 @@
 import whisper
 import os
-from typing import Optional, Dict, List
+from typing import Any, Optional, Dict, List, Union
 from pathlib import Path
 
 class SpeechRecognitionService:
@@ -50,17 +50,19 @@ class SpeechRecognitionService:
     
     def transcribe(
         self,
-        audio_path: str,
+        audio_path: Union[str, Any],
         language: Optional[str] = None,
-        model: str = "base"
+        model: str = "base",
+        word_timestamps: bool = False
     ) -> Dict:
         """
         Распознает речь в аудио файле
         
         Args:
-            audio_path: путь к аудио файлу
+            audio_path: путь к аудио файлу или массив float32 16 кГц
             language: код языка (ISO 639-1, например 'ru', 'en')
             model: модель Whisper для использования
+            word_timestamps: добавить в сегменты тайминги слов ("words")
         
         Returns:
             словарь с результатами распознавания
@@ -73,27 +75,33 @@ class SpeechRecognitionService:
             result = whisper_model.transcribe(
                 audio_path,
                 language=language,
-                task="transcribe"
+                task="transcribe",
+                word_timestamps=word_timestamps
             )
         else:
             # Автоопределение языка
             result = whisper_model.transcribe(
                 audio_path,
-                task="transcribe"
+                task="transcribe",
+                word_timestamps=word_timestamps
             )
         
+        segments = []
+        for i, seg in enumerate(result.get("segments", [])):
+            segment = {
+                "id": seg.get("id", i),
+                "start": seg.get("start", 0),
+                "end": seg.get("end", 0),
+                "text": seg.get("text", "").strip()
+            }
+            if word_timestamps:
+                segment["words"] = seg.get("words", [])
+            segments.append(segment)
+        
         return {
             "text": result["text"].strip(),
             "language": result.get("language", "unknown"),
-            "segments": [
-                {
-                    "id": seg.get("id", i),
-                    "start": seg.get("start", 0),
-                    "end": seg.get("end", 0),
-                    "text": seg.get("text", "").strip()
-                }
-                for i, seg in enumerate(result.get("segments", []))
-            ]
+            "segments": segments
         }
     
     def generate_subtitles(self, transcription_result: Dict, format: str = "srt") -> str:
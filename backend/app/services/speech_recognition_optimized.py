@@ -4,7 +4,9 @@
 - Speaker Diarization (разделение по ролям)
 """
 import os
-from typing import Optional, Dict, List
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Dict, List, Tuple, Union
 from pathlib import Path
 
 # Отключение XET для избежания проблем с зависанием загрузок на Windows
@@ -95,18 +97,45 @@ try:
 except ImportError:
     WHISPERX_AVAILABLE = False
 
+from .cancellation import CancelToken, guard, pyannote_hook
+from .transcript import Transcript
+from .transcript_export import format_timestamp, iter_srt, iter_vtt
+from .long_form import SAMPLE_RATE, LongFormTranscriber, SegmentSpool, pcm_to_float32
+from .deadline import DeadlineMonitor, degrade_levels, diarization_seconds, transcribe_with_deadline
+
 # Простая diarization на основе пауз (fallback, если WhisperX недоступен)
 try:
-    from .simple_diarization import simple_diarization, group_by_speakers
+    from .simple_diarization import diarize_transcript
     SIMPLE_DIARIZATION_AVAILABLE = True
 except ImportError:
     SIMPLE_DIARIZATION_AVAILABLE = False
 
+# Diarization по спектральным признакам (NumPy, без моделей и токена) - между pyannote и паузами
+from .spectral_diarization import NUMPY_AVAILABLE as SPECTRAL_DIARIZATION_AVAILABLE
+from .spectral_diarization import diarize_transcript as spectral_diarize_transcript
+from .online_diarization import OnlineDiarizer
+from .diarization_cache import DiarizationCache
+
+# Движки diarization: auto - WhisperX/pyannote, при недоступности - спектральная, затем по паузам
+DIARIZATION_ENGINES = ("auto", "spectral", "pauses")
+
 
 class OptimizedSpeechRecognitionService:
     """Оптимизированный сервис для распознавания речи"""
     
-    def __init__(self, cache_dir: Optional[str] = None, use_gpu: bool = False, device: str = "auto"):
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        use_gpu: bool = False,
+        device: str = "auto",
+        diarization_engine: str = "auto",
+        parallel_diarization: bool = True,
+        transcribe_threads: int = 0,
+        diarization_threads: int = 0,
+        diarization_cache_dir: Optional[str] = None,
+        diarization_cache_max_bytes: int = 0,
+        concurrent_jobs: int = 1
+    ):
         """
         Инициализация сервиса
         
@@ -114,8 +143,32 @@ class OptimizedSpeechRecognitionService:
             cache_dir: путь для сохранения моделей
             use_gpu: использовать GPU (если доступен)
             device: устройство для обработки ("cuda", "cpu", "auto")
+            diarization_engine: движок diarization (DIARIZATION_ENGINES)
+            parallel_diarization: pyannote/WhisperX diarization одновременно с распознаванием
+            transcribe_threads: потоки CPU Faster-Whisper (0 - по умолчанию библиотеки)
+            diarization_threads: потоки CPU pyannote (torch; 0 - по умолчанию библиотеки)
+            diarization_cache_dir: директория кэша сегментации и эмбеддингов pyannote
+            diarization_cache_max_bytes: бюджет этого кэша (0 - кэш отключен)
+            concurrent_jobs: сколько задач сервис выполняет одновременно
+                (по потоку параллельной diarization на задачу)
         """
+        if diarization_engine not in DIARIZATION_ENGINES:
+            raise ValueError(f"Неизвестный движок diarization: {diarization_engine}")
+        self.diarization_engine = diarization_engine
+        self.parallel_diarization = parallel_diarization
+        self._diarization_executor = None
+        self.set_concurrent_jobs(concurrent_jobs)
+        self.transcribe_threads = transcribe_threads
+        self.diarization_threads = diarization_threads
+        # Сегментация и эмбеддинги по ключу аудио: другое num_speakers - только кластеризация
+        self.diarization_cache = DiarizationCache(
+            diarization_cache_dir or "", diarization_cache_max_bytes if diarization_cache_dir else 0
+        )
         self.models = {}
+        # Пайплайн diarization (WhisperX/pyannote), загружается при первой задаче с diarization
+        self.diarization_pipeline = None
+        # Время загрузки моделей (секунды) - оценка стоимости холодной загрузки для планировщика
+        self.load_seconds: Dict[str, float] = {}
         self.default_model = "base"
         self.cache_dir = Path(cache_dir) if cache_dir else None
         self.use_gpu = use_gpu
@@ -147,16 +200,35 @@ class OptimizedSpeechRecognitionService:
         
         print(f"Используется: {'Faster-Whisper' if FASTER_WHISPER_AVAILABLE else 'Standard Whisper'}")
         print(f"Устройство: {self.device}")
-        if WHISPERX_AVAILABLE:
+        if WHISPERX_AVAILABLE and diarization_engine == "auto":
             print(f"Speaker Diarization: Доступен (WhisperX)")
+        elif SPECTRAL_DIARIZATION_AVAILABLE and diarization_engine != "pauses":
+            print(f"Speaker Diarization: Доступен (спектральные признаки, CPU)")
         elif SIMPLE_DIARIZATION_AVAILABLE:
             print(f"Speaker Diarization: Доступен (простая версия на основе пауз)")
         else:
             print(f"Speaker Diarization: Недоступен")
     
+    def set_concurrent_jobs(self, concurrent_jobs: int) -> None:
+        """
+        Размер пула потоков параллельной diarization - по одному на одновременную задачу
+
+        Потоки CPU самой diarization задает diarization_threads; лишние потоки пула
+        только ждали бы ядра. Вызывается до запуска задач (емкость рабочего процесса).
+        """
+        if not self.parallel_diarization:
+            return
+        previous = self._diarization_executor
+        self._diarization_executor = ThreadPoolExecutor(
+            max_workers=max(concurrent_jobs, 1), thread_name_prefix="diarization"
+        )
+        if previous is not None:
+            previous.shutdown(wait=False)
+    
     def load_model(self, model_name: str = "base"):
         """Загружает модель"""
         if model_name not in self.models:
+            load_start = time.time()
             print(f"[LOAD_MODEL] Начало загрузки модели: {model_name}")
             print(f"[LOAD_MODEL] FASTER_WHISPER_AVAILABLE: {FASTER_WHISPER_AVAILABLE}")
             print(f"[LOAD_MODEL] Устройство: {self.device}")
@@ -193,6 +265,7 @@ class OptimizedSpeechRecognitionService:
                         model_name,
                         device=self.device,
                         compute_type="float16" if self.device == "cuda" else "int8",
+                        cpu_threads=self.transcribe_threads,
                         download_root=download_path
                     )
                     print(f"[LOAD_MODEL] ✓ WhisperModel создан успешно")
@@ -226,12 +299,34 @@ class OptimizedSpeechRecognitionService:
                     traceback.print_exc()
                     raise
             
-            print(f"[LOAD_MODEL] ✓ Модель {model_name} полностью загружена и готова к использованию")
+            self.load_seconds[model_name] = time.time() - load_start
+            print(f"[LOAD_MODEL] ✓ Модель {model_name} полностью загружена и готова к использованию "
+                  f"за {self.load_seconds[model_name]:.1f} сек")
         return self.models[model_name]
+
+    @property
+    def compute_type(self) -> str:
+        if not FASTER_WHISPER_AVAILABLE:
+            return "float32"
+        return "float16" if self.device == "cuda" else "int8"
+
+    def warm_state(self) -> Dict:
+        """
+        Загруженные модели для планировщика очереди (model affinity)
+
+        Returns:
+            {"models": [...], "compute_type", "diarization": bool, "load_seconds": {...}}
+        """
+        return {
+            "models": sorted(self.models),
+            "compute_type": self.compute_type,
+            "diarization": self.diarization_pipeline is not None,
+            "load_seconds": {name: round(seconds, 2) for name, seconds in self.load_seconds.items()},
+        }
     
     def transcribe(
         self,
-        audio_path: str,
+        audio_path: Union[str, Any],
         language: Optional[str] = None,
         model: str = "base",
         beam_size: int = 5,
@@ -239,13 +334,18 @@ class OptimizedSpeechRecognitionService:
         enable_diarization: bool = False,
         num_speakers: Optional[int] = None,
         speaker_names: Optional[List[str]] = None,
-        translate_to_english: bool = False
+        translate_to_english: bool = False,
+        word_timestamps: bool = False,
+        cancel: Optional[CancelToken] = None,
+        deadline_seconds: Optional[float] = None,
+        audio_key: Optional[str] = None,
+        transcript: Optional[Transcript] = None
     ) -> Dict:
         """
         Распознает речь с опциональным разделением по ролям и переводом на английский
         
         Args:
-            audio_path: путь к аудио
+            audio_path: путь к аудио или массив float32 16 кГц (np.memmap из кэша аудио)
             language: код языка
             model: модель Whisper
             beam_size: размер луча (меньше = быстрее, но менее точно)
@@ -253,26 +353,46 @@ class OptimizedSpeechRecognitionService:
             enable_diarization: включить разделение по ролям
             num_speakers: количество спикеров (None = автоопределение)
             translate_to_english: перевести результат на английский язык
+            word_timestamps: получить тайминги слов (хранятся колонками в Transcript.words)
+            cancel: токен отмены - проверяется между сегментами и этапами (JobCancelled)
+            deadline_seconds: срок распознавания - при отставании качество снижается (result["deadline"])
+            audio_key: ключ аудио (хэш файла и диапазон) для кэша эмбеддингов diarization
+            transcript: готовая транскрипция этого аудио (задача с другим num_speakers) -
+                распознавание не повторяется, спикеры назначаются заново
         
         Returns:
             словарь с результатами
         """
-        # Diarization: сначала пробуем WhisperX, если недоступен - используем простую эвристику
+        if transcript is not None and enable_diarization:
+            return self._rediarize(
+                transcript, audio_path, language or "unknown", num_speakers, speaker_names, audio_key, cancel
+            )
+        
+        if deadline_seconds and FASTER_WHISPER_AVAILABLE:
+            return self._transcribe_with_deadline(
+                audio_path, language, model, beam_size, best_of, enable_diarization, num_speakers,
+                speaker_names, translate_to_english, word_timestamps, deadline_seconds, cancel=cancel
+            )
+        
+        # Diarization: сначала пробуем WhisperX, если недоступен - спектральные признаки или паузы
         # Примечание: diarization с переводом не поддерживается (нужно сначала транскрибировать, потом переводить)
+        lightweight_available = SPECTRAL_DIARIZATION_AVAILABLE or SIMPLE_DIARIZATION_AVAILABLE
         if enable_diarization and not translate_to_english:
-            if WHISPERX_AVAILABLE:
+            if WHISPERX_AVAILABLE and self.diarization_engine == "auto":
                 try:
                     return self._transcribe_with_diarization(
-                        audio_path, language, model, num_speakers, speaker_names
+                        audio_path, language, model, num_speakers, speaker_names,
+                        word_timestamps=word_timestamps, cancel=cancel, audio_key=audio_key
                     )
                 except Exception as e:
                     print(f"⚠️  WhisperX diarization не удалось: {e}")
-                    print("   Используем простую diarization на основе пауз")
-                    # Fallback на простую diarization (только если не требуется перевод)
-                    if SIMPLE_DIARIZATION_AVAILABLE and not translate_to_english:
+                    print("   Используем легкую diarization (спектральные признаки или паузы)")
+                    # Fallback на легкую diarization (только если не требуется перевод)
+                    if lightweight_available and not translate_to_english:
                         try:
                             return self._transcribe_with_simple_diarization(
-                                audio_path, language, model, beam_size, best_of, speaker_names
+                                audio_path, language, model, beam_size, best_of, speaker_names,
+                                word_timestamps=word_timestamps, cancel=cancel, num_speakers=num_speakers
                             )
                         except Exception as e2:
                             print(f"❌ Простая diarization также не удалась: {e2}")
@@ -280,11 +400,12 @@ class OptimizedSpeechRecognitionService:
                             # Продолжаем с обычной транскрипцией
                     else:
                         print("   Простая diarization недоступна - продолжаем без разделения по ролям")
-            elif SIMPLE_DIARIZATION_AVAILABLE and not translate_to_english:
-                # Используем простую diarization, если WhisperX не установлен (только если не требуется перевод)
+            elif lightweight_available and not translate_to_english:
+                # Легкая diarization, если WhisperX не установлен или не выбран (только если не требуется перевод)
                 try:
                     return self._transcribe_with_simple_diarization(
-                        audio_path, language, model, beam_size, best_of, speaker_names
+                        audio_path, language, model, beam_size, best_of, speaker_names,
+                        word_timestamps=word_timestamps, cancel=cancel, num_speakers=num_speakers
                     )
                 except Exception as e:
                     print(f"❌ Простая diarization не удалась: {e}")
@@ -312,7 +433,8 @@ class OptimizedSpeechRecognitionService:
                     beam_size=beam_size,
                     best_of=best_of,
                     vad_filter=True,  # Voice Activity Detection для ускорения
-                    vad_parameters=dict(min_silence_duration_ms=500)
+                    vad_parameters=dict(min_silence_duration_ms=500),
+                    word_timestamps=word_timestamps
                 )
                 print(f"[TRANSCRIBE] ✓ Транскрипция завершена, обработка сегментов...")
             except Exception as e:
@@ -321,67 +443,23 @@ class OptimizedSpeechRecognitionService:
                 traceback.print_exc()
                 raise
             
-            # Конвертация в нужный формат
-            segments_list = []
-            full_text_parts = []
-            
-            for segment in segments:
-                seg_dict = {
-                    "id": len(segments_list),
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text.strip()
-                }
-                segments_list.append(seg_dict)
-                full_text_parts.append(segment.text.strip())
+            # Сегменты сразу складываются в колоночную транскрипцию (без списка словарей);
+            # генератор ленивый - при отмене распознавание останавливается на следующем сегменте
+            transcript = Transcript.from_segments(guard(segments, cancel), with_words=word_timestamps)
             
             # Формируем результат с оригинальным текстом
             result = {
-                "text": " ".join(full_text_parts),
+                "text": transcript.full_text(),
                 "language": info.language,
-                "segments": segments_list,
+                "transcript": transcript,
                 "has_translation": False
             }
             
             # Если нужен перевод - делаем дополнительный вызов через стандартный Whisper
             if translate_to_english:
-                print(f"[TRANSLATE] Начало перевода на английский...")
-                print(f"[TRANSLATE] ⚠️  Faster-Whisper не поддерживает перевод, используем стандартный Whisper")
-                import whisper
-                try:
-                    standard_model = whisper.load_model(model)
-                    print(f"[TRANSLATE] Стандартная модель загружена, начинаем перевод...")
-                    translate_result = standard_model.transcribe(
-                        audio_path,
-                        language=language,
-                        task="translate",
-                        beam_size=beam_size,
-                        best_of=best_of
-                    )
-                    print(f"[TRANSLATE] ✓ Перевод завершен")
-                    
-                    # Формируем результат перевода
-                    translated_segments = [
-                        {
-                            "id": seg.get("id", i),
-                            "start": seg.get("start", 0),
-                            "end": seg.get("end", 0),
-                            "text": seg.get("text", "").strip()
-                        }
-                        for i, seg in enumerate(translate_result.get("segments", []))
-                    ]
-                    
-                    result["translated_text"] = translate_result["text"].strip()
-                    result["translated_language"] = "en"
-                    result["translated_segments"] = translated_segments
-                    result["has_translation"] = True
-                except Exception as e:
-                    print(f"[TRANSLATE] ❌ Ошибка при переводе: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    # Продолжаем без перевода, возвращаем только оригинал
-                    print(f"[TRANSLATE] ⚠️  Продолжаем без перевода")
-                    result["has_translation"] = False
+                if cancel is not None:
+                    cancel.check()
+                self._translate_with_whisper(result, audio_path, language, model, beam_size, best_of)
             
             return result
         else:
@@ -392,28 +470,21 @@ class OptimizedSpeechRecognitionService:
                 language=language,
                 task="transcribe",
                 beam_size=beam_size,
-                best_of=best_of
+                best_of=best_of,
+                word_timestamps=word_timestamps
             )
             
-            original_segments = [
-                {
-                    "id": seg.get("id", i),
-                    "start": seg.get("start", 0),
-                    "end": seg.get("end", 0),
-                    "text": seg.get("text", "").strip()
-                }
-                for i, seg in enumerate(original_result.get("segments", []))
-            ]
-            
             result = {
                 "text": original_result["text"].strip(),
                 "language": original_result.get("language", "unknown"),
-                "segments": original_segments,
+                "transcript": Transcript.from_segments(original_result.get("segments", []), with_words=word_timestamps),
                 "has_translation": False
             }
             
             # Если нужен перевод - делаем дополнительный вызов
             if translate_to_english:
+                if cancel is not None:
+                    cancel.check()
                 print(f"[TRANSLATE] Начало перевода на английский (стандартный Whisper)...")
                 try:
                     translate_result = whisper_model.transcribe(
@@ -447,15 +518,313 @@ class OptimizedSpeechRecognitionService:
             
             return result
     
+    def _transcribe_with_deadline(
+        self,
+        audio_path: Union[str, Any],
+        language: Optional[str],
+        model: str,
+        beam_size: int,
+        best_of: int,
+        enable_diarization: bool,
+        num_speakers: Optional[int],
+        speaker_names: Optional[List[str]],
+        translate_to_english: bool,
+        word_timestamps: bool,
+        deadline_seconds: float,
+        cancel: Optional[CancelToken] = None
+    ) -> Dict:
+        """
+        Распознавание к сроку (только Faster-Whisper)
+        
+        При отставании оставшееся аудио распознается на более дешевых настройках
+        (deadline.degrade_levels). Полная diarization выполняется, только если ее
+        прогноз укладывается в остаток срока, иначе - спикеры по паузам; перевод
+        (второй проход) - только если остатка хватает на еще одно распознавание.
+        """
+        if isinstance(audio_path, (str, Path)):
+            from faster_whisper import decode_audio
+            audio = decode_audio(str(audio_path), sampling_rate=SAMPLE_RATE)
+        else:
+            audio = audio_path
+        duration = len(audio) / SAMPLE_RATE
+        monitor = DeadlineMonitor(degrade_levels(model, beam_size, best_of), duration, deadline_seconds)
+        print(f"[DEADLINE] Срок {deadline_seconds:.0f} сек на {duration / 60:.1f} мин аудио ({model}, beam_size={beam_size})")
+        
+        def transcribe_region(offset: float, settings: Dict, region_language: Optional[str]):
+            whisper_model = self.load_model(settings["model"])
+            segments, info = whisper_model.transcribe(
+                audio[int(offset * SAMPLE_RATE):],
+                language=region_language,
+                beam_size=settings["beam_size"],
+                best_of=settings["best_of"],
+                vad_filter=True,
+                vad_parameters=dict(min_silence_duration_ms=500),
+                word_timestamps=word_timestamps
+            )
+            return guard(segments, cancel), info.language
+        
+        transcript = Transcript(with_words=word_timestamps)
+        detected_language = transcribe_with_deadline(transcribe_region, monitor, transcript, language) or "unknown"
+        transcription_seconds = monitor.elapsed()
+        print(f"[DEADLINE] ✓ Распознано {len(transcript)} сегментов за {transcription_seconds:.1f} сек")
+        if cancel is not None:
+            cancel.check()
+        
+        extra = {}
+        if enable_diarization and not translate_to_english:
+            diarized = False
+            loaded = self.diarization_pipeline is not None
+            full_available = WHISPERX_AVAILABLE and self.diarization_engine == "auto"
+            if full_available and len(transcript) and monitor.remaining() >= diarization_seconds(duration, loaded):
+                device = "cuda" if self.use_gpu and self.device == "cuda" else "cpu"
+                try:
+                    diarized = self._diarize(transcript, audio, num_speakers, device, cancel)
+                except Exception as e:
+                    print(f"[DEADLINE] ⚠️  Diarization не удалась: {e}")
+            if diarized:
+                extra["diarization"] = "full"
+            elif len(transcript) and (SPECTRAL_DIARIZATION_AVAILABLE or SIMPLE_DIARIZATION_AVAILABLE):
+                extra["diarization"] = self._diarize_lightweight(transcript, audio, num_speakers)
+                print(f"[DEADLINE] Спикеры определены легкой diarization ({extra['diarization']})")
+            else:
+                extra["diarization"] = "skipped"
+            result = self._build_diarized_result(transcript, detected_language, speaker_names)
+        else:
+            result = {
+                "text": transcript.full_text(),
+                "language": detected_language,
+                "transcript": transcript,
+                "has_translation": False
+            }
+        
+        if translate_to_english:
+            # Перевод - второй полный проход; выполняется, если остаток срока не меньше первого прохода
+            if monitor.remaining() >= transcription_seconds:
+                if cancel is not None:
+                    cancel.check()
+                settings = monitor.settings
+                self._translate_with_whisper(
+                    result, audio, language or detected_language, settings["model"],
+                    settings["beam_size"], settings["best_of"]
+                )
+                extra["translation"] = "done" if result["has_translation"] else "failed"
+            else:
+                print("[DEADLINE] Перевод пропущен: не укладывается в срок")
+                extra["translation"] = "skipped"
+        
+        result["deadline"] = {**monitor.finish(), **extra}
+        report = result["deadline"]
+        print(f"[DEADLINE] Завершено за {report['elapsed_seconds']:.1f} сек (срок {deadline_seconds:.0f} сек, "
+              f"{'уложились' if report['met'] else 'не уложились'}, снижение качества: {'да' if report['degraded'] else 'нет'})")
+        return result
+    
+    def _translate_with_whisper(
+        self,
+        result: Dict,
+        audio_path: Union[str, Any],
+        language: Optional[str],
+        model: str,
+        beam_size: int,
+        best_of: int
+    ) -> None:
+        """Перевод на английский стандартным Whisper (faster-whisper не переводит); дополняет result"""
+        print(f"[TRANSLATE] Начало перевода на английский...")
+        print(f"[TRANSLATE] ⚠️  Faster-Whisper не поддерживает перевод, используем стандартный Whisper")
+        import whisper
+        try:
+            standard_model = whisper.load_model(model)
+            print(f"[TRANSLATE] Стандартная модель загружена, начинаем перевод...")
+            translate_result = standard_model.transcribe(
+                audio_path,
+                language=language,
+                task="translate",
+                beam_size=beam_size,
+                best_of=best_of
+            )
+            print(f"[TRANSLATE] ✓ Перевод завершен")
+            
+            # Формируем результат перевода
+            translated_segments = [
+                {
+                    "id": seg.get("id", i),
+                    "start": seg.get("start", 0),
+                    "end": seg.get("end", 0),
+                    "text": seg.get("text", "").strip()
+                }
+                for i, seg in enumerate(translate_result.get("segments", []))
+            ]
+            
+            result["translated_text"] = translate_result["text"].strip()
+            result["translated_language"] = "en"
+            result["translated_segments"] = translated_segments
+            result["has_translation"] = True
+        except Exception as e:
+            print(f"[TRANSLATE] ❌ Ошибка при переводе: {e}")
+            import traceback
+            traceback.print_exc()
+            # Продолжаем без перевода, возвращаем только оригинал
+            print(f"[TRANSLATE] ⚠️  Продолжаем без перевода")
+            result["has_translation"] = False
+    
+    def transcribe_long_form(
+        self,
+        windows: Iterable[bytes],
+        language: Optional[str] = None,
+        model: str = "base",
+        beam_size: int = 5,
+        best_of: int = 5,
+        enable_diarization: bool = False,
+        num_speakers: Optional[int] = None,
+        speaker_names: Optional[List[str]] = None,
+        word_timestamps: bool = False,
+        spool_dir: Optional[str] = None,
+        duration: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+        deadline_seconds: Optional[float] = None,
+        on_partial: Optional[Callable[[List[Dict]], None]] = None
+    ) -> Dict:
+        """
+        Распознает длинную запись по окнам с ограниченным потреблением памяти
+        
+        Args:
+            windows: окна PCM s16le 16 кГц моно (VideoProcessor.stream_audio)
+            spool_dir: директория для файла готовых сегментов (None - системная временная)
+            duration: длительность записи из предварительного анализа (для прогресса)
+            cancel: токен отмены - проверяется между сегментами окна
+            deadline_seconds: срок распознавания (нужна duration) - при отставании
+                следующие окна распознаются на более дешевых настройках
+            on_partial: вызывается после каждого окна с новыми готовыми сегментами
+                (id, start, end, text и speaker, если diarization онлайн) -
+                клиент видит их до завершения (JobStore.append_partial)
+        
+        Перевод не поддерживается. WhisperX/pyannote требуют всю волну в памяти,
+        поэтому спикеры определяются онлайн-diarization по мере распознавания
+        (окна аудио и готовые сегменты, без NumPy - эвристикой по паузам).
+        Сегмент попадает в on_partial, когда diarizer выдал ему метку; метки
+        эвристики по паузам известны только в конце, и частичные сегменты
+        тогда без speaker.
+        
+        Returns:
+            словарь с результатами (как у transcribe)
+        """
+        monitor = None
+        if deadline_seconds and duration:
+            monitor = DeadlineMonitor(degrade_levels(model, beam_size, best_of), duration, deadline_seconds)
+            print(f"[DEADLINE] Срок {deadline_seconds:.0f} сек на {duration / 60:.1f} мин аудио ({model}, beam_size={beam_size})")
+        
+        def transcribe_window(pcm: bytes, window_language: Optional[str]):
+            settings = monitor.settings if monitor else {"model": model, "beam_size": beam_size, "best_of": best_of}
+            whisper_model = self.load_model(settings["model"])
+            audio = pcm_to_float32(pcm)
+            if FASTER_WHISPER_AVAILABLE:
+                segments, info = whisper_model.transcribe(
+                    audio,
+                    language=window_language,
+                    beam_size=settings["beam_size"],
+                    best_of=settings["best_of"],
+                    vad_filter=True,
+                    vad_parameters=dict(min_silence_duration_ms=500),
+                    word_timestamps=word_timestamps
+                )
+                return guard(segments, cancel), info.language
+            result = whisper_model.transcribe(
+                audio,
+                language=window_language,
+                task="transcribe",
+                beam_size=settings["beam_size"],
+                best_of=settings["best_of"],
+                word_timestamps=word_timestamps
+            )
+            return result.get("segments", []), result.get("language")
+        
+        diarizer = None
+        # Сегменты, ждущие метки diarizer, и готовые к публикации (on_partial)
+        unlabeled: Dict[int, Tuple[float, float, str]] = {}
+        partial: List[Dict] = []
+        
+        def on_progress(position: float):
+            if monitor:
+                monitor.update(position)
+            if on_partial is not None and partial:
+                on_partial(partial[:])
+                partial.clear()
+            speakers = (f", спикеры определены для {len(diarizer.labels)} сегментов "
+                        f"({diarizer.num_speakers} спикеров)") if diarizer is not None else ""
+            if duration:
+                print(f"[LONG_FORM] Обработано {position / 60:.1f} из {duration / 60:.1f} мин "
+                      f"({min(position / duration, 1.0) * 100:.0f}%){speakers}")
+            else:
+                print(f"[LONG_FORM] Обработано {position / 60:.1f} мин аудио{speakers}")
+        
+        if enable_diarization and SPECTRAL_DIARIZATION_AVAILABLE and self.diarization_engine != "pauses":
+            diarizer = OnlineDiarizer(num_speakers=num_speakers)
+            
+            def feed_diarizer(pcm_windows: Iterable[bytes]) -> Iterator[bytes]:
+                # Окно попадает к diarizer до распознавания - аудио сегментов уже в его буфере
+                for pcm in pcm_windows:
+                    diarizer.add_audio(pcm_to_float32(pcm))
+                    yield pcm
+            
+            windows = feed_diarizer(windows)
+        
+        def on_append(start: float, end: float, text: str):
+            if diarizer is None:
+                partial.append({"id": spool.count - 1, "start": start, "end": end, "text": text})
+                return
+            if on_partial is not None:
+                unlabeled[spool.count - 1] = (start, end, text)
+            for index, label in diarizer.add_segment(start, end):
+                if on_partial is not None:
+                    start, end, text = unlabeled.pop(index)
+                    partial.append({"id": index, "start": start, "end": end, "text": text, "speaker": label})
+        
+        with SegmentSpool(spool_dir, on_append=on_append if diarizer or on_partial else None) as spool:
+            detected_language = LongFormTranscriber(transcribe_window).run(
+                windows, spool, language=language, on_progress=on_progress
+            )
+            print(f"[LONG_FORM] ✓ Распознано {len(spool)} сегментов, собираем транскрипцию...")
+            transcript = Transcript.from_segments(spool.iter_segments(), with_words=word_timestamps)
+        
+        detected_language = detected_language or "unknown"
+        if diarizer is not None and len(transcript):
+            diarizer.flush()
+            for i, speaker in enumerate(diarizer.speaker_labels()):
+                transcript.set_speaker(i, speaker)
+            print(f"[LONG_FORM] ✓ Онлайн-diarization: {diarizer.num_speakers} спикеров")
+            result = self._build_diarized_result(transcript, detected_language, speaker_names)
+        elif enable_diarization and SIMPLE_DIARIZATION_AVAILABLE and len(transcript):
+            diarize_transcript(transcript, pause_threshold=0.3)
+            result = self._build_diarized_result(transcript, detected_language, speaker_names)
+        else:
+            result = {
+                "text": transcript.full_text(),
+                "language": detected_language,
+                "transcript": transcript,
+                "has_translation": False
+            }
+        if monitor:
+            result["deadline"] = monitor.finish()
+        return result
+    
     def _transcribe_with_diarization(
         self,
-        audio_path: str,
+        audio_path: Union[str, Any],
         language: Optional[str],
         model: str,
         num_speakers: Optional[int],
-        speaker_names: Optional[List[str]] = None
+        speaker_names: Optional[List[str]] = None,
+        word_timestamps: bool = False,
+        cancel: Optional[CancelToken] = None,
+        audio_key: Optional[str] = None
     ) -> Dict:
-        """Транскрипция с разделением по ролям (требует WhisperX)"""
+        """
+        Транскрипция с разделением по ролям (требует WhisperX)
+        
+        Распознавание и diarization читают одно аудио и не зависят друг от друга
+        до присваивания спикеров, поэтому при parallel_diarization diarization
+        выполняется в отдельном потоке одновременно с распознаванием: время
+        ответа ~ max(распознавание, diarization), а не их сумма.
+        """
         if not WHISPERX_AVAILABLE:
             raise ImportError("WhisperX не установлен. Установите: pip install whisperx")
         
@@ -465,9 +834,69 @@ class OptimizedSpeechRecognitionService:
             os.environ["HF_HOME"] = hf_home
             print(f"Используется HF_HOME: {hf_home}")
         
-        # Загрузка модели
         device = "cuda" if self.use_gpu and self.device == "cuda" else "cpu"
         
+        diarization = None
+        if self._diarization_executor is not None:
+            # Свой токен: при ошибке распознавания diarization останавливается, не отменяя задачу
+            diarization_cancel = CancelToken()
+            unlink = cancel.on_cancel(lambda: diarization_cancel.cancel(cancel.reason)) if cancel else None
+            diarization = self._diarization_executor.submit(
+                self._run_diarization, audio_path, num_speakers, device, diarization_cancel, audio_key
+            )
+            print("Diarization запущена параллельно с распознаванием")
+        
+        transcribe_start = time.time()
+        try:
+            transcript, detected_language = self._transcribe_for_diarization(
+                audio_path, language, model, device, word_timestamps, cancel
+            )
+            if cancel is not None:
+                cancel.check()
+        except BaseException:
+            if diarization is not None:
+                # Запасной вариант распознает запись заново, а вызывающий код удаляет аудиофайл -
+                # поток diarization не должен продолжать его читать
+                diarization_cancel.cancel("распознавание не удалось")
+                wait([diarization])
+                if unlink is not None:
+                    unlink()
+            raise
+        print(f"✓ Транскрипция завершена: {len(transcript)} сегментов за {time.time() - transcribe_start:.1f} сек")
+        
+        if diarization is None:
+            diarize_segments_list = self._run_diarization(audio_path, num_speakers, device, cancel, audio_key)
+        else:
+            wait_start = time.time()
+            try:
+                diarize_segments_list = diarization.result()
+            except Exception as e:
+                # Транскрипция уже готова - повторно распознавать ради легкой diarization не нужно
+                print(f"⚠️  Diarization не удалась: {e}")
+                diarize_segments_list = []
+            finally:
+                if unlink is not None:
+                    unlink()
+            print(f"✓ Diarization: ожидание после распознавания {time.time() - wait_start:.1f} сек")
+        
+        if not self._assign_diarization(transcript, diarize_segments_list):
+            # Легкая diarization - на уже готовой транскрипции, без повторного распознавания
+            if not (SPECTRAL_DIARIZATION_AVAILABLE or SIMPLE_DIARIZATION_AVAILABLE):
+                raise ValueError("Diarization не нашла спикеров и легкая diarization недоступна")
+            self._diarize_lightweight(transcript, audio_path, num_speakers)
+        
+        return self._build_diarized_result(transcript, detected_language, speaker_names)
+    
+    def _transcribe_for_diarization(
+        self,
+        audio_path: Union[str, Any],
+        language: Optional[str],
+        model: str,
+        device: str,
+        word_timestamps: bool = False,
+        cancel: Optional[CancelToken] = None
+    ) -> Tuple[Transcript, str]:
+        """Распознавание для режима с diarization: (транскрипция, язык)"""
         # WhisperX может использовать стандартный Whisper, поэтому нужно указать путь к кэшу
         if self.cache_dir:
             # WhisperX ищет модели в стандартном месте или через переменную окружения
@@ -480,14 +909,19 @@ class OptimizedSpeechRecognitionService:
         
         # Загружаем модель через Faster-Whisper напрямую
         if FASTER_WHISPER_AVAILABLE:
-            from faster_whisper import WhisperModel
-            download_path = str(self.cache_dir) if self.cache_dir else None
-            whisper_model = WhisperModel(
-                model,
-                device=device,
-                compute_type="int8" if device == "cpu" else "float16",
-                download_root=download_path
-            )
+            if device == self.device:
+                # Та же модель, что и без diarization - уже загруженная переиспользуется
+                whisper_model = self.load_model(model)
+            else:
+                from faster_whisper import WhisperModel
+                download_path = str(self.cache_dir) if self.cache_dir else None
+                whisper_model = WhisperModel(
+                    model,
+                    device=device,
+                    compute_type="int8" if device == "cpu" else "float16",
+                    cpu_threads=self.transcribe_threads,
+                    download_root=download_path
+                )
             print(f"Модель Whisper {model} загружена через Faster-Whisper")
             
             # Транскрипция
@@ -497,41 +931,71 @@ class OptimizedSpeechRecognitionService:
                 language=language,
                 beam_size=5,
                 vad_filter=True,
-                vad_parameters=dict(min_silence_duration_ms=500)
+                vad_parameters=dict(min_silence_duration_ms=500),
+                word_timestamps=word_timestamps
             )
             
-            # Конвертация в нужный формат
-            segments_list = []
-            for segment in segments:
-                segments_list.append({
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text.strip()
-                })
-            
-            result = {
-                "language": info.language,
-                "segments": segments_list
-            }
-        else:
-            # Fallback на стандартный Whisper
-            import whisper
-            whisper_model = whisper.load_model(model)
-            result = whisper_model.transcribe(audio_path, language=language)
-            result = {
-                "language": result.get("language", "unknown"),
-                "segments": [
-                    {
-                        "start": seg.get("start", 0),
-                        "end": seg.get("end", 0),
-                        "text": seg.get("text", "").strip()
-                    }
-                    for seg in result.get("segments", [])
-                ]
-            }
+            transcript = Transcript.from_segments(guard(segments, cancel), with_words=word_timestamps)
+            return transcript, info.language
         
-        print(f"✓ Транскрипция завершена: {len(result['segments'])} сегментов")
+        # Fallback на стандартный Whisper
+        import whisper
+        whisper_model = whisper.load_model(model)
+        result = whisper_model.transcribe(audio_path, language=language, word_timestamps=word_timestamps)
+        transcript = Transcript.from_segments(result.get("segments", []), with_words=word_timestamps)
+        return transcript, result.get("language", "unknown")
+    
+    def _diarize(
+        self,
+        transcript: Transcript,
+        audio_path: Union[str, Any],
+        num_speakers: Optional[int],
+        device: str,
+        cancel: Optional[CancelToken] = None,
+        audio_key: Optional[str] = None
+    ) -> bool:
+        """
+        Присваивает спикеров сегментам транскрипции (pyannote.audio или WhisperX DiarizationPipeline)
         
+        Returns:
+            False - diarization не нашла сегментов спикеров (спикеры не присвоены)
+        """
+        return self._assign_diarization(
+            transcript, self._run_diarization(audio_path, num_speakers, device, cancel, audio_key)
+        )
+    
+    def _assign_diarization(self, transcript: Transcript, diarize_segments_list: List[Dict]) -> bool:
+        """Присваивает спикеров по сегментам diarization; False - сегментов нет"""
+        if len(diarize_segments_list) == 0:
+            print("⚠️  Diarization не нашла сегментов спикеров!")
+            print("   Возможно, аудио слишком короткое или содержит только одного спикера")
+            print("   Используем легкую diarization как fallback")
+            return False
+        
+        # Объединяем транскрипцию с diarization вручную
+        print("Объединение транскрипции с diarization...")
+        self._assign_speakers_manual(transcript, diarize_segments_list)
+        print("✓ Спикеры успешно присвоены к сегментам транскрипции")
+        return True
+    
+    def _run_diarization(
+        self,
+        audio_path: Union[str, Any],
+        num_speakers: Optional[int],
+        device: str,
+        cancel: Optional[CancelToken] = None,
+        audio_key: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Diarization записи (pyannote.audio или WhisperX DiarizationPipeline)
+        
+        Не зависит от транскрипции - может выполняться параллельно с распознаванием.
+        С audio_key сегментация и эмбеддинги берутся из кэша (если это аудио уже
+        обрабатывалось) - заново выполняется только кластеризация.
+        
+        Returns:
+            сегменты спикеров [{"segment": {"start", "end"}, "speaker"}]
+        """
         # Diarization (разделение по ролям)
         # Используем HF_HOME для сохранения модели на диск E
         hf_home = os.getenv("HF_HOME")
@@ -548,73 +1012,82 @@ class OptimizedSpeechRecognitionService:
         # ВАЖНО: Модель требует токен Hugging Face и принятия условий использования
         # Получить токен: https://huggingface.co/settings/tokens
         # Принять условия: https://hf.co/pyannote/speaker-diarization-3.1
-        try:
-            # Пробуем использовать WhisperX.DiarizationPipeline, если доступен
-            if hasattr(whisperx, 'DiarizationPipeline'):
-                print("Используется WhisperX.DiarizationPipeline...")
-                if not hf_token:
-                    print("⚠️  Токен Hugging Face не указан (HF_TOKEN или HUGGINGFACE_TOKEN)")
-                    print("   Для использования WhisperX diarization нужен токен.")
-                    print("   Получите токен: https://huggingface.co/settings/tokens")
-                    print("   Примите условия: https://hf.co/pyannote/speaker-diarization-3.1")
-                    print("   Добавьте токен в настройки Spaces как секретную переменную HF_TOKEN")
-                    raise ValueError("HF_TOKEN не указан. Требуется для доступа к модели diarization.")
+        # Пайплайн diarization загружается один раз и переиспользуется между задачами
+        diarize_model = self.diarization_pipeline
+        if diarize_model is None:
+            load_start = time.time()
+            try:
+                # Пробуем использовать WhisperX.DiarizationPipeline, если доступен
+                if hasattr(whisperx, 'DiarizationPipeline'):
+                    print("Используется WhisperX.DiarizationPipeline...")
+                    if not hf_token:
+                        print("⚠️  Токен Hugging Face не указан (HF_TOKEN или HUGGINGFACE_TOKEN)")
+                        print("   Для использования WhisperX diarization нужен токен.")
+                        print("   Получите токен: https://huggingface.co/settings/tokens")
+                        print("   Примите условия: https://hf.co/pyannote/speaker-diarization-3.1")
+                        print("   Добавьте токен в настройки Spaces как секретную переменную HF_TOKEN")
+                        raise ValueError("HF_TOKEN не указан. Требуется для доступа к модели diarization.")
                 
-                diarize_model = whisperx.DiarizationPipeline(
-                    use_auth_token=hf_token,
-                    device=device
-                )
+                    diarize_model = whisperx.DiarizationPipeline(
+                        use_auth_token=hf_token,
+                        device=device
+                    )
                 
-                if diarize_model is None:
-                    raise ValueError("Не удалось загрузить модель diarization. Проверьте токен и условия использования.")
+                    if diarize_model is None:
+                        raise ValueError("Не удалось загрузить модель diarization. Проверьте токен и условия использования.")
                     
-            else:
-                # Используем pyannote.audio напрямую
-                print("DiarizationPipeline недоступен в whisperx, используем pyannote.audio...")
-                print(f"Путь к моделям: {hf_home}")
+                else:
+                    # Используем pyannote.audio напрямую
+                    print("DiarizationPipeline недоступен в whisperx, используем pyannote.audio...")
+                    print(f"Путь к моделям: {hf_home}")
                 
-                if not hf_token:
-                    print("⚠️  Токен Hugging Face не указан (HF_TOKEN или HUGGINGFACE_TOKEN)")
-                    print("   Для использования pyannote.audio diarization нужен токен.")
-                    print("   Получите токен: https://huggingface.co/settings/tokens")
-                    print("   Примите условия: https://hf.co/pyannote/speaker-diarization-3.1")
-                    raise ValueError("HF_TOKEN не указан. Требуется для доступа к модели diarization.")
+                    if not hf_token:
+                        print("⚠️  Токен Hugging Face не указан (HF_TOKEN или HUGGINGFACE_TOKEN)")
+                        print("   Для использования pyannote.audio diarization нужен токен.")
+                        print("   Получите токен: https://huggingface.co/settings/tokens")
+                        print("   Примите условия: https://hf.co/pyannote/speaker-diarization-3.1")
+                        raise ValueError("HF_TOKEN не указан. Требуется для доступа к модели diarization.")
                 
-                from pyannote.audio import Pipeline
+                    from pyannote.audio import Pipeline
                 
-                # Загружаем модель из Hugging Face
-                diarize_model = Pipeline.from_pretrained(
-                    "pyannote/speaker-diarization-3.1",
-                    use_auth_token=hf_token,
-                    cache_dir=hf_home
-                )
+                    # Загружаем модель из Hugging Face
+                    diarize_model = Pipeline.from_pretrained(
+                        "pyannote/speaker-diarization-3.1",
+                        use_auth_token=hf_token,
+                        cache_dir=hf_home
+                    )
                 
-                if diarize_model is None:
-                    raise ValueError("Не удалось загрузить модель diarization. Проверьте токен и условия использования.")
+                    if diarize_model is None:
+                        raise ValueError("Не удалось загрузить модель diarization. Проверьте токен и условия использования.")
                 
-                if device == "cuda":
-                    import torch
-                    diarize_model = diarize_model.to(torch.device("cuda"))
+                    if device == "cuda":
+                        import torch
+                        diarize_model = diarize_model.to(torch.device("cuda"))
                 
-                print("✓ Модель diarization загружена")
-        except Exception as diarize_load_error:
-            error_msg = str(diarize_load_error)
-            print(f"❌ Ошибка при загрузке модели diarization: {error_msg}")
-            if "HF_TOKEN" in error_msg or "token" in error_msg.lower() or "NoneType" in error_msg:
-                print("\n" + "="*60)
-                print("РЕШЕНИЕ ПРОБЛЕМЫ:")
-                print("="*60)
-                print("1. Получите токен Hugging Face:")
-                print("   https://huggingface.co/settings/tokens")
-                print("2. Примите условия использования модели:")
-                print("   https://hf.co/pyannote/speaker-diarization-3.1")
-                print("3. Добавьте токен в настройки Spaces:")
-                print("   Settings → Secrets → Добавьте HF_TOKEN")
-                print("="*60 + "\n")
-            import traceback
-            traceback.print_exc()
-            raise
-        
+                    print("✓ Модель diarization загружена")
+            except Exception as diarize_load_error:
+                error_msg = str(diarize_load_error)
+                print(f"❌ Ошибка при загрузке модели diarization: {error_msg}")
+                if "HF_TOKEN" in error_msg or "token" in error_msg.lower() or "NoneType" in error_msg:
+                    print("\n" + "="*60)
+                    print("РЕШЕНИЕ ПРОБЛЕМЫ:")
+                    print("="*60)
+                    print("1. Получите токен Hugging Face:")
+                    print("   https://huggingface.co/settings/tokens")
+                    print("2. Примите условия использования модели:")
+                    print("   https://hf.co/pyannote/speaker-diarization-3.1")
+                    print("3. Добавьте токен в настройки Spaces:")
+                    print("   Settings → Secrets → Добавьте HF_TOKEN")
+                    print("="*60 + "\n")
+                import traceback
+                traceback.print_exc()
+                raise
+            if self.diarization_threads:
+                # Бюджет потоков pyannote - пул torch; Faster-Whisper (CTranslate2) использует свой пул
+                import torch
+                torch.set_num_threads(self.diarization_threads)
+            self.diarization_pipeline = diarize_model
+            self.load_seconds["diarization"] = time.time() - load_start
         print(f"✓ Модель diarization загружена")
         
         # Выполнение diarization
@@ -635,13 +1108,26 @@ class OptimizedSpeechRecognitionService:
             try:
                 # Формируем входные данные для pyannote
                 # pyannote.audio ожидает словарь с ключом "uri" и "audio" (путь к файлу или массив)
-                diarize_input = {"uri": "audio", "audio": audio_path}
+                if isinstance(audio_path, str):
+                    diarize_input = {"uri": "audio", "audio": audio_path}
+                else:
+                    # Декодированное аудио из кэша: pyannote принимает волну (каналы x отсчеты)
+                    import numpy as np
+                    import torch
+                    diarize_input = {
+                        "uri": "audio",
+                        "waveform": torch.from_numpy(np.ascontiguousarray(audio_path))[None, :],
+                        "sample_rate": 16000
+                    }
                 if num_speakers:
                     diarize_input["num_speakers"] = num_speakers
                 
                 # Выполняем diarization
                 print("Выполняется diarization через pyannote.audio...")
-                diarization_result = diarize_model(diarize_input)
+                hook = pyannote_hook(cancel)
+                # hook вызывается на каждом шаге пайплайна - через него прерывается отмененная задача
+                with self.diarization_cache.reuse(diarize_model, audio_key):
+                    diarization_result = diarize_model(diarize_input, hook=hook) if hook else diarize_model(diarize_input)
                 
                 # Конвертируем результат pyannote в формат для присваивания спикеров
                 # pyannote возвращает Annotation объект
@@ -706,11 +1192,6 @@ class OptimizedSpeechRecognitionService:
                         raise ValueError(f"Не удалось обработать результат diarization типа {type(diarization_result)}")
                 
                 print(f"✓ Diarization завершена: найдено {len(diarize_segments_list)} сегментов спикеров")
-                
-                # Объединяем транскрипцию с diarization вручную
-                print("Объединение транскрипции с diarization...")
-                result = self._assign_speakers_manual(result, diarize_segments_list)
-                print("✓ Спикеры успешно присвоены к сегментам транскрипции")
             except Exception as pyannote_error:
                 error_msg = str(pyannote_error)
                 print(f"❌ Ошибка при выполнении pyannote diarization: {error_msg}")
@@ -721,13 +1202,18 @@ class OptimizedSpeechRecognitionService:
             # Это WhisperX DiarizationPipeline - используем стандартный API
             print("Используется WhisperX DiarizationPipeline API...")
             try:
-                # WhisperX DiarizationPipeline принимает путь к аудио файлу
-                print(f"Выполняется diarization для файла: {audio_path}")
-                diarize_segments = diarize_model(
-                    audio_path,
-                    min_speakers=num_speakers if num_speakers else None,
-                    max_speakers=num_speakers if num_speakers else None
-                )
+                # WhisperX DiarizationPipeline принимает путь к аудио файлу или массив float32 16 кГц
+                print(f"Выполняется diarization для файла: {audio_path if isinstance(audio_path, str) else 'аудио из кэша'}")
+                # Внутри WhisperX - пайплайн pyannote (атрибут model): кэшируются его шаги
+                with self.diarization_cache.reuse(getattr(diarize_model, "model", None), audio_key):
+                    diarize_segments = diarize_model(
+                        audio_path,
+                        min_speakers=num_speakers if num_speakers else None,
+                        max_speakers=num_speakers if num_speakers else None
+                    )
+                # WhisperX не принимает hook - отмена проверяется после шага
+                if cancel is not None:
+                    cancel.check()
                 
                 print(f"Результат diarization: тип={type(diarize_segments)}")
                 if hasattr(diarize_segments, '__len__'):
@@ -815,94 +1301,15 @@ class OptimizedSpeechRecognitionService:
                         traceback.print_exc()
                 
                 print(f"✓ Diarization завершена: найдено {len(diarize_segments_list)} сегментов спикеров")
-                
-                if len(diarize_segments_list) == 0:
-                    print("⚠️  Diarization не нашла сегментов спикеров!")
-                    print("   Возможно, аудио слишком короткое или содержит только одного спикера")
-                    print("   Используем простую diarization на основе пауз как fallback")
-                    # Fallback на простую diarization
-                    if SIMPLE_DIARIZATION_AVAILABLE:
-                        return self._transcribe_with_simple_diarization(
-                            audio_path, language, model, beam_size=5, best_of=5, speaker_names=speaker_names
-                        )
-                    else:
-                        raise ValueError("Diarization не нашла спикеров и простая diarization недоступна")
-                
-                # Объединяем транскрипцию с diarization вручную
-                print("Объединение транскрипции с diarization...")
-                result = self._assign_speakers_manual(result, diarize_segments_list)
-                print("✓ Спикеры успешно присвоены к сегментам транскрипции")
             except Exception as diarize_error:
                 print(f"⚠️  Ошибка при выполнении diarization: {diarize_error}")
                 import traceback
                 traceback.print_exc()
                 raise
         
-        # Форматирование результата
-        segments = []
-        speakers_text = {}  # Группировка по спикерам
-        
-        for segment in result["segments"]:
-            speaker = segment.get("speaker", "SPEAKER_00")
-            seg_dict = {
-                "id": len(segments),
-                "start": segment["start"],
-                "end": segment["end"],
-                "text": segment["text"].strip(),
-                "speaker": speaker
-            }
-            segments.append(seg_dict)
-            
-            # Группировка текста по спикерам
-            if speaker not in speakers_text:
-                speakers_text[speaker] = []
-            speakers_text[speaker].append(segment["text"].strip())
-        
-        # Формирование текста по спикерам
-        speakers_output = {
-            speaker: " ".join(texts)
-            for speaker, texts in speakers_text.items()
-        }
-        
-        # Формируем красивый текст с разделением по спикерам
-        formatted_text_parts = []
-        current_speaker = None
-        current_text_parts = []
-        
-        for seg in segments:
-            speaker = seg.get("speaker", "SPEAKER_00")
-            text = seg.get("text", "").strip()
-            
-            if not text:
-                continue
-            
-            if speaker != current_speaker:
-                # Новый спикер - добавляем предыдущий текст
-                if current_speaker and current_text_parts:
-                    speaker_name = self._format_speaker_name(current_speaker, speaker_names)
-                    formatted_text_parts.append(f"{speaker_name}: {' '.join(current_text_parts)}")
-                    current_text_parts = []
-                current_speaker = speaker
-            
-            current_text_parts.append(text)
-        
-        # Добавляем последнего спикера
-        if current_speaker and current_text_parts:
-            speaker_name = self._format_speaker_name(current_speaker, speaker_names)
-            formatted_text_parts.append(f"{speaker_name}: {' '.join(current_text_parts)}")
-        
-        formatted_text = "\n\n".join(formatted_text_parts)
-        
-        return {
-            "text": " ".join([seg["text"] for seg in segments]),  # Простой текст
-            "formatted_text": formatted_text,  # Красивый текст с разделением по спикерам
-            "language": result.get("language", "unknown"),
-            "segments": segments,
-            "speakers": speakers_output,  # Текст по каждому спикеру
-            "num_speakers": len(speakers_output)
-        }
+        return diarize_segments_list
     
-    def _assign_speakers_manual(self, whisper_result: Dict, diarization_segments: List) -> Dict:
+    def _assign_speakers_manual(self, transcript: Transcript, diarization_segments: List) -> Transcript:
         """Вручную присваивает спикеров к сегментам транскрипции на основе временных меток"""
         # Создаем словарь спикеров по времени
         speaker_map = {}
@@ -916,10 +1323,8 @@ class OptimizedSpeechRecognitionService:
             speaker_map[mid_time] = speaker
         
         # Присваиваем спикеров к каждому сегменту транскрипции
-        for segment in whisper_result.get("segments", []):
-            seg_start = segment.get("start", 0)
-            seg_end = segment.get("end", seg_start)
-            seg_mid = (seg_start + seg_end) / 2
+        for i in range(len(transcript)):
+            seg_mid = (transcript.starts[i] + transcript.ends[i]) / 2
             
             # Находим ближайшего спикера
             closest_speaker = "SPEAKER_00"
@@ -932,22 +1337,28 @@ class OptimizedSpeechRecognitionService:
                     closest_speaker = speaker
             
             # Присваиваем спикера к сегменту
-            segment["speaker"] = closest_speaker
+            transcript.set_speaker(i, closest_speaker)
         
-        return whisper_result
+        return transcript
     
     def _transcribe_with_simple_diarization(
         self,
-        audio_path: str,
+        audio_path: Union[str, Any],
         language: Optional[str],
         model: str,
         beam_size: int,
         best_of: int,
-        speaker_names: Optional[List[str]] = None
+        speaker_names: Optional[List[str]] = None,
+        word_timestamps: bool = False,
+        cancel: Optional[CancelToken] = None,
+        num_speakers: Optional[int] = None
     ) -> Dict:
-        """Транскрипция с простым разделением по ролям на основе пауз (не требует дополнительных моделей)"""
-        if not SIMPLE_DIARIZATION_AVAILABLE:
-            raise ImportError("Простая diarization недоступна")
+        """
+        Транскрипция с легким разделением по ролям (не требует дополнительных моделей):
+        по спектральным признакам голоса, без NumPy - по паузам
+        """
+        if not (SPECTRAL_DIARIZATION_AVAILABLE or SIMPLE_DIARIZATION_AVAILABLE):
+            raise ImportError("Легкая diarization недоступна")
         
         # Стандартная транскрипция
         whisper_model = self.load_model(model)
@@ -960,17 +1371,11 @@ class OptimizedSpeechRecognitionService:
                 beam_size=beam_size,
                 best_of=best_of,
                 vad_filter=True,
-                vad_parameters=dict(min_silence_duration_ms=500)
+                vad_parameters=dict(min_silence_duration_ms=500),
+                word_timestamps=word_timestamps
             )
             
-            segments_list = []
-            for segment in segments:
-                segments_list.append({
-                    "id": len(segments_list),
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text.strip()
-                })
+            transcript = Transcript.from_segments(guard(segments, cancel), with_words=word_timestamps)
         else:
             # Стандартный Whisper
             result = whisper_model.transcribe(
@@ -978,18 +1383,11 @@ class OptimizedSpeechRecognitionService:
                 language=language,
                 task="transcribe",
                 beam_size=beam_size,
-                best_of=best_of
+                best_of=best_of,
+                word_timestamps=word_timestamps
             )
             
-            segments_list = [
-                {
-                    "id": seg.get("id", i),
-                    "start": seg.get("start", 0),
-                    "end": seg.get("end", 0),
-                    "text": seg.get("text", "").strip()
-                }
-                for i, seg in enumerate(result.get("segments", []))
-            ]
+            transcript = Transcript.from_segments(result.get("segments", []), with_words=word_timestamps)
             # Создаем объект info с языком для совместимости с Faster-Whisper API
             class Info:
                 def __init__(self, lang):
@@ -997,89 +1395,145 @@ class OptimizedSpeechRecognitionService:
             info = Info(result.get("language", "unknown"))
         
         # Проверка на пустые сегменты
-        if not segments_list:
+        if not len(transcript):
             raise ValueError("Не удалось получить сегменты из аудио. Проверьте, что аудио содержит речь.")
         
-        # Применяем простую diarization с очень чувствительным порогом
-        # Используем агрессивный порог 0.3 сек + анализ паттернов вопрос-ответ
-        segments_with_speakers = simple_diarization(segments_list, pause_threshold=0.3)
+        # Спикеры присваиваются на месте, без копирования сегментов
+        engine = self._diarize_lightweight(transcript, audio_path, num_speakers)
         
         # Подсчитываем количество уникальных спикеров для отладки
-        unique_speakers = set(seg.get("speaker", "SPEAKER_00") for seg in segments_with_speakers)
-        print(f"✓ Простая diarization применена: найдено {len(unique_speakers)} спикеров")
+        unique_speakers = set(transcript.speakers)
+        print(f"✓ Легкая diarization ({engine}) применена: найдено {len(unique_speakers)} спикеров")
         print(f"  Спикеры: {sorted(unique_speakers)}")
         
-        # Группируем по спикерам
-        speakers_output = group_by_speakers(segments_with_speakers)
-        
-        # Формируем полный текст (простой вариант без меток спикеров)
-        full_text = " ".join([seg.get("text", "") for seg in segments_with_speakers if seg.get("text")])
-        
-        # Формируем красивый текст с разделением по спикерам
-        formatted_text_parts = []
-        current_speaker = None
-        current_text_parts = []
-        
-        for seg in segments_with_speakers:
-            speaker = seg.get("speaker", "SPEAKER_00")
-            text = seg.get("text", "").strip()
-            
-            if not text:
-                continue
-            
-            if speaker != current_speaker:
-                # Новый спикер - добавляем предыдущий текст
-                if current_speaker and current_text_parts:
-                    speaker_name = self._format_speaker_name(current_speaker, speaker_names)
-                    formatted_text_parts.append(f"{speaker_name}: {' '.join(current_text_parts)}")
-                    current_text_parts = []
-                current_speaker = speaker
-            
-            current_text_parts.append(text)
-        
-        # Добавляем последнего спикера
-        if current_speaker and current_text_parts:
-            speaker_name = self._format_speaker_name(current_speaker, speaker_names)
-            formatted_text_parts.append(f"{speaker_name}: {' '.join(current_text_parts)}")
-        
-        formatted_text = "\n\n".join(formatted_text_parts)
+        return self._build_diarized_result(transcript, info.language, speaker_names)
+    
+    def _rediarize(
+        self,
+        transcript: Transcript,
+        audio_path: Union[str, Any],
+        language: str,
+        num_speakers: Optional[int],
+        speaker_names: Optional[List[str]] = None,
+        audio_key: Optional[str] = None,
+        cancel: Optional[CancelToken] = None
+    ) -> Dict:
+        """Спикеры для готовой транскрипции: распознавание не выполняется, pyannote - по кэшу эмбеддингов"""
+        print(f"Повторная diarization готовой транскрипции ({len(transcript)} сегментов, "
+              f"спикеров: {num_speakers if num_speakers else 'авто'})")
+        transcript.clear_speakers()
+        diarized = False
+        if WHISPERX_AVAILABLE and self.diarization_engine == "auto":
+            device = "cuda" if self.use_gpu and self.device == "cuda" else "cpu"
+            try:
+                diarized = self._diarize(transcript, audio_path, num_speakers, device, cancel, audio_key)
+            except Exception as e:
+                print(f"⚠️  Diarization не удалась: {e}")
+        if not diarized:
+            self._diarize_lightweight(transcript, audio_path, num_speakers)
+        return self._build_diarized_result(transcript, language, speaker_names)
+    
+    def _diarize_lightweight(
+        self,
+        transcript: Transcript,
+        audio_path: Union[str, Any],
+        num_speakers: Optional[int] = None
+    ) -> str:
+        """
+        Спикеры без pyannote: по спектральным признакам голоса (NumPy), иначе по паузам
         
+        Returns:
+            использованный движок ("spectral" или "pauses")
+        """
+        if SPECTRAL_DIARIZATION_AVAILABLE and self.diarization_engine != "pauses":
+            try:
+                spectral_diarize_transcript(transcript, self._load_waveform(audio_path), num_speakers)
+                return "spectral"
+            except Exception as e:
+                print(f"⚠️  Спектральная diarization не удалась: {e}")
+        if not SIMPLE_DIARIZATION_AVAILABLE:
+            raise ValueError("Простая diarization недоступна")
+        # Агрессивный порог 0.3 сек + анализ паттернов вопрос-ответ
+        diarize_transcript(transcript, pause_threshold=0.3)
+        return "pauses"
+    
+    @staticmethod
+    def _load_waveform(audio_path: Union[str, Any]) -> Any:
+        """Аудио float32 16 кГц: массив передается как есть, файл декодируется"""
+        if not isinstance(audio_path, (str, Path)):
+            return audio_path
+        if FASTER_WHISPER_AVAILABLE:
+            from faster_whisper import decode_audio
+            return decode_audio(str(audio_path), sampling_rate=SAMPLE_RATE)
+        return whisper.load_audio(str(audio_path))
+    
+    def _format_speaker_text(self, transcript: Transcript, speaker_names: Optional[List[str]] = None) -> str:
+        """Формирует красивый текст с разделением по спикерам (реплики через пустую строку)"""
+        return "\n\n".join(
+            f"{self._format_speaker_name(speaker, speaker_names)}: {text}"
+            for speaker, text in transcript.iter_speaker_turns()
+        )
+    
+    def _build_diarized_result(
+        self,
+        transcript: Transcript,
+        language: str,
+        speaker_names: Optional[List[str]] = None
+    ) -> Dict:
+        """Результат транскрипции с разделением по спикерам"""
+        speakers_output = transcript.texts_by_speaker()
         return {
-            "text": full_text,  # Простой текст без меток
-            "formatted_text": formatted_text,  # Красивый текст с разделением по спикерам
-            "language": info.language,
-            "segments": segments_with_speakers,
-            "speakers": speakers_output,
+            "text": transcript.full_text(),  # Простой текст без меток
+            "formatted_text": self._format_speaker_text(transcript, speaker_names),  # Красивый текст с разделением по спикерам
+            "language": language,
+            "transcript": transcript,
+            "speakers": speakers_output,  # Текст по каждому спикеру
             "num_speakers": len(speakers_output)
         }
     
-    def generate_subtitles(self, transcription_result: Dict, format: str = "srt", include_speakers: bool = False) -> str:
-        """Генерирует субтитры с опциональным указанием спикеров"""
-        segments = transcription_result.get("segments", [])
+    def generate_subtitles(
+        self,
+        transcription_result: Dict,
+        format: str = "srt",
+        include_speakers: bool = False,
+        speaker_names: Optional[List[str]] = None,
+        word_timing: bool = False
+    ) -> str:
+        """
+        Генерирует субтитры с опциональным указанием спикеров
+        
+        Если переданы speaker_names, метки спикеров заменяются на имена
+        (через _format_speaker_name), иначе используются исходные метки SPEAKER_XX.
+        word_timing добавляет в VTT теги времени слов (караоке), если они были распознаны.
+        """
+        if "transcript" in transcription_result:
+            segments = transcription_result["transcript"].iter_segments(include_words=word_timing)
+        else:
+            segments = transcription_result.get("segments", [])
         
         if format.lower() == "srt":
-            return self._generate_srt(segments, include_speakers)
+            return self._generate_srt(segments, include_speakers, speaker_names)
         elif format.lower() == "vtt":
-            return self._generate_vtt(segments, include_speakers)
+            return self._generate_vtt(segments, include_speakers, speaker_names, word_timing)
         else:
             raise ValueError(f"Неподдерживаемый формат: {format}")
     
-    def _generate_srt(self, segments: List[Dict], include_speakers: bool = False) -> str:
+    def _speaker_label(self, speaker: str, speaker_names: Optional[List[str]] = None) -> str:
+        """Метка спикера для субтитров"""
+        if speaker_names:
+            return self._format_speaker_name(speaker, speaker_names)
+        return speaker
+    
+    def _generate_srt(
+        self,
+        segments: List[Dict],
+        include_speakers: bool = False,
+        speaker_names: Optional[List[str]] = None
+    ) -> str:
         """Генерирует SRT с опциональными метками спикеров"""
-        srt_lines = []
-        for seg in segments:
-            idx = seg.get("id", 0) + 1
-            start = self._format_timestamp(seg.get("start", 0))
-            end = self._format_timestamp(seg.get("end", 0))
-            text = seg.get("text", "")
-            
-            # Добавляем метку спикера, если есть
-            if include_speakers and "speaker" in seg:
-                text = f"[{seg['speaker']}] {text}"
-            
-            srt_lines.append(f"{idx}\n{start} --> {end}\n{text}\n")
-        
-        return "\n".join(srt_lines)
+        return "".join(iter_srt(
+            segments, include_speakers, lambda speaker: self._speaker_label(speaker, speaker_names)
+        ))
     
     def _format_speaker_name(self, speaker: str, speaker_names: Optional[List[str]] = None) -> str:
         """Форматирует имя спикера для красивого отображения"""
@@ -1110,35 +1564,23 @@ class OptimizedSpeechRecognitionService:
                 return f"Спикер {speaker_num}"
         return speaker
     
-    def _generate_vtt(self, segments: List[Dict], include_speakers: bool = False) -> str:
-        """Генерирует VTT с опциональными метками спикеров"""
-        vtt_lines = ["WEBVTT\n"]
-        for seg in segments:
-            start = self._format_timestamp_vtt(seg.get("start", 0))
-            end = self._format_timestamp_vtt(seg.get("end", 0))
-            text = seg.get("text", "")
-            
-            # Добавляем метку спикера, если есть
-            if include_speakers and "speaker" in seg:
-                text = f"<v {seg['speaker']}>{text}</v>"
-            
-            vtt_lines.append(f"{start} --> {end}\n{text}\n")
-        
-        return "\n".join(vtt_lines)
+    def _generate_vtt(
+        self,
+        segments: List[Dict],
+        include_speakers: bool = False,
+        speaker_names: Optional[List[str]] = None,
+        word_timing: bool = False
+    ) -> str:
+        """Генерирует VTT с опциональными метками спикеров и тегами времени слов"""
+        return "".join(iter_vtt(
+            segments, include_speakers, lambda speaker: self._speaker_label(speaker, speaker_names), word_timing
+        ))
     
     def _format_timestamp(self, seconds: float) -> str:
         """Форматирует время для SRT"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds % 1) * 1000)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+        return format_timestamp(seconds, ",")
     
     def _format_timestamp_vtt(self, seconds: float) -> str:
         """Форматирует время для VTT"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds % 1) * 1000)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+        return format_timestamp(seconds, ".")
 
@@ -0,0 +1,163 @@
+"""
+Раздача собранного frontend: оболочка SPA из памяти и ассеты со сжатыми копиями
+
+- index.html читается один раз при запуске и хранится в памяти вместе со
+  сжатыми вариантами (br, gzip); ETag - хэш содержимого, по If-None-Match
+  отвечает 304. Cache-Control: no-cache - браузер проверяет оболочку при
+  каждом открытии и получает новую версию сразу после развертывания.
+- ассеты (assets/*-[hash].js, .css) неизменяемы - имя меняется вместе
+  с содержимым, поэтому кэшируются на год (immutable). Сжатые копии
+  .br/.gz создаются рядом с файлами при запуске и выбираются по Accept-Encoding.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import stat
+from typing import Dict, Iterable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from .response_encoding import BROTLI_AVAILABLE, _accepts
+
+if BROTLI_AVAILABLE:
+    import brotli
+
+# Сжимаются текстовые форматы; изображения и шрифты (woff2) уже сжаты
+COMPRESSIBLE_EXTENSIONS = (".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml", ".wasm")
+# Файлы меньше этого размера не сжимаются
+MIN_COMPRESS_SIZE = 1024
+# Сжатая копия сохраняется, только если она меньше этой доли исходного файла
+MAX_COMPRESSED_RATIO = 0.9
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Content-Encoding -> расширение сжатой копии (в порядке предпочтения)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compress(data: bytes) -> Dict[str, bytes]:
+    """Сжатые варианты с максимальной степенью сжатия (выполняется один раз при запуске)"""
+    variants = {"gzip": gzip.compress(data, compresslevel=9)}
+    if BROTLI_AVAILABLE:
+        variants["br"] = brotli.compress(data, quality=11)
+    return {
+        encoding: body for encoding, body in variants.items()
+        if len(body) <= len(data) * MAX_COMPRESSED_RATIO
+    }
+
+
+def _negotiate(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    available = set(available)
+    for encoding, _ in ENCODINGS:
+        if encoding in available and _accepts(accept_encoding, encoding):
+            return encoding
+    return None
+
+
+class SpaShell:
+    """index.html в памяти со сжатыми вариантами и ETag"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.body = f.read()
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.variants = _compress(self.body) if len(self.body) >= MIN_COMPRESS_SIZE else {}
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """If-None-Match содержит ETag оболочки (слабое сравнение, как для GET по RFC 9110)"""
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+    def response(self, if_none_match: Optional[str], accept_encoding: Optional[str]) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": REVALIDATE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if self.matches(if_none_match):
+            return Response(status_code=304, headers=headers)
+        encoding = _negotiate(accept_encoding, self.variants)
+        if encoding is None:
+            return Response(self.body, media_type="text/html; charset=utf-8", headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type="text/html; charset=utf-8", headers=headers)
+
+
+def precompress_directory(directory: str) -> Tuple[int, int]:
+    """
+    Создает сжатые копии (.br, .gz) текстовых файлов директории, если их нет или они устарели
+
+    Returns:
+        (сжато файлов, пропущено - копии актуальны или сжатие невыгодно)
+    """
+    compressed = skipped = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            source = os.stat(path)
+            suffixes = [suffix for encoding, suffix in ENCODINGS if encoding == "gzip" or BROTLI_AVAILABLE]
+            if source.st_size < MIN_COMPRESS_SIZE or all(
+                os.path.exists(path + suffix) and os.stat(path + suffix).st_mtime >= source.st_mtime
+                for suffix in suffixes
+            ):
+                skipped += 1
+                continue
+            with open(path, "rb") as f:
+                variants = _compress(f.read())
+            for encoding, suffix in ENCODINGS:
+                if encoding not in variants:
+                    continue
+                tmp_path = f"{path}{suffix}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(variants[encoding])
+                os.replace(tmp_path, path + suffix)
+            compressed += 1
+    return compressed, skipped
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles, отдающий сжатую копию файла (.br/.gz рядом с ним) по Accept-Encoding
+
+    Args:
+        immutable: файлы с хэшем содержимого в имени - кэшировать на год без проверки
+    """
+
+    def __init__(self, *args, immutable: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        accept_encoding = request_headers.get("accept-encoding")
+        if scope["method"] in ("GET", "HEAD") and not path.endswith((".br", ".gz")):
+            for encoding, suffix in ENCODINGS:
+                if not _accepts(accept_encoding, encoding):
+                    continue
+                full_path, stat_result = await run_in_threadpool(self.lookup_path, path + suffix)
+                if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                    continue
+                response = FileResponse(
+                    full_path,
+                    stat_result=stat_result,
+                    method=scope["method"],
+                    media_type=mimetypes.guess_type(path)[0] or "text/plain",
+                    headers={"Content-Encoding": encoding},
+                )
+                self._add_headers(response)
+                if self.is_not_modified(response.headers, request_headers):
+                    return NotModifiedResponse(response.headers)
+                return response
+        response = await super().get_response(path, scope)
+        self._add_headers(response)
+        return response
+
+    def _add_headers(self, response: Response) -> None:
+        response.headers["Cache-Control"] = self.cache_control
+        response.headers["Vary"] = "Accept-Encoding"
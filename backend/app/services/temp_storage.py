@@ -0,0 +1,205 @@
+"""
+Временные файлы задач: входные файлы запросов и извлеченное аудио
+
+Файлы меньше memory_max_file_bytes создаются в памяти (/dev/shm - tmpfs,
+пути работают с ffmpeg как обычные файлы) в пределах memory_budget_bytes,
+остальные - в директории scratch (отдельный том вместо медленного
+overlay-диска контейнера). Перед созданием файла в scratch проверяется
+свободное место: при нехватке выбрасывается TempStorageFullError.
+
+Память не переживает перезапуск контейнера (новый tmpfs), поэтому файлы,
+нужные после него (durable - входные файлы задач, которые хранилище задач
+перезапускает после OOM или деплоя), всегда создаются в scratch. В памяти
+остаются промежуточные файлы, которые задача создает заново (извлеченное
+аудио). Компромисс: запись входных файлов не ускоряется памятью, зато
+прерванная задача запускается заново с сохраненного файла.
+
+Имя файла содержит хост и PID процесса-владельца. Janitor удаляет файлы
+завершившихся процессов этого хоста (упавший рабочий процесс, OOM) и любые
+файлы старше max_age_seconds, кроме защищенных (входные файлы задач,
+ожидающих перезапуска).
+"""
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# Префикс имен файлов: <префикс><хост>-<pid>-<случайная часть><суффикс>
+FILE_PREFIX = "vc-"
+
+
+class TempStorageFullError(Exception):
+    """Недостаточно свободного места во временном хранилище"""
+
+
+def _host() -> str:
+    # Дефис - разделитель полей имени файла
+    return socket.gethostname().replace("-", "_") or "host"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TempStorage:
+    """Выбор места для временных файлов, проверка свободного места и очистка"""
+
+    def __init__(
+        self,
+        scratch_dir: str,
+        memory_dir: Optional[str] = "/dev/shm",
+        memory_max_file_bytes: int = 64 * 1024 ** 2,
+        memory_budget_bytes: int = 512 * 1024 ** 2,
+        min_free_bytes: int = 1024 ** 3,
+        max_age_seconds: float = 24 * 3600
+    ):
+        """
+        Args:
+            scratch_dir: директория временных файлов на диске
+            memory_dir: tmpfs для небольших файлов (None или недоступна - все файлы в scratch)
+            memory_max_file_bytes: файлы не больше этого размера создаются в памяти
+            memory_budget_bytes: суммарный размер файлов в памяти (0 - память не используется)
+            min_free_bytes: свободное место, которое должно остаться в scratch после записи файла
+            max_age_seconds: janitor удаляет файлы старше этого, даже если процесс-владелец жив
+        """
+        self.scratch_dir = Path(scratch_dir)
+        self.scratch_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_dir = None
+        if memory_dir and memory_budget_bytes > 0 and os.path.isdir(memory_dir) and os.access(memory_dir, os.W_OK):
+            self.memory_dir = Path(memory_dir) / "videoconverter"
+            self.memory_dir.mkdir(exist_ok=True)
+        self.memory_max_file_bytes = memory_max_file_bytes
+        self.memory_budget_bytes = memory_budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.max_age_seconds = max_age_seconds
+        self._host = _host()
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_files": 0, "scratch_files": 0, "rejected": 0, "reclaimed_files": 0, "reclaimed_bytes": 0
+        }
+
+    def _directories(self) -> List[Path]:
+        return [self.scratch_dir] + ([self.memory_dir] if self.memory_dir is not None else [])
+
+    def _files(self, directory: Path) -> Iterable[os.DirEntry]:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return []
+        return [entry for entry in entries if entry.name.startswith(FILE_PREFIX) and entry.is_file()]
+
+    def _used_bytes(self, directory: Optional[Path]) -> int:
+        total = 0
+        for entry in self._files(directory) if directory is not None else []:
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                continue
+        return total
+
+    def _fits_in_memory(self, size_hint: int) -> bool:
+        if self.memory_dir is None or not 0 < size_hint <= self.memory_max_file_bytes:
+            return False
+        if self._used_bytes(self.memory_dir) + size_hint > self.memory_budget_bytes:
+            return False
+        # tmpfs занимает оперативную память - оставляем запас для остальных файлов
+        return shutil.disk_usage(self.memory_dir).free - size_hint >= self.memory_max_file_bytes
+
+    def check_space(self, size_hint: int = 0) -> None:
+        """TempStorageFullError, если в scratch не останется min_free_bytes после записи size_hint байт"""
+        free = shutil.disk_usage(self.scratch_dir).free
+        if free - size_hint < self.min_free_bytes:
+            self.stats["rejected"] += 1
+            raise TempStorageFullError(
+                f"Во временном хранилище {self.scratch_dir} свободно {free / 1024 ** 3:.1f} GB, "
+                f"нужно {(size_hint + self.min_free_bytes) / 1024 ** 3:.1f} GB"
+            )
+
+    def create(self, suffix: str = "", size_hint: int = 0, shared: bool = False, durable: bool = False) -> str:
+        """
+        Создает пустой временный файл и возвращает его путь
+
+        Args:
+            suffix: расширение файла (ffmpeg определяет по нему формат вывода)
+            size_hint: ожидаемый размер (0 - неизвестен: файл создается в scratch)
+            shared: файл читают другие процессы или хосты (ROLE=api) - только в scratch
+            durable: файл нужен после перезапуска контейнера (входной файл задачи) - только в scratch
+
+        Raises:
+            TempStorageFullError: в scratch недостаточно места
+        """
+        with self._lock:
+            if not shared and not durable and self._fits_in_memory(size_hint):
+                directory = self.memory_dir
+                self.stats["memory_files"] += 1
+            else:
+                self.check_space(size_hint)
+                directory = self.scratch_dir
+                self.stats["scratch_files"] += 1
+            path = directory / f"{FILE_PREFIX}{self._host}-{os.getpid()}-{uuid.uuid4().hex}{suffix}"
+            # Файл создается сразу: место выбрано с учетом его размера до следующего вызова
+            with open(path, "xb"):
+                pass
+        return str(path)
+
+    def _orphaned(self, entry: os.DirEntry, now: float, protected: set) -> bool:
+        if os.path.abspath(entry.path) in protected:
+            return False
+        try:
+            host, pid, _ = entry.name[len(FILE_PREFIX):].split("-", 2)
+            if host == self._host and not _process_alive(int(pid)):
+                return True
+        except ValueError:
+            pass
+        return now - entry.stat().st_mtime > self.max_age_seconds
+
+    def janitor(self, protected: Iterable[str] = ()) -> int:
+        """
+        Удаляет файлы завершившихся процессов этого хоста и файлы старше max_age_seconds
+
+        Args:
+            protected: пути, которые нельзя удалять (входные файлы задач, ожидающих перезапуска)
+
+        Returns:
+            количество удаленных файлов
+        """
+        protected = {os.path.abspath(path) for path in protected}
+        now = time.time()
+        removed = 0
+        for directory in self._directories():
+            for entry in self._files(directory):
+                try:
+                    if not self._orphaned(entry, now, protected):
+                        continue
+                    size = entry.stat().st_size
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                self.stats["reclaimed_files"] += 1
+                self.stats["reclaimed_bytes"] += size
+        return removed
+
+    def info(self) -> Dict:
+        scratch = shutil.disk_usage(self.scratch_dir)
+        info = {
+            "scratch_dir": str(self.scratch_dir),
+            "scratch_bytes": self._used_bytes(self.scratch_dir),
+            "scratch_free_bytes": scratch.free,
+            "scratch_disk_usage": round(scratch.used / scratch.total, 4) if scratch.total else 0.0,
+            "min_free_bytes": self.min_free_bytes,
+            "memory_dir": str(self.memory_dir) if self.memory_dir is not None else None,
+            "memory_bytes": self._used_bytes(self.memory_dir),
+            "memory_budget_bytes": self.memory_budget_bytes if self.memory_dir is not None else 0,
+        }
+        return {**info, **self.stats}
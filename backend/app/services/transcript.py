@@ -0,0 +1,390 @@
+"""
+Компактное колоночное представление транскрипции
+
+Вместо списка словарей {id, start, end, text, speaker} сегменты хранятся
+в колонках: массивы float для времени, индексы интернированных меток спикеров
+и один общий текстовый буфер со смещениями. Словари создаются только на
+границе API (to_segments / iter_segments).
+
+Тайминги слов (опционально) хранятся так же - параллельными массивами
+в WordTimings, а не словарем на каждое слово.
+"""
+from array import array
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Индекс спикера для сегментов без метки
+NO_SPEAKER = -1
+
+
+class TextColumn:
+    """Последовательность текстов сегментов (срезы общего буфера без копирования списка)"""
+
+    __slots__ = ("_transcript",)
+
+    def __init__(self, transcript: "Transcript"):
+        self._transcript = transcript
+
+    def __len__(self) -> int:
+        return len(self._transcript)
+
+    def __getitem__(self, index: int) -> str:
+        transcript = self._transcript
+        if index < 0:
+            index += len(transcript)
+        # Вызывается на каждый сегмент в эвристиках diarization - без промежуточных вызовов
+        offsets = transcript.offsets
+        return transcript.text_buffer[offsets[index]:offsets[index + 1]]
+
+
+# Слово в сегменте: (start, end, текст, вероятность)
+Word = Tuple[float, float, str, float]
+
+# Вероятности слов хранятся во float32 - больше знаков в выдаче бессмысленны
+PROBABILITY_PRECISION = 4
+
+
+def _round(value: float, precision: Optional[int]) -> float:
+    return value if precision is None else round(value, precision)
+
+
+class WordTimings:
+    """
+    Тайминги слов в колоночном виде
+
+    Слова сегмента i - индексы segment_index[i]:segment_index[i + 1]
+    в параллельных массивах starts / ends / probabilities / offsets.
+    Текст слова хранится как есть (faster-whisper отдает его с ведущим пробелом).
+    """
+
+    __slots__ = ("starts", "ends", "probabilities", "segment_index", "offsets", "_text", "_pending")
+
+    def __init__(self):
+        self.starts = array("d")
+        self.ends = array("d")
+        # Вероятности не нужны с двойной точностью
+        self.probabilities = array("f")
+        self.segment_index = array("q", [0])
+        self.offsets = array("q", [0])
+        self._text = ""
+        self._pending: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def append_segment(self, words: Optional[Iterable]) -> None:
+        """Добавляет слова очередного сегмента (словари openai-whisper или объекты faster-whisper)"""
+        for word in words or ():
+            if isinstance(word, dict):
+                start, end = word.get("start", 0), word.get("end", 0)
+                text, probability = word.get("word", ""), word.get("probability", 0.0)
+            else:
+                start, end, text, probability = word.start, word.end, word.word, word.probability
+            self.starts.append(start)
+            self.ends.append(end)
+            self.probabilities.append(probability)
+            self._pending.append(text)
+            self.offsets.append(self.offsets[-1] + len(text))
+        self.segment_index.append(len(self.starts))
+
+    @property
+    def text_buffer(self) -> str:
+        if self._pending:
+            self._text += "".join(self._pending)
+            self._pending = []
+        return self._text
+
+    def segment_words(self, index: int, precision: Optional[int] = None) -> List[Word]:
+        """Слова сегмента как кортежи (start, end, текст, вероятность)"""
+        buffer = self.text_buffer
+        offsets = self.offsets
+        return [
+            (
+                _round(self.starts[k], precision),
+                _round(self.ends[k], precision),
+                buffer[offsets[k]:offsets[k + 1]],
+                round(self.probabilities[k], PROBABILITY_PRECISION),
+            )
+            for k in range(self.segment_index[index], self.segment_index[index + 1])
+        ]
+
+    def to_compact(self, precision: Optional[int] = None) -> Dict:
+        """
+        Компактный JSON-вид (он же формат поля words в ответе API)
+
+        Тексты слов отдаются списком строк, а не буфером со смещениями:
+        смещения в символах Python не совпадают с индексами строк в JavaScript
+        (UTF-16), а список строк в JSON не длиннее массива смещений.
+        """
+        buffer = self.text_buffer
+        offsets = self.offsets
+        return {
+            "segment_index": self.segment_index.tolist(),
+            "start": [_round(value, precision) for value in self.starts],
+            "end": [_round(value, precision) for value in self.ends],
+            "probability": [round(value, PROBABILITY_PRECISION) for value in self.probabilities],
+            "text": [buffer[offsets[k]:offsets[k + 1]] for k in range(len(self.starts))],
+        }
+
+    def shift(self, offset: float) -> None:
+        """Сдвигает время всех слов на offset секунд"""
+        self.starts = array("d", (value + offset for value in self.starts))
+        self.ends = array("d", (value + offset for value in self.ends))
+
+    @classmethod
+    def from_compact(cls, data: Dict) -> "WordTimings":
+        words = cls()
+        words.starts = array("d", data["start"])
+        words.ends = array("d", data["end"])
+        words.probabilities = array("f", data["probability"])
+        words.segment_index = array("q", data["segment_index"])
+        words.offsets = array("q", [0])
+        words.offsets.extend(accumulate(len(text) for text in data["text"]))
+        words._text = "".join(data["text"])
+        return words
+
+
+class Transcript:
+    """Сегменты транскрипции в колоночном виде"""
+
+    __slots__ = (
+        "starts", "ends", "speaker_ids", "speakers", "_speaker_index",
+        "offsets", "_text", "_pending", "words",
+    )
+
+    def __init__(self, with_words: bool = False):
+        """
+        Args:
+            with_words: хранить тайминги слов (режим word_timestamps)
+        """
+        self.starts = array("d")
+        self.ends = array("d")
+        self.speaker_ids = array("i")
+        # Интернированные метки спикеров (SPEAKER_00, ...) - индекс в speaker_ids
+        self.speakers: List[str] = []
+        self._speaker_index: Dict[str, int] = {}
+        # Текст сегмента i - self._text[offsets[i]:offsets[i + 1]]
+        self.offsets = array("q", [0])
+        self._text = ""
+        # Новые тексты копятся в списке и склеиваются в буфер при первом чтении
+        self._pending: List[str] = []
+        self.words: Optional[WordTimings] = WordTimings() if with_words else None
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    # --- Построение ---
+
+    def append(
+        self,
+        start: float,
+        end: float,
+        text: str,
+        speaker: Optional[str] = None,
+        words: Optional[Iterable] = None
+    ) -> int:
+        """Добавляет сегмент, возвращает его индекс (words учитываются только при with_words)"""
+        self.starts.append(start)
+        self.ends.append(end)
+        self.speaker_ids.append(self._intern(speaker))
+        self._pending.append(text)
+        self.offsets.append(self.offsets[-1] + len(text))
+        if self.words is not None:
+            self.words.append_segment(words)
+        return len(self.starts) - 1
+
+    def _intern(self, speaker: Optional[str]) -> int:
+        if speaker is None:
+            return NO_SPEAKER
+        speaker_id = self._speaker_index.get(speaker)
+        if speaker_id is None:
+            speaker_id = len(self.speakers)
+            self.speakers.append(speaker)
+            self._speaker_index[speaker] = speaker_id
+        return speaker_id
+
+    def set_speaker(self, index: int, speaker: Optional[str]) -> None:
+        """Присваивает спикера сегменту"""
+        self.speaker_ids[index] = self._intern(speaker)
+
+    def set_speakers(self, speakers: Iterable[Optional[str]]) -> None:
+        """Присваивает спикеров сегментам по порядку (метка на каждый сегмент)"""
+        speaker_ids = self.speaker_ids
+        intern = self._intern
+        for i, speaker in enumerate(speakers):
+            speaker_ids[i] = intern(speaker)
+
+    def clear_speakers(self) -> None:
+        """Снимает спикеров со всех сегментов (перед повторной diarization)"""
+        self.speaker_ids = array("i", [NO_SPEAKER]) * len(self.starts)
+        self.speakers = []
+        self._speaker_index = {}
+
+    def shift(self, offset: float) -> None:
+        """
+        Сдвигает время всех сегментов и слов на offset секунд
+        (перевод времени фрагмента на шкалу исходного файла)
+        """
+        if not offset:
+            return
+        self.starts = array("d", (value + offset for value in self.starts))
+        self.ends = array("d", (value + offset for value in self.ends))
+        if self.words is not None:
+            self.words.shift(offset)
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Dict], with_words: bool = False) -> "Transcript":
+        """Создает транскрипцию из сегментов-словарей (или объектов faster-whisper)"""
+        transcript = cls(with_words=with_words)
+        for seg in segments:
+            if isinstance(seg, dict):
+                transcript.append(
+                    seg.get("start", 0),
+                    seg.get("end", 0),
+                    seg.get("text", "").strip(),
+                    seg.get("speaker"),
+                    seg.get("words")
+                )
+            else:
+                transcript.append(seg.start, seg.end, seg.text.strip(), words=seg.words)
+        return transcript
+
+    # --- Чтение ---
+
+    @property
+    def text_buffer(self) -> str:
+        if self._pending:
+            self._text += "".join(self._pending)
+            self._pending = []
+        return self._text
+
+    def text_at(self, index: int) -> str:
+        return self.text_buffer[self.offsets[index]:self.offsets[index + 1]]
+
+    @property
+    def texts(self) -> TextColumn:
+        return TextColumn(self)
+
+    def speaker_at(self, index: int) -> Optional[str]:
+        speaker_id = self.speaker_ids[index]
+        return None if speaker_id == NO_SPEAKER else self.speakers[speaker_id]
+
+    @property
+    def has_speakers(self) -> bool:
+        return any(speaker_id != NO_SPEAKER for speaker_id in self.speaker_ids)
+
+    def iter_segments(self, precision: Optional[int] = None, include_words: bool = False) -> Iterator[Dict]:
+        """
+        Выдает сегменты-словари по одному (для потокового экспорта)
+
+        Args:
+            precision: округление start/end (3 - до миллисекунд); None - без округления
+            include_words: добавить в сегмент "words" - список кортежей
+                           (start, end, текст, вероятность); только для экспорта,
+                           в ответе API слова передаются колонками (words_compact)
+        """
+        words = self.words if include_words else None
+        buffer = self.text_buffer
+        offsets = self.offsets
+        starts = self.starts
+        ends = self.ends
+        for i in range(len(starts)):
+            seg = {
+                "id": i,
+                "start": starts[i] if precision is None else round(starts[i], precision),
+                "end": ends[i] if precision is None else round(ends[i], precision),
+                "text": buffer[offsets[i]:offsets[i + 1]],
+            }
+            speaker_id = self.speaker_ids[i]
+            if speaker_id != NO_SPEAKER:
+                seg["speaker"] = self.speakers[speaker_id]
+            if words is not None:
+                seg["words"] = words.segment_words(i, precision)
+            yield seg
+
+    def to_segments(self, precision: Optional[int] = None) -> List[Dict]:
+        """Список сегментов-словарей (формат ответа API)"""
+        return list(self.iter_segments(precision))
+
+    def full_text(self, separator: str = " ") -> str:
+        """Полный текст без меток спикеров (пустые сегменты пропускаются)"""
+        buffer = self.text_buffer
+        offsets = self.offsets
+        return separator.join(
+            buffer[offsets[i]:offsets[i + 1]]
+            for i in range(len(self.starts))
+            if offsets[i] != offsets[i + 1]
+        )
+
+    def texts_by_speaker(self, default_speaker: str = "SPEAKER_00") -> Dict[str, str]:
+        """Текст каждого спикера: {speaker: текст}"""
+        buffer = self.text_buffer
+        # NO_SPEAKER (-1) - последний элемент labels
+        labels = [*self.speakers, default_speaker]
+        parts: Dict[str, List[str]] = {}
+        start = 0
+        for speaker_id, end in zip(self.speaker_ids, self.offsets[1:]):
+            if start != end:
+                speaker = labels[speaker_id]
+                texts = parts.get(speaker)
+                if texts is None:
+                    texts = parts[speaker] = []
+                texts.append(buffer[start:end])
+            start = end
+        return {speaker: " ".join(texts) for speaker, texts in parts.items()}
+
+    def iter_speaker_turns(self, default_speaker: str = "SPEAKER_00") -> Iterator[tuple]:
+        """Выдает реплики (speaker, текст) - подряд идущие сегменты одного спикера объединяются"""
+        buffer = self.text_buffer
+        labels = [*self.speakers, default_speaker]
+        current_speaker = None
+        current_parts: List[str] = []
+        start = 0
+        for speaker_id, end in zip(self.speaker_ids, self.offsets[1:]):
+            if start == end:
+                continue
+            # NO_SPEAKER (-1) - последний элемент labels
+            speaker = labels[speaker_id]
+            if speaker != current_speaker:
+                if current_speaker and current_parts:
+                    yield current_speaker, " ".join(current_parts)
+                current_speaker = speaker
+                current_parts = []
+            current_parts.append(buffer[start:end])
+            start = end
+        if current_speaker and current_parts:
+            yield current_speaker, " ".join(current_parts)
+
+    def words_compact(self, precision: Optional[int] = None) -> Optional[Dict]:
+        """Тайминги слов в компактном виде для ответа API (None, если слов нет)"""
+        return self.words.to_compact(precision) if self.words is not None else None
+
+    # --- Сериализация (хранилище задач) ---
+
+    def to_compact(self) -> Dict:
+        """Компактный JSON-совместимый вид: колонки вместо списка объектов"""
+        data = {
+            "start": self.starts.tolist(),
+            "end": self.ends.tolist(),
+            "speaker_ids": self.speaker_ids.tolist(),
+            "speakers": list(self.speakers),
+            "offsets": self.offsets.tolist(),
+            "text": self.text_buffer,
+        }
+        if self.words is not None:
+            data["words"] = self.words.to_compact()
+        return data
+
+    @classmethod
+    def from_compact(cls, data: Dict) -> "Transcript":
+        transcript = cls()
+        if "words" in data:
+            transcript.words = WordTimings.from_compact(data["words"])
+        transcript.starts = array("d", data["start"])
+        transcript.ends = array("d", data["end"])
+        transcript.speaker_ids = array("i", data["speaker_ids"])
+        transcript.speakers = list(data["speakers"])
+        transcript._speaker_index = {speaker: i for i, speaker in enumerate(transcript.speakers)}
+        transcript.offsets = array("q", data["offsets"])
+        transcript._text = data["text"]
+        return transcript
@@ -0,0 +1,275 @@
+"""
+Потоковый экспорт транскрипции в SRT, VTT, TSV, JSON Lines и ASS
+
+Каждый формат - генератор, который выдает текст по мере прохода по сегментам,
+поэтому файл субтитров для многочасовой записи не собирается целиком в памяти
+и может отдаваться клиенту через StreamingResponse.
+
+word_timing=True использует тайминги слов (сегменты из iter_segments(include_words=True)):
+караоке-теги в VTT и ASS, строка на слово в TSV, массив слов в JSON Lines.
+SRT не поддерживает время внутри реплики, поэтому выводится как обычно.
+"""
+import json
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+# Функция, превращающая метку спикера (SPEAKER_00) в отображаемое имя
+SpeakerLabel = Optional[Callable[[str], str]]
+
+
+def format_timestamp(seconds: float, separator: str = ",") -> str:
+    """Форматирует время как HH:MM:SS,mmm (SRT) или HH:MM:SS.mmm (VTT)"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millis = int((seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def format_timestamp_ass(seconds: float) -> str:
+    """Форматирует время для ASS (H:MM:SS.cc - сотые доли секунды)"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    centis = int((seconds % 1) * 100)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+
+def _speaker(seg: Dict, include_speakers: bool, speaker_label: SpeakerLabel) -> Optional[str]:
+    if not include_speakers or "speaker" not in seg:
+        return None
+    return speaker_label(seg["speaker"]) if speaker_label else seg["speaker"]
+
+
+def _split_word(word: str) -> Tuple[str, str]:
+    """Разделяет слово на ведущие пробелы и сам текст (" мир" -> (" ", "мир"))"""
+    text = word.lstrip()
+    return word[:len(word) - len(text)], text
+
+
+def iter_srt(
+    segments: Iterable[Dict],
+    include_speakers: bool = False,
+    speaker_label: SpeakerLabel = None,
+    word_timing: bool = False
+) -> Iterator[str]:
+    """SRT: блоки, разделенные пустой строкой (тайминги слов не поддерживаются форматом)"""
+    for i, seg in enumerate(segments):
+        idx = seg.get("id", 0) + 1
+        start = format_timestamp(seg.get("start", 0), ",")
+        end = format_timestamp(seg.get("end", 0), ",")
+        text = seg.get("text", "")
+
+        speaker = _speaker(seg, include_speakers, speaker_label)
+        if speaker is not None:
+            text = f"[{speaker}] {text}"
+
+        separator = "" if i == 0 else "\n"
+        yield f"{separator}{idx}\n{start} --> {end}\n{text}\n"
+
+
+def _vtt_karaoke(words) -> str:
+    """Текст реплики с тегами времени <HH:MM:SS.mmm> перед каждым словом, кроме первого"""
+    parts = []
+    for k, (start, _, word, _) in enumerate(words):
+        lead, text = _split_word(word)
+        if k == 0:
+            parts.append(text)
+        else:
+            parts.append(f"{lead}<{format_timestamp(start, '.')}>{text}")
+    return "".join(parts)
+
+
+def iter_vtt(
+    segments: Iterable[Dict],
+    include_speakers: bool = False,
+    speaker_label: SpeakerLabel = None,
+    word_timing: bool = False
+) -> Iterator[str]:
+    """WebVTT: заголовок и блоки с голосовыми тегами <v> для спикеров"""
+    yield "WEBVTT\n"
+    for seg in segments:
+        start = format_timestamp(seg.get("start", 0), ".")
+        end = format_timestamp(seg.get("end", 0), ".")
+        text = seg.get("text", "")
+        if word_timing and seg.get("words"):
+            text = _vtt_karaoke(seg["words"])
+
+        speaker = _speaker(seg, include_speakers, speaker_label)
+        if speaker is not None:
+            text = f"<v {speaker}>{text}</v>"
+
+        yield f"\n{start} --> {end}\n{text}\n"
+
+
+def _iter_tsv_words(
+    segments: Iterable[Dict],
+    include_speakers: bool,
+    speaker_label: SpeakerLabel
+) -> Iterator[str]:
+    """TSV по словам: строка на слово с вероятностью (для поиска и перехода к месту в записи)"""
+    yield "start\tend\tspeaker\tword\tprobability\n" if include_speakers else "start\tend\tword\tprobability\n"
+    for seg in segments:
+        speaker = (_speaker(seg, include_speakers, speaker_label) or "") if include_speakers else None
+        for start, end, word, probability in seg.get("words") or ():
+            start = int(round(start * 1000))
+            end = int(round(end * 1000))
+            word = " ".join(word.split())
+            if speaker is not None:
+                yield f"{start}\t{end}\t{speaker}\t{word}\t{probability:.3f}\n"
+            else:
+                yield f"{start}\t{end}\t{word}\t{probability:.3f}\n"
+
+
+def iter_tsv(
+    segments: Iterable[Dict],
+    include_speakers: bool = False,
+    speaker_label: SpeakerLabel = None,
+    word_timing: bool = False
+) -> Iterator[str]:
+    """TSV: время в миллисекундах, по строке на сегмент (или на слово при word_timing)"""
+    if word_timing:
+        yield from _iter_tsv_words(segments, include_speakers, speaker_label)
+        return
+    yield "start\tend\tspeaker\ttext\n" if include_speakers else "start\tend\ttext\n"
+    for seg in segments:
+        start = int(round(seg.get("start", 0) * 1000))
+        end = int(round(seg.get("end", 0) * 1000))
+        text = " ".join(seg.get("text", "").split())
+
+        if include_speakers:
+            speaker = _speaker(seg, include_speakers, speaker_label) or ""
+            yield f"{start}\t{end}\t{speaker}\t{text}\n"
+        else:
+            yield f"{start}\t{end}\t{text}\n"
+
+
+def iter_jsonl(
+    segments: Iterable[Dict],
+    include_speakers: bool = False,
+    speaker_label: SpeakerLabel = None,
+    word_timing: bool = False
+) -> Iterator[str]:
+    """JSON Lines: один JSON-объект сегмента на строку (слова - массивами [start, end, word, probability])"""
+    for seg in segments:
+        item = {
+            "id": seg.get("id", 0),
+            "start": seg.get("start", 0),
+            "end": seg.get("end", 0),
+            "text": seg.get("text", ""),
+        }
+        speaker = _speaker(seg, include_speakers, speaker_label)
+        if speaker is not None:
+            item["speaker"] = speaker
+        if word_timing:
+            item["words"] = seg.get("words") or []
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+
+ASS_HEADER = (
+    "[Script Info]\n"
+    "ScriptType: v4.00+\n"
+    "PlayResX: 384\n"
+    "PlayResY: 288\n"
+    "WrapStyle: 0\n"
+    "\n"
+    "[V4+ Styles]\n"
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+    "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+    "Style: Default,Arial,16,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,"
+    "0,0,0,0,100,100,0,0,1,1,0,2,10,10,10,1\n"
+    "\n"
+    "[Events]\n"
+    "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+)
+
+
+def _ass_escape(text: str) -> str:
+    # Фигурные скобки в ASS - теги форматирования, переводы строк - \N
+    return text.replace("{", "(").replace("}", ")").replace("\n", "\\N")
+
+
+def _ass_karaoke(seg_start: float, words) -> str:
+    """
+    Текст реплики с караоке-тегами {\\kNN} (длительность в сотых долях секунды)
+
+    Позиции считаются от начала реплики и округляются по абсолютному времени,
+    чтобы ошибки округления не накапливались к концу длинной реплики.
+    """
+    parts = []
+    position = int(round(seg_start * 100))
+    for start, end, word, _ in words:
+        lead, text = _split_word(word)
+        word_start = max(int(round(start * 100)), position)
+        word_end = max(int(round(end * 100)), word_start)
+        parts.append(lead)
+        if word_start > position:
+            # Пауза перед словом - пустой слог
+            parts.append(f"{{\\k{word_start - position}}}")
+        parts.append(f"{{\\k{word_end - word_start}}}{_ass_escape(text)}")
+        position = word_end
+    return "".join(parts).lstrip()
+
+
+def iter_ass(
+    segments: Iterable[Dict],
+    include_speakers: bool = False,
+    speaker_label: SpeakerLabel = None,
+    word_timing: bool = False
+) -> Iterator[str]:
+    """ASS (Advanced SubStation Alpha): спикер пишется в поле Name, слова - караоке-тегами"""
+    yield ASS_HEADER
+    for seg in segments:
+        start = format_timestamp_ass(seg.get("start", 0))
+        end = format_timestamp_ass(seg.get("end", 0))
+        if word_timing and seg.get("words"):
+            text = _ass_karaoke(seg.get("start", 0), seg["words"])
+        else:
+            text = _ass_escape(seg.get("text", ""))
+        name = (_speaker(seg, include_speakers, speaker_label) or "").replace(",", " ")
+        yield f"Dialogue: 0,{start},{end},Default,{name},0,0,0,,{text}\n"
+
+
+# формат -> (генератор, media type, расширение файла)
+EXPORT_FORMATS = {
+    "srt": (iter_srt, "application/x-subrip; charset=utf-8", "srt"),
+    "vtt": (iter_vtt, "text/vtt; charset=utf-8", "vtt"),
+    "tsv": (iter_tsv, "text/tab-separated-values; charset=utf-8", "tsv"),
+    "jsonl": (iter_jsonl, "application/x-ndjson; charset=utf-8", "jsonl"),
+    "ass": (iter_ass, "text/x-ssa; charset=utf-8", "ass"),
+}
+
+
+def export_transcript(
+    segments: Iterable[Dict],
+    format: str = "srt",
+    include_speakers: bool = False,
+    speaker_label: SpeakerLabel = None,
+    word_timing: bool = False
+) -> Iterator[str]:
+    """Генератор текста транскрипции в указанном формате"""
+    exporter = EXPORT_FORMATS.get(format.lower())
+    if exporter is None:
+        raise ValueError(f"Неподдерживаемый формат: {format}")
+    return exporter[0](segments, include_speakers, speaker_label, word_timing)
+
+
+def iter_encoded(parts: Iterable[str], buffer_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Кодирует части в UTF-8 и объединяет их в блоки ~buffer_size байт
+
+    StreamingResponse отправляет каждый элемент отдельной записью в сокет,
+    поэтому мелкие строки (по одной на сегмент) выгоднее группировать.
+    """
+    buffer = []
+    size = 0
+    for part in parts:
+        data = part.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
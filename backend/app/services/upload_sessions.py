@@ -0,0 +1,358 @@
+"""
+Возобновляемая загрузка больших файлов по частям
+
+Протокол:
+1. create()   - создание сессии загрузки (можно сразу передать sha256 файла)
+2. write()    - запись очередного диапазона байт (строго с текущего смещения)
+3. finalize() - проверка размера, вычисление хэша и перенос файла в хранилище
+
+Хэш SHA-256 считается инкрементально по мере поступления частей, поэтому
+на финализации файл не перечитывается. Одинаковые файлы хранятся один раз
+(по хэшу содержимого), незавершенные сессии удаляются по TTL.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+
+# SHA-256 в hex: хэш из запроса становится частью имени файла в хранилище
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadError(Exception):
+    """Ошибка протокола загрузки"""
+
+
+class UploadNotFoundError(UploadError):
+    """Сессия загрузки не найдена или истекла"""
+
+
+class UploadOffsetError(UploadError):
+    """Диапазон байт не совпадает с текущим смещением сессии"""
+
+    def __init__(self, expected_offset: int, received_offset: int):
+        super().__init__(
+            f"Ожидалось смещение {expected_offset}, получено {received_offset}"
+        )
+        self.expected_offset = expected_offset
+        self.received_offset = received_offset
+
+
+class UploadSession:
+    """Состояние одной сессии загрузки"""
+
+    def __init__(
+        self,
+        upload_id: str,
+        filename: str,
+        total_size: int,
+        expected_sha256: Optional[str] = None,
+        created_at: Optional[float] = None
+    ):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.total_size = total_size
+        self.expected_sha256 = expected_sha256
+        self.created_at = created_at or time.time()
+        self.updated_at = self.created_at
+        self.offset = 0
+        self.sha256: Optional[str] = None
+        self.stored_path: Optional[str] = None
+        self.hasher = hashlib.sha256()
+        # Запись и финализация сессии: файловый ввод-вывод не блокирует другие сессии
+        self.lock = threading.Lock()
+
+    @property
+    def suffix(self) -> str:
+        return Path(self.filename).suffix if self.filename else ".mp4"
+
+    @property
+    def complete(self) -> bool:
+        return self.stored_path is not None
+
+    def to_dict(self) -> Dict:
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "total_size": self.total_size,
+            "offset": self.offset,
+            "complete": self.complete,
+            "sha256": self.sha256,
+        }
+
+
+class UploadSessionManager:
+    """Менеджер сессий загрузки и хранилища загруженных файлов"""
+
+    def __init__(
+        self,
+        storage_dir: str,
+        session_ttl: float = 24 * 3600,
+        stored_ttl: float = 7 * 24 * 3600
+    ):
+        """
+        Args:
+            storage_dir: директория для частичных и завершенных загрузок
+            session_ttl: время жизни незавершенной сессии (секунды с последней активности)
+            stored_ttl: время жизни сохраненного файла (секунды с последнего обращения)
+        """
+        self.storage_dir = Path(storage_dir)
+        self.sessions_dir = self.storage_dir / "sessions"
+        self.stored_dir = self.storage_dir / "stored"
+        self.sessions_dir.mkdir(parents=True, exist_ok=True)
+        self.stored_dir.mkdir(parents=True, exist_ok=True)
+        self.session_ttl = session_ttl
+        self.stored_ttl = stored_ttl
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    # --- Пути ---
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.sessions_dir / f"{upload_id}.part"
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.sessions_dir / f"{upload_id}.json"
+
+    def _stored_path(self, sha256: str, suffix: str) -> Path:
+        return self.stored_dir / f"{sha256}{suffix}"
+
+    # --- Публичный API ---
+
+    def find_stored(self, sha256: str) -> Optional[str]:
+        """Возвращает путь к уже сохраненному файлу с таким хэшем (если есть)"""
+        sha256 = sha256.lower()
+        if not SHA256_PATTERN.match(sha256):
+            return None
+        for path in self.stored_dir.glob(f"{sha256}*"):
+            # Только точное совпадение имени без расширения
+            if path.stem == sha256 and path.is_file():
+                # Обновляем время обращения, чтобы файл не удалился по TTL
+                os.utime(path, None)
+                return str(path)
+        return None
+
+    def create(
+        self,
+        filename: str,
+        total_size: int,
+        sha256: Optional[str] = None
+    ) -> UploadSession:
+        """
+        Создает сессию загрузки
+
+        Если передан sha256 и такой файл уже хранится, сессия сразу считается
+        завершенной - передавать данные не нужно.
+        """
+        if total_size < 0:
+            raise UploadError("Размер файла не может быть отрицательным")
+        if sha256 and not SHA256_PATTERN.match(sha256.lower()):
+            raise UploadError("sha256 должен содержать 64 шестнадцатеричных символа")
+
+        session = UploadSession(
+            upload_id=uuid.uuid4().hex,
+            filename=filename or "upload.mp4",
+            total_size=total_size,
+            expected_sha256=sha256.lower() if sha256 else None
+        )
+
+        if session.expected_sha256:
+            existing = self.find_stored(session.expected_sha256)
+            if existing:
+                session.offset = total_size
+                session.sha256 = session.expected_sha256
+                session.stored_path = existing
+                print(f"[UPLOAD] Файл {session.expected_sha256[:12]} уже загружен, передача пропущена")
+
+        with self._lock:
+            self._sessions[session.upload_id] = session
+            if not session.complete:
+                self._part_path(session.upload_id).touch()
+            self._save_meta(session)
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        """Возвращает сессию (восстанавливает с диска после перезапуска)"""
+        with self._lock:
+            return self._get_locked(upload_id)
+
+    def write(self, upload_id: str, offset: int, chunks: Iterable[bytes]) -> UploadSession:
+        """
+        Дописывает диапазон байт, начинающийся с offset
+
+        Части должны приходить последовательно: offset обязан совпадать с
+        текущим смещением сессии (иначе UploadOffsetError с ожидаемым смещением,
+        по которому клиент возобновляет загрузку). chunks читаются по мере
+        записи - например, прямо из тела запроса.
+        """
+        with self._lock:
+            session = self._get_locked(upload_id)
+        with session.lock:
+            if session.complete:
+                return session
+            if offset != session.offset:
+                raise UploadOffsetError(session.offset, offset)
+
+            try:
+                with open(self._part_path(upload_id), "ab") as part_file:
+                    for chunk in chunks:
+                        if not chunk:
+                            continue
+                        if session.offset + len(chunk) > session.total_size:
+                            raise UploadError("Получено больше данных, чем заявленный размер файла")
+                        part_file.write(chunk)
+                        session.hasher.update(chunk)
+                        session.offset += len(chunk)
+            finally:
+                # Записанная часть сохраняется и при обрыве соединения - клиент продолжит с нового смещения
+                session.updated_at = time.time()
+                self._save_meta(session)
+            return session
+
+    def finalize(self, upload_id: str) -> UploadSession:
+        """
+        Завершает загрузку: проверяет размер и хэш, переносит файл в хранилище
+
+        Если файл с таким хэшем уже хранится, частичный файл удаляется.
+        """
+        with self._lock:
+            session = self._get_locked(upload_id)
+        with session.lock:
+            if session.complete:
+                return session
+            if session.offset != session.total_size:
+                raise UploadError(
+                    f"Загрузка не завершена: получено {session.offset} из {session.total_size} байт"
+                )
+
+            sha256 = session.hasher.hexdigest()
+            if session.expected_sha256 and session.expected_sha256 != sha256:
+                raise UploadError("Хэш загруженного файла не совпадает с заявленным")
+
+            part_path = self._part_path(upload_id)
+            existing = self.find_stored(sha256)
+            if existing:
+                part_path.unlink(missing_ok=True)
+                stored_path = existing
+            else:
+                stored_path = str(self._stored_path(sha256, session.suffix))
+                os.replace(part_path, stored_path)
+
+            session.sha256 = sha256
+            session.stored_path = stored_path
+            session.updated_at = time.time()
+            self._save_meta(session)
+            print(f"[UPLOAD] Загрузка {upload_id} завершена: sha256={sha256[:12]}, {session.total_size / 1024 / 1024:.1f} MB")
+            return session
+
+    def delete(self, upload_id: str) -> None:
+        """Удаляет сессию и ее частичный файл (сохраненный файл не трогается)"""
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        # Идущая запись сессии завершается до удаления ее файлов
+        with session.lock if session is not None else self._lock:
+            self._part_path(upload_id).unlink(missing_ok=True)
+            self._meta_path(upload_id).unlink(missing_ok=True)
+
+    def cleanup_expired(self) -> int:
+        """
+        Удаляет истекшие сессии и давно не использовавшиеся сохраненные файлы
+
+        Returns:
+            количество удаленных файлов
+        """
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for meta_path in list(self.sessions_dir.glob("*.json")):
+                upload_id = meta_path.stem
+                try:
+                    last_activity = meta_path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if now - last_activity < self.session_ttl:
+                    continue
+                self._sessions.pop(upload_id, None)
+                for path in (self._part_path(upload_id), meta_path):
+                    if path.exists():
+                        path.unlink(missing_ok=True)
+                        removed += 1
+
+            for stored_path in list(self.stored_dir.iterdir()):
+                try:
+                    if now - stored_path.stat().st_mtime >= self.stored_ttl:
+                        stored_path.unlink(missing_ok=True)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        if removed:
+            print(f"[UPLOAD] Очистка: удалено {removed} файлов")
+        return removed
+
+    # --- Внутренние методы ---
+
+    def _get_locked(self, upload_id: str) -> UploadSession:
+        session = self._sessions.get(upload_id)
+        if session is None:
+            session = self._load_meta(upload_id)
+            self._sessions[upload_id] = session
+        if not session.complete and time.time() - session.updated_at >= self.session_ttl:
+            raise UploadNotFoundError(f"Сессия загрузки {upload_id} истекла")
+        return session
+
+    def _save_meta(self, session: UploadSession) -> None:
+        meta = {
+            "upload_id": session.upload_id,
+            "filename": session.filename,
+            "total_size": session.total_size,
+            "expected_sha256": session.expected_sha256,
+            "created_at": session.created_at,
+            "sha256": session.sha256,
+            "stored_path": session.stored_path,
+        }
+        with open(self._meta_path(session.upload_id), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _load_meta(self, upload_id: str) -> UploadSession:
+        # upload_id приходит из URL - не допускаем выхода за пределы директории
+        if not upload_id.isalnum():
+            raise UploadNotFoundError(f"Сессия загрузки {upload_id} не найдена")
+        meta_path = self._meta_path(upload_id)
+        if not meta_path.exists():
+            raise UploadNotFoundError(f"Сессия загрузки {upload_id} не найдена")
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        session = UploadSession(
+            upload_id=meta["upload_id"],
+            filename=meta["filename"],
+            total_size=meta["total_size"],
+            expected_sha256=meta.get("expected_sha256"),
+            created_at=meta.get("created_at")
+        )
+        session.updated_at = meta_path.stat().st_mtime
+        if meta.get("stored_path") and os.path.exists(meta["stored_path"]):
+            session.sha256 = meta.get("sha256")
+            session.stored_path = meta["stored_path"]
+            session.offset = session.total_size
+            return session
+
+        # После перезапуска состояние хэша в памяти потеряно -
+        # пересчитываем его по уже полученной части файла
+        part_path = self._part_path(upload_id)
+        if part_path.exists():
+            with open(part_path, "rb") as part_file:
+                while True:
+                    chunk = part_file.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    session.hasher.update(chunk)
+                    session.offset += len(chunk)
+        return session
@@ -1,31 +1,183 @@
 import ffmpeg
 import os
 import tempfile
+import threading
 from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from .cancellation import CancelToken, JobCancelled
+from .long_form import SAMPLE_RATE, iter_pcm_windows
+
+
+class MediaProbeError(Exception):
+    """Файл не удалось разобрать как медиа (ffprobe завершился с ошибкой)"""
+
+
+class NoAudioStreamError(MediaProbeError):
+    """Во входном файле нет аудиодорожки"""
+
+
+class MediaInfo:
+    """Результат предварительного анализа файла (ffprobe)"""
+    
+    def __init__(self, probe: Dict, audio_stream: Dict, audio_stream_count: int):
+        fmt = probe.get("format", {})
+        self.format_name: str = fmt.get("format_name", "")
+        self.size = int(fmt.get("size", 0) or 0)
+        self.audio_stream_count = audio_stream_count
+        # Абсолютный индекс дорожки во входном файле (для -map 0:N)
+        self.audio_stream_index = int(audio_stream["index"])
+        self.audio_codec: Optional[str] = audio_stream.get("codec_name")
+        self.sample_rate = int(audio_stream.get("sample_rate", 0) or 0)
+        self.channels = int(audio_stream.get("channels", 0) or 0)
+        # Длительность контейнера, если ее нет - длительность дорожки
+        self.duration = float(fmt.get("duration") or audio_stream.get("duration") or 0)
+    
+    @property
+    def is_target_pcm(self) -> bool:
+        """Файл уже в формате для Whisper (WAV, PCM s16le, 16 кГц, моно) - перекодирование не нужно"""
+        return (
+            "wav" in self.format_name.split(",")
+            and self.audio_codec == "pcm_s16le"
+            and self.sample_rate == SAMPLE_RATE
+            and self.channels == 1
+            and self.audio_stream_count == 1
+        )
+    
+    def to_dict(self) -> Dict:
+        return {
+            "duration": self.duration,
+            "format": self.format_name,
+            "audio_codec": self.audio_codec,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "audio_stream_index": self.audio_stream_index,
+        }
+
+
+# Сколько последних байт stderr ffmpeg хранится для сообщения об ошибке
+STDERR_TAIL_BYTES = 64 * 1024
+
+
+class _StderrTail:
+    """
+    Читает stderr процесса в фоновом потоке, сохраняя последние STDERR_TAIL_BYTES
+
+    Непрочитанный pipe stderr заполняется (предупреждения о поврежденных
+    пакетах, сообщения декодера) и останавливает ffmpeg на записи.
+    """
+
+    def __init__(self, pipe: BinaryIO):
+        self._pipe = pipe
+        self._tail = bytearray()
+        self._thread = threading.Thread(target=self._read, name="ffmpeg-stderr", daemon=True)
+        self._thread.start()
+
+    def _read(self) -> None:
+        for chunk in iter(lambda: self._pipe.read1(4096), b""):
+            self._tail += chunk
+            del self._tail[:-STDERR_TAIL_BYTES]
+
+    def text(self) -> str:
+        """Сохраненный stderr (после завершения процесса)"""
+        self._thread.join(timeout=5)
+        return self._tail.decode("utf-8", errors="replace").strip()
+
+
+def _select_audio_stream(streams: List[Dict]) -> Dict:
+    """
+    Выбирает лучшую аудиодорожку: помеченную по умолчанию, затем
+    без пометок комментария/тифлокомментария, затем с большим числом каналов и битрейтом
+    """
+    def rank(stream: Dict):
+        disposition = stream.get("disposition", {})
+        return (
+            disposition.get("default", 0),
+            not (disposition.get("comment", 0) or disposition.get("visual_impaired", 0)),
+            int(stream.get("channels", 0) or 0),
+            int(stream.get("bit_rate", 0) or 0),
+        )
+    return max(streams, key=rank)
+
+def _input_audio(
+    video_path: str,
+    audio_stream: Optional[int],
+    start: Optional[float] = None,
+    end: Optional[float] = None
+):
+    """
+    Вход ffmpeg с явно выбранной аудиодорожкой (-map 0:N) и диапазоном времени
+
+    -ss/-t задаются как параметры входа: ffmpeg переходит к нужному месту
+    по индексу контейнера и декодирует только запрошенный диапазон.
+    """
+    input_args = {}
+    if start:
+        input_args["ss"] = start
+    if end is not None:
+        input_args["t"] = end - (start or 0)
+    source = ffmpeg.input(video_path, **input_args)
+    return source[str(audio_stream)] if audio_stream is not None else source
+
 
 class VideoProcessor:
     """Класс для обработки видео файлов"""
     
-    def extract_audio(self, video_path: str, output_format: str = "wav") -> str:
+    def probe(self, video_path: str) -> MediaInfo:
+        """
+        Предварительный анализ файла до любой обработки
+        
+        Raises:
+            NoAudioStreamError: в файле нет аудиодорожки
+            MediaProbeError: файл не распознан ffprobe
+        """
+        try:
+            probe = ffmpeg.probe(video_path)
+        except ffmpeg.Error as e:
+            stderr = e.stderr.decode("utf-8", errors="replace").strip() if e.stderr else ""
+            raise MediaProbeError(f"Не удалось прочитать медиафайл: {stderr or e}")
+        
+        audio_streams = [s for s in probe.get("streams", []) if s.get("codec_type") == "audio"]
+        if not audio_streams:
+            raise NoAudioStreamError("В файле нет аудиодорожки - распознавать нечего")
+        return MediaInfo(probe, _select_audio_stream(audio_streams), len(audio_streams))
+    
+    def extract_audio(
+        self,
+        video_path: str,
+        output_format: str = "wav",
+        audio_stream: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+        output_path: Optional[str] = None
+    ) -> str:
         """
         Извлекает аудио из видео файла
         
         Args:
             video_path: путь к видео файлу
             output_format: формат выходного аудио (wav, mp3)
+            audio_stream: абсолютный индекс аудиодорожки (None - выбор ffmpeg по умолчанию)
+            start, end: диапазон времени в секундах (None - от начала / до конца файла)
+            cancel: при отмене процесс ffmpeg завершается, частичный файл удаляется
+            output_path: файл результата (TempStorage.create); None - системная временная директория
         
         Returns:
             путь к извлеченному аудио файлу
+        
+        Raises:
+            JobCancelled: задача отменена
         """
         # Создание временного файла для аудио
-        audio_path = tempfile.NamedTemporaryFile(
+        audio_path = output_path or tempfile.NamedTemporaryFile(
             delete=False,
             suffix=f".{output_format}"
         ).name
         
         try:
             # Извлечение аудио с помощью ffmpeg
-            stream = ffmpeg.input(video_path)
+            stream = _input_audio(video_path, audio_stream, start, end)
             stream = ffmpeg.output(
                 stream,
                 audio_path,
@@ -33,7 +185,16 @@ class VideoProcessor:
                 ac=1,  # моно
                 ar='16000'  # частота дискретизации 16kHz (оптимально для Whisper)
             )
-            ffmpeg.run(stream, overwrite_output=True, quiet=True)
+            process = ffmpeg.run_async(stream, overwrite_output=True, quiet=True)
+            remove_callback = cancel.on_cancel(process.kill) if cancel is not None else lambda: None
+            try:
+                out, err = process.communicate()
+            finally:
+                remove_callback()
+            if cancel is not None:
+                cancel.check()
+            if process.returncode != 0:
+                raise ffmpeg.Error("ffmpeg", out, err)
             
             return audio_path
         
@@ -42,6 +203,59 @@ class VideoProcessor:
             if os.path.exists(audio_path):
                 os.unlink(audio_path)
             raise Exception(f"Ошибка при извлечении аудио: {e}")
+        except JobCancelled:
+            if os.path.exists(audio_path):
+                os.unlink(audio_path)
+            raise
+    
+    def stream_audio(
+        self,
+        video_path: str,
+        window_seconds: float = 300,
+        audio_stream: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        cancel: Optional[CancelToken] = None
+    ) -> Iterator[bytes]:
+        """
+        Декодирует аудио через pipe ffmpeg и выдает его окнами PCM s16le (16 кГц, моно)
+        
+        В отличие от extract_audio, WAV на диск не пишется и целиком в память
+        не читается. При закрытии генератора процесс ffmpeg завершается.
+        
+        Args:
+            video_path: путь к видео/аудио файлу
+            window_seconds: длительность окна в секундах
+            audio_stream: абсолютный индекс аудиодорожки (None - выбор ffmpeg по умолчанию)
+            start, end: диапазон времени в секундах (None - от начала / до конца файла)
+            cancel: при отмене процесс ffmpeg завершается, генератор выбрасывает JobCancelled
+        """
+        process = (
+            _input_audio(video_path, audio_stream, start, end)
+            .output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=str(SAMPLE_RATE))
+            # Только ошибки в stderr: статистику прогресса незачем читать
+            .global_args('-loglevel', 'error', '-nostats', '-nostdin')
+            .run_async(pipe_stdout=True, pipe_stderr=True)
+        )
+        stderr = _StderrTail(process.stderr)
+        remove_callback = cancel.on_cancel(process.kill) if cancel is not None else lambda: None
+        try:
+            yield from iter_pcm_windows(process.stdout, window_seconds)
+            process.wait()
+            if cancel is not None:
+                # После kill pipe закрывается как при обычном завершении - различаем по токену
+                cancel.check()
+            if process.returncode != 0:
+                raise Exception(f"Ошибка при извлечении аудио: {stderr.text()}")
+        finally:
+            remove_callback()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            # Поток чтения завершается по EOF после остановки процесса
+            stderr.text()
+            process.stderr.close()
     
     def get_video_info(self, video_path: str) -> dict:
         """
@@ -72,4 +286,3 @@ class VideoProcessor:
         except Exception as e:
             raise Exception(f"Ошибка при получении информации о видео: {e}")
 
-
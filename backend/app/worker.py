@@ -0,0 +1,173 @@
+"""
+Рабочий процесс распознавания (ROLE=worker)
+
+Забирает задачи из очереди (JOB_QUEUE_URL), выполняет конвертацию тем же
+кодом, что и процесс API в роли all, и записывает результат в очередь.
+Транскрипция сохраняется в хранилище задач (JOBS_DIR) - оно должно быть
+общим с процессом API, как и директории входных файлов.
+
+Запуск (из директории backend):
+    ROLE=api uvicorn app.main:app            # процесс API
+    python -m app.worker [--models base,small] [--capacity 1]
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+# Роль задается до импорта приложения: конфигурация читает ее при импорте
+os.environ["ROLE"] = "worker"
+
+from fastapi import HTTPException
+
+from app import main as app_main
+from app.services.cancellation import CancelToken, JobCancelled
+from app.services.job_queue import JobQueueError
+
+try:
+    from config import WORKER_MODELS, WORKER_CAPACITY
+except ImportError:
+    WORKER_MODELS = ""
+    WORKER_CAPACITY = 1
+
+# Интервал опроса очереди, когда задач нет (секунды)
+IDLE_POLL_INTERVAL = 1.0
+# Интервал проверки, не отменена ли выполняемая задача (секунды)
+CANCEL_POLL_INTERVAL = 1.0
+
+
+class Worker:
+    """Рабочий процесс: регистрация, heartbeat и потоки выполнения задач"""
+
+    def __init__(self, models, capacity: int):
+        self.queue = app_main.job_queue
+        self.models = models or None
+        self.capacity = capacity
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+
+    def info(self):
+        service = app_main.speech_service
+        return {
+            "hostname": socket.gethostname(),
+            "pid": os.getpid(),
+            "capacity": self.capacity,
+            "models": self.models,
+            "device": getattr(service, "device", "cpu"),
+            "service": type(service).__name__,
+            "warm": self.warm_state(),
+        }
+
+    def warm_state(self):
+        """Загруженные модели - по ним очередь выбирает задачи без холодной загрузки"""
+        service = app_main.speech_service
+        if hasattr(service, "warm_state"):
+            return service.warm_state()
+        return {"models": sorted(getattr(service, "models", {})), "diarization": False, "load_seconds": {}}
+
+    def _heartbeat_loop(self) -> None:
+        # Чаще, чем истекает аренда задач, чтобы длинная задача не вернулась в очередь
+        interval = max(self.queue.lease_seconds / 4, 1.0)
+        while not self._stop.wait(interval):
+            try:
+                self.queue.heartbeat(self.worker_id, self.warm_state())
+            except JobQueueError:
+                # Процесс был удален из реестра (долго не отвечал) - регистрируемся заново
+                self.queue.register_worker(self.worker_id, self.info())
+            except Exception as e:
+                print(f"[WORKER] ⚠️  Ошибка heartbeat: {e}")
+
+    def _watch_cancel(self, job_id: str, cancel: CancelToken, done: threading.Event) -> None:
+        """Процесс API удаляет из очереди отмененную задачу - тогда обработка останавливается"""
+        while not done.wait(CANCEL_POLL_INTERVAL):
+            try:
+                self.queue.status(job_id)
+            except JobQueueError:
+                cancel.cancel("задача удалена из очереди")
+                return
+            except Exception as e:
+                print(f"[WORKER] ⚠️  Ошибка проверки отмены: {e}")
+
+    def _run_job(self, job) -> None:
+        payload = job.payload
+        print(f"[WORKER] Задача {job.job_id} (попытка {job.attempts}): {payload['input_path']}")
+        cancel = CancelToken()
+        done = threading.Event()
+        threading.Thread(target=self._watch_cancel, args=(job.job_id, cancel, done), daemon=True).start()
+        try:
+            data = app_main._run_conversion(
+                payload["input_path"], payload["params"], payload["start_time"], payload["content_hash"],
+                cancel=cancel, job_id=payload.get("job_id")
+            )
+            data["content_hash"] = payload["content_hash"]
+            self.queue.complete(job.job_id, self.worker_id, data)
+        except JobCancelled as e:
+            # Результат никто не ждет - задача уже удалена из очереди
+            print(f"[WORKER] Задача {job.job_id} остановлена: {e.reason}")
+        except HTTPException as e:
+            self.queue.fail(job.job_id, self.worker_id, {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            traceback.print_exc()
+            self.queue.fail(job.job_id, self.worker_id, {"status_code": 500, "detail": str(e)})
+        finally:
+            done.set()
+            # Новые загруженные модели сразу видны планировщику
+            try:
+                self.queue.heartbeat(self.worker_id, self.warm_state())
+            except Exception as e:
+                print(f"[WORKER] ⚠️  Ошибка heartbeat: {e}")
+
+    def _slot_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(self.worker_id, self.models)
+            except Exception as e:
+                print(f"[WORKER] ⚠️  Ошибка очереди: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(IDLE_POLL_INTERVAL)
+                continue
+            self._run_job(job)
+
+    def run(self) -> None:
+        # Временные файлы прежнего процесса на этом хосте (упал, не удалив их)
+        removed = app_main.temp_storage.janitor(protected=app_main.job_store.input_paths())
+        if removed:
+            print(f"[WORKER] Удалено временных файлов завершившихся процессов: {removed}")
+        self.queue.register_worker(self.worker_id, self.info())
+        print(f"✓ Рабочий процесс {self.worker_id} зарегистрирован "
+              f"(емкость {self.capacity}, модели: {', '.join(self.models) if self.models else 'любые'})")
+        threads = [threading.Thread(target=self._heartbeat_loop, daemon=True)]
+        threads += [threading.Thread(target=self._slot_loop, daemon=True) for _ in range(self.capacity)]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads[1:]):
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            print(f"[WORKER] Остановка...")
+        finally:
+            self._stop.set()
+            # Незавершенные задачи возвращаются в очередь для других процессов
+            self.queue.unregister_worker(self.worker_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default=WORKER_MODELS, help="модели через запятую (пусто - любые)")
+    parser.add_argument("--capacity", type=int, default=WORKER_CAPACITY, help="одновременных задач")
+    args = parser.parse_args()
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    capacity = max(args.capacity, 1)
+    service = app_main.speech_service
+    if hasattr(service, "set_concurrent_jobs"):
+        # Поток параллельной diarization на каждую одновременную задачу
+        service.set_concurrent_jobs(capacity)
+    Worker(models, capacity).run()
+
+
+if __name__ == "__main__":
+    main()
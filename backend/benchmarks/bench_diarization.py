@@ -0,0 +1,240 @@
+"""
+Бенчмарк движков diarization на синтетических записях с несколькими голосами
+
+Сравнивает скорость и точность:
+- pauses: simple_diarization (паузы и вопросительные слова)
+- spectral: spectral_diarization (MFCC + основной тон, кластеризация по BIC)
+- online: online_diarization (те же признаки; аудио подается окнами по 30 сек,
+  сегменты - по мере готовности, метки выдаются с задержкой lookahead)
+- pyannote: pyannote/speaker-diarization-3.1 (если установлен pyannote.audio
+  и задан HF_TOKEN; иначе пропускается)
+
+Голоса синтезируются: гармонический сигнал с основным тоном и формантами
+гласных, масштабированными по длине речевого тракта спикера, плюс шум.
+Реплики разбиты на сегменты с короткими паузами внутри реплики - как их
+выдает Whisper, - поэтому эвристика по паузам ошибается на смене сегмента,
+а не спикера. Точность - доля длительности сегментов с верным спикером
+после жадного сопоставления найденных спикеров с истинными (один к одному).
+
+Запуск (из директории backend):
+    python -m benchmarks.bench_diarization [--minutes 3] [--seed 0]
+"""
+import argparse
+import os
+import random
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services import simple_diarization, spectral_diarization
+from app.services.online_diarization import OnlineDiarizer
+from app.services.long_form import SAMPLE_RATE
+
+from benchmarks.bench_transcript_memory import WORDS
+
+# (основной тон, Гц; масштаб формант - короче речевой тракт, выше форманты)
+VOICES = {
+    "male_1": (110.0, 1.0),
+    "female": (205.0, 1.17),
+    "male_2": (135.0, 0.93),
+    "child": (280.0, 1.3),
+}
+# Окно аудио онлайн-движка (короче LONG_FORM_WINDOW_SECONDS - как при живом потоке)
+ONLINE_WINDOW_SECONDS = 30.0
+# Форманты гласных (F1, F2, F3) взрослого мужского голоса
+VOWELS = [(730, 1090, 2440), (530, 1840, 2480), (270, 2290, 3010), (570, 840, 2410), (300, 870, 2240)]
+SCENARIOS = [
+    ("монолог", ["male_1"]),
+    ("интервью м/ж", ["male_1", "female"]),
+    ("диалог м/м", ["male_1", "male_2"]),
+    ("3 спикера", ["male_1", "female", "male_2"]),
+    ("4 спикера", ["male_1", "female", "male_2", "child"]),
+]
+
+
+def synthesize(voice: str, seconds: float, rng: random.Random) -> np.ndarray:
+    """Последовательность слогов-гласных голосом voice"""
+    base_f0, tract = VOICES[voice]
+    parts = []
+    total = int(seconds * SAMPLE_RATE)
+    length = 0
+    while length < total:
+        syllable = int(rng.uniform(0.15, 0.35) * SAMPLE_RATE)
+        f0_start = base_f0 * rng.gauss(1.0, 0.06)
+        f0_end = f0_start * rng.uniform(0.9, 1.1)
+        f0 = np.linspace(f0_start, f0_end, syllable)
+        phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+        harmonics = np.arange(1, int(4000 / max(f0_start, f0_end)) + 1)
+        formants = np.array(rng.choice(VOWELS)) * tract
+        # Огибающая спектра: форманты с полосой ~100 Гц и спад 1/h
+        frequencies = harmonics * (f0_start + f0_end) / 2
+        amplitude = np.exp(-((frequencies[:, None] - formants[None]) / 100.0) ** 2).sum(axis=1) / harmonics
+        wave = (amplitude[:, None] * np.sin(harmonics[:, None] * phase[None])).sum(axis=0)
+        wave *= np.hanning(syllable)
+        parts.append(wave)
+        gap = int(rng.uniform(0.0, 0.05) * SAMPLE_RATE)
+        parts.append(np.zeros(gap))
+        length += syllable + gap
+    wave = np.concatenate(parts)[:total]
+    return (wave / (np.abs(wave).max() + 1e-8) * rng.uniform(0.3, 0.8)).astype(np.float32)
+
+
+def make_fixture(voices: List[str], minutes: float, seed: int = 0) -> Tuple[np.ndarray, List[Dict]]:
+    """
+    Диалог: реплики случайных длин, разбитые на сегменты с паузами
+
+    Returns:
+        (аудио, сегменты {"start", "end", "text", "speaker"})
+    """
+    rng = random.Random(seed)
+    target = minutes * 60
+    chunks, segments = [], []
+    t = 0.0
+    current = None
+    while t < target:
+        speaker = rng.choice([voice for voice in voices if voice != current] or voices)
+        current = speaker
+        turn = rng.uniform(2.0, 12.0)
+        spoken = 0.0
+        while spoken < turn:
+            seconds = min(rng.uniform(1.5, 6.0), turn - spoken + 0.5)
+            words = [rng.choice(WORDS) for _ in range(max(1, int(seconds * 2.5)))]
+            segments.append({
+                "start": t,
+                "end": t + seconds,
+                "text": " ".join(words) + ("?" if rng.random() < 0.2 else "."),
+                "speaker": speaker,
+            })
+            chunks.append(synthesize(speaker, seconds, rng))
+            pause = rng.uniform(0.15, 0.5)
+            chunks.append(np.zeros(int(pause * SAMPLE_RATE), dtype=np.float32))
+            t += seconds + pause
+            spoken += seconds + pause
+        gap = rng.uniform(0.1, 1.0)
+        chunks.append(np.zeros(int(gap * SAMPLE_RATE), dtype=np.float32))
+        t += gap
+    audio = np.concatenate(chunks)
+    noise = np.random.RandomState(seed).normal(0.0, 0.01, len(audio)).astype(np.float32)
+    return audio + noise, segments
+
+
+def accuracy(segments: List[Dict], labels: Sequence[str]) -> float:
+    """Доля длительности с верным спикером при жадном сопоставлении меток (один к одному)"""
+    overlap: Dict[Tuple[str, str], float] = {}
+    total = 0.0
+    for seg, label in zip(segments, labels):
+        duration = seg["end"] - seg["start"]
+        key = (label, seg["speaker"])
+        overlap[key] = overlap.get(key, 0.0) + duration
+        total += duration
+    matched, used_labels, used_speakers = 0.0, set(), set()
+    for (label, speaker), duration in sorted(overlap.items(), key=lambda item: -item[1]):
+        if label not in used_labels and speaker not in used_speakers:
+            used_labels.add(label)
+            used_speakers.add(speaker)
+            matched += duration
+    return matched / total if total else 0.0
+
+
+def pauses_engine(audio: np.ndarray, segments: List[Dict]) -> List[str]:
+    return list(simple_diarization.iter_speaker_labels(
+        [seg["start"] for seg in segments], [seg["end"] for seg in segments],
+        [seg["text"] for seg in segments]
+    ))
+
+
+def spectral_engine(audio: np.ndarray, segments: List[Dict]) -> List[str]:
+    return spectral_diarization.speaker_labels(
+        audio, [seg["start"] for seg in segments], [seg["end"] for seg in segments]
+    )
+
+
+def online_engine(audio: np.ndarray, segments: List[Dict]) -> List[str]:
+    diarizer = OnlineDiarizer()
+    window = int(ONLINE_WINDOW_SECONDS * SAMPLE_RATE)
+    next_segment = 0
+    for position in range(0, len(audio), window):
+        diarizer.add_audio(audio[position:position + window])
+        # Сегмент готов, когда его аудио целиком распознано
+        covered = min(position + window, len(audio)) / SAMPLE_RATE
+        while next_segment < len(segments) and segments[next_segment]["end"] <= covered:
+            diarizer.add_segment(segments[next_segment]["start"], segments[next_segment]["end"])
+            next_segment += 1
+    for seg in segments[next_segment:]:
+        diarizer.add_segment(seg["start"], seg["end"])
+    diarizer.flush()
+    return diarizer.speaker_labels()
+
+
+def load_pyannote() -> Tuple[Optional[object], str]:
+    """(пайплайн, причина пропуска)"""
+    token = os.getenv("HF_TOKEN") or os.getenv("HUGGINGFACE_TOKEN")
+    if not token:
+        return None, "не задан HF_TOKEN"
+    try:
+        from pyannote.audio import Pipeline
+    except ImportError:
+        return None, "pyannote.audio не установлен"
+    try:
+        return Pipeline.from_pretrained("pyannote/speaker-diarization-3.1", use_auth_token=token), ""
+    except Exception as e:
+        return None, f"не удалось загрузить пайплайн: {e}"
+
+
+def pyannote_engine(pipeline) -> Callable:
+    import torch
+
+    def run(audio: np.ndarray, segments: List[Dict]) -> List[str]:
+        diarization = pipeline({"waveform": torch.from_numpy(audio)[None], "sample_rate": SAMPLE_RATE})
+        turns = [(turn.start, turn.end, speaker) for turn, _, speaker in diarization.itertracks(yield_label=True)]
+        labels = []
+        for seg in segments:
+            best, best_overlap = "SPEAKER_00", 0.0
+            for start, end, speaker in turns:
+                overlap = min(end, seg["end"]) - max(start, seg["start"])
+                if overlap > best_overlap:
+                    best, best_overlap = speaker, overlap
+            labels.append(best)
+        return labels
+
+    return run
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=3.0, help="длительность каждой записи")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engines = [("pauses", pauses_engine), ("spectral", spectral_engine), ("online", online_engine)]
+    pipeline, reason = load_pyannote()
+    if pipeline is not None:
+        engines.append(("pyannote", pyannote_engine(pipeline)))
+    else:
+        print(f"pyannote пропущен: {reason}")
+
+    print(f"{'запись':<16} {'движок':<10} {'спикеров':>9} {'точность':>9} {'время':>10} {'x реального':>12}")
+    totals = {name: [0.0, 0.0, 0.0] for name, _ in engines}
+    for i, (scenario, voices) in enumerate(SCENARIOS):
+        audio, segments = make_fixture(voices, args.minutes, args.seed + i)
+        audio_seconds = len(audio) / SAMPLE_RATE
+        for name, engine in engines:
+            started = time.perf_counter()
+            labels = engine(audio, segments)
+            elapsed = time.perf_counter() - started
+            score = accuracy(segments, labels)
+            totals[name][0] += score
+            totals[name][1] += elapsed
+            totals[name][2] += audio_seconds
+            print(f"{scenario:<16} {name:<10} {len(set(labels)):>4} из {len(voices):<2} {score * 100:>8.1f}% "
+                  f"{elapsed * 1000:>8.0f} мс {audio_seconds / elapsed:>11.0f}x")
+
+    print("Итого:")
+    for name, (score, elapsed, audio_seconds) in totals.items():
+        print(f"  {name:<10} средняя точность {score / len(SCENARIOS) * 100:5.1f}%, "
+              f"{audio_seconds / elapsed:.0f}x реального времени")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Бенчмарк памяти режима длинных записей на синтетическом аудио
+
+Моделирует распознавание многочасовой записи (по умолчанию 6 часов):
+- whole: весь PCM читается в память, для движка строится float32-копия
+  всей волны, сегменты копятся в списке (как при обработке WAV целиком)
+- windowed: LongFormTranscriber читает окна из потока, готовые сегменты
+  дописываются в SegmentSpool на диске, транскрипция собирается из файла
+
+Вместо модели используется заглушка, которая выделяет float32-буфер
+размером с окно и возвращает сегменты примерно каждые 4 секунды.
+Ожидаемый результат: пик windowed не зависит от длительности записи.
+
+Запуск (из директории backend):
+    python -m benchmarks.bench_long_form_memory [--hours 6] [--whole-hours 1]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.services.long_form import BYTES_PER_SECOND, LongFormTranscriber, SegmentSpool, iter_pcm_windows
+from app.services.transcript import Transcript
+
+from benchmarks.bench_transcript_memory import WORDS
+
+
+class SyntheticPCM:
+    """Поток PCM s16le заданной длительности (как stdout ffmpeg), без хранения всей записи"""
+
+    def __init__(self, hours: float):
+        self.remaining = int(hours * 3600) * BYTES_PER_SECOND
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.remaining
+        size = min(size, self.remaining)
+        self.remaining -= size
+        return bytes(size)
+
+
+def fake_engine(pcm: bytes, language):
+    """Заглушка движка: float32-копия окна и сегменты по ~4 секунды"""
+    audio = bytearray(len(pcm) * 2)  # как pcm_to_float32: 4 байта на отсчет
+    duration = len(pcm) / BYTES_PER_SECOND
+    rng = random.Random(len(pcm))
+    segments = []
+    t = rng.uniform(0.0, 1.0)
+    while t < duration:
+        end = min(t + rng.uniform(1.5, 6.0), duration)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 14)))
+        segments.append({"start": t, "end": end, "text": text})
+        t = end + rng.uniform(0.0, 0.6)
+    del audio
+    return segments, language or "ru"
+
+
+def run_whole(hours: float):
+    pcm = SyntheticPCM(hours).read()
+    segments, _ = fake_engine(pcm, None)
+    transcript = Transcript.from_segments(segments)
+    return transcript, segments, pcm
+
+
+def run_windowed(hours: float, window_seconds: float):
+    windows = iter_pcm_windows(SyntheticPCM(hours), window_seconds)
+    with SegmentSpool() as spool:
+        LongFormTranscriber(fake_engine).run(windows, spool)
+        transcript = Transcript.from_segments(spool.iter_segments())
+    transcript.text_buffer
+    return transcript
+
+
+def measure(name: str, fn, *args) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    segments = len(result[0] if isinstance(result, tuple) else result)
+    del result
+    print(f"{name:<24} пик {peak / 1024 / 1024:8.1f} MB   удерживается {current / 1024 / 1024:7.1f} MB"
+          f"   сегментов {segments:6d}   {elapsed:6.2f} сек")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=6.0)
+    parser.add_argument("--whole-hours", type=float, default=1.0,
+                        help="длительность для варианта whole (память растет линейно)")
+    parser.add_argument("--window", type=float, default=300.0, help="окно, сек")
+    args = parser.parse_args()
+
+    print(f"Окно: {args.window:.0f} сек")
+    for hours in sorted({0.5, args.whole_hours}):
+        measure(f"  whole {hours:g} ч", run_whole, hours)
+    for hours in sorted({1.0, args.hours}):
+        measure(f"  windowed {hours:g} ч", run_windowed, hours, args.window)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Бенчмарк параллельной diarization: время ответа задачи с разделением по ролям
+
+Сравнивает два режима OptimizedSpeechRecognitionService._transcribe_with_diarization:
+- sequential: pyannote/WhisperX запускается после распознавания (parallel_diarization=False)
+- parallel: diarization в отдельном потоке одновременно с распознаванием
+
+Без --audio модели не запускаются: этапы заменяются ожиданием длительностью
+по оценкам scheduler (MODEL_COST_FACTOR модели и DIARIZATION_COST_FACTOR
+на секунду аудио, умноженным на --scale), как нативный код Faster-Whisper
+и torch, выполняющийся вне GIL на своих пулах потоков. Так измеряется сама
+оркестрация: ожидаемое время parallel ~ max этапов, sequential ~ их сумма.
+
+С --audio распознается реальный файл (нужны Faster-Whisper, WhisperX/pyannote
+и HF_TOKEN); первый прогон загружает модели и в замер не входит. На CPU выигрыш
+зависит от числа ядер: этапам нужны непересекающиеся бюджеты потоков
+(TRANSCRIBE_CPU_THREADS, DIARIZATION_CPU_THREADS).
+
+Запуск (из директории backend):
+    python -m benchmarks.bench_parallel_diarization [--minutes 10] [--model base] [--scale 0.02]
+    python -m benchmarks.bench_parallel_diarization --audio interview.wav [--runs 2]
+"""
+import argparse
+import time
+from typing import Dict, List, Optional
+
+from app.services import scheduler
+from app.services import speech_recognition_optimized
+from app.services.speech_recognition_optimized import OptimizedSpeechRecognitionService
+from app.services.transcript import Transcript
+
+# Реплика стенд-ина (секунды) - спикеры чередуются
+TURN_SECONDS = 8.0
+
+
+class SimulatedService(OptimizedSpeechRecognitionService):
+    """Этапы заменены ожиданием по оценкам времени scheduler"""
+
+    def __init__(self, duration: float, scale: float, **kwargs):
+        super().__init__(**kwargs)
+        self.duration = duration
+        self.scale = scale
+
+    def _transcribe_for_diarization(self, audio_path, language, model, device, word_timestamps=False, cancel=None):
+        time.sleep(self.duration * scheduler.MODEL_COST_FACTOR.get(model, scheduler.DEFAULT_COST_FACTOR) * self.scale)
+        segments = [
+            {"start": start, "end": start + TURN_SECONDS - 0.5, "text": "реплика"}
+            for start in range(0, int(self.duration), int(TURN_SECONDS))
+        ]
+        return Transcript.from_segments(segments), "ru"
+
+    def _run_diarization(self, audio_path, num_speakers, device, cancel=None) -> List[Dict]:
+        time.sleep(self.duration * scheduler.DIARIZATION_COST_FACTOR * self.scale)
+        return [
+            {"segment": {"start": start, "end": start + TURN_SECONDS}, "speaker": f"SPEAKER_0{i % 2}"}
+            for i, start in enumerate(range(0, int(self.duration), int(TURN_SECONDS)))
+        ]
+
+
+def run(service: OptimizedSpeechRecognitionService, audio: Optional[str], model: str) -> float:
+    started = time.perf_counter()
+    result = service._transcribe_with_diarization(audio, None, model, None)
+    elapsed = time.perf_counter() - started
+    print(f"    {elapsed:7.2f} сек, спикеров: {len(result.get('speakers', {}))}")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", help="файл для реального прогона (иначе - симуляция этапов)")
+    parser.add_argument("--minutes", type=float, default=10.0, help="длительность записи в симуляции")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--scale", type=float, default=0.02, help="масштаб времени этапов в симуляции")
+    parser.add_argument("--runs", type=int, default=1, help="прогонов каждого режима")
+    args = parser.parse_args()
+
+    results = {}
+    for name, parallel in (("sequential", False), ("parallel", True)):
+        if args.audio:
+            service = OptimizedSpeechRecognitionService(parallel_diarization=parallel)
+            print(f"{name}: прогрев (загрузка моделей)")
+            run(service, args.audio, args.model)
+        else:
+            # Этапы симулируются - реальный WhisperX не нужен
+            speech_recognition_optimized.WHISPERX_AVAILABLE = True
+            service = SimulatedService(args.minutes * 60, args.scale, parallel_diarization=parallel)
+        print(f"{name}:")
+        results[name] = min(run(service, args.audio, args.model) for _ in range(args.runs))
+
+    if not args.audio:
+        duration = args.minutes * 60
+        transcribe = duration * scheduler.MODEL_COST_FACTOR.get(args.model, scheduler.DEFAULT_COST_FACTOR) * args.scale
+        diarize = duration * scheduler.DIARIZATION_COST_FACTOR * args.scale
+        print(f"Этапы: распознавание {transcribe:.2f} сек, diarization {diarize:.2f} сек "
+              f"(сумма {transcribe + diarize:.2f}, максимум {max(transcribe, diarize):.2f})")
+    print(f"Итого: sequential {results['sequential']:.2f} сек, parallel {results['parallel']:.2f} сек "
+          f"(в {results['sequential'] / results['parallel']:.2f} раза быстрее)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Симуляция планирования очереди на смешанной нагрузке
+
+Сравнивает две политики выдачи задач рабочим процессам:
+- fifo: в порядке поступления (как очередь без планировщика)
+- lanes: scheduler.order - быстрая полоса для коротких задач (с резервом
+  слотов, которые не занимают длинные задачи), WFQ между клиентами
+  внутри полосы, защита от голодания длинных задач
+
+Нагрузка: в основном короткие клипы (15 сек - 2 мин), немного записей
+на 5-20 минут и многочасовые записи; один из клиентов ("heavy") отправляет
+большую часть длинных записей. Время обработки - scheduler.estimate_cost
+с шумом. Модель не запускается - симулируется только очередь.
+
+Для каждой полосы выводятся p50/p95 времени от постановки в очередь
+до результата и максимальное ожидание. Ожидаемый результат: p95 быстрой
+полосы при lanes на порядок меньше, чем при fifo; длинные задачи платят
+за это умеренным ростом ожидания, но не голодают - задача, ждущая дольше
+порога, выдается первой, как только освобождается слот для длинных задач.
+
+Запуск (из директории backend):
+    python -m benchmarks.bench_scheduling [--workers 4] [--hours 8] [--load 0.85]
+"""
+import argparse
+import heapq
+import random
+from typing import Dict, List
+
+from app.services import scheduler
+
+MODELS = ("base", "small", "medium")
+MODEL_WEIGHTS = (0.5, 0.3, 0.2)
+CLIENTS = ("heavy", "alpha", "beta", "gamma", "delta")
+
+
+def generate_jobs(hours: float, workers: int, load: float, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+
+    def make_job(now: float) -> Dict:
+        kind = rng.random()
+        if kind < 0.85:
+            duration, client = rng.uniform(15, 120), rng.choice(CLIENTS)
+        elif kind < 0.95:
+            duration, client = rng.uniform(300, 1200), rng.choice(CLIENTS)
+        else:
+            duration = rng.uniform(3600, 3 * 3600)
+            client = "heavy" if rng.random() < 0.8 else rng.choice(CLIENTS)
+        model = rng.choices(MODELS, MODEL_WEIGHTS)[0]
+        cost = scheduler.estimate_cost(duration, model)
+        return {
+            "job_id": None,
+            "model": model,
+            "diarization": False,
+            "client": client,
+            "cost": cost,
+            "service": cost * rng.uniform(0.8, 1.2),
+            "created_at": now,
+        }
+
+    # Средняя стоимость задачи - по выборке, чтобы задать интенсивность потока под загрузку
+    sample = [make_job(0.0)["cost"] for _ in range(20000)]
+    rate = load * workers / (sum(sample) / len(sample))
+    jobs, now = [], 0.0
+    while now < hours * 3600:
+        now += rng.expovariate(rate)
+        job = make_job(now)
+        job["job_id"] = len(jobs)
+        jobs.append(job)
+    return jobs
+
+
+def simulate(jobs: List[Dict], workers: int, policy: str, fast_lane_seconds: float,
+             starvation_seconds: float) -> List[Dict]:
+    """Дискретно-событийная симуляция; возвращает задачи с finished_at"""
+    jobs = [dict(job) for job in jobs]
+    fair = scheduler.new_fair_shares()
+    warm = {"models": list(MODELS), "diarization": True}
+    pool = {f"w{i}": {"warm": warm} for i in range(workers)}
+    idle = list(pool)
+    queue: List[Dict] = []
+    # (время, порядок, тип, данные): тип 0 - завершение задачи, 1 - поступление
+    events = [(job["created_at"], job["job_id"], 1, job) for job in jobs]
+    heapq.heapify(events)
+    sequence = len(jobs)
+    running_bulk = 0
+
+    while events:
+        now, _, kind, data = heapq.heappop(events)
+        if kind == 1:
+            queue.append(data)
+        else:
+            worker_id, finished = data
+            idle.append(worker_id)
+            if scheduler.lane(finished, fast_lane_seconds) == scheduler.BULK_LANE:
+                running_bulk -= 1
+        while idle and queue:
+            worker_id = idle.pop()
+            if policy == "fifo":
+                job = min(queue, key=lambda job: job["created_at"])
+            else:
+                ordered = scheduler.order(queue, fair, now, fast_lane_seconds, starvation_seconds)
+                allow_bulk = scheduler.bulk_allowed(running_bulk, workers)
+                job, _ = scheduler.pick(ordered, worker_id, pool, now, allow_bulk)
+                if job is None:
+                    # Остались только длинные задачи, а свободен слот резерва быстрой полосы
+                    idle.append(worker_id)
+                    break
+                fair[job["lane"]].charge(job)
+            queue.remove(job)
+            if scheduler.lane(job, fast_lane_seconds) == scheduler.BULK_LANE:
+                running_bulk += 1
+            job["started_at"] = now
+            job["finished_at"] = now + job["service"]
+            sequence += 1
+            heapq.heappush(events, (job["finished_at"], sequence, 0, (worker_id, job)))
+    return jobs
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def report(name: str, jobs: List[Dict], fast_lane_seconds: float) -> None:
+    print(f"{name}:")
+    for lane in (scheduler.FAST_LANE, scheduler.BULK_LANE):
+        latencies = [
+            job["finished_at"] - job["created_at"] for job in jobs
+            if scheduler.lane(job, fast_lane_seconds) == lane
+        ]
+        waits = [
+            job["started_at"] - job["created_at"] for job in jobs
+            if scheduler.lane(job, fast_lane_seconds) == lane
+        ]
+        print(f"  {lane:<5} задач {len(latencies):5d}   p50 {percentile(latencies, 0.5):8.1f} сек"
+              f"   p95 {percentile(latencies, 0.95):8.1f} сек   max ожидания {max(waits, default=0):8.1f} сек")
+    for client in CLIENTS:
+        waits = [
+            job["started_at"] - job["created_at"] for job in jobs
+            if job["client"] == client and scheduler.lane(job, fast_lane_seconds) == scheduler.FAST_LANE
+        ]
+        print(f"    {client:<6} быстрая полоса: p95 ожидания {percentile(waits, 0.95):8.1f} сек")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--hours", type=float, default=8.0)
+    parser.add_argument("--load", type=float, default=0.85, help="средняя загрузка рабочих процессов")
+    parser.add_argument("--fast-lane", type=float, default=scheduler.FAST_LANE_SECONDS)
+    parser.add_argument("--starvation", type=float, default=scheduler.STARVATION_SECONDS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    jobs = generate_jobs(args.hours, args.workers, args.load, args.seed)
+    print(f"Задач: {len(jobs)}, рабочих процессов: {args.workers}, загрузка {args.load:.0%}, "
+          f"быстрая полоса <= {args.fast_lane:.0f} сек, порог голодания {args.starvation:.0f} сек")
+    for policy in ("fifo", "lanes"):
+        finished = simulate(jobs, args.workers, policy, args.fast_lane, args.starvation)
+        report(policy, finished, args.fast_lane)
+
+
+if __name__ == "__main__":
+    main()
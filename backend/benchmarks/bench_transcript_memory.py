@@ -0,0 +1,118 @@
+"""
+Бенчмарк памяти: список словарей сегментов против колоночной транскрипции
+
+Моделирует обработку транскрипции из 100 000 сегментов:
+- legacy: список словарей -> копии в simple_diarization -> итоговые сегменты
+  -> текст по спикерам и форматированный текст
+- columnar: Transcript -> diarize_transcript (на месте) -> словари только для ответа
+
+Запуск (из директории backend):
+    python -m benchmarks.bench_transcript_memory [--segments 100000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.services.simple_diarization import simple_diarization, group_by_speakers, diarize_transcript
+from app.services.transcript import Transcript
+
+WORDS = ["как", "это", "да", "мы", "работает", "система", "распознавания", "речи",
+         "нет", "вопрос", "ответ", "сегодня", "проект", "модель", "время", "данные"]
+
+
+def synthetic_segments(count: int, seed: int = 0):
+    """Поток сегментов, похожий на выдачу faster-whisper"""
+    rng = random.Random(seed)
+    t = 0.0
+    for _ in range(count):
+        duration = rng.uniform(0.8, 6.0)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 14)))
+        if rng.random() < 0.15:
+            text += "?"
+        yield t, t + duration, text
+        t += duration + rng.uniform(0.0, 0.6)
+
+
+def run_legacy(count: int):
+    segments_list = []
+    for start, end, text in synthetic_segments(count):
+        segments_list.append({"id": len(segments_list), "start": start, "end": end, "text": text.strip()})
+    with_speakers = simple_diarization(segments_list, pause_threshold=0.3)
+    segments = [
+        {"id": i, "start": s["start"], "end": s["end"], "text": s["text"].strip(), "speaker": s["speaker"]}
+        for i, s in enumerate(with_speakers)
+    ]
+    speakers = group_by_speakers(segments)
+    formatted = "\n\n".join(f"{s['speaker']}: {s['text']}" for s in segments)
+    full_text = " ".join(s["text"] for s in segments)
+    return segments, speakers, formatted, full_text, segments_list, with_speakers
+
+
+def run_columnar(count: int):
+    transcript = Transcript()
+    for start, end, text in synthetic_segments(count):
+        transcript.append(start, end, text.strip())
+    diarize_transcript(transcript, pause_threshold=0.3)
+    speakers = transcript.texts_by_speaker()
+    formatted = "\n\n".join(f"{speaker}: {text}" for speaker, text in transcript.iter_speaker_turns())
+    full_text = transcript.full_text()
+    # Граница API: словари создаются один раз для ответа
+    segments = transcript.to_segments()
+    return segments, speakers, formatted, full_text, transcript
+
+
+def retained_only_columnar(count: int):
+    transcript = Transcript()
+    for start, end, text in synthetic_segments(count):
+        transcript.append(start, end, text.strip())
+    diarize_transcript(transcript, pause_threshold=0.3)
+    return transcript
+
+
+def retained_only_legacy(count: int):
+    segments_list = [
+        {"id": i, "start": start, "end": end, "text": text}
+        for i, (start, end, text) in enumerate(synthetic_segments(count))
+    ]
+    return simple_diarization(segments_list, pause_threshold=0.3)
+
+
+# Запусков для замера времени
+TIMING_RUNS = 3
+
+
+def measure(name: str, fn, count: int) -> None:
+    # Время - без tracemalloc: трассировка замедляет каждое выделение памяти,
+    # и вариант с большим числом мелких объектов выглядел бы медленнее, чем есть.
+    # Лучшее из TIMING_RUNS запусков - разброс отдельных запусков велик
+    elapsed = float("inf")
+    for _ in range(TIMING_RUNS):
+        started = time.perf_counter()
+        result = fn(count)
+        elapsed = min(elapsed, time.perf_counter() - started)
+        del result
+    tracemalloc.start()
+    result = fn(count)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{name:<28} пик {peak / 1024 / 1024:8.1f} MB   удерживается {current / 1024 / 1024:8.1f} MB   {elapsed:6.2f} сек")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"Сегментов: {args.segments}")
+    print("Полный конвейер (включая ответ API):")
+    measure("  legacy (словари)", run_legacy, args.segments)
+    measure("  columnar (Transcript)", run_columnar, args.segments)
+    print("Только представление сегментов со спикерами:")
+    measure("  legacy (словари)", retained_only_legacy, args.segments)
+    measure("  columnar (Transcript)", retained_only_columnar, args.segments)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Бенчмарк режима word_timestamps: размер ответа и стоимость кодирования/декодирования
+
+Сравнивает три представления одной транскрипции:
+- segments: только сегменты (режим по умолчанию)
+- naive: словарь на каждое слово внутри сегмента ({"word", "start", "end", "probability"})
+- columnar: сегменты + поле words параллельными массивами (Transcript.words_compact)
+
+Для columnar отдельно измеряется декодирование на стороне клиента - сборка
+слов сегмента из параллельных массивов - и память Transcript со словами и без.
+
+Запуск (из директории backend):
+    python -m benchmarks.bench_word_timestamps [--segments 20000]
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+import tracemalloc
+
+from app.services.transcript import Transcript
+from app.services.transcript_export import export_transcript
+
+from benchmarks.bench_transcript_memory import WORDS
+
+PRECISION = 3
+
+
+def synthetic_segments(count: int, seed: int = 0):
+    """Сегменты со словами, как их отдает openai-whisper при word_timestamps=True"""
+    rng = random.Random(seed)
+    t = 0.0
+    for _ in range(count):
+        start = t
+        words = []
+        for _ in range(rng.randint(3, 14)):
+            duration = rng.uniform(0.15, 0.6)
+            words.append({
+                "word": " " + rng.choice(WORDS),
+                "start": t,
+                "end": t + duration,
+                "probability": rng.uniform(0.4, 1.0),
+            })
+            t += duration + rng.uniform(0.0, 0.2)
+        yield {
+            "start": start,
+            "end": t,
+            "text": "".join(word["word"] for word in words),
+            "words": words,
+        }
+        t += rng.uniform(0.0, 0.8)
+
+
+def naive_payload(segments) -> dict:
+    return {
+        "segments": [
+            {
+                "id": i,
+                "start": round(seg["start"], PRECISION),
+                "end": round(seg["end"], PRECISION),
+                "text": seg["text"].strip(),
+                "words": [
+                    {
+                        "word": word["word"],
+                        "start": round(word["start"], PRECISION),
+                        "end": round(word["end"], PRECISION),
+                        "probability": round(word["probability"], 4),
+                    }
+                    for word in seg["words"]
+                ],
+            }
+            for i, seg in enumerate(segments)
+        ]
+    }
+
+
+def columnar_payload(transcript: Transcript, with_words: bool = True) -> dict:
+    payload = {"segments": transcript.to_segments(PRECISION)}
+    if with_words:
+        payload["words"] = transcript.words_compact(PRECISION)
+    return payload
+
+
+def decode_naive(body: bytes) -> int:
+    data = json.loads(body)
+    count = 0
+    for seg in data["segments"]:
+        for word in seg["words"]:
+            count += word["end"] > word["start"]
+    return count
+
+
+def decode_columnar(body: bytes) -> int:
+    """Клиент: слова сегмента i - индексы segment_index[i]:segment_index[i + 1]"""
+    data = json.loads(body)
+    words = data["words"]
+    index = words["segment_index"]
+    starts, ends, texts = words["start"], words["end"], words["text"]
+    count = 0
+    for i in range(len(data["segments"])):
+        for start, end, _ in zip(starts[index[i]:index[i + 1]], ends[index[i]:index[i + 1]],
+                                 texts[index[i]:index[i + 1]]):
+            count += end > start
+    return count
+
+
+def timed(fn, *args, repeat: int = 3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def report_payload(name: str, payload: dict, decoder=None) -> None:
+    body, encode_time = timed(lambda: json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    compressed = gzip.compress(body, compresslevel=6)
+    line = (f"{name:<12} {len(body) / 1024 / 1024:8.2f} MB  gzip {len(compressed) / 1024 / 1024:7.2f} MB"
+            f"   кодирование {encode_time * 1000:7.1f} мс")
+    if decoder is not None:
+        _, decode_time = timed(decoder, body)
+        line += f"   декодирование {decode_time * 1000:7.1f} мс"
+    print(line)
+
+
+def measure_memory(name: str, segments, with_words: bool) -> None:
+    tracemalloc.start()
+    transcript = Transcript.from_segments(segments, with_words=with_words)
+    transcript.text_buffer
+    if transcript.words is not None:
+        transcript.words.text_buffer
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del transcript
+    print(f"{name:<28} удерживается {current / 1024 / 1024:8.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=20_000)
+    args = parser.parse_args()
+
+    segments = list(synthetic_segments(args.segments))
+    transcript = Transcript.from_segments(segments, with_words=True)
+    print(f"Сегментов: {len(transcript)}, слов: {len(transcript.words)}")
+
+    print("Ответ API (JSON):")
+    report_payload("  segments", columnar_payload(transcript, with_words=False))
+    report_payload("  naive", naive_payload(segments), decode_naive)
+    report_payload("  columnar", columnar_payload(transcript), decode_columnar)
+
+    print("Экспорт VTT:")
+    for name, word_timing in (("  без слов", False), ("  караоке", True)):
+        parts, elapsed = timed(lambda: "".join(export_transcript(
+            transcript.iter_segments(include_words=word_timing), "vtt", word_timing=word_timing
+        )))
+        print(f"{name:<12} {len(parts.encode('utf-8')) / 1024 / 1024:8.2f} MB   {elapsed * 1000:7.1f} мс")
+
+    print("Память Transcript:")
+    measure_memory("  без слов", segments, with_words=False)
+    measure_memory("  со словами (колонки)", segments, with_words=True)
+
+
+if __name__ == "__main__":
+    main()
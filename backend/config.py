@@ -2,6 +2,7 @@
 Конфигурация приложения
 """
 import os
+import tempfile
 from pathlib import Path
 from typing import Optional
 
@@ -38,3 +39,150 @@ if HF_HOME:
     os.environ["HF_HOME"] = str(hf_path)
     print(f"✓ Модели HuggingFace (diarization) будут сохраняться в: {hf_path}")
 
+
+# Директория для возобновляемых загрузок (частичные файлы и хранилище по хэшу)
+UPLOAD_DIR: str = os.getenv(
+    "UPLOAD_DIR",
+    os.path.join(tempfile.gettempdir(), "videoconverter_uploads")
+)
+
+# Время жизни незавершенной сессии загрузки (секунды с последней активности)
+UPLOAD_SESSION_TTL: int = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+# Время жизни загруженного файла в хранилище (секунды с последнего обращения)
+UPLOAD_STORED_TTL: int = int(os.getenv("UPLOAD_STORED_TTL", str(7 * 24 * 3600)))
+
+# Максимальное количество готовых результатов в кэше (по хэшу файла и параметрам)
+RESULT_CACHE_SIZE: int = int(os.getenv("RESULT_CACHE_SIZE", "64"))
+
+# Директория для сохраненных транскрипций задач (перегенерация субтитров без распознавания)
+JOBS_DIR: str = os.getenv(
+    "JOBS_DIR",
+    os.path.join(tempfile.gettempdir(), "videoconverter_jobs")
+)
+
+# Время хранения завершенных задач (секунды с завершения; 0 - хранить без ограничения)
+JOB_RETENTION_SECONDS: int = int(os.getenv("JOB_RETENTION_SECONDS", str(30 * 24 * 3600)))
+
+# Сколько раз задача, прерванная остановкой процесса, запускается заново при старте
+# (задача, которая сама приводит к падению процесса - например, OOM, - не перезапускается бесконечно)
+JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+# Аренда задачи процессом (секунды): процесс продлевает ее каждую треть срока,
+# задачи с истекшей арендой (процесс остановлен) забирает и перезапускает другой процесс
+JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Записи длиннее этого порога (секунды) распознаются по окнам из pipe ffmpeg
+# с ограниченным потреблением памяти (0 - режим отключен)
+LONG_FORM_MIN_DURATION: float = float(os.getenv("LONG_FORM_MIN_DURATION", str(30 * 60)))
+
+# Длительность окна аудио в режиме длинных записей (секунды)
+LONG_FORM_WINDOW_SECONDS: float = float(os.getenv("LONG_FORM_WINDOW_SECONDS", "300"))
+
+# Кэш декодированного аудио (.npy, float32 16 кГц) по хэшу исходного файла
+AUDIO_CACHE_DIR: str = os.getenv(
+    "AUDIO_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "videoconverter_audio_cache")
+)
+
+# Бюджет кэша декодированного аудио в байтах (0 - кэш отключен); 1 час аудио ~ 230 MB
+AUDIO_CACHE_MAX_BYTES: int = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(4 * 1024 ** 3)))
+
+# Количество процессов распознавания (0 - распознавание в пуле потоков процесса API);
+# аудио передается процессам через разделяемую память
+TRANSCRIBE_WORKERS: int = int(os.getenv("TRANSCRIBE_WORKERS", "0"))
+
+# Роль процесса: all - API и распознавание в одном процессе (по умолчанию),
+# api - только HTTP, задачи уходят в очередь рабочим процессам,
+# worker - рабочий процесс очереди (задается python -m app.worker)
+ROLE: str = os.getenv("ROLE", "all")
+
+# Очередь задач между API и рабочими процессами (sqlite:///путь - для одного хоста)
+JOB_QUEUE_URL: str = os.getenv(
+    "JOB_QUEUE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "videoconverter_queue.db")
+)
+
+# Задачи рабочего процесса без heartbeat дольше этого (секунды) возвращаются в очередь
+JOB_QUEUE_LEASE_SECONDS: float = float(os.getenv("JOB_QUEUE_LEASE_SECONDS", "120"))
+
+# Директория входных файлов /api/convert (прежнее имя SCRATCH_DIR, используется, если он не задан)
+INPUT_DIR: Optional[str] = os.getenv("INPUT_DIR") or None
+
+# Том для временных файлов задач (входные файлы, извлеченный WAV): по умолчанию - INPUT_DIR
+# или поддиректория системной временной директории. При ROLE=api он, как UPLOAD_DIR
+# и JOBS_DIR, должен быть доступен рабочим процессам
+SCRATCH_DIR: str = (
+    os.getenv("SCRATCH_DIR") or INPUT_DIR or os.path.join(tempfile.gettempdir(), "videoconverter_scratch")
+)
+
+# Временные файлы не больше этого размера (байты) создаются в памяти (/dev/shm);
+# входные файлы задач - всегда в SCRATCH_DIR (нужны для перезапуска после рестарта контейнера)
+TEMP_MEMORY_MAX_FILE_BYTES: int = int(os.getenv("TEMP_MEMORY_MAX_FILE_BYTES", str(64 * 1024 ** 2)))
+
+# Суммарный размер временных файлов в памяти (0 - все файлы в SCRATCH_DIR)
+TEMP_MEMORY_BUDGET_BYTES: int = int(os.getenv("TEMP_MEMORY_BUDGET_BYTES", str(512 * 1024 ** 2)))
+
+# Свободное место, которое должно остаться в SCRATCH_DIR после записи файла (иначе 507)
+TEMP_MIN_FREE_BYTES: int = int(os.getenv("TEMP_MIN_FREE_BYTES", str(1024 ** 3)))
+
+# Временные файлы старше этого (секунды) удаляются, даже если процесс-владелец жив
+TEMP_FILE_MAX_AGE: int = int(os.getenv("TEMP_FILE_MAX_AGE", str(24 * 3600)))
+
+# Модели, которые обслуживает рабочий процесс (через запятую; пусто - любые)
+WORKER_MODELS: str = os.getenv("WORKER_MODELS", "")
+
+# Количество задач, которые рабочий процесс выполняет одновременно
+WORKER_CAPACITY: int = int(os.getenv("WORKER_CAPACITY", "1"))
+
+# Задачи с оценкой времени обработки не больше этой (секунды) идут в быструю полосу очереди
+SCHEDULER_FAST_LANE_SECONDS: float = float(os.getenv("SCHEDULER_FAST_LANE_SECONDS", "120"))
+
+# Задача, ждущая в очереди дольше этого (секунды), обслуживается первой (защита от голодания)
+SCHEDULER_STARVATION_SECONDS: float = float(os.getenv("SCHEDULER_STARVATION_SECONDS", "1800"))
+
+# Слоты рабочих процессов, которые не получают длинные задачи (резерв быстрой полосы)
+SCHEDULER_FAST_LANE_RESERVED: int = int(os.getenv("SCHEDULER_FAST_LANE_RESERVED", "1"))
+
+# Веса клиентов в справедливой очереди: "key-<sha256 ключа[:12]>=2,10.0.0.5=0.5" (по умолчанию 1)
+CLIENT_WEIGHTS: str = os.getenv("CLIENT_WEIGHTS", "")
+
+# Новые задачи отклоняются (429 с Retry-After), если прогноз ожидания в очереди больше этого
+# (секунды; 0 - без лимита). Прогноз - по оставшейся работе принятых задач и измеренному RTF
+ADMISSION_MAX_WAIT_SECONDS: float = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "1800"))
+
+# Новые задачи отклоняются, если временный диск (SCRATCH_DIR, UPLOAD_DIR) заполнен больше этой доли
+ADMISSION_DISK_WATERMARK: float = float(os.getenv("ADMISSION_DISK_WATERMARK", "0.9"))
+
+# Сколько задач обрабатывается параллельно при ROLE=all (0 - по TRANSCRIBE_WORKERS);
+# при ROLE=api емкость берется из зарегистрированных рабочих процессов
+ADMISSION_CAPACITY: int = int(os.getenv("ADMISSION_CAPACITY", "0"))
+
+# Движок diarization: auto - WhisperX/pyannote (нужен HF_TOKEN), при недоступности - спектральная
+# на CPU, затем по паузам; spectral - спектральные признаки голоса без моделей; pauses - эвристика по паузам
+DIARIZATION_ENGINE: str = os.getenv("DIARIZATION_ENGINE", "auto")
+
+# Diarization pyannote/WhisperX выполняется в отдельном потоке одновременно с распознаванием
+# (время ответа ~ max из двух этапов вместо суммы; пиковая память - обе модели сразу)
+PARALLEL_DIARIZATION: bool = os.getenv("PARALLEL_DIARIZATION", "true").lower() == "true"
+
+# Бюджеты потоков CPU этапов (0 - по умолчанию библиотек, то есть все ядра): Faster-Whisper
+# (CTranslate2) и pyannote (torch) используют разные пулы; при параллельной diarization сумма
+# не должна превышать число ядер, иначе этапы отнимают время друг у друга - по умолчанию ядра
+# делятся пополам. Бюджет diarization задается torch.set_num_threads и действует на весь
+# процесс (все задачи процесса и любой код на torch в нем), а не на одну задачу
+_CPU_COUNT = os.cpu_count() or 1
+TRANSCRIBE_CPU_THREADS: int = int(os.getenv(
+    "TRANSCRIBE_CPU_THREADS", str(_CPU_COUNT - _CPU_COUNT // 2 if PARALLEL_DIARIZATION else 0)
+))
+DIARIZATION_CPU_THREADS: int = int(os.getenv(
+    "DIARIZATION_CPU_THREADS", str(max(_CPU_COUNT // 2, 1) if PARALLEL_DIARIZATION else 0)
+))
+
+# Кэш сегментации и эмбеддингов pyannote по хэшу аудио: повторный запуск с другим
+# num_speakers пересчитывает только кластеризацию (бюджет в байтах; 0 - кэш отключен)
+DIARIZATION_CACHE_DIR: str = os.getenv(
+    "DIARIZATION_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "videoconverter_diarization_cache")
+)
+DIARIZATION_CACHE_MAX_BYTES: int = int(os.getenv("DIARIZATION_CACHE_MAX_BYTES", str(1024 ** 3)))
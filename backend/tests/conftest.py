@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Тесты запускаются из директории backend или из корня репозитория: пакет app - в backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
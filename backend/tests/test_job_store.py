@@ -0,0 +1,124 @@
+import sqlite3
+import time
+
+import pytest
+
+from app.services.job_store import JobStore
+from app.services.job_queue import DONE, FAILED, RUNNING
+
+LEASE_SECONDS = 0.2
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path), lease_seconds=LEASE_SECONDS)
+
+
+@pytest.fixture
+def other(tmp_path, store):
+    # Другой процесс с тем же хранилищем
+    return JobStore(str(tmp_path), lease_seconds=LEASE_SECONDS)
+
+
+def expire_leases():
+    time.sleep(LEASE_SECONDS * 1.5)
+
+
+def test_live_lease_is_not_claimed(store, other):
+    store.start("job", {"model": "base"})
+
+    assert other.claim_expired() == []
+    assert store.get("job")["owner"] == store.owner
+
+
+def test_expired_lease_is_claimed_once(store, other, tmp_path):
+    store.start("job", {"model": "base"}, input_path="/data/input.mp4")
+    expire_leases()
+
+    claimed = other.claim_expired()
+    assert [job["job_id"] for job in claimed] == ["job"]
+    assert claimed[0]["owner"] == other.owner
+    assert claimed[0]["lease_until"] > time.time()
+    assert claimed[0]["input_path"] == "/data/input.mp4"
+    # Аренда новым владельцем еще действует - задачу больше никто не забирает
+    third = JobStore(str(tmp_path), lease_seconds=LEASE_SECONDS)
+    assert third.claim_expired() == []
+    assert other.claim_expired() == []
+
+
+def test_claim_in_order_of_acceptance(store, other):
+    for job_id in ("first", "second", "third"):
+        store.start(job_id, {})
+        time.sleep(0.01)
+    expire_leases()
+
+    assert [job["job_id"] for job in other.claim_expired()] == ["first", "second", "third"]
+
+
+def test_finished_jobs_are_not_claimed(store, other):
+    store.start("done", {})
+    store.save({"text": ""}, {}, job_id="done")
+    store.start("failed", {})
+    store.fail("failed", {"detail": "error"})
+    expire_leases()
+
+    assert other.claim_expired() == []
+    assert store.get("done")["status"] == DONE
+    assert store.get("failed")["status"] == FAILED
+
+
+def test_jobs_without_lease_are_claimed(store, other):
+    # Задачи, записанные до появления аренды (колонка lease_until пустая)
+    store.start("legacy", {})
+    with sqlite3.connect(store.path) as db:
+        db.execute("UPDATE jobs SET owner = NULL, lease_until = NULL WHERE job_id = 'legacy'")
+
+    assert [job["job_id"] for job in other.claim_expired()] == ["legacy"]
+
+
+def test_renew_keeps_lease(store, other):
+    store.start("job", {})
+    for _ in range(3):
+        time.sleep(LEASE_SECONDS / 2)
+        assert store.renew(["job"]) == 1
+
+    assert other.claim_expired() == []
+    assert store.get("job")["status"] == RUNNING
+
+
+def test_renew_after_claim_by_other_process(store, other):
+    store.start("job", {})
+    expire_leases()
+    other.claim_expired()
+
+    # Прежний владелец не продлевает забранную задачу
+    assert store.renew(["job"]) == 0
+    assert store.get("job")["owner"] == other.owner
+    assert other.renew(["job"]) == 1
+
+
+def test_renew_skips_finished_and_unknown_jobs(store):
+    store.start("done", {})
+    store.save({"text": ""}, {}, job_id="done")
+    store.start("job", {})
+
+    assert store.renew(["done", "missing", "job"]) == 1
+
+
+def test_restart_counts_attempts(store, other):
+    store.start("job", {})
+    expire_leases()
+    job = other.claim_expired()[0]
+    other.start(job["job_id"], job["params"])
+
+    job = other.get("job")
+    assert job["attempts"] == 2
+    assert job["owner"] == other.owner
+
+
+def test_inputs_of_running_jobs_are_kept(store):
+    store.start("running", {}, input_path="/data/running.mp4", cleanup_input=True)
+    store.start("done", {}, input_path="/data/done.mp4", cleanup_input=True)
+    store.save({"text": ""}, {}, job_id="done")
+
+    assert store.input_paths() == ["/data/running.mp4"]
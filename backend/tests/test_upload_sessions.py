@@ -0,0 +1,153 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from app.services.upload_sessions import (
+    UploadError,
+    UploadNotFoundError,
+    UploadOffsetError,
+    UploadSessionManager,
+)
+
+DATA = b"0123456789" * 100
+DATA_SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return UploadSessionManager(str(tmp_path), session_ttl=60, stored_ttl=3600)
+
+
+def upload(manager, data=DATA, sha256=None, filename="video.mp4"):
+    session = manager.create(filename, len(data), sha256)
+    manager.write(session.upload_id, 0, [data[:300], data[300:]])
+    return manager.finalize(session.upload_id)
+
+
+def test_upload_in_parts(manager):
+    session = manager.create("video.mp4", len(DATA))
+    manager.write(session.upload_id, 0, [DATA[:400]])
+    manager.write(session.upload_id, 400, [DATA[400:700], DATA[700:]])
+    session = manager.finalize(session.upload_id)
+
+    assert session.complete
+    assert session.sha256 == DATA_SHA256
+    with open(session.stored_path, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_offset_mismatch_reports_expected_offset(manager):
+    session = manager.create("video.mp4", len(DATA))
+    manager.write(session.upload_id, 0, [DATA[:100]])
+
+    with pytest.raises(UploadOffsetError) as error:
+        manager.write(session.upload_id, 50, [DATA[50:200]])
+    assert error.value.expected_offset == 100
+    assert error.value.received_offset == 50
+    # Отклоненная часть не записана - загрузка продолжается с ожидаемого смещения
+    assert manager.get(session.upload_id).offset == 100
+    manager.write(session.upload_id, 100, [DATA[100:]])
+    assert manager.finalize(session.upload_id).sha256 == DATA_SHA256
+
+
+def test_write_beyond_declared_size(manager):
+    session = manager.create("video.mp4", 10)
+    with pytest.raises(UploadError):
+        manager.write(session.upload_id, 0, [DATA[:20]])
+
+
+def test_finalize_incomplete(manager):
+    session = manager.create("video.mp4", len(DATA))
+    manager.write(session.upload_id, 0, [DATA[:100]])
+    with pytest.raises(UploadError):
+        manager.finalize(session.upload_id)
+
+
+def test_hash_mismatch(manager):
+    session = manager.create("video.mp4", len(DATA), hashlib.sha256(b"other").hexdigest())
+    manager.write(session.upload_id, 0, [DATA])
+    with pytest.raises(UploadError):
+        manager.finalize(session.upload_id)
+    assert not os.listdir(manager.stored_dir)
+
+
+def test_dedup_on_finalize(manager):
+    first = upload(manager)
+    second = upload(manager, filename="copy.mkv")
+
+    assert second.stored_path == first.stored_path
+    assert os.listdir(manager.stored_dir) == [os.path.basename(first.stored_path)]
+    assert not list(manager.sessions_dir.glob("*.part"))
+
+
+def test_known_hash_skips_transfer(manager):
+    stored = upload(manager)
+    session = manager.create("video.mp4", len(DATA), DATA_SHA256.upper())
+
+    assert session.complete
+    assert session.offset == len(DATA)
+    assert session.stored_path == stored.stored_path
+
+
+@pytest.mark.parametrize("sha256", ["a", "?", "*", DATA_SHA256[:12], DATA_SHA256[:63] + "?", "../" + DATA_SHA256])
+def test_partial_or_wildcard_hash_does_not_match_stored(manager, sha256):
+    upload(manager)
+
+    assert manager.find_stored(sha256) is None
+    with pytest.raises(UploadError):
+        manager.create("video.mp4", len(DATA), sha256)
+
+
+def test_hash_prefix_of_stored_name_does_not_match(manager):
+    # Имя другого файла начинается с хэша - совпадать должно только имя целиком
+    (manager.stored_dir / f"{DATA_SHA256}0.mp4").write_bytes(DATA)
+    assert manager.find_stored(DATA_SHA256) is None
+
+
+def test_empty_hash_is_optional(manager):
+    session = manager.create("video.mp4", len(DATA), "")
+    assert not session.complete
+    assert session.expected_sha256 is None
+
+
+def test_expired_session(manager):
+    session = manager.create("video.mp4", len(DATA))
+    manager.write(session.upload_id, 0, [DATA[:100]])
+    manager.session_ttl = 0.05
+    time.sleep(0.1)
+
+    with pytest.raises(UploadNotFoundError):
+        manager.write(session.upload_id, 100, [DATA[100:]])
+    assert manager.cleanup_expired() == 2
+    assert not list(manager.sessions_dir.iterdir())
+
+
+def test_cleanup_keeps_recent_files(manager):
+    stored = upload(manager)
+    pending = manager.create("video.mp4", len(DATA))
+
+    assert manager.cleanup_expired() == 0
+    assert os.path.exists(stored.stored_path)
+    assert manager.get(pending.upload_id).offset == 0
+
+
+def test_cleanup_removes_unused_stored_files(manager):
+    stored = upload(manager)
+    past = time.time() - 2 * manager.stored_ttl
+    os.utime(stored.stored_path, (past, past))
+
+    manager.cleanup_expired()
+    assert not os.path.exists(stored.stored_path)
+    assert manager.find_stored(DATA_SHA256) is None
+
+
+def test_session_restored_after_restart(manager, tmp_path):
+    session = manager.create("video.mp4", len(DATA), DATA_SHA256)
+    manager.write(session.upload_id, 0, [DATA[:100]])
+
+    restarted = UploadSessionManager(str(tmp_path), session_ttl=60)
+    restored = restarted.get(session.upload_id)
+    assert restored.offset == 100
+    assert restored.expected_sha256 == DATA_SHA256
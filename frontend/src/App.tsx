@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useRef, useState } from 'react'
 import VideoUploader from './components/VideoUploader'
 import ResultDisplay from './components/ResultDisplay'
 import { useLanguage } from './contexts/LanguageContext'
@@ -10,6 +10,8 @@ function App() {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [progressMessage, setProgressMessage] = useState<string>('')
+  // Незавершенная отправка: повтор того же файла с теми же настройками идет с тем же ключом
+  const pendingSubmission = useRef<{ fingerprint: string, idempotencyKey: string } | null>(null)
 
   const handleConvert = async (
     file: File, 
@@ -128,6 +130,36 @@ function App() {
         // return
       }
       
+      // Ключ идемпотентности - случайный для каждой отправки: по нему сервер выдает
+      // прогноз, результат и отмену задачи, поэтому его нельзя вычислить по файлу.
+      // Повтор незавершенной отправки (таймаут, обрыв сети) того же файла с теми же
+      // настройками идет с тем же ключом и присоединяется к уже выполняющейся задаче
+      const fingerprint = [
+        file.name, file.size, file.lastModified, endpoint, language, model, beamSize,
+        enableDiarization, translateToEnglish, numSpeakers ?? '', speakerNames.join(',')
+      ].join('|')
+      if (pendingSubmission.current?.fingerprint !== fingerprint) {
+        pendingSubmission.current = { fingerprint, idempotencyKey: crypto.randomUUID() }
+      }
+      const idempotencyKey = pendingSubmission.current.idempotencyKey
+      
+      // Пока запрос выполняется, сервер сообщает прогноз готовности принятой задачи
+      const etaTimer = setInterval(async () => {
+        try {
+          const etaResponse = await fetch(
+            `${apiUrl}/api/admission?idempotency_key=${encodeURIComponent(idempotencyKey)}`,
+            { mode: 'cors' }
+          )
+          const eta = await etaResponse.json()
+          if (eta.admitted) {
+            const minutes = Math.max(1, Math.ceil(eta.eta_seconds / 60))
+            setProgressMessage(`Обработка видео на сервере... Ожидаемое время: ~${minutes} мин`)
+          }
+        } catch {
+          // Прогноз необязателен - ошибки опроса не прерывают конвертацию
+        }
+      }, 5000)
+      
       console.log('Отправка основного запроса...')
       setProgressMessage('Загрузка файла на сервер...')
       const response = await fetch(backendUrl, {
@@ -135,14 +167,22 @@ function App() {
         body: formData,
         signal: controller.signal,
         mode: 'cors', // Явно указываем CORS режим
+        headers: { 'Idempotency-Key': idempotencyKey },
         // Не добавляем Content-Type - браузер сам установит с boundary для FormData
-      })
+      }).finally(() => clearInterval(etaTimer))
       
       clearTimeout(timeoutId)
       const uploadTime = ((Date.now() - startTime) / 1000).toFixed(2)
       console.log(`Файл загружен за ${uploadTime} секунд`)
       console.log('Статус ответа:', response.status, response.statusText)
 
+      if (response.status === 429) {
+        // Сервер перегружен: задача не принята, файл не сохранен
+        const errorData = await response.json().catch(() => ({ detail: 'Сервер перегружен' }))
+        const retryAfter = Number(response.headers.get('Retry-After') || 60)
+        throw new Error(`${errorData.detail}. Повторите через ~${Math.max(1, Math.ceil(retryAfter / 60))} мин`)
+      }
+      
       if (!response.ok) {
         console.error('Ошибка ответа:', response.status)
         const errorData = await response.json().catch(() => ({ detail: 'Неизвестная ошибка' }))
@@ -159,6 +199,7 @@ function App() {
         segmentsCount: data.segments?.length || 0
       })
       console.log('=== Конвертация завершена успешно ===')
+      pendingSubmission.current = null
       setProgressMessage('Завершено!')
       setResult(data)
     } catch (err: any) {